@@ -0,0 +1,7 @@
+'''
+Offline benchmarks of the parsers on synthetic inputs.
+
+- `benchmarks.generators` writes seeded, realistic synthetic inputs for each parser at a configurable scale.
+- `benchmarks.harness` runs one parser with the network lookups (OnToma, PanelApp API, ...) stubbed.
+- `benchmarks.run` generates the inputs, runs the parsers and records their wall time, throughput and peak memory.
+'''
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+'''
+Seeded generators of synthetic parser inputs.
+
+Each generator writes the input files of one parser into a directory and returns their paths as a dictionary. The
+files have the layout of the real datasets (columns, formats, separators, nested fields), and the identifiers are
+drawn from shared pools (genes, variants, diseases) so that the joins of the parsers match in realistic proportions.
+`scale` is the number of rows of the main input table; the other tables are sized from it.
+
+The Parquet inputs (EPMC, Genetics Portal) are written with Spark, the other ones with the standard library only.
+
+>>> python -m benchmarks.generators --source CRISPR --output-dir /tmp/crispr --scale 100000
+'''
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import random
+import sys
+from xml.sax.saxutils import escape
+
+SOURCES = (
+    'PheWAS', 'PanelApp', 'Gene2Phenotype', 'Orphanet', 'EPMC', 'GeneticsPortal', 'PhenoDigm', 'CRISPR', 'SysBio'
+)
+
+GENE_PREFIXES = ('ZNF', 'SLC', 'KRT', 'TMEM', 'CDH', 'COL', 'KIF', 'RAB', 'ABC', 'FAM', 'ADAM', 'MYO')
+DISEASE_WORDS = (
+    'syndrome', 'disease', 'dystrophy', 'carcinoma', 'deficiency', 'anemia', 'ataxia', 'epilepsy', 'myopathy',
+    'neuropathy', 'cardiomyopathy', 'retinitis', 'dysplasia', 'disorder', 'type', 'congenital', 'familial', 'early',
+    'onset', 'juvenile', 'progressive', 'autosomal', 'recessive', 'dominant', 'hereditary', 'spastic', 'muscular'
+)
+CONSEQUENCES = (
+    ('missense_variant', 'SO_0001583'), ('synonymous_variant', 'SO_0001819'), ('intron_variant', 'SO_0001627'),
+    ('stop_gained', 'SO_0001587'), ('splice_region_variant', 'SO_0001630'), ('upstream_gene_variant', 'SO_0001631'),
+    ('downstream_gene_variant', 'SO_0001632'), ('3_prime_UTR_variant', 'SO_0001624'),
+    ('5_prime_UTR_variant', 'SO_0001623'), ('frameshift_variant', 'SO_0001589'),
+    ('regulatory_region_variant', 'SO_0001566'), ('intergenic_variant', 'SO_0001628'),
+)
+BASES = 'ACGT'
+
+
+def gene_pool(size):
+    '''Returns `size` genes as (HGNC id, approved symbol, Ensembl gene id), the same for every generator.'''
+    return [
+        (f'HGNC:{i + 1}', f'{GENE_PREFIXES[i % len(GENE_PREFIXES)]}{i // len(GENE_PREFIXES) + 1}',
+         f'ENSG{i + 100000:011d}')
+        for i in range(size)
+    ]
+
+
+def disease_name(rng):
+    return ' '.join(rng.choice(DISEASE_WORDS) for _ in range(rng.randint(2, 5))).capitalize() + f' {rng.randint(1, 30)}'
+
+
+def efo_id(rng):
+    return f'EFO_{rng.randint(1, 1000000):07d}'
+
+
+def pmid(rng):
+    return str(rng.randint(10000000, 34000000))
+
+
+def variant(rng):
+    '''Returns a (chromosome, position, reference, alternative) tuple.'''
+    ref = rng.choice(BASES)
+    return str(rng.randint(1, 22)), rng.randint(10000, 240000000), ref, rng.choice(BASES.replace(ref, ''))
+
+
+def _open(filename):
+    # Gzipped files get a null timestamp, so the same seed always gives the same bytes:
+    if filename.endswith('.gz'):
+        return io.TextIOWrapper(gzip.GzipFile(filename, 'wb', mtime=0), encoding='utf-8', newline='')
+    return open(filename, 'w', encoding='utf-8', newline='')
+
+
+def write_table(filename, header, rows, delimiter='\t'):
+    '''Writes a delimited table with a header row.'''
+    with _open(filename) as f:
+        writer = csv.writer(f, delimiter=delimiter, lineterminator='\n')
+        writer.writerow(header)
+        writer.writerows(rows)
+    return filename
+
+
+def write_hgnc(directory, genes, rng):
+    '''HGNC complete set in TSV, with previous symbols and a few genes without an Ensembl gene id.'''
+    return write_table(
+        os.path.join(directory, 'hgnc_complete_set.txt'),
+        ['hgnc_id', 'symbol', 'name', 'locus_group', 'status', 'prev_symbol', 'ensembl_gene_id'],
+        (
+            (
+                hgnc_id, symbol, f'{symbol} protein', 'protein-coding gene', 'Approved',
+                '|'.join(f'{symbol}P{j}' for j in range(rng.choice((0, 0, 0, 1, 2)))),
+                '' if rng.random() < 0.02 else ensembl_gene_id
+            )
+            for hgnc_id, symbol, ensembl_gene_id in genes
+        )
+    )
+
+
+def generate_phewas(directory, scale, rng):
+    '''PheWAS catalog associations, the consequences of their variants, phenotype mappings and the HGNC set.'''
+    genes = gene_pool(max(100, min(20000, scale // 5)))
+    phenotypes = [(f'{rng.randint(8, 999)}.{rng.randint(0, 99)}', disease_name(rng)) for _ in range(1800)]
+    snps = [(f'rs{rng.randint(1, 900000000)}', variant(rng), rng.choice(genes)) for _ in range(max(50, scale // 10))]
+
+    associations = []
+    for _ in range(scale):
+        snp, _, gene = rng.choice(snps)
+        # A few symbols are flagged with asterisks, and a few are not HGNC symbols:
+        symbol = gene[1] + rng.choice(('', '', '', '', '', '', '', '', '*', '**'))
+        if rng.random() < 0.02:
+            symbol = f'LOC{rng.randint(100000, 999999)}'
+        code, phenotype = rng.choice(phenotypes)
+        associations.append((
+            str(rng.randint(1, 22)), snp, code, phenotype, rng.randint(20, 20000),
+            f'{rng.uniform(1e-12, 0.06):.3g}', f'{rng.uniform(0.2, 6):.4f}', symbol, rng.choice(('TRUE', 'FALSE'))
+        ))
+
+    consequences = []
+    for snp, (chrom, pos, ref, alt), gene in snps:
+        # About 2% of the SNPs are multi-allelic, and are dropped by the parser:
+        for allele in range(2 if rng.random() < 0.02 else 1):
+            consequences.append((
+                snp, gene[2], pos, chrom, ref, BASES[allele - 1] if allele else alt,
+                f'http://purl.obolibrary.org/obo/{rng.choice(CONSEQUENCES)[1]}'
+            ))
+
+    mappings = [
+        (phenotype, f'http://www.ebi.ac.uk/efo/{efo_id(rng)}' if rng.random() < 0.95 else
+         'http://purl.obolibrary.org/obo/CHEBI_36047')
+        for _, phenotype in phenotypes if rng.random() < 0.9
+    ]
+
+    return {
+        'inputFile': write_table(
+            os.path.join(directory, 'phewas-catalog.csv'),
+            ['chromosome', 'snp', 'phewas_code', 'phewas_string', 'cases', 'p', 'odds_ratio', 'gene',
+             'gwas-associations'],
+            associations, delimiter=','
+        ),
+        'consequencesFile': write_table(
+            os.path.join(directory, 'phewas_w_consequences.csv'),
+            ['rsid', 'gene_id', 'pos', 'chrom', 'ref', 'alt', 'consequence_link'], consequences, delimiter=','
+        ),
+        'diseaseMapping': write_table(
+            os.path.join(directory, 'phewascat.mappings.tsv'), ['Phewas_string', 'EFO_id'], mappings
+        ),
+        'genesSet': write_hgnc(directory, genes, rng),
+    }
+
+
+def generate_panelapp(directory, scale, rng):
+    '''PanelApp gene panel export, and the API responses of its panels (served by `benchmarks.harness`).'''
+    genes = gene_pool(max(100, min(5000, scale // 3)))
+    panels = [(str(rng.randint(1, 1500)), disease_name(rng).title()) for _ in range(max(5, scale // 100))]
+    panels = list(dict(panels).items())
+    omim_phenotypes = [f'{disease_name(rng)}, {rng.randint(100000, 699999)}' for _ in range(max(50, scale // 5))]
+    mode_of_inheritance = (
+        'BIALLELIC, autosomal or pseudoautosomal', 'MONOALLELIC, autosomal or pseudoautosomal, imprinted status unknown',
+        'X-LINKED: hemizygous mutation in males, biallelic mutations in females', 'BOTH monoallelic and biallelic'
+    )
+
+    rows, publications = [], {}
+    for _ in range(scale):
+        panel_id, panel_name = rng.choice(panels)
+        symbol = rng.choice(genes)[1]
+        draw = rng.random()
+        if draw < 0.1:
+            phenotypes = ''
+        elif draw < 0.2:
+            phenotypes = 'No OMIM phenotype'
+        else:
+            phenotypes = ';'.join(rng.choice(omim_phenotypes) for _ in range(rng.randint(1, 3)))
+        rows.append((
+            'gene', symbol, symbol, panel_id, panel_name, f'{rng.randint(0, 4)}.{rng.randint(0, 150)}',
+            rng.choice(('PUBLIC', 'PUBLIC', 'PUBLIC', 'RETIRED')), rng.choice(('green', 'green', 'amber', 'red')),
+            rng.choice(mode_of_inheritance), phenotypes, rng.choice(('Expert Review Green', 'Literature', ''))
+        ))
+        publications.setdefault(panel_id, {})[symbol] = [
+            rng.choice((pmid(rng), f'{pmid(rng)} - {disease_name(rng)}', 'PMID: unknown'))
+            for _ in range(rng.randint(0, 3))
+        ]
+
+    api_directory = os.path.join(directory, 'panelapp_api')
+    os.makedirs(api_directory, exist_ok=True)
+    for panel_id, panel_publications in publications.items():
+        with open(os.path.join(api_directory, f'{panel_id}.json'), 'w') as f:
+            json.dump({'id': int(panel_id), 'genes': [
+                {'gene_data': {'gene_symbol': symbol}, 'publications': pmids}
+                for symbol, pmids in panel_publications.items()
+            ]}, f)
+
+    return {
+        'inputFile': write_table(
+            os.path.join(directory, 'All_genes_panelapp.tsv'),
+            ['Entity type', 'Symbol', 'Entity Name', 'Panel Id', 'Panel Name', 'Panel Version', 'Panel Status', 'List',
+             'Mode of inheritance', 'Phenotypes', 'Sources'],
+            rows
+        ),
+        'apiDirectory': api_directory,
+    }
+
+
+def generate_gene2phenotype(directory, scale, rng):
+    '''The four gzipped gene2phenotype panels (DD, eye, skin and cancer), `scale` rows in total.'''
+    genes = gene_pool(max(100, min(5000, scale // 2)))
+    diseases = [(disease_name(rng).upper(), str(rng.randint(100000, 699999))) for _ in range(max(20, scale // 3))]
+    consequences = (
+        'loss of function', 'all missense/in frame', 'uncertain', 'activating', 'dominant negative', '',
+        'gain of function', 'cis-regulatory or promotor mutation', '5_prime or 3_prime UTR mutation',
+        'increased gene dosage', 'part of contiguous gene duplication'
+    )
+    header = [
+        'gene symbol', 'gene mim', 'disease name', 'disease mim', 'DDD category', 'allelic requirement list',
+        'mutation consequence', 'phenotypes', 'organ specificity list', 'pmid list', 'panel', 'prev symbols', 'hgnc id',
+        'gene disease pair entry date'
+    ]
+
+    files = {}
+    for panel, share in (('DD', 0.7), ('Eye', 0.15), ('Skin', 0.1), ('Cancer', 0.05)):
+        rows = []
+        for _ in range(max(1, int(scale * share))):
+            hgnc_id, symbol, _ = rng.choice(genes)
+            disease, mim = rng.choice(diseases)
+            rows.append((
+                symbol, str(rng.randint(100000, 699999)), disease, mim,
+                rng.choice(('confirmed', 'probable', 'possible', 'both RD and IF', 'child IF')),
+                ';'.join(sorted(rng.sample(('biallelic', 'monoallelic', 'hemizygous', 'mosaic'), rng.randint(1, 2)))),
+                rng.choice(consequences), ';'.join(f'HP:{rng.randint(1, 9999999):07d}' for _ in range(rng.randint(0, 4))),
+                ';'.join(rng.sample(('Brain/Cognition', 'Eye', 'Skin', 'Heart', 'Kidney'), rng.randint(1, 2))),
+                ';'.join(pmid(rng) for _ in range(rng.randint(0, 4))), panel, '', hgnc_id.split(':')[1],
+                f'{rng.randint(2013, 2021)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:00:00'
+            ))
+        files[f'{panel.lower()}_panel'] = write_table(
+            os.path.join(directory, f'{panel}G2P.csv.gz'), header, rows, delimiter=','
+        )
+    return files
+
+
+def generate_orphanet(directory, scale, rng):
+    '''Orphanet gene-disease associations (en_product6.xml) with `scale` disorders.'''
+    genes = gene_pool(max(100, min(5000, scale)))
+    association_types = (
+        'Disease-causing germline mutation(s) in', 'Disease-causing germline mutation(s) (loss of function) in',
+        'Disease-causing germline mutation(s) (gain of function) in', 'Modifying germline mutation in',
+        'Major susceptibility factor in', 'Candidate gene tested in', 'Role in the phenotype of',
+        'Disease-causing somatic mutation(s) in'
+    )
+
+    filename = os.path.join(directory, 'en_product6.xml')
+    with open(filename, 'w', encoding='iso-8859-1') as f:
+        f.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n<JDBOR date="2021-04-01" version="1.3.12">\n')
+        f.write(f'<DisorderList count="{scale}">\n')
+        for i in range(scale):
+            f.write(
+                f'<Disorder id="{i + 1}"><OrphaCode>{rng.randint(1, 1000000)}</OrphaCode>'
+                f'<Name lang="en">{escape(disease_name(rng))}</Name>'
+                f'<DisorderType id="21394"><Name lang="en">{rng.choice(("Disease", "Malformation syndrome"))}</Name>'
+                '</DisorderType>'
+            )
+            associations = rng.randint(1, 4)
+            f.write(f'<DisorderGeneAssociationList count="{associations}">')
+            for _ in range(associations):
+                _, symbol, ensembl_gene_id = rng.choice(genes)
+                validation = '_'.join(f'{pmid(rng)}[PMID]' for _ in range(rng.randint(0, 3)))
+                f.write(
+                    '<DisorderGeneAssociation>'
+                    + (f'<SourceOfValidation>{validation}</SourceOfValidation>' if validation else '<SourceOfValidation/>')
+                    + f'<Gene id="{rng.randint(1, 30000)}"><Name lang="en">{symbol} protein</Name>'
+                    f'<Symbol>{symbol}</Symbol><ExternalReferenceList count="2">'
+                    f'<ExternalReference><Source>HGNC</Source><Reference>{rng.randint(1, 50000)}</Reference>'
+                    '</ExternalReference>'
+                    f'<ExternalReference><Source>Ensembl</Source><Reference>{ensembl_gene_id}</Reference>'
+                    '</ExternalReference></ExternalReferenceList></Gene>'
+                    f'<DisorderGeneAssociationType><Name lang="en">{escape(rng.choice(association_types))}</Name>'
+                    '</DisorderGeneAssociationType>'
+                    f'<DisorderGeneAssociationStatus><Name lang="en">'
+                    f'{rng.choice(("Assessed", "Assessed", "Not yet assessed"))}</Name>'
+                    '</DisorderGeneAssociationStatus></DisorderGeneAssociation>'
+                )
+            f.write('</DisorderGeneAssociationList></Disorder>\n')
+        f.write('</DisorderList>\n</JDBOR>\n')
+
+    return {'inputFile': filename}
+
+
+def _spark():
+    from common.SparkSessionFactory import get_spark_session
+    return get_spark_session('benchmark_inputs', 'local')
+
+
+def generate_epmc(directory, scale, rng):
+    '''EPMC cooccurrences, as a partitioned Parquet dataset of `scale` rows.'''
+    genes = gene_pool(max(100, min(20000, scale // 20)))
+    diseases = [efo_id(rng) for _ in range(max(50, scale // 50))]
+    labels = [symbol for _, symbol, _ in genes] + ['TEC', 'U6', 'S']
+    sections = ('title', 'abstract', 'intro', 'results', 'discuss', 'methods', 'figure', 'table')
+
+    rows = []
+    for _ in range(scale):
+        start1, start2 = rng.randint(0, 300), rng.randint(0, 300)
+        text = ' '.join(rng.choice(DISEASE_WORDS) for _ in range(rng.randint(5, 120)))
+        rows.append((
+            int(pmid(rng)) if rng.random() < 0.9 else None, f'PMC{rng.randint(1000000, 8000000)}',
+            rng.choice(('GP-DS', 'GP-DS', 'GP-DS', 'GP-CD', 'DS-CD')), rng.random() < 0.9, text,
+            rng.choice(labels), rng.choice(genes)[2], disease_name(rng), rng.choice(diseases),
+            start1, start1 + rng.randint(2, 10), start2, start2 + rng.randint(5, 40), rng.choice(sections),
+            rng.choice((0.5, 1.0, 1.0, 2.0, 5.0))
+        ))
+
+    spark = _spark()
+    path = os.path.join(directory, 'cooccurrences')
+    (
+        spark.createDataFrame(rows, (
+            'pmid long, pmcid string, type string, isMapped boolean, text string, label1 string, '
+            'keywordId1 string, label2 string, keywordId2 string, start1 int, end1 int, start2 int, end2 int, '
+            'section string, evidence_score double'
+        ))
+        .write.mode('overwrite').parquet(path)
+    )
+    return {'cooccurrenceFile': path}
+
+
+def generate_genetics_portal(directory, scale, rng):
+    '''Genetics Portal locus-to-gene, top loci, study and variant index Parquet tables, and the ECO code table.'''
+    genes = gene_pool(max(100, min(20000, scale // 10)))
+    studies = [f'GCST{rng.randint(1, 99999):06d}' for _ in range(max(10, scale // 50))]
+    loci = [(rng.choice(studies), variant(rng)) for _ in range(max(20, scale // 4))]
+    variants = list({locus_variant for _, locus_variant in loci})
+
+    l2g = [
+        (
+            study_id, chrom, pos, ref, alt, rng.choice(genes)[2], rng.random() ** 2,
+            rng.choice(('high_medium', 'high_medium', 'high', 'sumstats')), rng.choice(('xgboost', 'xgboost', 'logreg'))
+        )
+        for _ in range(scale)
+        for study_id, (chrom, pos, ref, alt) in [rng.choice(loci)]
+    ]
+    toploci = []
+    for study_id, (chrom, pos, ref, alt) in loci:
+        beta = rng.gauss(0, 0.2)
+        toploci.append((
+            study_id, chrom, pos, ref, alt, beta, beta - 0.05, beta + 0.05, rng.uniform(1, 9.99),
+            -rng.randint(8, 300), None if rng.random() < 0.5 else rng.uniform(0.5, 2), None, None
+        ))
+    study = [
+        (
+            study_id, f'PMID:{pmid(rng)}' if rng.random() < 0.9 else '',
+            f'{rng.randint(2008, 2021)}-{rng.randint(1, 12):02d}-01', f'Author{rng.randint(1, 5000)} X',
+            disease_name(rng), [efo_id(rng) for _ in range(rng.choice((0, 1, 1, 1, 2)))], rng.randint(500, 500000)
+        )
+        for study_id in studies
+    ]
+    variant_index = [
+        (
+            chrom, pos, ref, alt, f'rs{rng.randint(1, 900000000)}',
+            (rng.choice(CONSEQUENCES)[0], [
+                (rng.choice(genes)[2], sorted({rng.choice(CONSEQUENCES)[0] for _ in range(rng.randint(1, 3))}),
+                 rng.choice((1, None)))
+                for _ in range(rng.randint(1, 4))
+            ])
+        )
+        for chrom, pos, ref, alt in variants
+    ]
+
+    spark = _spark()
+    paths = {}
+    for name, rows, schema in (
+        ('locus2gene', l2g, (
+            'study_id string, chrom string, pos int, ref string, alt string, gene_id string, y_proba_full_model double, '
+            'training_gs string, training_clf string'
+        )),
+        ('toploci', toploci, (
+            'study_id string, chrom string, pos int, ref string, alt string, beta double, beta_ci_lower double, '
+            'beta_ci_upper double, pval_mantissa double, pval_exponent int, odds_ratio double, '
+            'oddsr_ci_lower double, oddsr_ci_upper double'
+        )),
+        ('study', study, (
+            'study_id string, pmid string, pub_date string, pub_author string, trait_reported string, '
+            'trait_efos array<string>, n_initial int'
+        )),
+        ('variantIndex', variant_index, (
+            'chrom_b38 string, pos_b38 int, ref string, alt string, rsid string, '
+            'vep struct<most_severe_consequence: string, transcript_consequences: '
+            'array<struct<gene_id: string, consequence_terms: array<string>, canonical: int>>>'
+        )),
+    ):
+        paths[name] = os.path.join(directory, f'{name}.parquet')
+        spark.createDataFrame(rows, schema).write.mode('overwrite').parquet(paths[name])
+
+    paths['ecoCodes'] = write_table(
+        os.path.join(directory, 'vep_consequences.tsv'), ['Term', 'Accession', 'eco_score'],
+        (
+            (term, f'http://purl.obolibrary.org/obo/{accession}', round(1 - i / len(CONSEQUENCES), 2))
+            for i, (term, accession) in enumerate(CONSEQUENCES)
+        )
+    )
+    return paths
+
+
+def generate_phenodigm(directory, scale, rng):
+    '''
+    PhenoDigm cache directory: the IMPC SOLR CSV tables, `scale` disease-model associations, and the MGI gene
+    coordinates. The HGNC set, read through the HGNC index, is written in the parent directory.
+    '''
+    cache_dir = os.path.join(directory, 'phenodigm_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    genes = gene_pool(max(100, min(20000, scale // 20)))
+    mouse_genes = [(f'MGI:{1000000 + i}', symbol.capitalize(), f'ENSMUSG{i + 100000:011d}')
+                   for i, (_, symbol, _) in enumerate(genes)]
+    mp_terms = [(f'MP:{i + 1:07d}', disease_name(rng).lower()) for i in range(2000)]
+    hp_terms = [(f'HP:{i + 1:07d}', disease_name(rng)) for i in range(3000)]
+    models = [f'MGI:{rng.randint(2000000, 7000000)}{rng.choice(("", "#hom#early", "#het#late"))}'
+              for _ in range(max(50, scale // 10))]
+    diseases = [(f'{rng.choice(("OMIM", "ORPHA", "DECIPHER"))}:{rng.randint(1, 700000)}', disease_name(rng))
+                for _ in range(max(50, scale // 20))]
+
+    def phenotype_list(terms, number):
+        return ','.join(f'{term_id} {label}' for term_id, label in rng.sample(terms, number))
+
+    def solr_csv(data_type, header, rows):
+        return write_table(os.path.join(cache_dir, f'impc_solr_{data_type}.csv'), header, rows, delimiter=',')
+
+    write_table(
+        os.path.join(cache_dir, 'MGI_Gene_Model_Coord.rpt'),
+        ['1. MGI accession id', '2. marker type', '3. marker symbol', '4. marker name', '5. genome build',
+         '6. Entrez gene id', '7. NCBI gene chromosome', '8. NCBI gene start', '9. NCBI gene end',
+         '10. NCBI gene strand', '11. Ensembl gene id', '12. Ensembl gene chromosome', '13. Ensembl gene start',
+         '14. Ensembl gene end', '15. Ensembl gene strand'],
+        (
+            (mgi_id, 'Gene', symbol, f'{symbol} gene', 'GRCm39', str(rng.randint(1, 999999)), '1', '100', '2000', '+',
+             'null' if rng.random() < 0.03 else ensembl_gene_id, '1', '100', '2000', '+')
+            for mgi_id, symbol, ensembl_gene_id in mouse_genes
+        )
+    )
+    solr_csv('gene_gene', ['gene_id', 'hgnc_gene_id'], (
+        (mgi_id, hgnc_id) for (mgi_id, _, _), (hgnc_id, _, _) in zip(mouse_genes, genes) if rng.random() < 0.95
+    ))
+    solr_csv('ontology_ontology', ['mp_id', 'hp_id'], (
+        (mp_id, rng.choice(hp_terms)[0]) for mp_id, _ in mp_terms for _ in range(rng.randint(0, 2))
+    ))
+    solr_csv('mouse_model', ['model_id', 'model_phenotypes'], (
+        (model_id, phenotype_list(mp_terms, rng.randint(1, 15))) for model_id in models
+    ))
+    solr_csv('disease', ['disease_id', 'disease_phenotypes'], (
+        (disease_id, phenotype_list(hp_terms, rng.randint(1, 25))) for disease_id, _ in diseases
+    ))
+    solr_csv(
+        'disease_model_summary',
+        ['model_id', 'model_genetic_background', 'model_description', 'disease_id', 'disease_term',
+         'disease_model_avg_norm', 'disease_model_max_norm', 'marker_id'],
+        (
+            (model_id, f'C57BL/6N,{rng.choice(mouse_genes)[1]}<tm1a> hom', f'{rng.choice(mouse_genes)[1]}<tm1a>/'
+             f'{rng.choice(mouse_genes)[1]}<tm1a>', disease_id, disease_term, f'{rng.uniform(0, 100):.2f}',
+             f'{rng.uniform(0, 100):.2f}', rng.choice(mouse_genes)[0])
+            for _ in range(scale)
+            for model_id, (disease_id, disease_term) in [(rng.choice(models), rng.choice(diseases))]
+        )
+    )
+    solr_csv('ontology', ['ontology', 'phenotype_id', 'phenotype_term'], (
+        [('MP', term_id, label) for term_id, label in mp_terms] + [('HP', term_id, label) for term_id, label in hp_terms]
+        + [('MPATH', f'MPATH:{i}', 'lesion') for i in range(100)]
+    ))
+
+    return {'cacheDir': cache_dir, 'genesSet': write_hgnc(directory, genes, rng)}
+
+
+def generate_crispr(directory, scale, rng):
+    '''Project Score priority scores, the method descriptions per cancer type and the cell line annotation.'''
+    genes = gene_pool(max(100, min(20000, scale // 2)))
+    cancer_types = [(f'http://www.ebi.ac.uk/efo/{efo_id(rng)}', f'{disease_name(rng)} cancer') for _ in range(30)]
+
+    return {
+        'descriptions_file': write_table(
+            os.path.join(directory, 'crispr_descriptions.tsv'), ['efo_id', 'tissue_or_cancer_type', 'method'],
+            ((efo, cancer_type, 'Project Score') for efo, cancer_type in cancer_types)
+        ),
+        'evidence_file': write_table(
+            os.path.join(directory, 'crispr_evidence.tsv'),
+            ['target_id', 'disease_id', 'disease_name', 'score', 'pmid', 'gene_set_name'],
+            (
+                (rng.choice(genes)[2], efo, cancer_type, round(rng.uniform(0, 100), 2), '30971826', '')
+                for _ in range(scale)
+                for efo, cancer_type in [rng.choice(cancer_types)]
+            )
+        ),
+        'cell_types_file': write_table(
+            os.path.join(directory, 'crispr_cell_lines.tsv'), ['Name', 'Tissue', 'Cancer Type'],
+            (
+                (f'CL-{rng.randint(1, 99999)}', cancer_type if rng.random() < 0.5 else 'Other', cancer_type)
+                for _, cancer_type in cancer_types
+                for _ in range(rng.randint(1, 10))
+            )
+        ),
+    }
+
+
+def generate_sysbio(directory, scale, rng):
+    '''SystemsBiology gene set evidence and the study (gene set) descriptions.'''
+    genes = gene_pool(max(100, min(20000, scale // 2)))
+    studies = []
+    for i in range(max(5, scale // 200)):
+        score_type = rng.choice(('p-value', 'rank', 'other'))
+        low, high = (1e-10, 0.05) if score_type == 'p-value' else (1, 500)
+        studies.append((f'GeneSet_{i}', pmid(rng), f'{disease_name(rng)} network analysis', score_type, low, high))
+
+    def score(study):
+        _, _, _, score_type, low, high = study
+        return f'{10 ** rng.uniform(-10, -1.31):.3g}' if score_type == 'p-value' else rng.randint(low, high)
+
+    return {
+        'evidenceFile': write_table(
+            os.path.join(directory, 'sysbio_evidence.tsv'),
+            ['target_id', 'disease_id', 'disease_name', 'gene_set_name', 'pmid', 'score'],
+            (
+                (rng.choice(genes)[2], f'http://www.ebi.ac.uk/efo/{efo_id(rng)}', disease_name(rng), study[0],
+                 study[1], score(study))
+                for _ in range(scale)
+                for study in [rng.choice(studies)]
+            )
+        ),
+        'studyFile': write_table(
+            os.path.join(directory, 'sysbio_publication_info.tsv'),
+            ['gene_set_name', 'pmid', 'method', 'score_type', 'min_score', 'max_score'], studies
+        ),
+    }
+
+
+GENERATORS = {
+    'PheWAS': generate_phewas,
+    'PanelApp': generate_panelapp,
+    'Gene2Phenotype': generate_gene2phenotype,
+    'Orphanet': generate_orphanet,
+    'EPMC': generate_epmc,
+    'GeneticsPortal': generate_genetics_portal,
+    'PhenoDigm': generate_phenodigm,
+    'CRISPR': generate_crispr,
+    'SysBio': generate_sysbio,
+}
+
+
+def generate(source, directory, scale, seed=42):
+    '''
+    Writes the synthetic inputs of a parser.
+
+    Args:
+        source (str): One of `SOURCES`
+        directory (str): Output directory, created if needed
+        scale (int): Number of rows of the main input table
+        seed (int): Seed of the random generator; the same seed and scale give the same inputs
+    Returns:
+        inputs (dict): Paths of the generated inputs, by parser argument
+    '''
+    os.makedirs(directory, exist_ok=True)
+    inputs = GENERATORS[source](directory, scale, random.Random(f'{source}-{seed}'))
+    with open(os.path.join(directory, 'inputs.json'), 'w') as f:
+        json.dump(inputs, f, indent=2)
+    return inputs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates the synthetic inputs of a parser.')
+    parser.add_argument('--source', help='Parser to generate the inputs for.', choices=SOURCES, required=True)
+    parser.add_argument('--output-dir', help='Directory to write the inputs into.', required=True)
+    parser.add_argument('--scale', help='Number of rows of the main input table.', type=int, default=10000)
+    parser.add_argument('--seed', help='Seed of the random generator.', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', stream=sys.stderr)
+    json.dump(generate(args.source, args.output_dir, args.scale, args.seed), sys.stdout, indent=2)
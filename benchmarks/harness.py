@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+'''
+Runs one parser offline, as its command line entry point, on inputs written by `benchmarks.generators`.
+
+The network lookups of the parsers are replaced by local stubs before the parser is loaded:
+- OnToma: `FakeOnToma` answers the lookups of `common.MappingCache.CachedOnToma` deterministically, with an optional
+  latency per call to simulate the remote service.
+- PanelApp API: the requests of `common.HttpClient` are served the panels saved by the generator.
+- HGNC: `Config.GENES_HGNC` points to the generated HGNC set.
+- Any other connection to a remote host fails, so a lookup missed by the stubs cannot silently hit the network.
+  Loopback connections (Spark, Py4J) are allowed.
+
+>>> python -m benchmarks.harness --input-dir /tmp/crispr modules/CRISPR.py -d ... -o /tmp/crispr.json.gz
+'''
+
+import argparse
+import ipaddress
+import json
+import os
+import runpy
+import socket
+import sys
+import time
+import zlib
+
+
+def _draw(term, salt=''):
+    '''Deterministic number in [0, 1) drawn from a term.'''
+    return zlib.crc32(f'{salt}{term}'.lower().encode('utf-8')) / 2 ** 32
+
+
+class _FakeOLS(object):
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def besthit(self, term, exact=False, **kwargs):
+        time.sleep(self.latency)
+        if _draw(term, 'ols') < (0.3 if exact else 0.5):
+            mondo_id = f'MONDO_{zlib.crc32(term.encode("utf-8")) % 10 ** 7:07d}'
+            return {'iri': f'http://purl.obolibrary.org/obo/{mondo_id}', 'label': term}
+        return None
+
+
+class FakeOnToma(object):
+    '''
+    Stand-in for `ontoma.interface.OnToma`: about 70% of the terms are found, and the results have the shape of the
+    OnToma ones. The same term always gets the same result.
+
+    Args:
+        latency (float): Seconds spent in every lookup
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._ols = _FakeOLS(latency)
+
+    def _efo_id(self, term):
+        return f'EFO_{zlib.crc32(str(term).encode("utf-8")) % 10 ** 7:07d}'
+
+    def find_term(self, term, verbose=False, **kwargs):
+        time.sleep(self.latency)
+        draw = _draw(term, 'find_term')
+        if draw >= 0.7:
+            return None
+        url = f'http://www.ebi.ac.uk/efo/{self._efo_id(term)}'
+        if not verbose:
+            return url
+        quality, action = ('match', None) if draw < 0.5 else ('fuzzy', 'check')
+        return {'term': url, 'label': str(term), 'source': 'EFO OBO', 'quality': quality, 'action': action}
+
+    def get_efo_label(self, term):
+        time.sleep(self.latency)
+        return f'Label of {term}'
+
+    def get_efo_from_xref(self, term):
+        time.sleep(self.latency)
+        if _draw(term, 'xref') < 0.4:
+            return [{'id': self._efo_id(term).replace('_', ':'), 'label': f'Label of {term}'}]
+        return None
+
+    def mondo_lookup(self, term):
+        time.sleep(self.latency)
+        if _draw(term, 'mondo') < 0.3:
+            return f'MONDO_{zlib.crc32(term.encode("utf-8")) % 10 ** 7:07d}'
+        raise KeyError(term)
+
+    def get_mondo_label(self, term):
+        time.sleep(self.latency)
+        return f'Label of {term}'
+
+
+class _FakeResponse(object):
+
+    def __init__(self, url, payload):
+        self.url = url
+        self._payload = payload
+        self.status_code = 200 if payload is not None else 404
+
+    def json(self):
+        if self._payload is None:
+            raise ValueError(f'No data for {self.url}')
+        return self._payload
+
+    def raise_for_status(self):
+        if self._payload is None:
+            raise IOError(f'404 Client Error: Not Found for url: {self.url}')
+
+
+def _fake_request(api_directory):
+    '''
+    `requests.Session.request`, used by `common.HttpClient`, serving the PanelApp panels saved by the generator; other
+    URLs are not found.
+    '''
+    def request(session, method, url, *args, **kwargs):
+        payload = None
+        if 'panelapp' in url:
+            filename = os.path.join(api_directory, f'{url.rstrip("/").split("/")[-1]}.json')
+            if os.path.exists(filename):
+                with open(filename) as f:
+                    payload = json.load(f)
+        return _FakeResponse(url, payload)
+    return request
+
+
+def _is_local(address):
+    if not isinstance(address, tuple):
+        return True  # Unix sockets
+    host = address[0]
+    if host in ('localhost', ''):
+        return True
+    try:
+        return ipaddress.ip_address(host.split('%')[0]).is_loopback
+    except ValueError:
+        return False
+
+
+def block_remote_connections():
+    '''Makes the connections to remote hosts fail with an OSError.'''
+    connect, connect_ex = socket.socket.connect, socket.socket.connect_ex
+
+    def guard(address):
+        if not _is_local(address):
+            raise OSError(f'Network access is disabled in the benchmarks: {address}')
+
+    def guarded_connect(self, address):
+        guard(address)
+        return connect(self, address)
+
+    def guarded_connect_ex(self, address):
+        guard(address)
+        return connect_ex(self, address)
+
+    socket.socket.connect, socket.socket.connect_ex = guarded_connect, guarded_connect_ex
+
+
+def install_stubs(inputs, lookup_latency=0.0):
+    '''
+    Replaces the network lookups of the parsers by local stubs.
+
+    Args:
+        inputs (dict): Inputs written by the generator (see `benchmarks.generators.generate`)
+        lookup_latency (float): Seconds spent in every OnToma lookup
+    '''
+    block_remote_connections()
+
+    if 'apiDirectory' in inputs:
+        import requests
+        requests.Session.request = _fake_request(inputs['apiDirectory'])
+
+    from common.MappingCache import CachedOnToma
+    fake_ontoma = FakeOnToma(lookup_latency)
+    CachedOnToma.otmap = property(lambda self: fake_ontoma)
+
+    from settings import Config
+    if 'genesSet' in inputs:
+        Config.GENES_HGNC = inputs['genesSet']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs a parser offline on generated inputs.')
+    parser.add_argument('--input-dir', help='Directory written by benchmarks.generators.', required=True)
+    parser.add_argument('--lookup-latency', help='Seconds spent in every OnToma lookup.', type=float, default=0.0)
+    parser.add_argument('script', help='Parser script to run.')
+    parser.add_argument('arguments', help='Arguments of the parser script.', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.input_dir, 'inputs.json')) as f:
+        install_stubs(json.load(f), args.lookup_latency)
+
+    sys.argv = [args.script] + args.arguments
+    runpy.run_path(args.script, run_name='__main__')
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+'''
+Profiles the start of the parsers: the time spent importing each module before the parser does anything.
+
+Every parser script is started with `--help` in a fresh process with `python -X importtime`, which stops it right after
+its imports and the parsing of its arguments. The best of `--repeat` runs is kept, and the following is reported:
+- `wall_time_s`: time of the process, from start to exit
+- `import_time_s`: time spent in imports, as measured by the interpreter
+- `modules`: import time of each module of the repository (`common`, `settings`, ...) and of each third-party or
+  standard library package (`numpy`, `pyspark`, ...), its submodules included, excluding the time of the modules they
+  import themselves
+- `heavy_imports`: the packages of `HEAVY_PACKAGES` imported, which the parsers only import where they are used
+
+>>> python -m benchmarks.imports --scripts modules/SLAPEnrich.py modules/ClinGen.py --output startup.json
+'''
+
+import argparse
+import collections
+import glob
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages of the repository, whose modules are reported one by one:
+REPOSITORY_PACKAGES = ('benchmarks', 'common', 'modules', 'settings')
+
+# Packages slow to import, or not installed everywhere, which the start of a parser should not pay for:
+HEAVY_PACKAGES = ('jsonschema', 'numpy', 'ontoma', 'pandas', 'pkg_resources', 'pyarrow', 'pyspark', 'requests')
+
+
+def parse_importtime(stderr):
+    '''
+    Parses the `-X importtime` report of a process.
+
+    Args:
+        stderr (str): Standard error of the process
+    Returns:
+        imports (list): (module, self time, cumulative time) of every import, in microseconds, in the report order
+    '''
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, cumulative_time, module = line[len('import time:'):].split('|')
+        if not self_time.strip().isdigit():
+            # Header of the report
+            continue
+        imports.append((module.strip(), int(self_time), int(cumulative_time)))
+    return imports
+
+
+def module_group(module):
+    '''Name under which the import time of a module is reported: itself in the repository, else its top package.'''
+    top_package = module.split('.')[0]
+    return module if top_package in REPOSITORY_PACKAGES else top_package
+
+
+def group_import_times(imports):
+    '''Self time of the imports in seconds by module group (see `module_group`), in decreasing order.'''
+    times = collections.Counter()
+    for module, self_time, _ in imports:
+        times[module_group(module)] += self_time
+    return {group: self_time / 1e6 for group, self_time in times.most_common()}
+
+
+def profile_script(script, repeat=5):
+    '''
+    Starts a parser script with `--help`, `repeat` times, and profiles its imports.
+
+    Returns:
+        result (dict): Measurements of the fastest run
+    '''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPOSITORY_ROOT, os.environ.get('PYTHONPATH')])))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', script, '--help'], cwd=REPOSITORY_ROOT, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+        )
+        wall_time = time.perf_counter() - start
+        if process.returncode != 0:
+            error = [line for line in process.stderr.splitlines() if not line.startswith('import time:')]
+            return {'script': script, 'status': 'failed', 'error': '\n'.join(error[-5:])}
+        if best is None or wall_time < best[0]:
+            best = wall_time, process.stderr
+
+    imports = parse_importtime(best[1])
+    return {
+        'script': script,
+        'status': 'succeeded',
+        'wall_time_s': round(best[0], 4),
+        'import_time_s': round(sum(self_time for _, self_time, _ in imports) / 1e6, 4),
+        'modules': group_import_times(imports),
+        'heavy_imports': sorted({module.split('.')[0] for module, _, _ in imports} & set(HEAVY_PACKAGES)),
+    }
+
+
+def main(scripts, repeat, top, output=None):
+    results = []
+    for script in scripts:
+        result = profile_script(script, repeat)
+        results.append(result)
+        if result['status'] != 'succeeded':
+            logging.error(f'{script}: failed to start:\n{result["error"]}')
+            continue
+        slowest = '\n'.join(
+            f'{seconds * 1000:10.1f} ms  {group}' for group, seconds in list(result['modules'].items())[:top]
+        )
+        logging.info(f'{script}: started in {result["wall_time_s"]:.3f} s, of which {result["import_time_s"]:.3f} s of '
+                     f'imports. Slowest imports:\n{slowest}')
+        if result['heavy_imports']:
+            logging.warning(f'{script}: imports {", ".join(result["heavy_imports"])} before parsing its arguments.')
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'repeat': repeat, 'results': results}, f, indent=2)
+        logging.info(f'Results written to {output}.')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scripts', nargs='+', help='Parser scripts to profile. Defaults to all the modules/*.py.',
+                        default=sorted(os.path.relpath(path, REPOSITORY_ROOT)
+                                       for path in glob.glob(os.path.join(REPOSITORY_ROOT, 'modules', '*.py'))))
+    parser.add_argument('--repeat', type=int, default=5, help='Number of starts of every script, the fastest is kept.')
+    parser.add_argument('--top', type=int, default=15, help='Number of the slowest imports logged for every script.')
+    parser.add_argument('--output', help='JSON file of the results.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    main(args.scripts, args.repeat, args.top, args.output)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+'''
+Benchmarks the parsers offline on synthetic inputs.
+
+For every parser, the inputs are generated at the requested scale (`benchmarks.generators`), then the parser is run
+from its command line entry point in a fresh process with the network lookups stubbed (`benchmarks.harness`). The
+following measurements are written to a JSON results file, updated after every parser:
+- `wall_time_s`: time of the parser process, from start to exit (interpreter start, JVM start and imports included)
+- `records` and `records_per_s`: evidence strings written, and their rate
+- `peak_rss_bytes`: peak resident memory of the parser process and all its children (Spark JVM, Python workers),
+  sampled from /proc every `RSS_SAMPLE_INTERVAL` seconds. Where /proc is not available, the peak of the largest
+  process is used instead.
+
+>>> python -m benchmarks.run --scale 100000 --parsers PheWAS CRISPR --output benchmark_results.json
+'''
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from benchmarks.generators import SOURCES
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RSS_SAMPLE_INTERVAL = 0.05
+
+# Parser script, output name, and the parser arguments built from the generated inputs and the output path:
+Benchmark = namedtuple('Benchmark', ['script', 'output', 'arguments'])
+
+BENCHMARKS = {
+    'PheWAS': Benchmark('modules/PheWAS.py', 'phewas.json.gz', lambda i, o: [
+        '-i', i['inputFile'], '-c', i['consequencesFile'], '-d', i['diseaseMapping'], '-g', i['genesSet'], '-o', o
+    ]),
+    'PanelApp': Benchmark('modules/GenomicsEnglandPanelApp.py', 'genomics_england.json.gz', lambda i, o: [
+        '-i', i['inputFile'], '-o', o, '--local'
+    ]),
+    'Gene2Phenotype': Benchmark('modules/Gene2Phenotype.py', 'gene2phenotype.json.gz', lambda i, o: [
+        '-d', i['dd_panel'], '-e', i['eye_panel'], '-k', i['skin_panel'], '-c', i['cancer_panel'], '-o', o,
+        '--engine', 'pandas'
+    ]),
+    'Orphanet': Benchmark('modules/Orphanet.py', 'orphanet', lambda i, o: [
+        '--input_file', i['inputFile'], '--output_file', o, '--local'
+    ]),
+    'EPMC': Benchmark('modules/EPMC.py', 'epmc', lambda i, o: [
+        '--cooccurrenceFile', i['cooccurrenceFile'], '--outputFile', o, '--local'
+    ]),
+    'GeneticsPortal': Benchmark('modules/GeneticsPortal.py', 'genetics_portal', lambda i, o: [
+        '--locus2gene', i['locus2gene'], '--toploci', i['toploci'], '--study', i['study'],
+        '--variantIndex', i['variantIndex'], '--ecoCodes', i['ecoCodes'], '--outputFile', o, '--threshold', '0.05',
+        '--local'
+    ]),
+    'PhenoDigm': Benchmark('modules/PhenoDigm.py', 'phenodigm.json.gz', lambda i, o: [
+        '--cache-dir', i['cacheDir'], '--output', o, '--use-cached', '--local'
+    ]),
+    'CRISPR': Benchmark('modules/CRISPR.py', 'crispr.json.gz', lambda i, o: [
+        '-d', i['descriptions_file'], '-e', i['evidence_file'], '-c', i['cell_types_file'], '-o', o
+    ]),
+    'SysBio': Benchmark('modules/SystemsBiology.py', 'sysbio.json.gz', lambda i, o: [
+        '-e', i['evidenceFile'], '-s', i['studyFile'], '-o', o
+    ]),
+}
+
+
+def _process_tree(pid):
+    '''Ids of a process and of all its descendants.'''
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _rss(pid):
+    '''Resident memory of a process in bytes, 0 if it has exited.'''
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class PeakMemorySampler(threading.Thread):
+    '''Samples the resident memory of a process tree in the background and keeps its peak.'''
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.peak = max(self.peak, sum(_rss(pid) for pid in _process_tree(self.pid)))
+            self._stopped.wait(RSS_SAMPLE_INTERVAL)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def count_records(path):
+    '''Number of JSON lines in an evidence file, or in the part files of a directory written by Spark.'''
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.startswith('part-')]
+    elif os.path.exists(path):
+        files = [path]
+    else:
+        return 0
+    records = 0
+    for filename in files:
+        with (gzip.open if filename.endswith('.gz') else open)(filename, 'rb') as f:
+            records += sum(1 for line in f if line.strip())
+    return records
+
+
+def _path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def _run(command, log_file, env):
+    '''Runs a command, logging its output into a file. Returns its exit code, wall time and peak memory.'''
+    with open(log_file, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, cwd=REPOSITORY_ROOT, env=env)
+        sampler = PeakMemorySampler(process.pid)
+        sampler.start()
+        return_code = process.wait()
+        wall_time = time.perf_counter() - start
+        sampler.stop()
+
+    # Fall back on the peak of the largest child process where /proc is not available:
+    peak_rss = sampler.peak or resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * (
+        1 if sys.platform == 'darwin' else 1024
+    )
+    return return_code, wall_time, peak_rss
+
+
+def _log_tail(log_file, lines=20):
+    with open(log_file) as f:
+        return ''.join(f.readlines()[-lines:])
+
+
+def run_benchmark(name, work_dir, scale, seed, lookup_latency=0.0):
+    '''
+    Generates the inputs of a parser and runs it.
+
+    Returns:
+        result (dict): Measurements of the run
+    '''
+    benchmark = BENCHMARKS[name]
+    directory = os.path.join(work_dir, name)
+    input_dir, output = os.path.join(directory, 'input'), os.path.join(directory, benchmark.output)
+    os.makedirs(directory, exist_ok=True)
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [REPOSITORY_ROOT, os.environ.get('PYTHONPATH')])),
+        # Every run starts with empty caches, and the stubbed lookups are not rate limited:
+        OT_ONTOMA_CACHE_PATH=os.path.join(directory, 'ontoma_cache.sqlite'),
+        OT_HGNC_INDEX_PATH=os.path.join(directory, 'hgnc_index.bin'),
+        OT_ONTOMA_RATE_LIMIT='0',
+    )
+    result = {'parser': name, 'script': benchmark.script, 'scale': scale, 'seed': seed}
+
+    logging.info(f'{name}: generating the inputs at scale {scale}.')
+    return_code, generation_time, _ = _run(
+        [sys.executable, '-m', 'benchmarks.generators', '--source', name, '--output-dir', input_dir,
+         '--scale', str(scale), '--seed', str(seed)],
+        os.path.join(directory, 'generate.log'), env
+    )
+    if return_code != 0:
+        logging.error(f'{name}: the generation of the inputs has failed, see {directory}/generate.log.')
+        result.update(status='generation_failed', error=_log_tail(os.path.join(directory, 'generate.log')))
+        return result
+    with open(os.path.join(input_dir, 'inputs.json')) as f:
+        inputs = json.load(f)
+    result.update(generation_time_s=round(generation_time, 3), input_bytes=_path_size(input_dir))
+
+    logging.info(f'{name}: running {benchmark.script}.')
+    log_file = os.path.join(directory, 'parser.log')
+    return_code, wall_time, peak_rss = _run(
+        [sys.executable, '-m', 'benchmarks.harness', '--input-dir', input_dir, '--lookup-latency', str(lookup_latency),
+         benchmark.script] + benchmark.arguments(inputs, output),
+        log_file, env
+    )
+    records = count_records(output)
+    result.update(
+        status='ok' if return_code == 0 else 'failed',
+        return_code=return_code,
+        wall_time_s=round(wall_time, 3),
+        records=records,
+        records_per_s=round(records / wall_time, 1) if wall_time else None,
+        peak_rss_bytes=peak_rss,
+        output_bytes=_path_size(output) if os.path.exists(output) else 0,
+    )
+    if return_code != 0:
+        result['error'] = _log_tail(log_file)
+        logging.error(f'{name}: the parser has failed, see {log_file}.')
+    else:
+        logging.info(
+            f'{name}: {records} records in {wall_time:.1f} s, {result["records_per_s"]:,.0f} records/s, '
+            f'peak RSS {peak_rss / 2 ** 20:,.0f} MiB.'
+        )
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY_ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(parsers, scale, seed, output_file, work_dir=None, lookup_latency=0.0):
+    results = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': _git_commit(),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'scale': scale,
+        'seed': seed,
+        'lookup_latency_s': lookup_latency,
+        'results': [],
+    }
+
+    keep_work_dir = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='parser_benchmarks_')
+    try:
+        for name in parsers:
+            results['results'].append(run_benchmark(name, work_dir, scale, seed, lookup_latency))
+            # The results are saved after every parser, so an interrupted run keeps the finished ones:
+            with open(output_file, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        if not keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    logging.info(f'Results saved into {output_file}.')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the parsers offline on synthetic inputs.')
+    parser.add_argument('--parsers', help='Parsers to benchmark.', nargs='+', choices=SOURCES, default=list(SOURCES))
+    parser.add_argument('--scale', help='Number of rows of the main input table of every parser.', type=int,
+                        default=10000)
+    parser.add_argument('--seed', help='Seed of the input generators.', type=int, default=42)
+    parser.add_argument('--output', help='JSON file to write the results into.', default='benchmark_results.json')
+    parser.add_argument('--work-dir', help=(
+        'Directory to keep the generated inputs, outputs and logs in. A temporary directory is used and removed if '
+        'not given.'
+    ))
+    parser.add_argument('--lookup-latency', help='Seconds spent in every stubbed OnToma lookup.', type=float,
+                        default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    main(args.parsers, args.scale, args.seed, os.path.abspath(args.output), args.work_dir, args.lookup_latency)
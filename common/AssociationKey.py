@@ -0,0 +1,42 @@
+'''
+Association key of the evidence strings, on which their uniqueness is checked (see `common/UniquenessCheck.py`) and the
+sharded output is sorted (see `common/ShardedWriter.py`).
+
+This module only depends on the standard library, so that the writers of the parsers do not import numpy.
+'''
+
+import json
+
+# Association key of the evidence strings of every datasource. The evidence strings of the other datasources are
+# compared on all their fields.
+UNIQUE_ASSOCIATION_FIELDS = {
+    'europepmc': ('targetFromSourceId', 'diseaseFromSourceMappedId', 'literature', 'pmcIds'),
+    'genomics_england': ('studyId', 'targetFromSourceId', 'diseaseFromSourceMappedId', 'cohortPhenotypes'),
+    'ot_genetics_portal': ('variantId', 'studyId', 'targetFromSourceId', 'diseaseFromSourceMappedId'),
+    'phewas_catalog': (
+        'diseaseFromSource', 'diseaseFromSourceId', 'diseaseFromSourceMappedId', 'oddsRatio', 'resourceScore',
+        'studyCases', 'targetFromSourceId', 'variantFunctionalConsequenceId', 'variantId', 'variantRsId'
+    ),
+}
+
+
+def association_key(record, fields=None):
+    '''
+    Canonical association key of an evidence string: its datasource and the values of its unique association fields,
+    as JSON. Lists of plain values are compared regardless of their order, as they are built from sets.
+
+    Args:
+        record (dict): Evidence string
+        fields (tuple): Fields of the key. Defaults to the ones of the datasource, or all the fields.
+    Returns:
+        key (bytes)
+    '''
+    datasource = record.get('datasourceId')
+    fields = fields or UNIQUE_ASSOCIATION_FIELDS.get(datasource) or sorted(record)
+    values = []
+    for field in fields:
+        value = record.get(field)
+        if isinstance(value, list) and all(isinstance(v, (str, int, float)) for v in value):
+            value = sorted(value, key=str)
+        values.append(value)
+    return json.dumps([datasource, values], sort_keys=True, separators=(',', ':')).encode('utf-8')
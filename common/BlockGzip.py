@@ -0,0 +1,109 @@
+'''
+Multi-threaded gzip compression.
+
+The data is cut into independent blocks which are compressed on a thread pool (zlib releases the GIL) and written in
+their original order, each of them as a separate gzip member. A concatenation of gzip members is itself a valid gzip
+file, so the output is read by `gzip`, `zcat`, Spark or pandas as a normal `.json.gz` file.
+'''
+
+import collections
+import concurrent.futures
+import shutil
+import struct
+import zlib
+
+from common.Storage import open_uri
+from settings import Config
+
+# Header of a gzip member without file name and with a null timestamp, so that the output is reproducible:
+# magic number, deflate method, no flags, mtime 0, no extra flags, unknown OS.
+GZIP_MEMBER_HEADER = b'\x1f\x8b\x08\x00' + struct.pack('<I', 0) + b'\x00\xff'
+
+
+def compress_block(data, compresslevel):
+    '''Compresses a block of bytes into a complete gzip member.'''
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return b''.join([
+        GZIP_MEMBER_HEADER,
+        compressor.compress(data),
+        compressor.flush(),
+        struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff),
+    ])
+
+
+class ParallelGzipFile(object):
+    '''
+    Binary, write-only file object producing a multi-member gzip file. Blocks are compressed on `threads` threads;
+    at most two blocks per thread are kept in memory at any time.
+
+    Args:
+        filename (str): Name or URI of the output file (see `common.Storage`)
+        threads (int): Number of compression threads. Defaults to `Config.GZIP_THREADS`.
+        block_size (int): Size of the uncompressed blocks in bytes. Defaults to `Config.GZIP_BLOCK_SIZE`.
+        compresslevel (int): zlib compression level
+    '''
+
+    def __init__(self, filename, threads=None, block_size=None, compresslevel=9):
+        self.threads = threads or Config.GZIP_THREADS
+        self.block_size = block_size or Config.GZIP_BLOCK_SIZE
+        self.compresslevel = compresslevel
+        self._file = open_uri(filename, 'wb')
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads)
+        self._pending = collections.deque()
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self._abort(*exc)
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return len(data)
+
+    def _submit(self, block):
+        self._pending.append(self._executor.submit(compress_block, block, self.compresslevel))
+        # Write out the finished blocks in order, so memory does not grow with the file size:
+        while len(self._pending) > 2 * self.threads or (self._pending and self._pending[0].done()):
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._buffer or not self._pending:
+            # An empty input still produces one (empty) gzip member, as `gzip.open` would.
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        while self._pending:
+            self._file.write(self._pending.popleft().result())
+        self._executor.shutdown()
+        self._file.close()
+
+    def _abort(self, *exc):
+        '''
+        Closes the file after an exception without writing the pending blocks, so that a remote output is not
+        published (see `common.Storage`).
+        '''
+        if self._file.closed:
+            return
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._buffer = bytearray()
+        self._executor.shutdown()
+        self._file.__exit__(*exc)
+
+
+def compress_files(input_files, output_file, threads=None, block_size=None):
+    '''Concatenates the given uncompressed files, in order, into one block-compressed gzip file.'''
+    with ParallelGzipFile(output_file, threads, block_size) as out:
+        for input_file in input_files:
+            with open(input_file, 'rb') as f:
+                shutil.copyfileobj(f, out, length=out.block_size)
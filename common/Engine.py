@@ -0,0 +1,280 @@
+'''
+Execution engines for the tabular transformations of the parsers.
+
+The transformations of a parser are written once, as a sequence of calls to the methods of an engine, and can be run
+by either of them:
+- `SparkEngine`: the transformations are run by Spark.
+- `PandasEngine`: the transformations are run in-process with pandas. There is no JVM to start and no Python worker
+  serialization, which makes it the fastest option for inputs of a few MB.
+
+Both engines follow the Spark semantics: values are read as strings, unless the file has a typed input schema (see
+`common.InputSchemas`), empty fields are nulls, null keys never match in
+joins and exploding a null or empty array drops the row. The evidence strings are then built by the same parser
+function and written by the same writer, so both engines produce identical evidence (the order of the lines may
+differ).
+'''
+
+import math
+import os
+import re
+
+from common.EvidenceWriter import prune_evidence, write_evidence_records, write_evidence_strings
+from common.InputCache import read_cache_pandas
+from common.InputSchemas import check_header, fresh_caches, input_schema, pandas_dtypes, read_spark
+from common.Sampling import sample_fraction, sample_pandas, sample_spark
+from common.Storage import is_local, local_input, spark_path
+
+ENGINES = ('spark', 'pandas')
+
+# Python types used by the `cast` method of the engines:
+CAST_TYPES = {'int': int, 'float': float, 'string': str}
+
+# Number of rows of the chunks of the files read by pandas in a sampled run:
+SAMPLE_CHUNK_ROWS = 100000
+
+# Lookup tables read by the engines, shared by the parsers run in the same process (see common/ParserRunner.py):
+_LOOKUPS = {}
+
+
+def _lookup_key(engine_key, path, sep, columns, schema=None):
+    '''Key of a lookup table: the file and its version, and how it is read.'''
+    paths = path if isinstance(path, (list, tuple)) else [path]
+    # The remote files are only identified by their URI:
+    versions = tuple(
+        (os.path.abspath(p), os.path.getsize(p), os.path.getmtime(p)) if is_local(p) else (p,) for p in paths
+    )
+    return engine_key, versions, sep, tuple(columns) if columns else None, schema
+
+
+def get_engine(name, app_name=None, local=False, input_files=None):
+    '''
+    Returns an engine instance.
+
+    Args:
+        name (str): `spark` or `pandas`
+        app_name (str): Name of the Spark application (Spark engine only)
+        local (bool): Whether Spark runs with the local profile (Spark engine only)
+        input_files (list): Input files of the parser, used to size the Spark session (Spark engine only)
+    '''
+    if name == 'spark':
+        from common.SparkSessionFactory import get_spark_session
+        return SparkEngine(get_spark_session(app_name, 'local' if local else 'cluster', input_files))
+    if name == 'pandas':
+        return PandasEngine()
+    raise ValueError(f'Unknown engine: {name}. Available: {", ".join(ENGINES)}.')
+
+
+class SparkEngine(object):
+    name = 'spark'
+
+    def __init__(self, spark):
+        import pyspark.sql.functions as F
+        self.F = F
+        self.spark = spark
+
+    def _col(self, column):
+        return self.F.col(f'`{column}`')
+
+    def read_csv(self, path, sep=',', columns=None, lookup=False, sample=None, schema=None):
+        '''
+        Reads one or more delimited files with a header. All values are read as strings, unless an input `schema` is
+        given: only its columns are then read, with their types (see `common.InputSchemas`), from the Parquet cache
+        of the files when it is fresh. A small `lookup` table is collected once into a local dataframe, shared by all
+        the parsers using the same Spark session. In a sampled run, only the rows whose `sample` key column(s) are
+        sampled are read (see `common.Sampling`).
+        '''
+        if lookup:
+            key = _lookup_key(id(self.spark), path, sep, columns, schema)
+            if key not in _LOOKUPS:
+                df = self.read_csv(path, sep, columns, schema=schema)
+                _LOOKUPS[key] = self.spark.createDataFrame(df.collect(), df.schema)
+            return _LOOKUPS[key]
+        if schema:
+            df = read_spark(self.spark, schema, path, sep)
+        else:
+            paths = [spark_path(p) for p in path] if isinstance(path, (list, tuple)) else spark_path(path)
+            df = self.spark.read.csv(paths, sep=sep, header=True)
+        if sample:
+            df = sample_spark(df, *((sample,) if isinstance(sample, str) else sample))
+        return df.select(*[self._col(c) for c in columns]) if columns else df
+
+    def rename(self, df, mapping):
+        for old, new in mapping.items():
+            df = df.withColumnRenamed(old, new)
+        return df
+
+    def select(self, df, columns):
+        return df.select(*[self._col(c) for c in columns])
+
+    def cast(self, df, column, to_type):
+        spark_type = {'int': 'int', 'float': 'double', 'string': 'string'}[to_type]
+        return df.withColumn(column, self._col(column).cast(spark_type))
+
+    def split(self, df, column, separator, output=None):
+        '''Splits a string column on a literal separator into an array.'''
+        # The separator of `F.split` is a Java regular expression:
+        return df.withColumn(output or column, self.F.split(self._col(column), re.escape(separator)))
+
+    def get_item(self, df, column, index, output):
+        return df.withColumn(output, self._col(column).getItem(index))
+
+    def explode(self, df, column):
+        return df.withColumn(column, self.F.explode(self._col(column)))
+
+    def trim(self, df, column):
+        return df.withColumn(column, self.F.trim(self._col(column)))
+
+    def map_values(self, df, column, mapping, output=None):
+        '''Translates the values of a column with a dictionary; values missing from it become null.'''
+        F = self.F
+        items = [item for pair in mapping.items() for item in pair]
+        mapping_expr = F.create_map([F.lit(x) for x in items])
+        return df.withColumn(output or column, mapping_expr.getItem(self._col(column)))
+
+    def with_constant(self, df, column, value):
+        literal = self.F.lit(value)
+        return df.withColumn(column, literal.cast('string') if value is None else literal)
+
+    def filter_less_than(self, df, column, value):
+        return df.filter(self._col(column) < value)
+
+    def join(self, left, right, on, how='inner'):
+        return left.join(right, on=on, how=how)
+
+    def distinct(self, df, columns):
+        return df.select(*[self._col(c) for c in columns]).distinct()
+
+    def collect(self, df):
+        return [row.asDict(recursive=True) for row in df.collect()]
+
+    def from_records(self, records, columns):
+        '''Creates a table of string columns from a list of dictionaries.'''
+        from pyspark.sql.types import StructType, StructField, StringType
+        schema = StructType([StructField(c, StringType()) for c in columns])
+        return self.spark.createDataFrame([tuple(r.get(c) for c in columns) for r in records], schema=schema)
+
+    def write_evidence(self, df, output_file, parser=None, output_format=None, shard_size=None):
+        return write_evidence_strings(df, output_file, parser, output_format=output_format, shard_size=shard_size)
+
+
+class PandasEngine(object):
+    name = 'pandas'
+
+    def __init__(self):
+        import pandas as pd
+        self.pd = pd
+
+    @staticmethod
+    def _is_null(value):
+        return value is None or (isinstance(value, float) and math.isnan(value))
+
+    def _map(self, series, function):
+        '''Applies a function to the non-null values of a series, keeping nulls as None.'''
+        return series.map(lambda x: None if self._is_null(x) else function(x)).astype(object)
+
+    def read_csv(self, path, sep=',', columns=None, lookup=False, sample=None, schema=None):
+        '''
+        Reads one or more delimited files with a header. All values are read as strings, unless an input `schema` is
+        given: only its columns are then read, with their types (see `common.InputSchemas`), from the Parquet cache
+        of the files when it is fresh. Empty fields are read as nulls. A `lookup` table is read once by all the parsers
+        of the process. In a sampled run, the files are read by chunks, keeping the rows whose `sample` key column(s)
+        are sampled (see `common.Sampling`).
+        '''
+        if lookup:
+            key = _lookup_key(self.name, path, sep, columns, schema)
+            if key not in _LOOKUPS:
+                _LOOKUPS[key] = self.read_csv(path, sep, columns, schema=schema)
+            return _LOOKUPS[key].copy()
+        paths = path if isinstance(path, (list, tuple)) else [path]
+        caches = fresh_caches(schema, paths) if schema else None
+        if caches:
+            # The typed Parquet cache of the files (see common.InputCache):
+            frames = [read_cache_pandas(c, input_schema(schema), pandas_dtypes(schema)) for c in caches]
+            df = self.pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            if sample:
+                df = sample_pandas(df, *((sample,) if isinstance(sample, str) else sample))
+            df = df[columns] if columns else df
+            return df.astype(object).where(df.notna(), None)
+
+        options = dict(sep=sep, header=0, dtype=str, usecols=columns, keep_default_na=False, na_values=[''])
+        if schema:
+            for p in paths:
+                check_header(schema, p, list(self.pd.read_csv(local_input(p), sep=sep, nrows=0).columns))
+            columns = columns or list(input_schema(schema))
+            dtypes = pandas_dtypes(schema)
+            options.update(dtype={column: dtypes[column] for column in columns}, usecols=columns)
+        if sample and sample_fraction() is not None:
+            sample = (sample,) if isinstance(sample, str) else sample
+            frames = [
+                self.pd.concat(
+                    [sample_pandas(chunk, *sample) for chunk in
+                     self.pd.read_csv(local_input(p), chunksize=SAMPLE_CHUNK_ROWS, **options)],
+                    ignore_index=True
+                )
+                for p in paths
+            ]
+        else:
+            frames = [self.pd.read_csv(local_input(p), **options) for p in paths]
+        df = self.pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        df = df[columns] if columns else df
+        return df.astype(object).where(df.notna(), None)
+
+    def rename(self, df, mapping):
+        return df.rename(columns=mapping)
+
+    def select(self, df, columns):
+        return df[list(columns)]
+
+    def cast(self, df, column, to_type):
+        python_type = CAST_TYPES[to_type]
+
+        def convert(value):
+            try:
+                return python_type(float(value)) if to_type == 'int' else python_type(value)
+            except (TypeError, ValueError):
+                return None
+
+        return df.assign(**{column: self._map(df[column], convert)})
+
+    def split(self, df, column, separator, output=None):
+        return df.assign(**{output or column: self._map(df[column], lambda x: x.split(separator))})
+
+    def get_item(self, df, column, index, output):
+        return df.assign(**{output: self._map(df[column], lambda x: x[index] if index < len(x) else None)})
+
+    def explode(self, df, column):
+        # As in Spark, rows with a null or empty array are dropped:
+        df = df[df[column].map(lambda x: not self._is_null(x) and len(x) > 0).astype(bool)]
+        return df.explode(column).reset_index(drop=True)
+
+    def trim(self, df, column):
+        return df.assign(**{column: self._map(df[column], lambda x: x.strip(' '))})
+
+    def map_values(self, df, column, mapping, output=None):
+        return df.assign(**{output or column: self._map(df[column], mapping.get)})
+
+    def with_constant(self, df, column, value):
+        return df.assign(**{column: self.pd.Series([value] * len(df), index=df.index, dtype=object)})
+
+    def filter_less_than(self, df, column, value):
+        return df[df[column].map(lambda x: not self._is_null(x) and x < value).astype(bool)]
+
+    def join(self, left, right, on, how='inner'):
+        keys = [on] if isinstance(on, str) else list(on)
+        # Null keys never match, as in Spark:
+        right = right[right[keys].notna().all(axis=1)]
+        joined = left.merge(right, on=keys, how=how)
+        return joined.astype(object).where(joined.notna(), None)
+
+    def distinct(self, df, columns):
+        return df[list(columns)].drop_duplicates().reset_index(drop=True)
+
+    def collect(self, df):
+        return df.astype(object).where(df.notna(), None).to_dict('records')
+
+    def from_records(self, records, columns):
+        return self.pd.DataFrame([{c: r.get(c) for c in columns} for r in records], columns=columns, dtype=object)
+
+    def write_evidence(self, df, output_file, parser=None, output_format=None, shard_size=None):
+        evidence = (prune_evidence(parser(row) if parser else row) for row in self.collect(df))
+        return write_evidence_records(evidence, output_file, output_format, shard_size=shard_size)
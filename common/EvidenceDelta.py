@@ -0,0 +1,265 @@
+'''
+Delta between two releases of evidence files: the evidence strings added, removed and changed in the new release.
+
+The evidence strings of both releases are matched on their association key (see `common.UniquenessCheck`), and
+compared on a 64-bit digest of their canonical JSON, where the keys of the objects and the items of the lists are
+sorted, so that a different serialisation of the same evidence is not a change. Both releases are read in parallel,
+one process per shard, and reduced to fixed-width entries (key digest, content digest, position), hash-partitioned on
+the key digest and spilled to disk (see `common/HashPartitions.py`). Every partition is then sorted on the key:
+- the keys only found in the new release are added evidence,
+- the keys only found in the old release are removed evidence,
+- the keys of both releases whose evidence strings differ are changed, and their evidence strings in the new release
+  replace all the ones of the old release.
+
+The selected evidence strings are finally copied from the input shards, as they are, into the `added`, `removed` and
+`changed` directories of part files of the output, with a `summary.json` of the counts per datasource.
+
+>>> summary = evidence_delta(['21.04/clingen.json.gz'], ['21.06/clingen.json.gz'], 'delta/clingen')
+>>> summary['datasources']['clingen']['changed']
+12
+'''
+
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from common.HashPartitions import HashPartitions
+from common.SchemaValidation import list_shards
+from common.AssociationKey import association_key
+
+# Entry of an evidence string: the two halves of the digest of its association key, the digest of its content and its
+# position, packed as release (8 bits), shard index (16 bits) and line number (40 bits).
+DELTA_ENTRY = np.dtype([('key_high', '>u8'), ('key_low', '>u8'), ('content', '>u8'), ('position', '<u8')])
+DEFAULT_MEMORY_LIMIT = 512 * 2 ** 20
+
+OLD, NEW = 0, 1
+ADDED, REMOVED, CHANGED = 'added', 'removed', 'changed'
+# Categories of the selected evidence strings, by their code in the selection files:
+CATEGORIES = {1: ADDED, 2: REMOVED, 3: CHANGED}
+LINE_MASK = 0xffffffffff
+
+
+def _canonical(value):
+    '''Value with the lists sorted on the canonical JSON of their items, recursively.'''
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, list):
+        items = [_canonical(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, separators=(',', ':')))
+    return value
+
+
+def content_digest(record):
+    '''
+    Digest of the content of an evidence string, independent of the order of its fields and of the items of its lists.
+
+    Returns:
+        digest (bytes): 8 bytes
+    '''
+    canonical = json.dumps(_canonical(record), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(canonical, digest_size=8).digest()
+
+
+def _open(filename):
+    return gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb')
+
+
+def _hash_shard(task):
+    '''Hashes the evidence strings of a shard into the work directory. Returns the records per datasource.'''
+    release, shard_index, filename, work_dir, memory_limit, fields = task
+    entries = HashPartitions(work_dir, DELTA_ENTRY, memory_limit, name=f'{release}-{shard_index:05d}')
+    records = collections.Counter()
+    with _open(filename) as f:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            record = json.loads(text)
+            records[record.get('datasourceId')] += 1
+            key = hashlib.blake2b(association_key(record, fields), digest_size=16).digest()
+            position = (release << 56) | (shard_index << 40) | line
+            entries.add(key + content_digest(record) + position.to_bytes(8, 'little'))
+    entries.spill()
+    return release, records
+
+
+def _classify(entries):
+    '''
+    Categories of the entries of a partition.
+
+    Returns:
+        codes (numpy.ndarray): Category code of every entry (see `CATEGORIES`), 0 for the unchanged ones
+        entries (numpy.ndarray): Entries, in the order of the codes
+    '''
+    release = (entries['position'] >> 56).astype(np.uint8)
+    order = np.lexsort((entries['content'], release, entries['key_low'], entries['key_high']))
+    entries, release = entries[order], release[order]
+
+    # Groups of entries sharing a key, and their number of old and new entries:
+    new_key = np.ones(len(entries), dtype=bool)
+    new_key[1:] = (
+        (entries['key_high'][1:] != entries['key_high'][:-1]) | (entries['key_low'][1:] != entries['key_low'][:-1])
+    )
+    starts = np.flatnonzero(new_key)
+    group = np.cumsum(new_key) - 1
+    new_count = np.add.reduceat(release.astype(np.int64), starts)
+    old_count = np.diff(np.append(starts, len(entries))) - new_count
+
+    # The groups with as many old as new entries are unchanged when their sorted contents are the same:
+    changed = (old_count > 0) & (new_count > 0) & (old_count != new_count)
+    candidates = (old_count == new_count) & (old_count > 0)
+    old_entries = np.flatnonzero((release == OLD) & candidates[group])
+    differs = entries['content'][old_entries] != entries['content'][old_entries + old_count[group[old_entries]]]
+    changed |= np.bincount(group[old_entries], weights=differs, minlength=len(starts)) > 0
+
+    codes = np.zeros(len(entries), dtype=np.uint64)
+    codes[(release == NEW) & (old_count[group] == 0)] = 1
+    codes[(release == OLD) & (new_count[group] == 0)] = 2
+    codes[(release == NEW) & changed[group]] = 3
+    return codes, entries
+
+
+def _select(entries, selection_dir):
+    '''Appends the lines of the selected entries of a partition to the selection files of their shards.'''
+    codes, entries = _classify(entries)
+    selected = codes > 0
+    codes, positions = codes[selected], entries['position'][selected]
+    shards = positions >> 40
+    values = (codes << np.uint64(56)) | (positions & np.uint64(LINE_MASK))
+    for shard in np.unique(shards):
+        with open(os.path.join(selection_dir, f'{int(shard) >> 16}-{int(shard) & 0xffff:05d}.bin'), 'ab') as f:
+            f.write(values[shards == shard].astype('<u8').tobytes())
+
+
+def _extract_shard(task):
+    '''Copies the selected lines of a shard into the part files of their category. Returns the counts per category.'''
+    filename, selection_file, shard_index, output_dir = task
+    categories = {int(v) & LINE_MASK: CATEGORIES[int(v) >> 56] for v in np.fromfile(selection_file, dtype='<u8')}
+    wanted = sorted(categories)
+    counts = collections.defaultdict(collections.Counter)
+    outputs = {}
+    try:
+        with _open(filename) as f:
+            next_index = 0
+            for line, text in enumerate(f, 1):
+                if next_index >= len(wanted):
+                    break
+                if line != wanted[next_index]:
+                    continue
+                next_index += 1
+                category = categories[line]
+                if category not in outputs:
+                    outputs[category] = gzip.open(
+                        os.path.join(output_dir, category, f'part-{shard_index:05d}.json.gz'), 'wb'
+                    )
+                outputs[category].write(text if text.endswith(b'\n') else text + b'\n')
+                counts[category][json.loads(text).get('datasourceId')] += 1
+    finally:
+        for output in outputs.values():
+            output.close()
+    return counts
+
+
+def _run(executor, function, tasks, processes):
+    '''Runs the tasks on the pool, with at most two pending tasks per process. Yields their results.'''
+    pending = collections.deque()
+    for task in tasks:
+        if len(pending) >= 2 * processes:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, task))
+    while pending:
+        yield pending.popleft().result()
+
+
+def evidence_delta(old_paths, new_paths, output_dir, fields=None, processes=None, memory_limit=DEFAULT_MEMORY_LIMIT,
+                   temp_dir=None):
+    '''
+    Writes the evidence strings added, removed and changed between two releases.
+
+    Args:
+        old_paths (list): Evidence files of the old release, or directories of part files
+        new_paths (list): Evidence files of the new release, or directories of part files
+        output_dir (str): Directory of the `added`, `removed` and `changed` part files, and of `summary.json`
+        fields (tuple): Fields of the association key of all the datasources. Defaults to the unique association fields
+            of each datasource, or all the fields (see `common.UniquenessCheck.association_key`).
+        processes (int): Number of reading processes. Defaults to the number of CPUs.
+        memory_limit (int): Size in bytes of the entries kept in memory, shared by the processes
+        temp_dir (str): Directory of the spilled partitions. Defaults to the system temporary directory.
+    Returns:
+        summary (dict): Records, added, removed, changed and unchanged evidence strings per datasource
+    '''
+    shards = {OLD: list_shards(old_paths), NEW: list_shards(new_paths)}
+    for release_shards in shards.values():
+        if len(release_shards) > 0xffff:
+            raise ValueError(f'At most {0xffff + 1} files per release can be compared, {len(release_shards)} given.')
+    processes = processes or os.cpu_count()
+    for category in CATEGORIES.values():
+        shutil.rmtree(os.path.join(output_dir, category), ignore_errors=True)
+        os.makedirs(os.path.join(output_dir, category))
+
+    records = {OLD: collections.Counter(), NEW: collections.Counter()}
+    counts = collections.defaultdict(collections.Counter)
+    work_dir = tempfile.mkdtemp(prefix='delta_', dir=temp_dir)
+    try:
+        entries_dir, selection_dir = os.path.join(work_dir, 'entries'), os.path.join(work_dir, 'selection')
+        os.makedirs(selection_dir)
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            tasks = (
+                (release, shard_index, filename, entries_dir, max(memory_limit // processes, 2 ** 20), fields)
+                for release, release_shards in shards.items() for shard_index, filename in enumerate(release_shards)
+            )
+            for release, shard_records in _run(executor, _hash_shard, tasks, processes):
+                records[release].update(shard_records)
+            logging.info(
+                f'{sum(records[OLD].values())} old and {sum(records[NEW].values())} new evidence strings hashed.'
+            )
+
+            for partition in HashPartitions(entries_dir, DELTA_ENTRY, memory_limit).partitions():
+                _select(partition, selection_dir)
+
+            tasks = []
+            for selection in sorted(os.listdir(selection_dir)):
+                release, shard_index = (int(part) for part in selection[:-len('.bin')].split('-'))
+                tasks.append((
+                    shards[release][shard_index], os.path.join(selection_dir, selection), shard_index, output_dir
+                ))
+            for shard_counts in _run(executor, _extract_shard, tasks, processes):
+                for category, datasource_counts in shard_counts.items():
+                    counts[category].update(datasource_counts)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    datasources = sorted(set(records[OLD]) | set(records[NEW]), key=str)
+    summary = {
+        'old': list(map(str, shards[OLD])),
+        'new': list(map(str, shards[NEW])),
+        'datasources': {
+            str(name): {
+                'old_records': records[OLD][name],
+                'new_records': records[NEW][name],
+                ADDED: counts[ADDED][name],
+                REMOVED: counts[REMOVED][name],
+                CHANGED: counts[CHANGED][name],
+                'unchanged': records[NEW][name] - counts[ADDED][name] - counts[CHANGED][name],
+            }
+            for name in datasources
+        },
+    }
+    for category in CATEGORIES.values():
+        summary[category] = sum(counts[category].values())
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    for name, datasource in summary['datasources'].items():
+        logging.info(
+            f'{name}: {datasource[ADDED]} added, {datasource[REMOVED]} removed, {datasource[CHANGED]} changed and '
+            f'{datasource["unchanged"]} unchanged evidence strings.'
+        )
+    return summary
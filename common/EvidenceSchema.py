@@ -0,0 +1,233 @@
+'''
+Explicit nested schema of the evidence strings, for the columnar (Parquet) outputs of the parsers.
+
+The schema is the union of the fields written by all the parsers, so that the evidence of every datasource has the
+same columns and can be loaded together; the fields which a datasource does not use are null. It is described with
+plain Python values, from which the Spark and the Arrow schemas are built:
+- a type name (`STRING`, `DOUBLE`, `LONG`, `BOOLEAN`),
+- a list of one type for an array of that type,
+- a dictionary of field names and types for a struct.
+
+A field written by a parser but missing from the schema is an error, so that the schema follows the evidence.
+'''
+
+STRING, DOUBLE, LONG, BOOLEAN = 'string', 'double', 'long', 'boolean'
+
+# Names of the types in the Spark SQL expressions:
+SQL_TYPES = {STRING: 'string', DOUBLE: 'double', LONG: 'bigint', BOOLEAN: 'boolean'}
+
+# Python types of the values, applied to the evidence strings built by the parsers:
+PYTHON_TYPES = {STRING: str, DOUBLE: float, LONG: int, BOOLEAN: bool}
+
+EVIDENCE_FIELDS = {
+    'datasourceId': STRING,
+    'datatypeId': STRING,
+    'targetFromSource': STRING,
+    'targetFromSourceId': STRING,
+    'targetInModel': STRING,
+    'targetInModelId': STRING,
+    'diseaseFromSource': STRING,
+    'diseaseFromSourceId': STRING,
+    'diseaseFromSourceMappedId': STRING,
+    'diseaseCellLines': [STRING],
+    'resourceScore': DOUBLE,
+    'confidence': STRING,
+    'allelicRequirements': [STRING],
+    'alleleOrigins': [STRING],
+    'literature': [STRING],
+    'pmcIds': [STRING],
+    'textMiningSentences': [{
+        'text': STRING,
+        'tStart': LONG,
+        'tEnd': LONG,
+        'dStart': LONG,
+        'dEnd': LONG,
+        'section': STRING,
+    }],
+    'publicationFirstAuthor': STRING,
+    'publicationYear': LONG,
+    'studyId': STRING,
+    'studyOverview': STRING,
+    'studyCases': LONG,
+    'studySampleSize': LONG,
+    'cohortId': STRING,
+    'cohortShortName': STRING,
+    'cohortDescription': STRING,
+    'cohortPhenotypes': [STRING],
+    'significantDriverMethods': [STRING],
+    'mutatedSamples': [{
+        'functionalConsequenceId': STRING,
+        'numberMutatedSamples': LONG,
+        'numberSamplesTested': LONG,
+    }],
+    'pathways': [{
+        'id': STRING,
+        'name': STRING,
+    }],
+    'variantId': STRING,
+    'variantRsId': STRING,
+    'variantFunctionalConsequenceId': STRING,
+    'oddsRatio': DOUBLE,
+    'oddsRatioConfidenceIntervalLower': DOUBLE,
+    'oddsRatioConfidenceIntervalUpper': DOUBLE,
+    'beta': DOUBLE,
+    'betaConfidenceIntervalLower': DOUBLE,
+    'betaConfidenceIntervalUpper': DOUBLE,
+    'pValueMantissa': DOUBLE,
+    'pValueExponent': LONG,
+    'biologicalModelAllelicComposition': STRING,
+    'biologicalModelGeneticBackground': STRING,
+    'biologicalModelId': STRING,
+    'diseaseModelAssociatedHumanPhenotypes': [{
+        'id': STRING,
+        'label': STRING,
+    }],
+    'diseaseModelAssociatedModelPhenotypes': [{
+        'id': STRING,
+        'label': STRING,
+    }],
+    'urls': [{
+        'niceName': STRING,
+        'url': STRING,
+    }],
+}
+
+
+def sql_type(field_type):
+    '''Spark SQL name of a field type, e.g. `array<struct<id:string,name:string>>`.'''
+    if isinstance(field_type, list):
+        return f'array<{sql_type(field_type[0])}>'
+    if isinstance(field_type, dict):
+        return 'struct<' + ','.join(f'{name}:{sql_type(t)}' for name, t in field_type.items()) + '>'
+    return SQL_TYPES[field_type]
+
+
+def arrow_type(field_type):
+    '''Arrow type of a field type.'''
+    import pyarrow as pa
+    if isinstance(field_type, list):
+        return pa.list_(arrow_type(field_type[0]))
+    if isinstance(field_type, dict):
+        return pa.struct([pa.field(name, arrow_type(t)) for name, t in field_type.items()])
+    return {STRING: pa.string(), DOUBLE: pa.float64(), LONG: pa.int64(), BOOLEAN: pa.bool_()}[field_type]
+
+
+def arrow_schema(fields=None):
+    '''Arrow schema of the evidence strings.'''
+    import pyarrow as pa
+    return pa.schema([pa.field(name, arrow_type(t)) for name, t in (fields or EVIDENCE_FIELDS).items()])
+
+
+def spark_schema(fields=None):
+    '''Spark schema of the evidence strings.'''
+    from pyspark.sql.types import StructType
+    return StructType.fromJson({
+        'type': 'struct',
+        'fields': [
+            {'name': name, 'type': _spark_json_type(t), 'nullable': True, 'metadata': {}}
+            for name, t in (fields or EVIDENCE_FIELDS).items()
+        ],
+    })
+
+
+def _spark_json_type(field_type):
+    if isinstance(field_type, list):
+        return {'type': 'array', 'elementType': _spark_json_type(field_type[0]), 'containsNull': True}
+    if isinstance(field_type, dict):
+        return {
+            'type': 'struct',
+            'fields': [
+                {'name': name, 'type': _spark_json_type(t), 'nullable': True, 'metadata': {}}
+                for name, t in field_type.items()
+            ],
+        }
+    return SQL_TYPES[field_type].replace('bigint', 'long')
+
+
+def _unknown_fields(names, fields, path):
+    unknown = sorted(set(names) - set(fields))
+    if unknown:
+        raise ValueError(
+            f'Evidence fields missing from the evidence schema (common/EvidenceSchema.py): '
+            f'{", ".join(path + name for name in unknown)}.'
+        )
+
+
+def conform_record(record, fields=None, path=''):
+    '''
+    Converts the values of an evidence string into the Python types of the schema, e.g. the numpy numbers of pandas
+    into floats and ints.
+
+    Args:
+        record (dict): Evidence string
+        fields (dict): Schema of the record. Defaults to `EVIDENCE_FIELDS`.
+    Returns:
+        record (dict)
+    Raises:
+        ValueError: when the record has a field which is not in the schema
+    '''
+    fields = fields or EVIDENCE_FIELDS
+    _unknown_fields(record, fields, path)
+    return {name: _conform_value(value, fields[name], f'{path}{name}.') for name, value in record.items()}
+
+
+def _conform_value(value, field_type, path):
+    if value is None:
+        return None
+    if isinstance(field_type, list):
+        return [_conform_value(item, field_type[0], path) for item in value]
+    if isinstance(field_type, dict):
+        return conform_record(value, field_type, path)
+    return PYTHON_TYPES[field_type](value)
+
+
+def _spark_fields(struct_type):
+    # Spark resolves the column names regardless of their case:
+    return {field.name.lower(): field.dataType for field in struct_type.fields}
+
+
+def _conform_expression(expression, source_type, field_type, depth=0):
+    '''Spark SQL expression converting a column of the given Spark type into a field type of the schema.'''
+    from pyspark.sql.types import ArrayType, StructType
+
+    if source_type is None:
+        return f'CAST(NULL AS {sql_type(field_type)})'
+    if isinstance(field_type, list):
+        if not isinstance(source_type, ArrayType):
+            raise ValueError(f'{expression} is a {source_type.simpleString()}, not an array.')
+        variable = f'x{depth}'
+        element = _conform_expression(variable, source_type.elementType, field_type[0], depth + 1)
+        return f'transform({expression}, {variable} -> {element})'
+    if isinstance(field_type, dict):
+        if not isinstance(source_type, StructType):
+            raise ValueError(f'{expression} is a {source_type.simpleString()}, not a struct.')
+        source_fields = _spark_fields(source_type)
+        _unknown_fields(source_fields, {name.lower() for name in field_type}, f'{expression}.')
+        members = ', '.join(
+            f"'{name}', {_conform_expression(f'{expression}.`{name}`', source_fields.get(name.lower()), t, depth)}"
+            for name, t in field_type.items()
+        )
+        return f'IF({expression} IS NULL, NULL, named_struct({members}))'
+    return f'CAST({expression} AS {SQL_TYPES[field_type]})'
+
+
+def conform_dataframe(dataframe, fields=None):
+    '''
+    Selects the columns of a Spark dataframe of evidence strings in the schema: in its order, with its types, and with
+    the fields missing from the dataframe as nulls.
+
+    Args:
+        dataframe (pyspark.sql.DataFrame): Evidence strings
+        fields (dict): Schema of the evidence. Defaults to `EVIDENCE_FIELDS`.
+    Returns:
+        dataframe (pyspark.sql.DataFrame)
+    Raises:
+        ValueError: when the dataframe has a column which is not in the schema
+    '''
+    fields = fields or EVIDENCE_FIELDS
+    source_fields = _spark_fields(dataframe.schema)
+    _unknown_fields(source_fields, {name.lower() for name in fields}, '')
+    return dataframe.selectExpr(*[
+        f'{_conform_expression(f"`{name}`", source_fields.get(name.lower()), t)} AS `{name}`'
+        for name, t in fields.items()
+    ])
@@ -0,0 +1,160 @@
+import contextlib
+import logging
+
+from common.EvidenceSchema import conform_record, spark_schema
+from common.JsonWriter import JsonLinesWriter, get_encoder
+from common.ParquetWriter import JSON, PARQUET, ParquetEvidenceWriter, output_formats, parquet_path, write_spark_parquet
+from common.ShardedWriter import ShardedJsonWriter, write_spark_shards
+from settings import Config
+
+
+def prune_evidence(evidence):
+    '''
+    Recursively removes the keys of an evidence string that carry no information: null values, empty strings and
+    empty lists/objects. Null items are also dropped from lists, so that e.g. `[None]` is removed altogether.
+
+    Args:
+        evidence (dict): Evidence string as returned by a parser
+    Returns:
+        evidence (dict): The same object without the empty keys
+    '''
+    if isinstance(evidence, dict):
+        pruned = {}
+        for key, value in evidence.items():
+            value = prune_evidence(value)
+            if value is None or value == '' or value == [] or value == {}:
+                continue
+            pruned[key] = value
+        return pruned
+
+    if isinstance(evidence, (list, tuple)):
+        return [prune_evidence(item) for item in evidence if item is not None]
+
+    return evidence
+
+
+def _serialize_partition(parser, backend):
+    '''
+    Returns a function that turns an iterator of Spark rows into an iterator of serialized, pruned evidence strings.
+    The work is done on the executors, so the driver only receives ready-to-write bytes.
+    '''
+    def serialize(rows):
+        encoder = get_encoder(backend)
+        for row in rows:
+            evidence = parser(row) if parser else row.asDict(recursive=True)
+            yield encoder.encode(prune_evidence(evidence))
+    return serialize
+
+
+def _build_partition(parser):
+    '''
+    Returns a function that turns an iterator of Spark rows into an iterator of pruned evidence dictionaries, with the
+    types of the evidence schema.
+    '''
+    def build(rows):
+        for row in rows:
+            evidence = parser(row) if parser else row.asDict(recursive=True)
+            yield conform_record(prune_evidence(evidence))
+    return build
+
+
+def _shard_size(shard_size):
+    '''Target size of the JSON shards in bytes, `Config.SHARD_SIZE` (in MiB) when not given.'''
+    return Config.SHARD_SIZE * 2 ** 20 if shard_size is None else shard_size
+
+
+def write_evidence_strings(dataframe, output_file, parser=None, backend=None, threads=None, block_size=None,
+                           output_format=None, shard_size=None):
+    '''
+    Streams the evidence of a Spark dataframe into a gzipped JSON lines file, and/or writes it as Parquet.
+
+    The evidence strings are built, pruned and serialized on the executors. The driver then pulls one partition at a
+    time with `toLocalIterator`, so its peak memory is bounded by the largest partition instead of the whole output.
+    The Parquet output is written by the executors with the evidence schema, next to the JSON file (see
+    `common.ParquetWriter`). With a shard size, the JSON output is instead a directory of sorted shards with a
+    manifest (see `common.ShardedWriter`).
+
+    Args:
+        dataframe (pyspark.sql.DataFrame): Final dataframe of the parser
+        output_file (str): Name of the gzipped JSON lines output file
+        parser (callable): Optional function building an evidence dictionary out of a row. When not given, the row
+            is converted to a dictionary as it is.
+        backend (str): JSON encoder backend, see `common.JsonWriter`.
+        threads (int): Number of gzip compression threads, see `common.BlockGzip`.
+        block_size (int): Size of the independently compressed blocks when using more than one thread.
+        output_format (str): `json`, `parquet` or `both`. Defaults to `Config.OUTPUT_FORMAT`.
+        shard_size (int): Target size of the JSON shards, in bytes of uncompressed JSON lines. Defaults to
+            `Config.SHARD_SIZE`, no sharding when 0.
+    Returns:
+        count (int): Number of evidence strings written
+    '''
+    formats = output_formats(output_format)
+    shard_size = _shard_size(shard_size)
+    if len(formats) > 1:
+        # Both outputs are built from the same rows:
+        dataframe = dataframe.persist()
+
+    count = None
+    if PARQUET in formats:
+        evidence = dataframe.rdd.mapPartitions(_build_partition(parser))
+        count = write_spark_parquet(
+            dataframe.sql_ctx.sparkSession.createDataFrame(evidence, schema=spark_schema()),
+            parquet_path(output_file), count=JSON not in formats
+        )
+
+    if JSON in formats and shard_size:
+        count = write_spark_shards(dataframe, output_file, shard_size, parser, backend)
+    elif JSON in formats:
+        # The backend is resolved on the driver so that the executors use the same one:
+        backend = get_encoder(backend).name
+        serialized_evidence = dataframe.rdd.mapPartitions(_serialize_partition(parser, backend))
+
+        with JsonLinesWriter(output_file, backend, threads=threads, block_size=block_size) as writer:
+            for evidence in serialized_evidence.toLocalIterator():
+                writer.write_encoded(evidence)
+
+        logging.info(f'{writer.count} evidence strings saved into {output_file}.')
+        count = writer.count
+
+    if len(formats) > 1:
+        dataframe.unpersist()
+    return count
+
+
+def write_evidence_records(records, output_file, output_format=None, backend=None, threads=None, block_size=None,
+                           shard_size=None):
+    '''
+    Writes evidence dictionaries into a gzipped JSON lines file (or a directory of sorted shards), and/or into a
+    Parquet file next to it, in one pass.
+
+    Args:
+        records (iterable): Evidence strings, already pruned
+        output_file (str): Name of the gzipped JSON lines output file
+        output_format (str): `json`, `parquet` or `both`. Defaults to `Config.OUTPUT_FORMAT`.
+        backend (str): JSON encoder backend, see `common.JsonWriter`.
+        threads (int): Number of gzip compression threads, see `common.BlockGzip`.
+        block_size (int): Size of the independently compressed blocks when using more than one thread.
+        shard_size (int): Target size of the JSON shards, in bytes of uncompressed JSON lines. Defaults to
+            `Config.SHARD_SIZE`, no sharding when 0.
+    Returns:
+        count (int): Number of evidence strings written
+    '''
+    formats = output_formats(output_format)
+    shard_size = _shard_size(shard_size)
+    writers = []
+    with contextlib.ExitStack() as stack:
+        if JSON in formats and shard_size:
+            writers.append(stack.enter_context(ShardedJsonWriter(output_file, shard_size, backend)))
+        elif JSON in formats:
+            writers.append(stack.enter_context(
+                JsonLinesWriter(output_file, backend, threads=threads, block_size=block_size)
+            ))
+        if PARQUET in formats:
+            writers.append(stack.enter_context(ParquetEvidenceWriter(parquet_path(output_file))))
+        for record in records:
+            for writer in writers:
+                writer.write(record)
+
+    for writer in writers:
+        logging.info(f'{writer.count} evidence strings saved into {writer.filename}.')
+    return writers[0].count
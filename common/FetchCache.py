@@ -0,0 +1,254 @@
+'''
+Local content-addressed store of the input files of the parsers, used by the `fetch*` rules of the Snakefile.
+
+The dated input files of a run (`tmp/ClinGen-Gene-Disease-Summary-2021-03-01.csv`, ...) are hard links to the objects
+of the store, which are named after the SHA-256 of their content:
+
+    store/
+    ├── objects/3f/3f5a...       content of a file, read-only
+    └── sources/a1/a1b2....json  last version of a source: its validators and the digest of its content
+
+A source is only transferred again when it has changed:
+- HTTP(S) sources are requested with `If-None-Match`/`If-Modified-Since` from the ETag and Last-Modified of the last
+  version, and a `304 Not Modified` reuses its object,
+- Google Cloud Storage objects are compared by generation and MD5 before being downloaded, and their MD5 is verified
+  after the download. A `gs://` prefix which is not an object is fetched as a directory of objects,
+- local files are copied into the store.
+
+When a source has changed but its content is the same (a new upload of the same file), the existing object is reused.
+'''
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from common.HttpClient import get
+from settings import Config
+
+try:
+    from google.cloud import storage
+except ImportError:
+    storage = None
+
+# Statuses of a fetched file:
+CACHED = 'cached'          # the source was not modified, nothing was transferred
+UNCHANGED = 'unchanged'    # the source was transferred, with the same content as an object of the store
+DOWNLOADED = 'downloaded'  # new content
+
+CHUNK_SIZE = 8 * 2 ** 20
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _hex_md5(md5):
+    '''Hexadecimal form of a base64 MD5 (Content-MD5 header, Cloud Storage metadata).'''
+    return base64.b64decode(md5).hex() if md5 else None
+
+
+class _HashingWriter(object):
+    '''Binary file wrapper computing the SHA-256 and MD5 of the data written through it.'''
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256, self.md5 = hashlib.sha256(), hashlib.md5()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.md5.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+
+class ContentStore(object):
+    '''
+    Store of files named after the SHA-256 of their content, with the last known version of each source.
+
+    Args:
+        directory (str): Directory of the store. Defaults to `Config.FETCH_CACHE_PATH`.
+    '''
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.FETCH_CACHE_PATH
+        for subdirectory in ('objects', 'sources', 'tmp'):
+            os.makedirs(os.path.join(self.directory, subdirectory), exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def has(self, digest):
+        return digest is not None and os.path.isfile(self.object_path(digest))
+
+    def _source_path(self, source):
+        digest = _digest(source)
+        return os.path.join(self.directory, 'sources', digest[:2], f'{digest}.json')
+
+    def get_source(self, source):
+        '''Last known version of a source, if its object is still in the store.'''
+        try:
+            with open(self._source_path(source)) as source_file:
+                version = json.load(source_file)
+        except (OSError, ValueError):
+            return {}
+        return version if self.has(version.get('sha256')) else {}
+
+    def set_source(self, source, version):
+        path = self._source_path(source)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=os.path.join(self.directory, 'tmp'), delete=False) as temp_file:
+            json.dump(dict(version, source=source), temp_file, indent=2, sort_keys=True)
+        os.replace(temp_file.name, path)
+
+    def add(self, write, md5=None):
+        '''
+        Writes a file into the store.
+
+        Args:
+            write (callable): Function writing the content of the file into the binary file object it is given
+            md5 (str): Expected MD5 of the content, in hexadecimal, verified before it is added
+        Returns:
+            sha256 (str), md5 (str), size (int), new (bool): the digests and size of the content, and whether it was
+                not in the store yet
+        '''
+        with tempfile.NamedTemporaryFile('wb', dir=os.path.join(self.directory, 'tmp'), delete=False) as temp_file:
+            writer = _HashingWriter(temp_file)
+            try:
+                write(writer)
+            except BaseException:
+                temp_file.close()
+                os.remove(temp_file.name)
+                raise
+
+        if md5 and writer.md5.hexdigest() != md5:
+            os.remove(temp_file.name)
+            raise IOError(f'The MD5 checksum of the content is {writer.md5.hexdigest()} instead of {md5}.')
+        digest = writer.sha256.hexdigest()
+        if self.has(digest):
+            os.remove(temp_file.name)
+            return digest, writer.md5.hexdigest(), writer.size, False
+        os.makedirs(os.path.dirname(self.object_path(digest)), exist_ok=True)
+        # Objects are shared by the hard links of every run, which must not modify them:
+        os.chmod(temp_file.name, 0o444)
+        os.replace(temp_file.name, self.object_path(digest))
+        return digest, writer.md5.hexdigest(), writer.size, True
+
+    def materialize(self, digest, destination):
+        '''Links an object to a destination file, or copies it when the store is on another file system.'''
+        os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+        if os.path.lexists(destination):
+            os.remove(destination)
+        try:
+            os.link(self.object_path(digest), destination)
+        except OSError:
+            shutil.copyfile(self.object_path(digest), destination)
+
+
+def _fetch_http(store, url, destination):
+    version = store.get_source(url)
+    headers = {}
+    if version.get('etag'):
+        headers['If-None-Match'] = version['etag']
+    if version.get('lastModified'):
+        headers['If-Modified-Since'] = version['lastModified']
+
+    with get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304 and version:
+            store.materialize(version['sha256'], destination)
+            return CACHED, 0
+        response.raise_for_status()
+        sha256, _, size, new = store.add(
+            lambda writer: [writer.write(chunk) for chunk in response.iter_content(CHUNK_SIZE)],
+            md5=_hex_md5(response.headers.get('Content-MD5'))
+        )
+        store.set_source(url, {
+            'etag': response.headers.get('ETag'),
+            'lastModified': response.headers.get('Last-Modified'),
+            'sha256': sha256,
+            'size': size,
+        })
+
+    store.materialize(sha256, destination)
+    return DOWNLOADED if new else UNCHANGED, size
+
+
+def _fetch_gcs_blob(store, blob, destination):
+    source = f'gs://{blob.bucket.name}/{blob.name}'
+    version = store.get_source(source)
+    if version and version.get('generation') == blob.generation and version.get('md5') == blob.md5_hash:
+        store.materialize(version['sha256'], destination)
+        return CACHED, 0
+
+    # The blob has the generation which was compared, so that one is downloaded. Its MD5 is verified, except for the
+    # composite objects which only have a CRC32C:
+    sha256, _, size, new = store.add(blob.download_to_file, md5=_hex_md5(blob.md5_hash))
+    store.set_source(source, {'generation': blob.generation, 'md5': blob.md5_hash, 'sha256': sha256, 'size': size})
+    store.materialize(sha256, destination)
+    return DOWNLOADED if new else UNCHANGED, size
+
+
+def _fetch_gcs(store, url, destination):
+    if storage is None:
+        raise ImportError('Fetching gs:// sources requires the google-cloud-storage package.')
+    bucket_name, _, name = url[len('gs://'):].partition('/')
+    bucket = storage.Client().bucket(bucket_name)
+
+    blob = bucket.get_blob(name) if name else None
+    if blob is not None:
+        return [(destination, *_fetch_gcs_blob(store, blob, destination))]
+
+    # A prefix is fetched as a directory, with the paths of its objects relative to the prefix:
+    prefix = name.rstrip('/') + '/' if name else ''
+    fetched = []
+    for blob in bucket.list_blobs(prefix=prefix):
+        if blob.name.endswith('/'):
+            continue
+        target = os.path.join(destination, *blob.name[len(prefix):].split('/'))
+        fetched.append((target, *_fetch_gcs_blob(store, blob, target)))
+    if not fetched:
+        raise FileNotFoundError(f'No object found at {url}.')
+    return fetched
+
+
+def _fetch_local(store, path, destination):
+    def copy(writer):
+        with open(path, 'rb') as local_file:
+            shutil.copyfileobj(local_file, writer, CHUNK_SIZE)
+
+    sha256, _, size, new = store.add(copy)
+    store.materialize(sha256, destination)
+    return DOWNLOADED if new else UNCHANGED, 0
+
+
+def fetch(source, destination, store=None):
+    '''
+    Fetches a source into a destination file (or directory, for a `gs://` prefix) through the content-addressed store.
+
+    Args:
+        source (str): HTTP(S) URL, `gs://` object or prefix, or local file
+        destination (str): Destination file or directory
+        store (ContentStore): Store of the inputs. Defaults to the one at `Config.FETCH_CACHE_PATH`.
+    Returns:
+        fetched (list): (destination file, status, bytes transferred) of each fetched file, where the status is
+            `CACHED`, `UNCHANGED` or `DOWNLOADED`
+    '''
+    store = store or ContentStore()
+    if source.startswith(('http://', 'https://')):
+        fetched = [(destination, *_fetch_http(store, source, destination))]
+    elif source.startswith('gs://'):
+        fetched = _fetch_gcs(store, source, destination)
+    else:
+        fetched = [(destination, *_fetch_local(store, source, destination))]
+
+    statuses = [status for _, status, _ in fetched]
+    transferred = sum(size for _, _, size in fetched)
+    logging.info(
+        f'{source} fetched into {destination}: {len(fetched)} files ({statuses.count(CACHED)} not modified, '
+        f'{statuses.count(UNCHANGED)} unchanged, {statuses.count(DOWNLOADED)} new), {transferred} bytes transferred.'
+    )
+    return fetched
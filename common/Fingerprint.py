@@ -0,0 +1,310 @@
+'''
+Fingerprints of the parser runs, to republish the output of a previous run instead of recomputing it.
+
+The fingerprint of a run is the SHA-256 of:
+- the checksums of its input files and directories (not their names, which are dated),
+- the source of the parser module and of the `common` modules and settings it imports, directly or not,
+- its other command line arguments, with the paths of its inputs and outputs replaced by placeholders,
+- the `OT_*` environment variables, except the paths of the caches.
+
+The outputs of every run are kept in a local run cache, as hard links (`OT_RUN_CACHE_PATH`, default:
+`~/.cache/evidence_datasource_parsers/runs`). A run with the fingerprint of a cached one links its outputs to the new
+output paths instead of running the parser. The parsers write their outputs in place, so the outputs are removed before
+a parser runs (see `remove_outputs`): otherwise a new run would overwrite the files of the cached run linked to them.
+
+The checksums of the input files are memoized by inode, size and modification time: the inputs fetched through
+`common.FetchCache` are hard links to the same files from one run to the next, so they are only read once.
+'''
+
+import ast
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common.ParquetWriter import parquet_path
+from settings import Config
+
+# Root of the repository, in which the `common` modules and the settings are resolved:
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Outputs written next to the output of a parser, kept and republished with it:
+SIDE_OUTPUTS = {'parquet': parquet_path}
+
+# Number of runs of a parser kept in the cache:
+KEEP_RUNS = 3
+
+CHUNK_SIZE = 8 * 2 ** 20
+
+
+def _imported_modules(tree):
+    '''Names of the modules imported by a module, including the `from package import module` forms.'''
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            yield node.module
+            for alias in node.names:
+                yield f'{node.module}.{alias.name}'
+
+
+def source_files(module_file):
+    '''
+    Source files a parser depends on: its module, and the modules of the repository it imports, recursively.
+
+    Args:
+        module_file (str): Path of the parser module
+    Returns:
+        files (list): Sorted paths of the source files, relative to the repository
+    '''
+    pending, files = [os.path.abspath(module_file)], set()
+    while pending:
+        path = pending.pop()
+        if path in files:
+            continue
+        files.add(path)
+        with open(path, 'rb') as source:
+            tree = ast.parse(source.read(), path)
+        for name in _imported_modules(tree):
+            candidate = os.path.join(REPOSITORY_ROOT, *name.split('.')) + '.py'
+            if os.path.isfile(candidate):
+                pending.append(candidate)
+    return sorted(os.path.relpath(path, REPOSITORY_ROOT) for path in files)
+
+
+class ChecksumIndex(object):
+    '''
+    SHA-256 of files, memoized by device, inode, size and modification time.
+
+    Args:
+        filename (str): JSON file of the memoized checksums
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            with open(filename) as index_file:
+                self.checksums = json.load(index_file)
+        except (OSError, ValueError):
+            self.checksums = {}
+        self.updated = False
+
+    def file_checksum(self, path):
+        stat = os.stat(path)
+        key = f'{stat.st_dev}:{stat.st_ino}'
+        version = [stat.st_size, stat.st_mtime_ns]
+        memoized = self.checksums.get(key)
+        if memoized and memoized[:2] == version:
+            return memoized[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        self.checksums[key] = version + [digest.hexdigest()]
+        self.updated = True
+        return digest.hexdigest()
+
+    def checksum(self, path):
+        '''Checksum of a file, or of a directory: of the relative paths and checksums of its files.'''
+        if not os.path.isdir(path):
+            return self.file_checksum(path)
+        digest = hashlib.sha256()
+        for directory, subdirectories, filenames in os.walk(path):
+            subdirectories.sort()
+            for filename in sorted(filenames):
+                file_path = os.path.join(directory, filename)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+                digest.update(self.file_checksum(file_path).encode('ascii'))
+        return digest.hexdigest()
+
+    def save(self):
+        if not self.updated:
+            return
+        # Concurrent runs may lose each other's entries, which only costs a new checksum:
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(self.filename), delete=False) as temp_file:
+            json.dump(self.checksums, temp_file)
+        os.replace(temp_file.name, self.filename)
+        self.updated = False
+
+
+def _environment():
+    return {
+        name: value for name, value in sorted(os.environ.items())
+        if name.startswith('OT_') and not name.endswith('_PATH')
+    }
+
+
+def placeholder_arguments(arguments, inputs, outputs):
+    '''Command line arguments with the paths of the inputs and outputs of the run replaced by placeholders.'''
+    paths = [(path, f'{{input{index}}}') for index, path in enumerate(inputs)]
+    paths += [(path, f'{{output{index}}}') for index, path in enumerate(outputs)]
+    # Longest paths first, so that a path is not replaced inside a longer one:
+    paths.sort(key=lambda path: len(path[0]), reverse=True)
+    replaced = []
+    for argument in arguments:
+        for path, placeholder in paths:
+            argument = argument.replace(path, placeholder)
+        replaced.append(argument)
+    return replaced
+
+
+def fingerprint(module_file, inputs, arguments, checksums):
+    '''
+    Fingerprint of a parser run.
+
+    Args:
+        module_file (str): Path of the parser module
+        inputs (list): Input files or directories
+        arguments (list): Command line arguments, with the inputs and outputs replaced by placeholders
+        checksums (ChecksumIndex): Checksums of the input files
+    Returns:
+        fingerprint (str), components (dict): the fingerprint and what it was computed from
+    '''
+    components = {
+        'inputs': [checksums.checksum(path) for path in inputs],
+        'sources': {path: checksums.file_checksum(os.path.join(REPOSITORY_ROOT, path))
+                    for path in source_files(module_file)},
+        'arguments': list(arguments),
+        'environment': _environment(),
+        'python': sys.version.split()[0],
+    }
+    checksums.save()
+    encoded = json.dumps(components, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest(), components
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def remove_outputs(outputs):
+    '''
+    Removes the outputs of a parser about to run, with their side outputs (see `SIDE_OUTPUTS`). They may be hard links
+    to the files of a cached run, which the parser would overwrite in place.
+    '''
+    for output in outputs:
+        _remove(output)
+        for path in SIDE_OUTPUTS.values():
+            _remove(path(output))
+
+
+def _link_tree(source, destination):
+    '''Hard links a file, or the files of a directory, to a destination which is replaced.'''
+    _remove(destination)
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    if os.path.isdir(source):
+        shutil.copytree(source, destination, copy_function=_link_file)
+    else:
+        _link_file(source, destination)
+
+
+def _link_file(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class RunCache(object):
+    '''
+    Outputs of the previous runs of the parsers, by fingerprint.
+
+    Args:
+        directory (str): Directory of the cache. Defaults to `Config.RUN_CACHE_PATH`.
+    '''
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.RUN_CACHE_PATH
+        os.makedirs(self.directory, exist_ok=True)
+        self.checksums = ChecksumIndex(os.path.join(self.directory, 'checksums.json'))
+
+    def local_inputs(self, inputs):
+        '''
+        Local copies of the inputs: the remote ones (a gene set downloaded by the parser, ...) are fetched through the
+        input store (see `common.FetchCache`), so that their content is part of the fingerprint.
+        '''
+        local_inputs = []
+        for path in inputs:
+            if path.startswith(('http://', 'https://', 'gs://')):
+                from common.FetchCache import fetch
+
+                local_path = os.path.join(self.directory, 'inputs', hashlib.sha256(path.encode('utf-8')).hexdigest())
+                fetch(path, local_path)
+                path = local_path
+            local_inputs.append(path)
+        return local_inputs
+
+    def _run_dir(self, name, run_fingerprint):
+        return os.path.join(self.directory, name, run_fingerprint)
+
+    def lookup(self, name, run_fingerprint):
+        '''Metadata of the cached run of a parser with the given fingerprint, if any.'''
+        try:
+            with open(os.path.join(self._run_dir(name, run_fingerprint), 'run.json')) as run_file:
+                return json.load(run_file)
+        except (OSError, ValueError):
+            return None
+
+    def republish(self, name, run_fingerprint, outputs):
+        '''Links the outputs of a cached run to the given output paths, in the same order.'''
+        run_dir = self._run_dir(name, run_fingerprint)
+        run = self.lookup(name, run_fingerprint)
+        for output, stored_outputs in zip(outputs, run['outputs']):
+            for stored, side_output in stored_outputs:
+                destination = SIDE_OUTPUTS[side_output](output) if side_output else output
+                _link_tree(os.path.join(run_dir, stored), destination)
+        # The most recently used runs are the ones kept:
+        os.utime(run_dir)
+
+    def store(self, name, run_fingerprint, components, outputs):
+        '''
+        Keeps the outputs of a run, with their side outputs (see `SIDE_OUTPUTS`), and removes the oldest runs of the
+        parser.
+
+        Args:
+            name (str): Name of the parser
+            run_fingerprint (str): Fingerprint of the run
+            components (dict): What the fingerprint was computed from
+            outputs (list): Output files or directories of the run
+        '''
+        run_dir = self._run_dir(name, run_fingerprint)
+        temp_dir = tempfile.mkdtemp(dir=self.directory)
+        stored_outputs = []
+        for index, output in enumerate(outputs):
+            stored_outputs.append([])
+            paths = [(output, None)] + [(path(output), side_output) for side_output, path in SIDE_OUTPUTS.items()]
+            for path, side_output in paths:
+                if (side_output and path == output) or not os.path.exists(path):
+                    continue
+                stored = os.path.join(str(index), os.path.basename(path.rstrip('/')))
+                _link_tree(path, os.path.join(temp_dir, stored))
+                stored_outputs[-1].append((stored, side_output))
+        with open(os.path.join(temp_dir, 'run.json'), 'w') as run_file:
+            json.dump({
+                'fingerprint': run_fingerprint, 'components': components, 'outputs': stored_outputs,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            }, run_file, indent=2)
+
+        if os.path.isdir(run_dir):
+            shutil.rmtree(run_dir)
+        os.makedirs(os.path.dirname(run_dir), exist_ok=True)
+        os.rename(temp_dir, run_dir)
+        self._prune(name)
+
+    def _prune(self, name):
+        parser_dir = os.path.join(self.directory, name)
+        runs = sorted(
+            (os.path.join(parser_dir, run) for run in os.listdir(parser_dir)), key=os.path.getmtime, reverse=True
+        )
+        for run_dir in runs[KEEP_RUNS:]:
+            logging.info(f'Removing the cached run {run_dir}.')
+            shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,290 @@
+'''
+Compact on-disk index of the HGNC gene set: approved symbols, previous symbols and HGNC ids to Ensembl gene ids.
+
+The HGNC dataset is streamed once, row by row, and its lookups are written into a single binary file made of a JSON
+header with the version metadata (source, its Last-Modified date, digest, build time, ...) followed by a sorted table of
+keys and values. Later runs memory-map the file and binary search it, so loading the index takes milliseconds and the
+pages are shared by all the processes reading it.
+
+>>> index = get_hgnc_index()
+>>> index.symbol_to_ensembl('BRAF')
+'ENSG00000157764'
+'''
+
+import array
+import csv
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+from common.HttpClient import open_stream
+from settings import Config
+
+MAGIC = b'HGNCIDX1'
+FORMAT_VERSION = 1
+
+# Indexes loaded by `get_hgnc_index` in this process, by source and path:
+_LOADED_INDEXES = {}
+
+# Namespaces of the keys in the index:
+APPROVED_SYMBOL = 's'
+PREVIOUS_SYMBOL = 'p'
+HGNC_ID = 'h'
+
+
+class _HashingReader(io.RawIOBase):
+    '''Binary stream wrapper computing the SHA-256 of the data read through it.'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        self.digest.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _open_source(source):
+    '''Opens a local file or a URL as a binary stream. Returns the stream and the Last-Modified date of the source.'''
+    if os.path.exists(source):
+        return open(source, 'rb'), time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(os.path.getmtime(source)))
+    response = open_stream(source)
+    return response, response.headers.get('Last-Modified')
+
+
+def _parse_records(stream, source):
+    '''Yields (HGNC id, approved symbol, previous symbols, Ensembl gene id) from the HGNC TSV or JSON dataset.'''
+    if source.endswith('.json'):
+        # The JSON dataset is a single document which cannot be streamed with the standard library:
+        for row in json.load(stream)['response']['docs']:
+            yield row.get('hgnc_id'), row['symbol'], row.get('prev_symbol', []), row.get('ensembl_gene_id', '')
+    else:
+        for row in csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8'), delimiter='\t'):
+            previous_symbols = [symbol for symbol in (row.get('prev_symbol') or '').split('|') if symbol]
+            yield row['hgnc_id'], row['symbol'], previous_symbols, row.get('ensembl_gene_id') or ''
+
+
+def build_hgnc_index(source=None, path=None):
+    '''
+    Streams the HGNC dataset and writes its index. The file is replaced atomically, so processes reading the previous
+    version of the index are not affected.
+
+    Args:
+        source (str): URL or local path of the HGNC complete set, TSV or JSON. Defaults to `Config.GENES_HGNC`.
+        path (str): Index file. Defaults to `Config.HGNC_INDEX_PATH`.
+    Returns:
+        metadata (dict): Version metadata stored in the index
+    '''
+    source = source or Config.GENES_HGNC
+    path = path or Config.HGNC_INDEX_PATH
+    logging.info(f'Building the HGNC index {path} from {source}.')
+
+    stream, last_modified = _open_source(source)
+    reader = _HashingReader(stream)
+    approved, previous, hgnc_ids = {}, {}, {}
+    with stream:
+        for hgnc_id, symbol, previous_symbols, ensembl_gene_id in _parse_records(io.BufferedReader(reader), source):
+            approved[symbol] = ensembl_gene_id
+            if hgnc_id:
+                hgnc_ids[hgnc_id] = ensembl_gene_id
+            # The first gene using an obsolete symbol (e.g. EFCAB4B) is kept:
+            for previous_symbol in previous_symbols:
+                previous.setdefault(previous_symbol, ensembl_gene_id)
+
+    entries = sorted(
+        (f'{namespace}:{key}'.encode('utf-8'), value.encode('utf-8'))
+        for namespace, lookup in ((APPROVED_SYMBOL, approved), (PREVIOUS_SYMBOL, previous), (HGNC_ID, hgnc_ids))
+        for key, value in lookup.items()
+    )
+    metadata = {
+        'format_version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'source': source,
+        'source_last_modified': last_modified,
+        'source_sha256': reader.digest.hexdigest(),
+        'built_at': time.time(),
+        'approved_symbols': len(approved),
+        'previous_symbols': len(previous),
+        'hgnc_ids': len(hgnc_ids),
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        _write_table(f, metadata, entries)
+    os.replace(tmp_path, path)
+
+    logging.info(
+        f'HGNC index built: {len(approved)} approved symbols, {len(previous)} previous symbols, '
+        f'{len(hgnc_ids)} HGNC ids.'
+    )
+    return metadata
+
+
+def _write_table(f, metadata, entries):
+    '''
+    Layout: magic, header length, JSON header (padded to 4 bytes), number of entries n, n + 1 key offsets,
+    n + 1 value offsets, keys, values. Offsets are unsigned 32-bit integers in the byte order of the host.
+    '''
+    header = json.dumps(metadata).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 4)
+    key_offsets, value_offsets = array.array('I', [0]), array.array('I', [0])
+    for key, value in entries:
+        key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets.append(value_offsets[-1] + len(value))
+
+    f.write(MAGIC)
+    f.write(struct.pack('<I', len(header)))
+    f.write(header)
+    f.write(array.array('I', [len(entries)]).tobytes())
+    f.write(key_offsets.tobytes())
+    f.write(value_offsets.tobytes())
+    f.writelines(key for key, _ in entries)
+    f.writelines(value for _, value in entries)
+
+
+class HGNCIndex(object):
+    '''Read-only, memory-mapped HGNC index. See `get_hgnc_index`.'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not an HGNC index.')
+        position = len(MAGIC)
+        header_length, = struct.unpack_from('<I', self._mmap, position)
+        position += 4
+        self.metadata = json.loads(self._mmap[position:position + header_length])
+        position += header_length
+
+        view = memoryview(self._mmap)
+        self._size = view[position:position + 4].cast('I')[0]
+        position += 4
+        offsets_length = 4 * (self._size + 1)
+        self._key_offsets = view[position:position + offsets_length].cast('I')
+        position += offsets_length
+        self._value_offsets = view[position:position + offsets_length].cast('I')
+        position += offsets_length
+        self._keys = view[position:position + self._key_offsets[-1]]
+        position += self._key_offsets[-1]
+        self._values = view[position:position + self._value_offsets[-1]]
+
+    def __len__(self):
+        return self._size
+
+    def _key(self, i):
+        return self._keys[self._key_offsets[i]:self._key_offsets[i + 1]].tobytes()
+
+    def _value(self, i):
+        return self._values[self._value_offsets[i]:self._value_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def get(self, namespace, key):
+        '''Returns the Ensembl gene id stored for the key, '' if the gene has none, None if the key is unknown.'''
+        target = f'{namespace}:{key}'.encode('utf-8')
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._size and self._key(low) == target:
+            return self._value(low)
+        return None
+
+    def items(self, namespace):
+        '''Yields the (key, Ensembl gene id) pairs of a namespace, sorted by key.'''
+        prefix = f'{namespace}:'.encode('utf-8')
+        for i in range(self._size):
+            key = self._key(i)
+            if key.startswith(prefix):
+                yield key[len(prefix):].decode('utf-8'), self._value(i)
+
+    def symbol_to_ensembl(self, symbol):
+        '''Ensembl gene id of an approved symbol or, failing that, of a previous symbol. None if not found.'''
+        ensembl_gene_id = self.get(APPROVED_SYMBOL, symbol)
+        if ensembl_gene_id is None:
+            ensembl_gene_id = self.get(PREVIOUS_SYMBOL, symbol)
+        return ensembl_gene_id or None
+
+    def hgnc_id_to_ensembl(self, hgnc_id):
+        '''Ensembl gene id of an HGNC id (e.g. `HGNC:5`). None if not found.'''
+        return self.get(HGNC_ID, hgnc_id) or None
+
+    def symbol_mappings(self):
+        '''
+        Returns the symbol to Ensembl gene id lookup as a list of pairs: approved symbols, and previous symbols which
+        are not approved symbols of another gene. Symbols without an Ensembl gene id are left out.
+        '''
+        approved = dict(self.items(APPROVED_SYMBOL))
+        mappings = [(symbol, ensembl_gene_id) for symbol, ensembl_gene_id in approved.items() if ensembl_gene_id]
+        mappings.extend(
+            (symbol, ensembl_gene_id) for symbol, ensembl_gene_id in self.items(PREVIOUS_SYMBOL)
+            if ensembl_gene_id and symbol not in approved
+        )
+        return mappings
+
+
+def get_hgnc_index(source=None, path=None, max_age_days=None):
+    '''
+    Loads the HGNC index, building it first if it does not exist, if it was built from another source or if it is
+    older than `max_age_days`.
+
+    Args:
+        source (str): URL or local path of the HGNC complete set. Defaults to `Config.GENES_HGNC`.
+        path (str): Index file. Defaults to `Config.HGNC_INDEX_PATH`.
+        max_age_days (float): Maximum age of the index, 0 to never rebuild an existing index built from the same
+            source. Defaults to `Config.HGNC_INDEX_MAX_AGE_DAYS`.
+    Returns:
+        index (HGNCIndex)
+    '''
+    source = source or Config.GENES_HGNC
+    path = path or Config.HGNC_INDEX_PATH
+    max_age_days = Config.HGNC_INDEX_MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    # The parsers run in the same process (see common/ParserRunner.py) share the index loaded by the first one:
+    loaded = _LOADED_INDEXES.get((source, path))
+    if loaded is not None and os.path.exists(path) and os.path.getmtime(path) == loaded[0]:
+        return loaded[1]
+    index = _load_hgnc_index(source, path, max_age_days)
+    _LOADED_INDEXES[(source, path)] = (os.path.getmtime(path), index)
+    return index
+
+
+def _load_hgnc_index(source, path, max_age_days):
+    '''Opens the HGNC index file, after building it if it is missing or outdated.'''
+    index = None
+    if os.path.exists(path):
+        try:
+            index = HGNCIndex(path)
+        except ValueError as e:
+            logging.warning(e)
+
+    if index is not None:
+        metadata = index.metadata
+        age = time.time() - metadata['built_at']
+        if (
+            metadata.get('format_version') == FORMAT_VERSION and metadata.get('byteorder') == sys.byteorder
+            and metadata.get('source') == source and (not max_age_days or age <= max_age_days * 86400)
+        ):
+            logging.info(
+                f'Using the HGNC index {path} built from {source} '
+                f'(last modified {metadata["source_last_modified"]}).'
+            )
+            return index
+
+    build_hgnc_index(source, path)
+    return HGNCIndex(path)
@@ -1,6 +1,6 @@
 import logging
 
-import requests
+from common.HGNCIndex import get_hgnc_index
 
 
 logger = logging.getLogger(__name__)
@@ -79,23 +79,7 @@ class GeneParser(object):
     def __init__(self):
         self.genes = dict()
 
-    def _get_hgnc_data_from_json(self, HGNC_genes_set):
-
-        r = requests.get(HGNC_genes_set)
-        data = r.json()
-
-        for row in data['response']['docs']:
-            ensembl_gene_id = ''
-
-            if 'ensembl_gene_id' in row:
-                ensembl_gene_id = row['ensembl_gene_id']
-                if not ensembl_gene_id:
-                    ensembl_gene_id = data['ensembl_id_supplied_by_ensembl']
-            self.genes[row['symbol']] = ensembl_gene_id
-
-            if 'prev_symbol' in row:
-                # to handle obsolete gene symbols like EFCAB4B
-                for prev_symbol in row['prev_symbol']:
-                    if prev_symbol not in self.genes:
-                        self.genes[prev_symbol] = ensembl_gene_id
-        logger.info('All HGNC genes parsed')
\ No newline at end of file
+    def _get_hgnc_data_from_json(self, HGNC_genes_set=None):
+        # The HGNC dataset is only downloaded when the local index is missing or outdated:
+        self.genes = dict(get_hgnc_index(HGNC_genes_set).symbol_mappings())
+        logger.info('All HGNC genes parsed')
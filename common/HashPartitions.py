@@ -0,0 +1,106 @@
+'''
+Fixed-width entries hash-partitioned in memory and spilled to disk, for the checks and comparisons of evidence files
+which do not fit in memory (see `common/UniquenessCheck.py` and `common/EvidenceDelta.py`).
+
+The entries are numpy records starting with a digest. They are split into 256 partitions on the first byte of the
+digest and kept in compact buffers; when the buffers exceed the memory limit, they are appended to one file per
+partition. Several writers, e.g. one per process, can spill into the same directory under different names. The
+partitions are then read back one at a time, from all the writers; a partition larger than the memory limit is split
+again on the next byte of the digest, so the memory used stays bounded whatever the size of the input.
+'''
+
+import glob
+import os
+
+import numpy as np
+
+PARTITIONS = 256
+
+
+class HashPartitions(object):
+    '''
+    Args:
+        directory (str): Directory to spill the partitions into
+        dtype (numpy.dtype): Type of the entries, starting with a digest of `digest_size` bytes
+        memory_limit (int): Size in bytes of the entries kept in memory before they are spilled
+        name (str): Name of the writer, to tell its files from the ones of the other writers of the directory
+        digest_size (int): Size of the digest in bytes, i.e. the number of times a partition can be split
+        depth (int): Byte of the digest the entries are partitioned on
+    '''
+
+    def __init__(self, directory, dtype, memory_limit, name='entries', digest_size=16, depth=0):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.memory_limit = memory_limit
+        self.name = name
+        self.digest_size = digest_size
+        self.depth = depth
+        self.buffers = [bytearray() for _ in range(PARTITIONS)]
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _files(self, partition):
+        return sorted(glob.glob(os.path.join(self.directory, f'partition_{partition:03d}.*.bin')))
+
+    def add(self, entry):
+        '''Adds an entry given as bytes.'''
+        self.buffers[entry[self.depth]].extend(entry)
+        self.size += len(entry)
+        if self.size >= self.memory_limit:
+            self.spill()
+
+    def add_array(self, entries):
+        '''Adds an array of entries.'''
+        partitions = entries.view(np.uint8).reshape(-1, self.dtype.itemsize)[:, self.depth]
+        for partition in np.unique(partitions):
+            self.buffers[partition].extend(entries[partitions == partition].tobytes())
+        self.size += entries.nbytes
+        if self.size >= self.memory_limit:
+            self.spill()
+
+    def spill(self):
+        '''Appends the buffered entries to the files of their partitions.'''
+        for partition, buffer in enumerate(self.buffers):
+            if buffer:
+                with open(os.path.join(self.directory, f'partition_{partition:03d}.{self.name}.bin'), 'ab') as f:
+                    f.write(buffer)
+                self.buffers[partition] = bytearray()
+        self.size = 0
+
+    def partitions(self):
+        '''
+        Yields the entries of every partition as arrays, each of them within the memory limit: the buffered entries,
+        and the ones spilled by all the writers of the directory. The spilled files are removed once read.
+        '''
+        for partition in range(PARTITIONS):
+            files = self._files(partition)
+            buffer, self.buffers[partition] = self.buffers[partition], bytearray()
+            size = len(buffer) + sum(os.path.getsize(f) for f in files)
+            if not size:
+                continue
+
+            if size <= self.memory_limit or self.depth + 1 >= self.digest_size:
+                entries = [np.frombuffer(buffer, dtype=self.dtype)] + [np.fromfile(f, dtype=self.dtype) for f in files]
+                for filename in files:
+                    os.remove(filename)
+                yield np.concatenate(entries) if len(entries) > 1 else entries[0]
+                continue
+
+            # The partition is split again on the next byte of the digest, reading its files in blocks:
+            sub_partitions = HashPartitions(
+                os.path.join(self.directory, f'split_{partition:03d}'), self.dtype, self.memory_limit,
+                digest_size=self.digest_size, depth=self.depth + 1
+            )
+            if buffer:
+                sub_partitions.add_array(np.frombuffer(buffer, dtype=self.dtype))
+            block = max(1, self.memory_limit // (2 * self.dtype.itemsize))
+            for filename in files:
+                with open(filename, 'rb') as f:
+                    while True:
+                        entries = np.fromfile(f, dtype=self.dtype, count=block)
+                        if not len(entries):
+                            break
+                        sub_partitions.add_array(entries)
+                os.remove(filename)
+            sub_partitions.spill()
+            yield from sub_partitions.partitions()
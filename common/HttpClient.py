@@ -0,0 +1,146 @@
+'''
+HTTP client shared by all the network fetches of the parsers.
+
+Every request of a process goes through one `requests` session, which keeps the connections alive in a pool per host,
+so that the hundreds of calls made to one API (PanelApp, IMPC SOLR, ...) pay a single TCP and TLS handshake per
+connection instead of one per call. On top of the session:
+- the responses are requested with gzip or deflate transfer encoding, and decoded transparently,
+- the connection errors, timeouts and transient statuses (429, 5xx) are retried with an exponential backoff and random
+  jitter (see `common.Resolver.call_with_backoff`), up to `Config.HTTP_MAX_RETRIES` times,
+- at most `Config.HTTP_HOST_CONNECTIONS` requests run at once against a host: the other threads wait for a connection
+  of the pool of the host to be released,
+- `download` streams a response into a file, by chunks, without holding it in memory.
+
+>>> genes = get_json(f'https://panelapp.genomicsengland.co.uk/api/v1/panels/{panel_id}/')['genes']
+>>> download('https://ftp.ebi.ac.uk/pub/databases/genenames/hgnc/tsv/hgnc_complete_set.txt', 'hgnc.tsv')
+
+requests is only imported with the first request, as it is slow to import.
+'''
+
+import os
+import threading
+import uuid
+
+from common.Resolver import call_with_backoff
+from settings import Config
+
+# Statuses of the responses which are retried:
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+CHUNK_SIZE = 2 ** 20
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+class TransientHTTPError(IOError):
+    '''Response with a transient status, retried until the retries run out.'''
+
+
+def get_session():
+    '''
+    Session of the current process, with a pool of `Config.HTTP_HOST_CONNECTIONS` kept-alive connections per host.
+    The sessions are not shared with the forked processes (Spark Python workers, ...), which make their own.
+    '''
+    pid = os.getpid()
+    if pid not in _SESSIONS:
+        with _SESSIONS_LOCK:
+            if pid not in _SESSIONS:
+                import requests
+
+                session = requests.Session()
+                # The pool of a host blocks the requests beyond its size, which limits the concurrency per host:
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=16, pool_maxsize=Config.HTTP_HOST_CONNECTIONS, pool_block=True
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['Accept-Encoding'] = 'gzip, deflate'
+                _SESSIONS[pid] = session
+    return _SESSIONS[pid]
+
+
+def _request_once(method, url, **kwargs):
+    response = get_session().request(method, url, **kwargs)
+    if response.status_code in TRANSIENT_STATUSES:
+        response.close()
+        raise TransientHTTPError(f'{response.status_code} for {method} {url}')
+    return response
+
+
+def request(method, url, max_retries=None, **kwargs):
+    '''
+    Makes a request with the shared session, retrying the connection errors and transient statuses. The other
+    statuses are returned as they are, to be checked by the caller.
+
+    Args:
+        method (str): HTTP method
+        url (str): URL of the request
+        max_retries (int): Number of retries. Defaults to `Config.HTTP_MAX_RETRIES`.
+        kwargs: Arguments of `requests.Session.request`. The timeout defaults to `Config.HTTP_TIMEOUT` seconds.
+    Returns:
+        response (requests.Response)
+    '''
+    kwargs.setdefault('timeout', Config.HTTP_TIMEOUT)
+    max_retries = Config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+    # The invalid URLs (requests.exceptions.InvalidURL, MissingSchema, ...) are value errors, not retried:
+    return call_with_backoff(_request_once, method, url, max_retries=max_retries, giveup=(ValueError,), **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault('allow_redirects', True)
+    return request('HEAD', url, **kwargs)
+
+
+def get_json(url, **kwargs):
+    '''Body of a successful GET request, decoded from JSON.'''
+    response = get(url, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+
+def open_stream(url, **kwargs):
+    '''
+    Binary stream of the body of a successful GET request, decoded from its transfer encoding. The connection goes
+    back to the pool when the stream is closed.
+    '''
+    response = get(url, stream=True, **kwargs)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return response.raw
+
+
+def _download_once(url, filename, **kwargs):
+    temp_name = f'{filename}.{uuid.uuid4().hex}.tmp'
+    try:
+        # The retries are made by `download`, from the start of the request:
+        with get(url, stream=True, max_retries=0, **kwargs) as response:
+            response.raise_for_status()
+            with open(temp_name, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+        os.replace(temp_name, filename)
+        return response.headers
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+
+def download(url, filename, **kwargs):
+    '''
+    Streams the body of a GET request into a file, which is only replaced once the download is complete. A download
+    interrupted midway is restarted, with the same backoff as the requests.
+
+    Returns:
+        headers (dict): Headers of the response
+    '''
+    import requests
+
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    # The error statuses other than the transient ones are not retried:
+    return call_with_backoff(_download_once, url, filename, max_retries=Config.HTTP_MAX_RETRIES,
+                             giveup=(requests.HTTPError, ValueError), **kwargs)
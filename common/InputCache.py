@@ -0,0 +1,173 @@
+'''
+Columnar cache of the tabular input files: each raw file converted once into a typed Parquet file next to it.
+
+The `ingestInput` rule of the Snakefile converts the fetched inputs with `utils/ingest_inputs.py` (see
+`common.InputSchemas.ingest`): `tmp/phewas_catalog-2021-03-01.csv` gets `tmp/phewas_catalog-2021-03-01.csv.parquet`,
+with the declared columns of its input schema, their types, row groups of `ROW_GROUP_SIZE` rows with their statistics,
+and the compression of `Config.PARQUET_COMPRESSION`. The readers of `common.InputSchemas` then read the Parquet file
+instead of the raw file:
+- without parsing the text, and only the columns they use,
+- with the filters pushed down to the row groups by Spark, and split between the Spark tasks, unlike a gzipped CSV.
+
+A cache file is only read while it is fresh: newer than its raw file, and made from the same version of it (size and
+modification time), with the same input schema and layout, as recorded in its metadata. Otherwise the raw file is read.
+Only the local files have a cache. The cache files are written and checked with pyarrow, without which the raw files
+are always read.
+
+The characters which Spark does not accept in the names of the Parquet columns (spaces, parentheses, ...) are
+replaced by underscores, and the columns are renamed back when they are read.
+'''
+
+import importlib.util
+import json
+import logging
+import os
+import re
+import uuid
+
+from common.EvidenceSchema import arrow_schema
+from common.Storage import is_local, local_input, spark_path
+from settings import Config
+
+CACHE_EXTENSION = '.parquet'
+
+# Rows of a row group of a cache file, which is also the number of rows of the raw file parsed at once:
+ROW_GROUP_SIZE = 100000
+
+# Key of the description of the raw file in the metadata of its cache file:
+METADATA_KEY = b'evidence_input'
+
+_INVALID_CHARACTERS = re.compile(r'[ ,;{}()\n\t=]')
+
+
+def is_available():
+    '''Whether the cache files can be written and read: pyarrow is installed.'''
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def cache_path(path):
+    '''Cache file of a raw input file.'''
+    return f'{path}{CACHE_EXTENSION}'
+
+
+def parquet_column(column):
+    '''Name of a column in the cache files, without the characters Spark does not accept.'''
+    return _INVALID_CHARACTERS.sub('_', column)
+
+
+def _description(path, name, fields, layout):
+    '''Description of a raw file and of how it is converted, recorded in the metadata of its cache file.'''
+    stat = os.stat(path)
+    return json.dumps({
+        'input': name,
+        'fields': fields,
+        'layout': layout,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }, sort_keys=True).encode('utf-8')
+
+
+def fresh_cache(path, name, fields, layout):
+    '''
+    Cache file of a raw input file, if it is fresh.
+
+    Args:
+        path (str): Raw file
+        name (str): Name of its input schema
+        fields (dict): Columns of the input schema and their types
+        layout (dict): Layout of the raw file, the options it is read with
+    Returns:
+        cache (str): Path of the cache file, None if there is no fresh cache
+    '''
+    if not is_local(path) or not is_available():
+        return None
+    path = local_input(path)
+    cache = cache_path(path)
+    if not os.path.exists(cache) or os.path.getmtime(cache) < os.path.getmtime(path):
+        return None
+
+    import pyarrow.parquet as pq
+    metadata = pq.read_schema(cache).metadata or {}
+    if metadata.get(METADATA_KEY) != _description(path, name, fields, layout):
+        logging.info(f'The cache of {path} is out of date, the raw file is read.')
+        return None
+    return cache
+
+
+def write_cache(path, name, fields, layout, chunks):
+    '''
+    Writes the cache file of a raw input file from the dataframes of its rows. The cache file is replaced once it is
+    complete.
+
+    Args:
+        path (str): Raw file
+        name (str): Name of its input schema
+        fields (dict): Columns of the input schema and their types
+        layout (dict): Layout of the raw file, the options it is read with
+        chunks (iterable): pandas dataframes with the rows of the raw file, in the types of the schema
+    Returns:
+        rows (int): Number of rows written
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = local_input(path)
+    cache = cache_path(path)
+    schema = arrow_schema({parquet_column(column): column_type for column, column_type in fields.items()})
+    schema = schema.with_metadata({METADATA_KEY: _description(path, name, fields, layout)})
+    temp_name = f'{cache}.{uuid.uuid4().hex}.tmp'
+    rows = 0
+    try:
+        writer = pq.ParquetWriter(temp_name, schema, compression=Config.PARQUET_COMPRESSION)
+        try:
+            for chunk in chunks:
+                chunk = chunk[list(fields)]
+                chunk.columns = [parquet_column(column) for column in fields]
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False), ROW_GROUP_SIZE)
+                rows += len(chunk)
+        finally:
+            writer.close()
+        os.replace(temp_name, cache)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+    logging.info(f'{path}: {rows} rows converted into {cache} ({os.path.getsize(cache) / 2 ** 20:,.1f} MiB).')
+    return rows
+
+
+def read_cache_spark(spark, caches, fields):
+    '''Spark dataframe of the declared columns of cache files.'''
+    import pyspark.sql.functions as F
+    dataframe = spark.read.parquet(*[spark_path(cache) for cache in caches])
+    return dataframe.select(*[F.col(f'`{parquet_column(column)}`').alias(column) for column in fields])
+
+
+def _to_pandas(table, fields, dtypes):
+    dataframe = table.to_pandas()
+    dataframe.columns = list(fields)
+    for column, dtype in dtypes.items():
+        if dtype is str:
+            dataframe[column] = dataframe[column].where(dataframe[column].notna(), float('nan'))
+        else:
+            dataframe[column] = dataframe[column].astype(dtype)
+    return dataframe
+
+
+def read_cache_pandas(cache, fields, dtypes):
+    '''
+    pandas dataframe of the declared columns of a cache file, with the dtypes and the missing values of
+    `pandas.read_csv`.
+    '''
+    import pyarrow.parquet as pq
+
+    return _to_pandas(pq.read_table(cache, columns=[parquet_column(column) for column in fields]), fields, dtypes)
+
+
+def iter_cache_pandas(cache, fields, dtypes):
+    '''As `read_cache_pandas`, one pandas dataframe per row group of the cache file.'''
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(cache)
+    columns = [parquet_column(column) for column in fields]
+    for index in range(parquet_file.num_row_groups):
+        yield _to_pandas(parquet_file.read_row_group(index, columns=columns), fields, dtypes)
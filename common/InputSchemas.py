@@ -0,0 +1,413 @@
+'''
+Typed schemas of the tabular input files of the parsers.
+
+Every delimited file read by a parser is declared here, with the columns the parser uses and their types, in the
+type vocabulary of the evidence schema (`STRING`, `DOUBLE`, `LONG`, `BOOLEAN`, see `common.EvidenceSchema`). The
+readers of both Spark and pandas then:
+- read the file in a single pass with the declared types, instead of inferring them (a second pass over the file) or
+  reading strings cast later,
+- only parse the declared columns, the other columns of the file being pruned,
+- fail fast on schema drift: a declared column missing from the header of a file is an error raised before the file
+  is read, and so is a value which does not parse into the type of its column (Spark `FAILFAST` mode, pandas dtypes).
+
+The layout of each raw file (delimiter, null values, ...) is declared too, so that `ingest` can convert it once into a
+typed Parquet file next to it (see `common.InputCache`), which the readers then read instead of the raw file while it
+is fresh.
+
+>>> phewas = read_spark(spark, 'phewas_catalog', input_file)
+>>> evidence_df = read_pandas('crispr_evidence', evidence_file, sep='\\t')
+
+The engines read the same schemas with `engine.read_csv(path, sep, schema='intogen_genes')`.
+'''
+
+import csv
+import io
+import logging
+import zlib
+
+from common.EvidenceSchema import BOOLEAN, DOUBLE, LONG, STRING, spark_schema
+from common.InputCache import (
+    ROW_GROUP_SIZE, fresh_cache, is_available, iter_cache_pandas, read_cache_pandas, read_cache_spark, write_cache
+)
+from common.Sampling import sample_fraction, sample_pandas
+from common.Storage import get_storage, local_input, spark_path
+
+# Bytes read from the start of a file to parse its header:
+HEADER_BYTES = 2 ** 16
+
+# pandas dtypes of the types. The integers and booleans are nullable:
+PANDAS_DTYPES = {STRING: str, DOUBLE: 'float64', LONG: 'Int64', BOOLEAN: 'boolean'}
+
+INPUT_SCHEMAS = {
+    # Disease and pathway mappings of the cancer datasources, in resources/:
+    'cancer_to_efo': {
+        'Cancer_type_acronym': STRING,
+        'EFO_id': STRING,
+    },
+    'pathway_to_reactome': {
+        'pathway': STRING,
+        'target': STRING,
+        'reactomeId': STRING,
+        'description': STRING,
+    },
+    'intogen_genes': {
+        'SYMBOL': STRING,
+        'COHORT': STRING,
+        'CANCER_TYPE': STRING,
+        'SAMPLES': LONG,
+        'METHODS': STRING,
+        'ROLE': STRING,
+        'QVALUE_COMBINATION': DOUBLE,
+    },
+    'intogen_cohorts': {
+        'COHORT': STRING,
+        'CANCER_TYPE_NAME': STRING,
+        'WEB_SHORT_COHORT_NAME': STRING,
+        'WEB_LONG_COHORT_NAME': STRING,
+        'SAMPLES': LONG,
+    },
+    'progeny': {
+        'Cancer_type': STRING,
+        'Pathway': STRING,
+        'P.Value': DOUBLE,
+    },
+    'slapenrich': {
+        'ctype': STRING,
+        'gene': STRING,
+        'pathway': STRING,
+        'SLAPEnrichPval': DOUBLE,
+    },
+    'gene2phenotype': {
+        'gene symbol': STRING,
+        'disease name': STRING,
+        'disease mim': STRING,
+        'DDD category': STRING,
+        'allelic requirement list': STRING,
+        'mutation consequence': STRING,
+        'pmid list': STRING,
+        'panel': STRING,
+    },
+    'phewas_catalog': {
+        'gene': STRING,
+        'snp': STRING,
+        'phewas_code': STRING,
+        'phewas_string': STRING,
+        'cases': LONG,
+        'odds_ratio': DOUBLE,
+        'p': DOUBLE,
+    },
+    'phewas_consequences': {
+        'rsid': STRING,
+        'gene_id': STRING,
+        'pos': LONG,
+        'chrom': STRING,
+        'ref': STRING,
+        'alt': STRING,
+        'consequence_link': STRING,
+    },
+    'phewas_mappings': {
+        'Phewas_string': STRING,
+        'EFO_id': STRING,
+    },
+    'panelapp': {
+        'Symbol': STRING,
+        'Panel Id': STRING,
+        'Panel Name': STRING,
+        'Panel Version': DOUBLE,
+        'Panel Status': STRING,
+        'List': STRING,
+        'Mode of inheritance': STRING,
+        'Phenotypes': STRING,
+    },
+    'eco_scores': {
+        'Term': STRING,
+        'Accession': STRING,
+        'eco_score': DOUBLE,
+    },
+    'mgi_gene_model_coord': {
+        '1. MGI accession id': STRING,
+        '3. marker symbol': STRING,
+        '11. Ensembl gene id': STRING,
+    },
+    # The PhenoDigm tables fetched from the IMPC SOLR API, with the fields of modules.PhenoDigm.IMPC_SOLR_TABLES:
+    'impc_solr_gene_gene': {
+        'gene_id': STRING,
+        'hgnc_gene_id': STRING,
+    },
+    'impc_solr_ontology_ontology': {
+        'mp_id': STRING,
+        'hp_id': STRING,
+    },
+    'impc_solr_mouse_model': {
+        'model_id': STRING,
+        'model_phenotypes': STRING,
+    },
+    'impc_solr_disease': {
+        'disease_id': STRING,
+        'disease_phenotypes': STRING,
+    },
+    'impc_solr_disease_model_summary': {
+        'model_id': STRING,
+        'model_genetic_background': STRING,
+        'model_description': STRING,
+        'disease_id': STRING,
+        'disease_term': STRING,
+        'disease_model_avg_norm': DOUBLE,
+        'disease_model_max_norm': DOUBLE,
+        'marker_id': STRING,
+    },
+    'impc_solr_ontology': {
+        'ontology': STRING,
+        'phenotype_id': STRING,
+        'phenotype_term': STRING,
+    },
+    'crispr_evidence': {
+        'target_id': STRING,
+        'disease_id': STRING,
+        'disease_name': STRING,
+        'score': DOUBLE,
+        'pmid': STRING,
+        'gene_set_name': STRING,
+    },
+    'crispr_descriptions': {
+        'efo_id': STRING,
+        'tissue_or_cancer_type': STRING,
+        'method': STRING,
+    },
+    'crispr_cell_lines': {
+        'Name': STRING,
+        'Tissue': STRING,
+        'Cancer Type': STRING,
+    },
+    'sysbio_evidence': {
+        'target_id': STRING,
+        'disease_id': STRING,
+        'disease_name': STRING,
+        'gene_set_name': STRING,
+        'pmid': STRING,
+        'score': DOUBLE,
+    },
+    'sysbio_studies': {
+        'gene_set_name': STRING,
+        'pmid': STRING,
+        'method': STRING,
+        'score_type': STRING,
+        'min_score': DOUBLE,
+        'max_score': DOUBLE,
+    },
+    'clingen_gene_validity': {
+        'GENE SYMBOL': STRING,
+        'DISEASE LABEL': STRING,
+        'DISEASE ID (MONDO)': STRING,
+        'MOI': STRING,
+        'CLASSIFICATION': STRING,
+        'ONLINE REPORT': STRING,
+        'GCEP': STRING,
+    },
+}
+
+# Null values of the files read by Spark and the engines: the empty fields only. The files read by the pandas parsers
+# have the default null values of pandas.
+EMPTY_NULLS = {'keep_default_na': False, 'na_values': ['']}
+
+# Layout of the raw files: delimiter and other options of pandas.read_csv, used to convert them into Parquet:
+INPUT_LAYOUTS = {
+    'cancer_to_efo': {'sep': '\t', **EMPTY_NULLS},
+    'pathway_to_reactome': {'sep': '\t', **EMPTY_NULLS},
+    'intogen_genes': {'sep': '\t', **EMPTY_NULLS},
+    'intogen_cohorts': {'sep': '\t', **EMPTY_NULLS},
+    'progeny': {'sep': '\t', **EMPTY_NULLS},
+    'slapenrich': {'sep': '\t', **EMPTY_NULLS},
+    'gene2phenotype': {'sep': ',', **EMPTY_NULLS},
+    'phewas_catalog': {'sep': ',', **EMPTY_NULLS},
+    'phewas_consequences': {'sep': ',', **EMPTY_NULLS},
+    'phewas_mappings': {'sep': '\t', **EMPTY_NULLS},
+    'panelapp': {'sep': '\t', **EMPTY_NULLS},
+    'eco_scores': {'sep': '\t', **EMPTY_NULLS},
+    'mgi_gene_model_coord': {'sep': '\t', 'keep_default_na': False, 'na_values': ['', 'null']},
+    'impc_solr_gene_gene': {'sep': ',', **EMPTY_NULLS},
+    'impc_solr_ontology_ontology': {'sep': ',', **EMPTY_NULLS},
+    'impc_solr_mouse_model': {'sep': ',', **EMPTY_NULLS},
+    'impc_solr_disease': {'sep': ',', **EMPTY_NULLS},
+    'impc_solr_disease_model_summary': {'sep': ',', **EMPTY_NULLS},
+    'impc_solr_ontology': {'sep': ',', **EMPTY_NULLS},
+    'crispr_evidence': {'sep': '\t'},
+    'crispr_descriptions': {'sep': '\t'},
+    'crispr_cell_lines': {'sep': '\t'},
+    'sysbio_evidence': {'sep': '\t'},
+    'sysbio_studies': {'sep': '\t'},
+    'clingen_gene_validity': {'sep': ',', 'skiprows': [0, 1, 2, 3, 5], 'quotechar': '"'},
+}
+
+
+class SchemaDriftError(ValueError):
+    '''Input file whose header lacks columns of its declared schema.'''
+
+
+def input_schema(name):
+    '''Declared columns of an input and their types, in the order they are read.'''
+    try:
+        return INPUT_SCHEMAS[name]
+    except KeyError:
+        raise ValueError(f'Unknown input schema: {name}. Declared in common/InputSchemas.py: '
+                         f'{", ".join(sorted(INPUT_SCHEMAS))}.') from None
+
+
+def _head(uri):
+    '''First bytes of a file, decompressed if it is gzipped. Only a range is read from Cloud Storage.'''
+    storage = get_storage(uri)
+    if storage.local or str(uri).startswith(('http://', 'https://')):
+        with open(local_input(uri), 'rb') as f:
+            head = f.read(HEADER_BYTES)
+    else:
+        head = storage.read_range(uri, 0, min(HEADER_BYTES, storage.size(uri)))
+    if head[:2] == b'\x1f\x8b':
+        head = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head)
+    return head.decode('utf-8', errors='replace')
+
+
+def read_header(uri, sep=','):
+    '''Column names of the header of a delimited file.'''
+    return next(csv.reader(io.StringIO(_head(uri)), delimiter=sep), [])
+
+
+def check_header(name, uri, header):
+    '''
+    Checks that the header of an input file has all the columns of its schema.
+
+    Args:
+        name (str): Name of the input schema
+        uri (str): File, for the error message
+        header (list): Column names of the file
+    Raises:
+        SchemaDriftError: when declared columns are missing from the header
+    '''
+    missing = [column for column in input_schema(name) if column not in header]
+    if missing:
+        raise SchemaDriftError(
+            f'{uri} does not match the {name} input schema: missing columns {", ".join(missing)}. '
+            f'Columns of the file: {", ".join(header)}.'
+        )
+
+
+def pandas_dtypes(name):
+    return {column: PANDAS_DTYPES[column_type] for column, column_type in input_schema(name).items()}
+
+
+def fresh_caches(name, paths):
+    '''Fresh cache files of input files (see `common.InputCache`), or None unless they all have one.'''
+    if name not in INPUT_LAYOUTS:
+        return None
+    caches = [fresh_cache(p, name, input_schema(name), INPUT_LAYOUTS[name]) for p in paths]
+    return caches if all(caches) else None
+
+
+def read_spark(spark, name, path, sep=',', **options):
+    '''
+    Reads one or more delimited files with a header into a Spark dataframe of the declared columns and types.
+
+    Args:
+        spark (pyspark.sql.SparkSession): Spark session
+        name (str): Name of the input schema
+        path (str or list): File(s) to read
+        sep (str): Delimiter
+        options: Other options of the Spark CSV reader
+    Returns:
+        dataframe (pyspark.sql.DataFrame)
+    Raises:
+        SchemaDriftError: when declared columns are missing from the header of a file
+    '''
+    fields = input_schema(name)
+    paths = list(path) if isinstance(path, (list, tuple)) else [path]
+    caches = fresh_caches(name, paths)
+    if caches:
+        return read_cache_spark(spark, caches, fields)
+
+    headers = [read_header(p, sep) for p in paths]
+    for p, header in zip(paths, headers):
+        check_header(name, p, header)
+
+    # The undeclared columns are read as strings, and pruned by the select before being parsed. Spark checks that the
+    # header of every file matches the schema (enforceSchema=False):
+    schema = spark_schema({column: fields.get(column, STRING) for column in headers[0]})
+    dataframe = spark.read.csv(
+        [spark_path(p) for p in paths], sep=sep, header=True, schema=schema, enforceSchema=False, mode='FAILFAST',
+        **options
+    )
+    return dataframe.select(*[f'`{column}`' for column in fields])
+
+
+def read_pandas(name, path, sep=',', sample=None, **options):
+    '''
+    Reads a delimited file with a header into a pandas dataframe of the declared columns and types, from its cache
+    file when it is fresh. In a sampled run, the file is read by chunks, keeping the rows whose `sample` key column(s)
+    are sampled (see `common.Sampling`).
+
+    Args:
+        name (str): Name of the input schema
+        path (str): File to read
+        sep (str): Delimiter
+        sample (str or tuple): Key column(s) of the sampled runs
+        options: Other options of `pandas.read_csv`, such as `skiprows` or `chunksize`
+    Returns:
+        dataframe (pandas.DataFrame), or an iterator of dataframes with `chunksize`
+    Raises:
+        SchemaDriftError: when declared columns are missing from the header of the file
+        ValueError: when a value does not parse into the type of its column
+    '''
+    sample = ((sample,) if isinstance(sample, str) else tuple(sample)) if sample and sample_fraction() else None
+    if 'chunksize' in options:
+        chunks = _read_csv_pandas(name, path, sep, **options)
+        return (sample_pandas(chunk, *sample) for chunk in chunks) if sample else chunks
+
+    caches = fresh_caches(name, [path])
+    if caches and not sample:
+        return read_cache_pandas(caches[0], input_schema(name), pandas_dtypes(name))
+    if not sample:
+        return _read_csv_pandas(name, path, sep, **options)
+
+    import pandas as pd
+
+    if caches:
+        chunks = iter_cache_pandas(caches[0], input_schema(name), pandas_dtypes(name))
+    else:
+        chunks = _read_csv_pandas(name, path, sep, chunksize=ROW_GROUP_SIZE, **options)
+    frames = [sample_pandas(chunk, *sample) for chunk in chunks]
+    if not frames:
+        return _read_csv_pandas(name, path, sep, nrows=0, **options)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _read_csv_pandas(name, path, sep=',', **options):
+    import pandas as pd
+
+    fields = input_schema(name)
+    local_path = local_input(path)
+    header_options = {key: options[key] for key in ('skiprows', 'quotechar') if key in options}
+    check_header(name, path, list(pd.read_csv(local_path, sep=sep, nrows=0, **header_options).columns))
+    return pd.read_csv(local_path, sep=sep, usecols=list(fields), dtype=pandas_dtypes(name), **options)
+
+
+def ingest(name, path):
+    '''
+    Converts a raw input file into its typed Parquet cache file (see `common.InputCache`), unless it is fresh. The raw
+    file is parsed by chunks, with the layout of the input.
+
+    Args:
+        name (str): Name of the input schema
+        path (str): Local raw file
+    Returns:
+        rows (int): Number of rows converted, None if the cache file was fresh or pyarrow is not installed
+    Raises:
+        SchemaDriftError: when declared columns are missing from the header of the file
+    '''
+    if not is_available():
+        logging.info(f'pyarrow is not installed, {path} is not converted: its parsers read the raw file.')
+        return None
+    fields, layout = input_schema(name), INPUT_LAYOUTS[name]
+    if fresh_caches(name, [path]):
+        logging.info(f'The cache of {path} is up to date.')
+        return None
+    options = {key: value for key, value in layout.items() if key != 'sep'}
+    chunks = _read_csv_pandas(name, path, layout['sep'], chunksize=ROW_GROUP_SIZE, **options)
+    return write_cache(path, name, fields, layout, chunks)
@@ -0,0 +1,273 @@
+'''
+Stage-level instrumentation of the parsers, and the JSON run report written next to their evidence file.
+
+A run is split into stages (load, map, join, write, ...). For every stage, the report records:
+- the wall time and the CPU time of the driver process,
+- the peak resident memory of the driver process during the stage (Linux; elsewhere, the peak since the start),
+- the input and output row counts given by the parser,
+- for Spark, the jobs run in the stage: their number of stages and tasks, the input/output and shuffle bytes, the
+  memory and disk spills and the executor CPU time.
+
+The Spark jobs of a stage are tagged with a job group, and found back with the status tracker of the context. Their
+task metrics are read from the status store of the application, through the REST API of the Spark UI; they are left
+out when the UI is disabled.
+
+>>> report = RunReport('EPMC', spark)
+>>> with report.stage('load') as stage:
+...     df = spark.read.parquet(input_file)
+...     stage.set_rows(output_rows=df)
+>>> report.write(output_file)
+'''
+
+import json
+import logging
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+from common.Storage import open_uri
+from settings import Config
+
+# Spark stage metrics of the REST API, and their names in the report:
+SPARK_STAGE_METRICS = {
+    'inputBytes': 'input_bytes',
+    'outputBytes': 'output_bytes',
+    'shuffleReadBytes': 'shuffle_read_bytes',
+    'shuffleWriteBytes': 'shuffle_write_bytes',
+    'memoryBytesSpilled': 'memory_bytes_spilled',
+    'diskBytesSpilled': 'disk_bytes_spilled',
+}
+
+
+def _reset_peak_rss():
+    '''Resets the peak resident memory of the process (Linux). Returns whether it could be reset.'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    '''Peak resident memory of the current process in bytes, since the start or the last reset.'''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _is_spark_dataframe(value):
+    return hasattr(value, 'rdd') and hasattr(value, 'sql_ctx')
+
+
+def report_path(output_file):
+    '''
+    Name of the run report of an evidence file or directory: `<name>.run_report.json`, next to it, in the same storage
+    (see `common.Storage`).
+    '''
+    path = str(output_file).rstrip('/')
+    for extension in ('.json.gz', '.jsonl.gz', '.json', '.gz'):
+        if path.endswith(extension):
+            path = path[:-len(extension)]
+            break
+    return f'{path}.run_report.json'
+
+
+class Stage(object):
+    '''Measurements of one stage of a run, see `RunReport.stage`.'''
+
+    def __init__(self, name, count_spark_rows=False):
+        self.name = name
+        self.count_spark_rows = count_spark_rows
+        self.input_rows, self.output_rows = None, None
+        self.metrics = {}
+
+    def _count(self, rows):
+        if rows is None or isinstance(rows, int):
+            return rows
+        if _is_spark_dataframe(rows):
+            # Counting runs the plan of the dataframe once more, so it is only done when enabled:
+            return rows.count() if self.count_spark_rows else None
+        return len(rows)
+
+    def set_rows(self, input_rows=None, output_rows=None):
+        '''
+        Records the row counts of the stage. The counts can be given as numbers, or as tables or lists to count
+        (pandas dataframes, lists, ...). Spark dataframes are only counted with `Config.INSTRUMENTATION_COUNT_ROWS`.
+        '''
+        if input_rows is not None:
+            self.input_rows = self._count(input_rows)
+        if output_rows is not None:
+            self.output_rows = self._count(output_rows)
+
+    def as_dict(self):
+        return dict(self.metrics, name=self.name, input_rows=self.input_rows, output_rows=self.output_rows)
+
+
+class RunReport(object):
+    '''
+    Run report of a parser.
+
+    Args:
+        parser (str): Name of the parser
+        spark (pyspark.sql.SparkSession): Spark session of the parser, if any. Can also be set later with `set_spark`.
+        count_spark_rows (bool): Whether the Spark dataframes given to `Stage.set_rows` are counted. Defaults to
+            `Config.INSTRUMENTATION_COUNT_ROWS`.
+    '''
+
+    def __init__(self, parser, spark=None, count_spark_rows=None):
+        self.parser = parser
+        self.spark = spark
+        self.count_spark_rows = Config.INSTRUMENTATION_COUNT_ROWS if count_spark_rows is None else count_spark_rows
+        self.stages = []
+        self.started = time.time()
+        self._wall_start, self._cpu_start = time.perf_counter(), time.process_time()
+
+    def set_spark(self, spark):
+        self.spark = spark
+
+    @contextmanager
+    def stage(self, name):
+        '''Context manager measuring one stage of the run. Yields the `Stage`, whose row counts can be set.'''
+        stage = Stage(name, self.count_spark_rows)
+        spark_jobs = self._start_spark_jobs(name)
+        peak_reset = _reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        status = 'failed'
+        try:
+            yield stage
+            status = 'ok'
+        finally:
+            stage.metrics.update(
+                status=status,
+                wall_time_s=round(time.perf_counter() - wall_start, 3),
+                cpu_time_s=round(time.process_time() - cpu_start, 3),
+                peak_rss_bytes=peak_rss(),
+                peak_rss_scope='stage' if peak_reset else 'process',
+            )
+            if spark_jobs:
+                stage.metrics['spark'] = self._end_spark_jobs(*spark_jobs)
+            self.stages.append(stage)
+            self._log(stage)
+
+    def _start_spark_jobs(self, name):
+        '''
+        Tags the Spark jobs of the stage with a job group. Returns the group and the properties it replaced, None
+        without Spark.
+        '''
+        if self.spark is None:
+            return None
+        context = self.spark.sparkContext
+        job_group = f'{self.parser}:{len(self.stages)}:{name}'
+        previous = {key: context.getLocalProperty(key) for key in ('spark.jobGroup.id', 'spark.job.description')}
+        context.setJobGroup(job_group, f'{self.parser} - {name}')
+        return job_group, previous
+
+    def _end_spark_jobs(self, job_group, previous):
+        '''Collects the metrics of the Spark jobs of a stage, and restores the previous job group.'''
+        context = self.spark.sparkContext
+        for key, value in previous.items():
+            context.setLocalProperty(key, value)
+        tracker = context.statusTracker()
+        job_ids = tracker.getJobIdsForGroup(job_group)
+        stage_ids = sorted({
+            stage_id for job_id in job_ids for stage_id in (getattr(tracker.getJobInfo(job_id), 'stageIds', None) or [])
+        })
+        metrics = {'jobs': len(job_ids), 'stages': len(stage_ids)}
+
+        stage_data = self._stage_data(stage_ids)
+        if stage_data is None:
+            metrics['tasks'] = sum(getattr(tracker.getStageInfo(i), 'numTasks', 0) for i in stage_ids)
+            return metrics
+
+        metrics['tasks'] = sum(attempt.get('numTasks', 0) for attempt in stage_data)
+        metrics['failed_tasks'] = sum(attempt.get('numFailedTasks', 0) for attempt in stage_data)
+        for key, name in SPARK_STAGE_METRICS.items():
+            metrics[name] = sum(attempt.get(key, 0) for attempt in stage_data)
+        metrics['executor_cpu_time_s'] = round(sum(attempt.get('executorCpuTime', 0) for attempt in stage_data) / 1e9, 3)
+        return metrics
+
+    def _stage_data(self, stage_ids):
+        '''Metrics of all the attempts of the given Spark stages, from the status store. None if not available.'''
+        context = self.spark.sparkContext
+        if not context.uiWebUrl:
+            return None
+        try:
+            # The status store is updated asynchronously, from the events of the tasks:
+            context._jsc.sc().listenerBus().waitUntilEmpty(10000)
+        except Exception:
+            pass
+
+        import urllib.request
+
+        url = f'{context.uiWebUrl}/api/v1/applications/{context.applicationId}/stages'
+        stage_data = []
+        try:
+            for stage_id in stage_ids:
+                with urllib.request.urlopen(f'{url}/{stage_id}', timeout=10) as response:
+                    stage_data.extend(json.load(response))
+        except Exception as e:
+            logging.warning(f'The Spark stage metrics are not available: {e}')
+            return None
+        return stage_data
+
+    def _log(self, stage):
+        metrics = stage.metrics
+        message = (
+            f'Stage {stage.name} ({metrics["status"]}): {metrics["wall_time_s"]:.1f} s, '
+            f'{metrics["cpu_time_s"]:.1f} s CPU, peak RSS {metrics["peak_rss_bytes"] / 2 ** 20:,.0f} MiB'
+        )
+        if stage.input_rows is not None:
+            message += f', {stage.input_rows} rows in'
+        if stage.output_rows is not None:
+            message += f', {stage.output_rows} rows out'
+        spark = metrics.get('spark')
+        if spark:
+            message += f', {spark["jobs"]} Spark jobs, {spark["tasks"]} tasks'
+            if 'shuffle_write_bytes' in spark:
+                message += (
+                    f', shuffle {spark["shuffle_write_bytes"] / 2 ** 20:,.1f} MiB, '
+                    f'spill {(spark["memory_bytes_spilled"] + spark["disk_bytes_spilled"]) / 2 ** 20:,.1f} MiB'
+                )
+        logging.info(message + '.')
+
+    def as_dict(self):
+        report = {
+            'parser': self.parser,
+            'command': sys.argv,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+            'wall_time_s': round(time.perf_counter() - self._wall_start, 3),
+            'cpu_time_s': round(time.process_time() - self._cpu_start, 3),
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (
+                1 if sys.platform == 'darwin' else 1024
+            ),
+            'stages': [stage.as_dict() for stage in self.stages],
+        }
+        if self.spark is not None:
+            context = self.spark.sparkContext
+            report['spark'] = {
+                'version': self.spark.version, 'master': context.master, 'application_id': context.applicationId
+            }
+        return report
+
+    def write(self, output_file):
+        '''
+        Writes the report next to the evidence file or directory, see `report_path`.
+
+        Returns:
+            filename (str): Name of the report
+        '''
+        filename = report_path(output_file)
+        report = self.as_dict()
+        report['output'] = str(output_file)
+        with open_uri(filename, 'w') as f:
+            json.dump(report, f, indent=2)
+        logging.info(f'Run report saved into {filename}: {report["wall_time_s"]:.1f} s in total.')
+        return filename
@@ -0,0 +1,140 @@
+'''
+Pluggable JSON encoding for the gzipped JSON lines evidence files.
+
+Two backends are available:
+- `json`: the standard library encoder. The C accelerated `json.dumps` is used, which produces exactly the same bytes
+  as the `json.dump` calls the parsers used before. This is the default.
+- `orjson`: optional high-speed backend, used only when requested and when the `orjson` package is installed. Its
+  output is compact (no spaces after separators) and floats use the shortest representation, so it is not byte for
+  byte identical to the `json` backend, but it is deterministic for the same input.
+'''
+
+import gzip
+import json
+import logging
+
+from common.BlockGzip import ParallelGzipFile
+from common.Storage import open_uri
+from settings import Config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Size of the buffer (in bytes) that is handed to the compressor in a single write.
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+class StdlibEncoder(object):
+    '''Standard library JSON encoder, output identical to `json.dump`.'''
+    name = 'json'
+
+    def encode(self, record):
+        return json.dumps(record).encode('utf-8')
+
+
+class OrjsonEncoder(object):
+    '''Encoder based on orjson. Native numpy types are supported, keys are serialized as they come.'''
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('The orjson backend was requested, but the orjson package is not installed.')
+        self.options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def encode(self, record):
+        return orjson.dumps(record, option=self.options)
+
+
+ENCODERS = {
+    StdlibEncoder.name: StdlibEncoder,
+    OrjsonEncoder.name: OrjsonEncoder,
+}
+
+
+def get_encoder(backend=None):
+    '''
+    Returns an encoder instance for the given backend name. If no name is given, the one set in
+    `Config.JSON_ENCODER_BACKEND` is used.
+    '''
+    backend = backend or Config.JSON_ENCODER_BACKEND
+    if backend not in ENCODERS:
+        raise ValueError(f'Unknown JSON encoder backend: {backend}. Available: {", ".join(ENCODERS)}.')
+    return ENCODERS[backend]()
+
+
+class JsonLinesWriter(object):
+    '''
+    Writes records as JSON lines into a gzip file. Records are serialized into a large byte buffer which is flushed to
+    the compressor in blocks, instead of doing two small writes per record through a text wrapper.
+
+    The gzip header is written without a timestamp or file name, so the same records always produce the same file.
+    With more than one compression thread, the file is written as a multi-member gzip by `common.BlockGzip`.
+
+    >>> with JsonLinesWriter('evidence.json.gz') as writer:
+    ...     writer.write({'datasourceId': 'clingen'})
+    '''
+
+    def __init__(self, filename, backend=None, buffer_size=DEFAULT_BUFFER_SIZE, threads=None, block_size=None):
+        self.filename = filename
+        self.encoder = get_encoder(backend)
+        self.threads = threads or Config.GZIP_THREADS
+        self.block_size = block_size
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.count = 0
+        self._raw_file, self._file = None, None
+
+    def __enter__(self):
+        if self.threads > 1:
+            self._file = ParallelGzipFile(self.filename, self.threads, self.block_size)
+        else:
+            # Streamed to the storage of the file, without a local copy of a remote output (see `common.Storage`):
+            self._raw_file = open_uri(self.filename, 'wb')
+            # Neither the file name nor a timestamp is stored in the gzip header:
+            self._file = gzip.GzipFile(filename='', mode='wb', fileobj=self._raw_file, mtime=0)
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.flush()
+        if self._raw_file:
+            self._file.close()
+            # A remote output is not written after an exception:
+            self._raw_file.__exit__(*exc)
+        else:
+            # Nor are the pending blocks of a multi-threaded file (see `common.BlockGzip`):
+            self._file.__exit__(*exc)
+
+    def write(self, record):
+        '''Serializes one record into the buffer.'''
+        self.write_encoded(self.encoder.encode(record))
+
+    def write_encoded(self, encoded_record):
+        '''Adds one already serialized record (bytes) to the buffer.'''
+        self.buffer += encoded_record
+        self.buffer += b'\n'
+        self.count += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self._file.write(self.buffer)
+            self.buffer = bytearray()
+
+
+def write_json_lines(records, filename, backend=None, threads=None, block_size=None):
+    '''
+    Writes an iterable of records into a gzipped JSON lines file.
+
+    Returns:
+        count (int): Number of records written
+    '''
+    with JsonLinesWriter(filename, backend, threads=threads, block_size=block_size) as writer:
+        for record in records:
+            writer.write(record)
+
+    logging.info(f'{writer.count} records saved into {filename} ({writer.encoder.name} encoder).')
+    return writer.count
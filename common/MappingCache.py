@@ -0,0 +1,284 @@
+'''
+Persistent cache of the OnToma lookups, shared by all the parsers that map diseases to EFO.
+
+The lookups are stored in a SQLite database on local disk, keyed by query type (the OnToma method and its options),
+normalized term and ontology release:
+- Lookups without a result are cached too (negative caching), so unmappable terms are not queried on every run.
+- Entries expire after `Config.ONTOMA_CACHE_TTL_DAYS` days (`Config.ONTOMA_CACHE_NEGATIVE_TTL_DAYS` for the negative
+  ones), and entries of a different release than `Config.ONTOMA_CACHE_RELEASE` are ignored.
+- The database runs in WAL mode with a busy timeout and every thread uses its own connection, so several parsers (or
+  worker processes of the same parser) can read and write it at the same time.
+'''
+
+import copy
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from common.Resolver import RateLimiter, call_with_backoff
+from settings import Config
+
+# Returned by `MappingCache.get` when a term is not cached (None is a cached negative result):
+MISSING = object()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS mappings (
+    query_type TEXT NOT NULL,
+    term TEXT NOT NULL,
+    release TEXT NOT NULL,
+    original_term TEXT NOT NULL,
+    result TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (query_type, term, release)
+)
+'''
+
+
+def normalize_term(term):
+    '''Normalizes a query term: case and repeated or surrounding whitespace are ignored.'''
+    return ' '.join(str(term).split()).lower()
+
+
+class MappingCache(object):
+    '''
+    Key-value store of lookup results on local disk.
+
+    Args:
+        path (str): SQLite database file. Defaults to `Config.ONTOMA_CACHE_PATH`.
+        release (str): Ontology release of the lookups. Defaults to `Config.ONTOMA_CACHE_RELEASE`.
+        ttl_days (float): Days after which a result is looked up again, 0 for never.
+        negative_ttl_days (float): Days after which a lookup without result is done again, 0 for never.
+    '''
+
+    def __init__(self, path=None, release=None, ttl_days=None, negative_ttl_days=None):
+        self.path = path or Config.ONTOMA_CACHE_PATH
+        self.release = release or Config.ONTOMA_CACHE_RELEASE
+        self.ttl = 86400 * (Config.ONTOMA_CACHE_TTL_DAYS if ttl_days is None else ttl_days)
+        self.negative_ttl = 86400 * (
+            Config.ONTOMA_CACHE_NEGATIVE_TTL_DAYS if negative_ttl_days is None else negative_ttl_days
+        )
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.hits, self.misses = 0, 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Connections and locks are not shared with other processes, they open their own:
+        state = self.__dict__.copy()
+        del state['_local'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        '''SQLite connection of the current thread.'''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _is_expired(self, result, created):
+        ttl = self.negative_ttl if result is None else self.ttl
+        return ttl > 0 and time.time() - created > ttl
+
+    def get(self, query_type, term):
+        '''Returns the cached result of a lookup, None for a cached negative result, or `MISSING`.'''
+        row = self.connection.execute(
+            'SELECT result, created FROM mappings WHERE query_type = ? AND term = ? AND release = ?',
+            (query_type, normalize_term(term), self.release)
+        ).fetchone()
+
+        with self._lock:
+            if row is None or self._is_expired(*row):
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+        return None if row[0] is None else json.loads(row[0])
+
+    def set(self, query_type, term, result):
+        '''Stores the result of a lookup. A None result is stored as a negative result.'''
+        self.connection.execute(
+            'INSERT OR REPLACE INTO mappings VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                query_type, normalize_term(term), self.release, str(term),
+                None if result is None else json.dumps(result), time.time()
+            )
+        )
+
+    def lookup(self, query_type, term, function):
+        '''
+        Returns the cached result for the term, or calls `function(term)` and caches its result. Lookups raising an
+        exception are not cached.
+        '''
+        result = self.get(query_type, term)
+        if result is MISSING:
+            result = function(term)
+            self.set(query_type, term, result)
+        return result
+
+    def export(self, filename, query_type, terms=None, default=None):
+        '''
+        Writes the cached results of one query type into a JSON file, as a dictionary of the queried terms. Negative
+        results are written as `default`.
+
+        Args:
+            filename (str): Output JSON file
+            query_type (str): Query type to export
+            terms (list): Terms to export. All the valid entries of the query type are exported if not given.
+            default: Value written for the terms without result
+        Returns:
+            mappings (dict): The exported dictionary
+        '''
+        if terms is None:
+            rows = self.connection.execute(
+                'SELECT original_term, result, created FROM mappings WHERE query_type = ? AND release = ?',
+                (query_type, self.release)
+            ).fetchall()
+            terms = [term for term, result, created in rows if not self._is_expired(result, created)]
+
+        mappings = {}
+        for term in terms:
+            result = self.get(query_type, term)
+            if result is not MISSING:
+                mappings[term] = copy.deepcopy(default) if result is None else result
+
+        with open(filename, 'w') as f:
+            json.dump(mappings, f)
+        return mappings
+
+    def purge(self):
+        '''Deletes the expired entries and the entries of other releases.'''
+        with self.connection as connection:
+            connection.execute('DELETE FROM mappings WHERE release != ?', (self.release,))
+            now = time.time()
+            if self.ttl > 0:
+                connection.execute(
+                    'DELETE FROM mappings WHERE result IS NOT NULL AND created < ?', (now - self.ttl,)
+                )
+            if self.negative_ttl > 0:
+                connection.execute(
+                    'DELETE FROM mappings WHERE result IS NULL AND created < ?', (now - self.negative_ttl,)
+                )
+
+    def log_stats(self):
+        logging.info(
+            f'Mapping cache {self.path} (release {self.release}): {self.hits} hits, {self.misses} misses.'
+        )
+
+
+class CachedOnToma(object):
+    '''
+    Drop-in replacement of `ontoma.interface.OnToma` whose lookups are cached in a `MappingCache`. The OnToma object
+    is only created on the first cache miss, and the methods that are not cached are delegated to it.
+
+    On a cache miss, the calls to every OnToma method (endpoint) are rate limited and retried with an exponential
+    backoff, so the object can be shared by the threads of a `common.Resolver.BatchResolver`.
+
+    Args:
+        otmap (ontoma.interface.OnToma): OnToma object. A new one is created when needed if not given.
+        cache (MappingCache): Cache of the lookups. Defaults to the cache set in `settings.Config`.
+        rate_limit (float): Maximum calls per second to each OnToma method. Defaults to `Config.ONTOMA_RATE_LIMIT`.
+    '''
+
+    def __init__(self, otmap=None, cache=None, rate_limit=None):
+        self._otmap = otmap
+        self.cache = cache or MappingCache()
+        self.rate_limit = Config.ONTOMA_RATE_LIMIT if rate_limit is None else rate_limit
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The OnToma object, the limiters and the lock are created again in other processes:
+        state = self.__dict__.copy()
+        state['_otmap'], state['_limiters'] = None, {}
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def otmap(self):
+        with self._lock:
+            if self._otmap is None:
+                from ontoma import OnToma
+                self._otmap = OnToma()
+        return self._otmap
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('_otmap', '_lock', '_limiters', 'cache'):
+            raise AttributeError(name)
+        return getattr(self.otmap, name)
+
+    def _call(self, method, *args, giveup=(), **kwargs):
+        '''Calls an OnToma method with the rate limit of the method and retries.'''
+        with self._lock:
+            limiter = self._limiters.setdefault(method, RateLimiter(self.rate_limit))
+        # The methods of the OLS client of OnToma are named by their path, such as `_ols.besthit`:
+        function = functools.reduce(getattr, method.split('.'), self.otmap)
+
+        def call():
+            limiter.acquire()
+            return function(*args, **kwargs)
+        call.__name__ = method
+
+        return call_with_backoff(call, giveup=giveup)
+
+    @staticmethod
+    def query_type(method, **kwargs):
+        '''Name of the cached query: the OnToma method and its options.'''
+        return method + ''.join(f':{key}={value}' for key, value in sorted(kwargs.items()))
+
+    def _lookup(self, method, term, **kwargs):
+        return self.cache.lookup(
+            self.query_type(method, **kwargs), term, lambda t: self._call(method, t, **kwargs)
+        )
+
+    def ols_besthit(self, term, **kwargs):
+        '''Best hit of a term in OLS, from `OnToma._ols.besthit`, with options such as `ontology` or `exact`.'''
+        return self.cache.lookup(
+            self.query_type('ols_besthit', **kwargs), term, lambda t: self._call('_ols.besthit', t, **kwargs)
+        )
+
+    def find_term(self, term, **kwargs):
+        return self._lookup('find_term', term, **kwargs)
+
+    def get_efo_label(self, term):
+        return self._lookup('get_efo_label', term)
+
+    def get_efo_from_xref(self, term):
+        return self._lookup('get_efo_from_xref', term)
+
+    def get_mondo_label(self, term):
+        return self._lookup('get_mondo_label', term)
+
+    def mondo_lookup(self, term):
+        '''As `OnToma.mondo_lookup`, raises a KeyError for the terms that are not found.'''
+        def lookup(t):
+            try:
+                return self._call('mondo_lookup', t, giveup=(KeyError,))
+            except KeyError:
+                return None
+
+        result = self.cache.lookup('mondo_lookup', term, lookup)
+        if result is None:
+            raise KeyError(term)
+        return result
+
+    def export(self, filename, method, terms=None, default=None, **kwargs):
+        '''Exports the cached results of an OnToma method into a JSON file, see `MappingCache.export`.'''
+        return self.cache.export(filename, self.query_type(method, **kwargs), terms, default)
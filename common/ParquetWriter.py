@@ -0,0 +1,161 @@
+'''
+Parquet output of the evidence strings, next to or instead of the gzipped JSON lines file.
+
+The Parquet output has the explicit nested schema of `common.EvidenceSchema`, so the downstream steps read typed
+columns, and can prune the columns and push the filters down, instead of parsing the JSON and inferring its schema. It
+is written next to the JSON output, with the `.json.gz` extension replaced by `.parquet` (see `parquet_path`):
+- by Spark, as a directory of part files,
+- by the parsers without Spark, as a single file written in row groups with `pyarrow`, without holding all the
+  evidence in memory.
+
+The output format of a parser is `json`, `parquet` or `both`, given on the command line or by `Config.OUTPUT_FORMAT`.
+'''
+
+import logging
+
+from common.EvidenceSchema import arrow_schema, conform_dataframe, conform_record
+from common.Storage import open_uri, spark_path
+from settings import Config
+
+JSON, PARQUET, BOTH = 'json', 'parquet', 'both'
+OUTPUT_FORMATS = (JSON, PARQUET, BOTH)
+
+# Number of evidence strings of a row group written with pyarrow:
+DEFAULT_ROW_GROUP_SIZE = 50000
+
+
+def output_formats(output_format=None):
+    '''
+    Formats written for an output format option.
+
+    Args:
+        output_format (str): `json`, `parquet` or `both`. Defaults to `Config.OUTPUT_FORMAT`.
+    Returns:
+        formats (set): `JSON` and/or `PARQUET`
+    '''
+    output_format = output_format or Config.OUTPUT_FORMAT
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format: {output_format}. Available: {", ".join(OUTPUT_FORMATS)}.')
+    return {JSON, PARQUET} if output_format == BOTH else {output_format}
+
+
+def parquet_path(output_file):
+    '''Name of the Parquet output of an evidence file: its JSON extension is replaced by `.parquet`.'''
+    path = str(output_file).rstrip('/')
+    for extension in ('.json.gz', '.jsonl.gz', '.json', '.gz'):
+        if path.endswith(extension):
+            path = path[:-len(extension)]
+            break
+    return path if path.endswith('.parquet') else f'{path}.parquet'
+
+
+class ParquetEvidenceWriter(object):
+    '''
+    Writes evidence strings into a Parquet file with the evidence schema, one row group at a time.
+
+    >>> with ParquetEvidenceWriter('evidence.parquet') as writer:
+    ...     writer.write({'datasourceId': 'clingen'})
+
+    Args:
+        filename (str): Name or URI of the Parquet file (see `common.Storage`), written as a stream
+        row_group_size (int): Number of evidence strings of a row group
+        compression (str): Parquet compression codec. Defaults to `Config.PARQUET_COMPRESSION`.
+    '''
+
+    def __init__(self, filename, row_group_size=DEFAULT_ROW_GROUP_SIZE, compression=None):
+        # pyarrow is only imported by the parsers writing Parquet files, as it is slow to import:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('The Parquet output without Spark requires the pyarrow package.')
+        self.pyarrow = pyarrow
+        self.filename = filename
+        self.row_group_size = row_group_size
+        self.schema = arrow_schema()
+        self.struct_type = pyarrow.struct(list(self.schema))
+        self.file = open_uri(filename, 'wb')
+        self.writer = pyarrow.parquet.ParquetWriter(
+            self.file, self.schema, compression=compression or Config.PARQUET_COMPRESSION
+        )
+        self.buffer = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.flush()
+        self.writer.close()
+        # A remote file is not written after an exception:
+        self.file.__exit__(*exc_info)
+
+    def write(self, record):
+        self.buffer.append(conform_record(record))
+        self.count += 1
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        rows = self.pyarrow.array(self.buffer, type=self.struct_type)
+        self.writer.write_table(self.pyarrow.Table.from_arrays(rows.flatten(), schema=self.schema))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        self.file.close()
+
+
+def write_parquet(records, filename, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    '''
+    Writes an iterable of evidence strings into a Parquet file.
+
+    Returns:
+        count (int): Number of evidence strings written
+    '''
+    with ParquetEvidenceWriter(filename, row_group_size) as writer:
+        for record in records:
+            writer.write(record)
+
+    logging.info(f'{writer.count} records saved into {filename}.')
+    return writer.count
+
+
+def write_spark_parquet(dataframe, output_dir, count=False):
+    '''
+    Writes a Spark dataframe of evidence strings into a Parquet directory, with the evidence schema.
+
+    Args:
+        dataframe (pyspark.sql.DataFrame): Evidence strings, with their columns named as the evidence fields
+        output_dir (str): Name of the Parquet directory. Spark writes `gs://` itself (see `common.Storage.spark_path`).
+        count (bool): Whether the written evidence strings are counted, from the metadata of the Parquet files
+    Returns:
+        count (int): Number of evidence strings written, if counted
+    '''
+    path = spark_path(output_dir)
+    (
+        conform_dataframe(dataframe)
+        .write.mode('overwrite').option('compression', Config.PARQUET_COMPRESSION)
+        .parquet(path)
+    )
+    if not count:
+        logging.info(f'Evidence strings saved into {output_dir}.')
+        return None
+    written = dataframe.sql_ctx.read.parquet(path).count()
+    logging.info(f'{written} evidence strings saved into {output_dir}.')
+    return written
+
+
+def write_pandas_parquet(dataframe, filename, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    '''
+    Writes a pandas dataframe of evidence strings into a Parquet file, with the missing values as nulls.
+
+    Returns:
+        count (int): Number of evidence strings written
+    '''
+    records = dataframe.astype(object).where(dataframe.notna(), None).to_dict('records')
+    return write_parquet(records, filename, row_group_size)
@@ -0,0 +1,190 @@
+'''
+Runs several parsers in one process, sharing one Spark session.
+
+Each parser started from the command line pays for the launch of a JVM, the creation of a Spark session and the warm-up
+of the Python workers. The runner executes the command line entry points of the parsers one after the other in the
+same process instead: `common.SparkSessionFactory.get_spark_session` returns the running session to every parser, and
+the lookup tables read through the engines (`read_csv(..., lookup=True)`) and the HGNC index are loaded once.
+
+The parsers are isolated from each other:
+- a parser which fails (exception or non-zero exit status) is reported, and the next ones still run,
+- the log records of a parser are tagged with its name, and also written into its own log file when one is given,
+- the Spark cache is cleared after each parser.
+
+With a run cache (see `common.Fingerprint`), a parser whose inputs, code and parameters have not changed since a
+cached run republishes its outputs instead of running.
+
+>>> run_parsers([
+...     ParserJob('modules/PheWAS.py', ['--inputFile', 'phewas.csv', ...], inputs=['phewas.csv'], outputs=['phewas.json.gz']),
+...     ParserJob('modules/Orphanet.py', ['--input_file', 'orphanet.xml', ...]),
+... ])
+'''
+
+import logging
+import os
+import runpy
+import sys
+import time
+import traceback
+
+from common.Fingerprint import fingerprint, placeholder_arguments, remove_outputs
+
+# Statuses of the parsers:
+SUCCEEDED, REPUBLISHED, FAILED = 'succeeded', 'republished', 'failed'
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(parser)s] %(module)s - %(funcName)s: %(message)s'
+
+
+class ParserJob(object):
+    '''
+    Run of a parser, with its command line arguments.
+
+    Args:
+        module_file (str): Path of the parser module, e.g. `modules/PheWAS.py`
+        arguments (list): Command line arguments of the parser
+        inputs (list): Input files or directories, for the fingerprint of the run
+        outputs (list): Output files or directories, republished from the run cache
+        log_file (str): Optional file in which the logs of the parser are also written
+        name (str): Name of the parser in the logs. Defaults to the name of the module.
+    '''
+
+    def __init__(self, module_file, arguments, inputs=(), outputs=(), log_file=None, name=None):
+        self.module_file = module_file
+        self.arguments = [str(argument) for argument in arguments]
+        self.inputs = [str(path) for path in inputs]
+        self.outputs = [str(path) for path in outputs]
+        self.log_file = log_file
+        self.name = name or os.path.splitext(os.path.basename(module_file))[0]
+
+
+class _ParserFilter(logging.Filter):
+    '''Tags the log records with the name of the running parser.'''
+
+    def __init__(self):
+        super().__init__()
+        self.parser = '-'
+
+    def filter(self, record):
+        record.parser = self.parser
+        return True
+
+
+def _run_module(job):
+    '''Runs the command line entry point of a parser module. Returns its exit status.'''
+    saved_argv = sys.argv
+    sys.argv = [job.module_file] + job.arguments
+    try:
+        runpy.run_path(job.module_file, run_name='__main__')
+        return 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        sys.argv = saved_argv
+
+
+def _clear_spark_cache():
+    # Only when a parser has started Spark: the runner itself does not import it.
+    if 'pyspark.sql' not in sys.modules:
+        return
+    from pyspark.sql import SparkSession
+    spark = SparkSession.getActiveSession() if hasattr(SparkSession, 'getActiveSession') else None
+    spark = spark or SparkSession._instantiatedSession
+    if spark is not None:
+        spark.catalog.clearCache()
+
+
+def run_parsers(jobs, run_cache=None, force=False, spark_profile=None):
+    '''
+    Runs parsers one after the other in the current process.
+
+    Args:
+        jobs (list): `ParserJob`s to run
+        run_cache (common.Fingerprint.RunCache): Cache of the previous runs, to republish the outputs of the parsers
+            whose fingerprint has not changed. Not used when not given.
+        force (bool): Whether the parsers are run even when a run with the same fingerprint is cached
+        spark_profile (str): When given (`local` or `cluster`), the Spark session is started first with this profile,
+            sized from the inputs of all the jobs, and reused by the parsers
+    Returns:
+        statuses (dict): Status of each parser, `SUCCEEDED`, `REPUBLISHED` or `FAILED`
+    '''
+    parser_filter = _ParserFilter()
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
+    for handler in root.handlers:
+        handler.addFilter(parser_filter)
+
+    statuses = {}
+    try:
+        if spark_profile:
+            from common.SparkSessionFactory import get_spark_session
+            get_spark_session('evidence_parsers', spark_profile, [path for job in jobs for path in job.inputs])
+
+        for job in jobs:
+            parser_filter.parser = job.name
+            handler = None
+            if job.log_file:
+                os.makedirs(os.path.dirname(os.path.abspath(job.log_file)), exist_ok=True)
+                handler = logging.FileHandler(job.log_file)
+                handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt='%Y-%m-%d %H:%M:%S'))
+                handler.addFilter(parser_filter)
+                root.addHandler(handler)
+            try:
+                statuses[job.name] = _run_job(job, run_cache, force)
+            except Exception:
+                # The fingerprint or the run cache failed: the next parsers still run.
+                logging.error(f'The run of the parser failed:\n{traceback.format_exc()}')
+                statuses[job.name] = FAILED
+            finally:
+                if handler:
+                    root.removeHandler(handler)
+                    handler.close()
+
+        parser_filter.parser = '-'
+        failed = [name for name, status in statuses.items() if status == FAILED]
+        logging.info(
+            f'{len(statuses)} parsers run: ' + ', '.join(f'{name} {status}' for name, status in statuses.items())
+            + (f'. Failed: {", ".join(failed)}.' if failed else '.')
+        )
+    finally:
+        for handler in root.handlers:
+            handler.removeFilter(parser_filter)
+    return statuses
+
+
+def _run_job(job, run_cache, force):
+    '''Runs a parser, or republishes the outputs of its cached run. Returns its status.'''
+    start = time.time()
+    run_fingerprint = None
+    if run_cache is not None:
+        arguments = placeholder_arguments(job.arguments, job.inputs, job.outputs)
+        arguments.append(f'outputs={len(job.outputs)}')
+        run_fingerprint, components = fingerprint(
+            job.module_file, run_cache.local_inputs(job.inputs), arguments, run_cache.checksums
+        )
+        run = run_cache.lookup(job.name, run_fingerprint)
+        if run and not force:
+            run_cache.republish(job.name, run_fingerprint, job.outputs)
+            logging.info(f'Unchanged inputs, code and parameters: the outputs of the run of {run["created"]} were '
+                         'republished.')
+            return REPUBLISHED
+
+    if run_cache is not None:
+        remove_outputs(job.outputs)
+    logging.info(f'Running {job.module_file} {" ".join(job.arguments)}')
+    try:
+        status = _run_module(job)
+    except Exception:
+        logging.error(f'The parser failed:\n{traceback.format_exc()}')
+        status = 1
+    finally:
+        _clear_spark_cache()
+
+    if status != 0:
+        logging.error(f'The parser failed after {time.time() - start:.1f} s (exit status {status}).')
+        return FAILED
+    if run_cache is not None:
+        run_cache.store(job.name, run_fingerprint, components, job.outputs)
+    logging.info(f'The parser succeeded in {time.time() - start:.1f} s.')
+    return SUCCEEDED
+
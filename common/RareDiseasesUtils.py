@@ -1,6 +1,6 @@
 from collections import OrderedDict
 import logging
-import urllib
+from common.HttpClient import get
 from settings import Config
 
 class RareDiseaseMapper(object):
@@ -14,10 +14,11 @@ class RareDiseaseMapper(object):
 
     def get_omim_to_efo_mappings(self):
         self._logger.info("OMIM to EFO parsing - requesting from URL %s" % Config.OMIM_TO_EFO_MAP_URL)
-        response = urllib.request.urlopen(Config.OMIM_TO_EFO_MAP_URL)
-        self._logger.info("OMIM to EFO parsing - response code %s" % response.status)
+        response = get(Config.OMIM_TO_EFO_MAP_URL)
+        response.raise_for_status()
+        self._logger.info("OMIM to EFO parsing - response code %s" % response.status_code)
         line_count = 0
-        for line in response.readlines():
+        for line in response.content.splitlines():
             line = line.decode('utf8').strip()
             #if its an empty line after stripping, skip it
             if len(line) == 0:
@@ -35,10 +36,11 @@ class RareDiseaseMapper(object):
 
     def get_opentargets_zooma_to_efo_mappings(self):
         self._logger.info("ZOOMA to EFO parsing - requesting from URL %s" % Config.ZOOMA_TO_EFO_MAP_URL)
-        response = urllib.request.urlopen(Config.ZOOMA_TO_EFO_MAP_URL)
-        self._logger.info("ZOOMA to EFO parsing - response code %s" % response.status)
+        response = get(Config.ZOOMA_TO_EFO_MAP_URL)
+        response.raise_for_status()
+        self._logger.info("ZOOMA to EFO parsing - response code %s" % response.status_code)
         n = 0
-        for line in response.readlines():
+        for line in response.content.splitlines():
             line = line.decode('utf8').strip()
             #if its an empty line after stripping, skip it
             if len(line) == 0:
@@ -0,0 +1,135 @@
+'''
+Memory-bounded buffer of the records built on the driver, spilled to a local file beyond a memory budget.
+
+The parsers which build their whole output in Python before writing it (ClinGen, ...) append the records to a
+`RecordBuffer` instead of a list. The buffer keeps an estimate of the memory held by its records, measured on one
+record out of `SIZE_SAMPLE_INTERVAL`, and when it exceeds `Config.RECORD_BUFFER_SIZE` MiB, the records are pickled
+and compressed in batches into a temporary file, then dropped from memory. The records are read back in the order they were appended, one batch at a
+time, so the memory held by the buffer never exceeds the budget plus one batch, whatever the size of the input.
+
+>>> with RecordBuffer() as evidence_strings:
+...     for row in rows:
+...         evidence_strings.append(build_evidence(row))
+...     write_evidence_records(evidence_strings, output_file)
+'''
+
+import logging
+import pickle
+import sys
+import tempfile
+import zlib
+
+from common.Instrumentation import peak_rss
+from settings import Config
+
+# Number of records of a spilled batch:
+DEFAULT_BATCH_SIZE = 10000
+
+# The size of one record out of this many is measured, the others are given the mean measured size:
+SIZE_SAMPLE_INTERVAL = 100
+
+
+def deep_size(value):
+    '''Estimate of the memory held by a record of dictionaries, lists and scalars, in bytes.'''
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key) + deep_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_size(item) for item in value)
+    return size
+
+
+class RecordBuffer(object):
+    '''
+    Append-only sequence of records, held in memory up to a budget and spilled to disk beyond it.
+
+    Args:
+        budget (int): Memory budget of the records, in bytes. Defaults to `Config.RECORD_BUFFER_SIZE` MiB.
+        batch_size (int): Number of records of a spilled batch, and of the batches returned by `batches`
+        name (str): Name of the buffer in the logs
+    '''
+
+    def __init__(self, budget=None, batch_size=DEFAULT_BATCH_SIZE, name='records'):
+        self.budget = Config.RECORD_BUFFER_SIZE * 2 ** 20 if budget is None else budget
+        self.batch_size = batch_size
+        self.name = name
+        self.records = []
+        self.memory = 0
+        self.count = 0
+        self._record_size, self._sampled_records = 0, 0
+        self._spill_file = None
+        self.spilled_batches, self.spilled_records, self.spilled_bytes = 0, 0, 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+    def append(self, record):
+        if self.count % SIZE_SAMPLE_INTERVAL == 0:
+            self._sampled_records += 1
+            self._record_size += (deep_size(record) - self._record_size) / self._sampled_records
+        self.records.append(record)
+        self.memory += self._record_size
+        self.count += 1
+        if self.memory > self.budget:
+            self.spill()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def spill(self):
+        '''Writes the records held in memory into the spill file, in batches, and releases them.'''
+        if not self.records:
+            return
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix='record_buffer_')
+        # The batches are appended, wherever a reader of the batches left the file:
+        self._spill_file.seek(0, 2)
+        for start in range(0, len(self.records), self.batch_size):
+            data = zlib.compress(pickle.dumps(self.records[start:start + self.batch_size], pickle.HIGHEST_PROTOCOL), 1)
+            pickle.dump(data, self._spill_file, pickle.HIGHEST_PROTOCOL)
+            self.spilled_batches += 1
+            self.spilled_bytes += len(data)
+        self.spilled_records += len(self.records)
+        self.records, self.memory = [], 0
+
+    def batches(self):
+        '''
+        Yields the records in the order they were appended, as lists of at most `batch_size` records: the spilled
+        batches first, read back one at a time, then the records held in memory.
+        '''
+        # The spill file is shared with `spill` and with the other readers, so every batch is read from this reader's
+        # own offset:
+        offset, batch = 0, 0
+        while batch < self.spilled_batches:
+            self._spill_file.seek(offset)
+            data = pickle.load(self._spill_file)
+            offset = self._spill_file.tell()
+            batch += 1
+            yield pickle.loads(zlib.decompress(data))
+        for start in range(0, len(self.records), self.batch_size):
+            yield self.records[start:start + self.batch_size]
+
+    def log_stats(self):
+        logging.info(
+            f'Record buffer {self.name}: {self.count} records, {self.spilled_records} of them spilled in '
+            f'{self.spilled_batches} batches ({self.spilled_bytes / 2 ** 20:,.1f} MiB), peak RSS '
+            f'{peak_rss() / 2 ** 20:,.0f} MiB.'
+        )
+
+    def close(self):
+        '''Releases the records and removes the spill file.'''
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        self.records = []
@@ -0,0 +1,102 @@
+'''
+Concurrent resolution of lookup batches against remote services (OnToma, OLS, ...).
+
+- `BatchResolver` resolves the distinct terms of a batch on a bounded thread pool, and returns the results in the order
+  in which the terms were first seen, whatever the order in which the lookups finish.
+- `RateLimiter` spaces the calls made to one endpoint by all the threads of the process.
+- `call_with_backoff` retries failed calls with an exponential backoff and random jitter.
+'''
+
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+
+from settings import Config
+
+
+class RateLimiter(object):
+    '''
+    Limits the calls to an endpoint to `rate` calls per second, shared by all the threads using the limiter.
+    A rate of 0 or None disables the limit.
+    '''
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Blocks until a call can be made.'''
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def call_with_backoff(function, *args, max_retries=None, base_delay=1.0, max_delay=60.0, giveup=(), **kwargs):
+    '''
+    Calls a function, retrying it when it raises an exception. The n-th retry waits `base_delay * 2 ** n` seconds
+    (at most `max_delay`), with a random jitter so concurrent callers do not retry in lockstep.
+
+    Args:
+        function (callable): Function to call with the given `args` and `kwargs`
+        max_retries (int): Number of retries. Defaults to `Config.ONTOMA_MAX_RETRIES`.
+        base_delay (float): Delay before the first retry, in seconds
+        max_delay (float): Maximum delay between two attempts, in seconds
+        giveup (tuple): Exception types that are raised without retrying (e.g. a KeyError meaning "not found")
+    '''
+    max_retries = Config.ONTOMA_MAX_RETRIES if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        try:
+            return function(*args, **kwargs)
+        except giveup:
+            raise
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logging.warning(f'{getattr(function, "__name__", function)} failed ({e}), retrying in {delay:.1f} s.')
+            time.sleep(delay)
+
+
+class BatchResolver(object):
+    '''
+    Resolves batches of terms with a lookup function on a bounded thread pool.
+
+    Args:
+        function (callable): Lookup function, called with one term at a time. It must be thread safe.
+        workers (int): Number of worker threads. Defaults to `Config.ONTOMA_WORKERS`.
+        default: Result of the terms whose lookup raised an exception (the error is logged)
+
+    >>> mappings = BatchResolver(ontoma.find_term).resolve(['asthma', 'breast carcinoma', 'asthma'])
+    '''
+
+    def __init__(self, function, workers=None, default=None):
+        self.function = function
+        self.workers = workers or Config.ONTOMA_WORKERS
+        self.default = default
+
+    def _resolve_one(self, term):
+        try:
+            return self.function(term)
+        except Exception as e:
+            logging.error(f'{term} mapping has failed: {e}')
+            return self.default
+
+    def resolve(self, terms):
+        '''
+        Returns:
+            results (dict): Result of every distinct term, in the order in which the terms were first seen
+        '''
+        distinct_terms = list(dict.fromkeys(terms))
+        logging.info(f'Resolving {len(distinct_terms)} distinct terms with {self.workers} workers.')
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # `map` returns the results in the order of the terms:
+            return dict(zip(distinct_terms, executor.map(self._resolve_one, distinct_terms)))
@@ -0,0 +1,74 @@
+'''
+Sampled runs of the parsers, for fast iteration on their code.
+
+A run is sampled by setting `OT_SAMPLE_FRACTION` to a fraction between 0 and 1 (see `Config.SAMPLE_FRACTION`). Each
+parser then keeps a fraction of its primary key space (genes, variants, studies, diseases, ...) rather than a fraction
+of its rows: a key is sampled when the CRC32 of its UTF-8 text is below the fraction of the 2^32 range. The filter is
+applied to every table holding the key as soon as it is read, so that:
+- the joins on the key match the same rows as in a full run, and every code path runs on a small input,
+- the selection is the same for every table, run and engine: `zlib.crc32` in Python and pandas, `crc32` in Spark.
+
+The keys made of several columns (such as a variant: chromosome, position, reference and alternate alleles) are
+joined with `_`. The rows with a null key are not sampled.
+
+The lookup tables (disease mappings, ontologies, ...) are read in full. The fingerprint of a sampled run includes
+`OT_SAMPLE_FRACTION`, so its outputs are never republished for a full run (see `common.Fingerprint`).
+'''
+
+import logging
+import zlib
+
+from settings import Config
+
+KEY_SEPARATOR = '_'
+
+
+def sample_fraction():
+    '''Fraction of the keys kept by a sampled run, or None when the run is not sampled.'''
+    fraction = Config.SAMPLE_FRACTION
+    return fraction if fraction and 0 < fraction < 1 else None
+
+
+def _threshold(fraction):
+    return int(fraction * 2 ** 32)
+
+
+def sample_key(*values):
+    '''Text of the key made of the given values, None if any of them is null.'''
+    if any(value is None or value != value for value in values):
+        return None
+    return KEY_SEPARATOR.join(str(value) for value in values)
+
+
+def in_sample(*values):
+    '''Whether the key made of the given values is sampled. Always true when the run is not sampled.'''
+    fraction = sample_fraction()
+    if fraction is None:
+        return True
+    key = sample_key(*values)
+    return key is not None and zlib.crc32(key.encode('utf-8')) < _threshold(fraction)
+
+
+def sample_spark(dataframe, *columns):
+    '''Keeps the rows of a Spark dataframe whose key, made of the given columns, is sampled.'''
+    fraction = sample_fraction()
+    if fraction is None:
+        return dataframe
+
+    from pyspark.sql import functions as F
+
+    parts = []
+    for column in columns:
+        parts.extend([F.lit(KEY_SEPARATOR), F.col(f'`{column}`').cast('string')])
+    # concat is null as soon as one of the columns is, so the rows with a null key are filtered out:
+    key = F.concat(*parts[1:]) if len(columns) > 1 else parts[1]
+    logging.info(f'Sampling {fraction:.2%} of the {"/".join(columns)} keys.')
+    return dataframe.filter(F.crc32(key) < _threshold(fraction))
+
+
+def sample_pandas(dataframe, *columns):
+    '''Keeps the rows of a pandas dataframe whose key, made of the given columns, is sampled.'''
+    if sample_fraction() is None:
+        return dataframe
+    keep = [in_sample(*values) for values in zip(*(dataframe[column] for column in columns))]
+    return dataframe[keep] if keep else dataframe
@@ -0,0 +1,295 @@
+'''
+Streaming validation of the evidence files against the JSON schema of the platform evidence.
+
+The schema is read from a local copy (`Config.EVIDENCE_SCHEMA_PATH`), fetched once from the opentargets/json_schema
+repository when missing. It is compiled once per process into a validation function: with `fastjsonschema` when it is
+installed, which generates Python code for the schema, otherwise with the `jsonschema` validator of its draft.
+
+The evidence files are gzipped (or plain) JSON lines: single files, or directories of part files written by Spark.
+They are never loaded in memory. The shards are validated in parallel on a pool of processes; when there are fewer
+shards than processes, they are read as streams of chunks of lines handed to the processes. The result is a summary
+per datasource: number of records, invalid records, and the number of every error with a few example lines.
+
+>>> summary = validate_evidence(['phewas.json.gz', 'epmc/'])
+>>> summary.invalid
+0
+'''
+
+import collections
+import concurrent.futures
+import gzip
+import itertools
+import json
+import logging
+import os
+import re
+
+from common.HttpClient import download
+from settings import Config
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+SCHEMA_URL = 'https://raw.githubusercontent.com/opentargets/json_schema/{version}/schemas/disease_target_evidence.json'
+
+# Number of lines of a chunk handed to a process, and example lines kept for every error:
+DEFAULT_CHUNK_SIZE = 20000
+MAX_EXAMPLES = 5
+
+# Datasource of the lines which are not valid JSON:
+UNPARSABLE = 'unparsable'
+
+# Schema compiled by every process of the pool, and its number of example lines per error:
+_schema = None
+_max_examples = MAX_EXAMPLES
+
+
+def load_schema(schema_file=None, version=None):
+    '''
+    Reads the evidence schema from its local copy, which is fetched first if missing.
+
+    Args:
+        schema_file (str): Local copy of the schema. Defaults to `Config.EVIDENCE_SCHEMA_PATH`.
+        version (str): Branch or tag of the opentargets/json_schema repository to fetch the schema from. Defaults to
+            `Config.EVIDENCE_SCHEMA_VERSION`.
+    Returns:
+        schema (dict)
+    '''
+    schema_file = schema_file or Config.EVIDENCE_SCHEMA_PATH
+    if not os.path.exists(schema_file):
+        url = SCHEMA_URL.format(version=version or Config.EVIDENCE_SCHEMA_VERSION)
+        logging.info(f'Fetching the evidence schema from {url} into {schema_file}.')
+        os.makedirs(os.path.dirname(os.path.abspath(schema_file)), exist_ok=True)
+        download(url, schema_file)
+    with open(schema_file) as f:
+        return json.load(f)
+
+
+def _location(path):
+    '''Location of a value in a record, in the `data.field[index]` notation of fastjsonschema.'''
+    return 'data' + ''.join(f'[{p}]' if isinstance(p, int) else f'.{p}' for p in path)
+
+
+class CompiledSchema(object):
+    '''
+    Validation function of a JSON schema, compiled once.
+
+    Args:
+        schema (dict): JSON schema
+    '''
+
+    def __init__(self, schema):
+        if fastjsonschema is not None:
+            self.backend = 'fastjsonschema'
+            self._validate = fastjsonschema.compile(schema)
+        elif jsonschema is not None:
+            self.backend = 'jsonschema'
+            validator_class = jsonschema.validators.validator_for(schema)
+            validator_class.check_schema(schema)
+            self._validator = validator_class(schema)
+        else:
+            raise ImportError('The evidence validation requires the fastjsonschema or the jsonschema package.')
+
+    def first_error(self, record):
+        '''
+        Validates a record.
+
+        Returns:
+            error (tuple): Location, failed rule and message of the first error of the record. None if it is valid.
+        '''
+        if self.backend == 'fastjsonschema':
+            try:
+                self._validate(record)
+                return None
+            except fastjsonschema.JsonSchemaException as e:
+                return getattr(e, 'name', 'data'), getattr(e, 'rule', None), e.message
+
+        error = jsonschema.exceptions.best_match(self._validator.iter_errors(record))
+        if error is None:
+            return None
+        return _location(error.absolute_path), error.validator, error.message
+
+
+class ValidationSummary(object):
+    '''
+    Validation results per datasource: records, invalid records, and the count of every error. The errors are
+    identified by their location, with the array indices removed, and the failed rule.
+
+    Args:
+        max_examples (int): Number of example lines kept for every error
+    '''
+
+    def __init__(self, max_examples=MAX_EXAMPLES):
+        self.max_examples = max_examples
+        self.datasources = {}
+
+    def _datasource(self, name):
+        return self.datasources.setdefault(name, {
+            'records': 0, 'invalid': 0, 'errors': collections.Counter(), 'examples': {}
+        })
+
+    @property
+    def records(self):
+        return sum(datasource['records'] for datasource in self.datasources.values())
+
+    @property
+    def invalid(self):
+        return sum(datasource['invalid'] for datasource in self.datasources.values())
+
+    def add(self, datasource, error=None, filename=None, line=None):
+        '''Records a validated line, with its first error if it is invalid (see `CompiledSchema.first_error`).'''
+        summary = self._datasource(datasource)
+        summary['records'] += 1
+        if error is None:
+            return
+        location, rule, message = error
+        key = re.sub(r'\[\d+\]', '[]', location) + (f' ({rule})' if rule else '')
+        summary['invalid'] += 1
+        summary['errors'][key] += 1
+        examples = summary['examples'].setdefault(key, [])
+        if len(examples) < self.max_examples:
+            examples.append({'file': filename, 'line': line, 'message': message[:500]})
+
+    def merge(self, other):
+        '''Adds the results of another summary into this one.'''
+        for name, other_summary in other.datasources.items():
+            summary = self._datasource(name)
+            summary['records'] += other_summary['records']
+            summary['invalid'] += other_summary['invalid']
+            summary['errors'].update(other_summary['errors'])
+            for key, other_examples in other_summary['examples'].items():
+                examples = summary['examples'].setdefault(key, [])
+                examples.extend(other_examples[:self.max_examples - len(examples)])
+
+    def as_dict(self):
+        return {
+            'records': self.records,
+            'invalid': self.invalid,
+            'datasources': {
+                name: {
+                    'records': summary['records'],
+                    'invalid': summary['invalid'],
+                    'errors': [
+                        {'error': key, 'count': count, 'examples': summary['examples'][key]}
+                        for key, count in summary['errors'].most_common()
+                    ],
+                }
+                for name, summary in sorted(self.datasources.items())
+            },
+        }
+
+    def log(self):
+        for name, summary in sorted(self.datasources.items()):
+            logging.info(f'{name}: {summary["records"]} records, {summary["invalid"]} invalid.')
+            for key, count in summary['errors'].most_common(10):
+                logging.info(f'    {count} x {key}: {summary["examples"][key][0]["message"]}')
+
+
+def list_shards(paths):
+    '''Files of the evidence outputs: the files themselves, or the part files of the directories written by Spark.'''
+    shards = []
+    for path in paths:
+        if os.path.isdir(path):
+            shards.extend(
+                os.path.join(path, f) for f in sorted(os.listdir(path))
+                if f.startswith('part-') and not f.endswith('.crc')
+            )
+        else:
+            shards.append(path)
+    return shards
+
+
+def _open(filename):
+    return gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb')
+
+
+def _init_worker(schema_file, max_examples):
+    global _schema, _max_examples
+    _schema = CompiledSchema(load_schema(schema_file))
+    _max_examples = max_examples
+
+
+def _validate_lines(lines, filename, first_line):
+    summary = ValidationSummary(_max_examples)
+    for number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            summary.add(UNPARSABLE, ('data', 'json', str(e)), filename, number)
+            continue
+        datasource = record.get('datasourceId') if isinstance(record, dict) else None
+        summary.add(datasource or 'unknown', _schema.first_error(record), filename, number)
+    return summary
+
+
+def _validate_shard(filename):
+    with _open(filename) as f:
+        return _validate_lines(f, filename, 1)
+
+
+def _validate_chunk(task):
+    filename, first_line, lines = task
+    return _validate_lines(lines, filename, first_line)
+
+
+def _chunks(filename, chunk_size):
+    '''Streams a file as (file name, number of the first line, lines) chunks.'''
+    with _open(filename) as f:
+        first_line = 1
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            yield filename, first_line, lines
+            first_line += len(lines)
+
+
+def validate_evidence(paths, schema_file=None, processes=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                      max_examples=MAX_EXAMPLES):
+    '''
+    Validates evidence files against the evidence schema, on a pool of processes.
+
+    Args:
+        paths (list): Evidence files, or directories of part files
+        schema_file (str): Local copy of the schema, see `load_schema`
+        processes (int): Number of validating processes. Defaults to the number of CPUs.
+        chunk_size (int): Number of lines handed to a process at once, when the files are read as chunks
+        max_examples (int): Number of example lines kept for every error
+    Returns:
+        summary (ValidationSummary)
+    '''
+    schema_file = schema_file or Config.EVIDENCE_SCHEMA_PATH
+    # Fetches the schema if needed, and fails early if it cannot be compiled:
+    CompiledSchema(load_schema(schema_file))
+
+    processes = processes or os.cpu_count()
+    shards = list_shards(paths)
+    summary = ValidationSummary(max_examples)
+    with concurrent.futures.ProcessPoolExecutor(
+        processes, initializer=_init_worker, initargs=(schema_file, max_examples)
+    ) as executor:
+        if len(shards) >= processes:
+            tasks = ((_validate_shard, shard) for shard in shards)
+        else:
+            tasks = ((_validate_chunk, chunk) for shard in shards for chunk in _chunks(shard, chunk_size))
+
+        # At most two tasks per process are pending, so the files are not read ahead into memory:
+        pending = collections.deque()
+        for function, task in tasks:
+            if len(pending) >= 2 * processes:
+                summary.merge(pending.popleft().result())
+            pending.append(executor.submit(function, task))
+        while pending:
+            summary.merge(pending.popleft().result())
+
+    logging.info(f'{summary.records} records validated from {len(shards)} files, {summary.invalid} invalid.')
+    return summary
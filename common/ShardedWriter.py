@@ -0,0 +1,284 @@
+'''
+Deterministic sharded output of the evidence strings, with a manifest.
+
+Instead of a single gzipped JSON lines file (one writing task), or of the part files of Spark (whose number and
+content depend on the partitioning of the run), the evidence is written as a directory of shards:
+- the evidence strings are sorted by their association key (see `common.AssociationKey.association_key`), then by
+  their serialized JSON, which is a total order: the same evidence always gives the same lines in the same order,
+- a shard starts at the first evidence string whose offset in the sorted, uncompressed output reaches the next
+  multiple of the shard size, so the shards only depend on the evidence, not on the Spark partitions,
+- the shards are gzipped without a timestamp or file name (as by `common.JsonWriter`), so they are reproducible byte
+  for byte.
+
+`manifest.json` lists each shard with its number of records, its size, its SHA-256 checksum and the first and last
+association keys it holds. It is written last, so a directory with a manifest is complete. The shards can be uploaded
+and loaded in parallel, and compared across runs by their checksums.
+
+With Spark, the shards are compressed on the executors and the driver only writes their bytes, one at a time.
+'''
+
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+
+from common.JsonWriter import get_encoder
+from common.AssociationKey import association_key
+from common.Storage import get_storage, join_uri, open_uri
+
+MANIFEST_NAME = 'manifest.json'
+SHARD_NAME = 'part-{:05d}.json.gz'
+
+# Default target size of a shard, in bytes of uncompressed JSON lines:
+DEFAULT_SHARD_SIZE = 256 * 2 ** 20
+
+
+def _sort_key(record, encoder, key_fields=None):
+    '''Sort key and JSON line of an evidence string.'''
+    line = encoder.encode(record)
+    return (association_key(record, key_fields), line), line
+
+
+def shard_of(offset, shard_size):
+    '''Index (before renumbering) of the shard holding the line starting at the given offset of the sorted output.'''
+    return offset // shard_size
+
+
+def _compress_shard(keyed_lines):
+    '''
+    Compresses the sorted lines of a shard.
+
+    Args:
+        keyed_lines (iterable): (association key, line) pairs
+    Returns:
+        shard (tuple): Gzipped content, and the manifest entry of the shard without its file name
+    '''
+    content = io.BytesIO()
+    records, uncompressed, first_key, last_key = 0, 0, None, None
+    with gzip.GzipFile(filename='', mode='wb', fileobj=content, mtime=0) as gzip_file:
+        for key, line in keyed_lines:
+            gzip_file.write(line + b'\n')
+            records += 1
+            uncompressed += len(line) + 1
+            first_key = key if first_key is None else first_key
+            last_key = key
+    data = content.getvalue()
+    return data, {
+        'records': records,
+        'bytes': len(data),
+        'uncompressedBytes': uncompressed,
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'firstKey': json.loads(first_key),
+        'lastKey': json.loads(last_key),
+    }
+
+
+class ShardWriter(object):
+    '''
+    Writes the shards of an output directory in order, then its manifest.
+
+    Args:
+        output_dir (str): Output directory, local or any URI of `common.Storage`. The shards and the manifest of a
+            previous run are removed.
+        shard_size (int): Target size of a shard, in bytes of uncompressed JSON lines
+        key_fields (tuple): Fields of the association key the evidence is sorted by. Defaults to the unique
+            association fields of each datasource.
+    '''
+
+    def __init__(self, output_dir, shard_size, key_fields=None):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.key_fields = key_fields
+        self.shards = []
+        self.storage = get_storage(output_dir)
+
+        if self.storage.local:
+            path = self.storage.path(output_dir)
+            if os.path.isfile(path):
+                os.remove(path)
+            os.makedirs(path, exist_ok=True)
+        for name in self.storage.list(output_dir) if self.storage.is_directory(output_dir) else []:
+            if name == MANIFEST_NAME or (name.startswith('part-') and name.endswith('.json.gz')):
+                self.storage.delete(join_uri(output_dir, name))
+
+    @property
+    def count(self):
+        return sum(shard['records'] for shard in self.shards)
+
+    def write_shard(self, data, entry):
+        entry = dict(file=SHARD_NAME.format(len(self.shards)), **entry)
+        with open_uri(join_uri(self.output_dir, entry['file']), 'wb') as shard_file:
+            shard_file.write(data)
+        self.shards.append(entry)
+
+    def close(self):
+        manifest = {
+            'records': self.count,
+            'shardSize': self.shard_size,
+            'sortKey': list(self.key_fields) if self.key_fields else 'association',
+            'shards': self.shards,
+        }
+        content = json.dumps(manifest, indent=2, sort_keys=True) + '\n'
+        if self.storage.local:
+            temp_name = os.path.join(self.storage.path(self.output_dir), f'.{MANIFEST_NAME}.tmp')
+            with open(temp_name, 'w') as manifest_file:
+                manifest_file.write(content)
+            os.replace(temp_name, os.path.join(self.storage.path(self.output_dir), MANIFEST_NAME))
+        else:
+            # A remote object only appears once it is completely written:
+            with open_uri(join_uri(self.output_dir, MANIFEST_NAME), 'w') as manifest_file:
+                manifest_file.write(content)
+        logging.info(f'{self.count} evidence strings saved into {len(self.shards)} shards in {self.output_dir}.')
+
+
+def _group_shards(keyed_lines, shard_size, offset=0):
+    '''
+    Groups sorted (sort key, line) pairs into the lines of each shard.
+
+    Yields:
+        (shard index, [(association key, line)]) for each non-empty shard, by increasing index
+    '''
+    current, lines = None, []
+    for (key, _), line in keyed_lines:
+        index = shard_of(offset, shard_size)
+        if index != current and lines:
+            yield current, lines
+            lines = []
+        current = index
+        lines.append((key, line))
+        offset += len(line) + 1
+    if lines:
+        yield current, lines
+
+
+class ShardedJsonWriter(object):
+    '''
+    Writer interface of `common.JsonWriter.JsonLinesWriter` for a sharded output: the evidence strings are serialized
+    as they are written, then sorted and split into shards when the writer is closed.
+
+    >>> with ShardedJsonWriter('evidence', 128 * 2 ** 20) as writer:
+    ...     writer.write({'datasourceId': 'clingen'})
+    '''
+
+    def __init__(self, output_dir, shard_size=DEFAULT_SHARD_SIZE, backend=None, key_fields=None):
+        self.filename = output_dir
+        self.shard_size = shard_size
+        self.key_fields = key_fields
+        self.encoder = get_encoder(backend)
+        self.keyed_lines = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+
+    def write(self, record):
+        self.keyed_lines.append(_sort_key(record, self.encoder, self.key_fields))
+        self.count += 1
+
+    def close(self):
+        self.keyed_lines.sort(key=lambda keyed_line: keyed_line[0])
+        writer = ShardWriter(self.filename, self.shard_size, self.key_fields)
+        for _, lines in _group_shards(self.keyed_lines, self.shard_size):
+            writer.write_shard(*_compress_shard(lines))
+        writer.close()
+        self.keyed_lines = []
+
+
+def write_sharded_records(records, output_dir, shard_size=DEFAULT_SHARD_SIZE, backend=None, key_fields=None):
+    '''
+    Writes evidence dictionaries into a directory of sorted shards with a manifest.
+
+    All the serialized evidence strings are held in memory to be sorted, as the evidence of the parsers without Spark
+    already is.
+
+    Args:
+        records (iterable): Evidence strings, already pruned
+        output_dir (str): Output directory
+        shard_size (int): Target size of a shard, in bytes of uncompressed JSON lines
+        backend (str): JSON encoder backend, see `common.JsonWriter`.
+        key_fields (tuple): Fields of the association key the evidence is sorted by
+    Returns:
+        count (int): Number of evidence strings written
+    '''
+    with ShardedJsonWriter(output_dir, shard_size, backend, key_fields) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.count
+
+
+def _key_partition(parser, backend, key_fields):
+    '''
+    Returns a function that turns an iterator of Spark rows into an iterator of (sort key, JSON line) pairs of the
+    pruned evidence strings, on the executors.
+    '''
+    def key(rows):
+        from common.EvidenceWriter import prune_evidence
+        encoder = get_encoder(backend)
+        for row in rows:
+            evidence = parser(row) if parser else row.asDict(recursive=True)
+            yield _sort_key(prune_evidence(evidence), encoder, key_fields)
+    return key
+
+
+def write_spark_shards(dataframe, output_dir, shard_size=DEFAULT_SHARD_SIZE, parser=None, backend=None,
+                       key_fields=None):
+    '''
+    Writes the evidence of a Spark dataframe into a directory of sorted shards with a manifest.
+
+    The evidence strings are serialized and sorted by Spark. The size of the sorted partitions gives the offset of
+    each line in the output, hence its shard, and the lines are shuffled again into one partition per shard, which is
+    compressed on an executor. The driver pulls the compressed shards one at a time and writes them.
+
+    Args:
+        dataframe (pyspark.sql.DataFrame): Final dataframe of the parser
+        output_dir (str): Output directory, local to the driver or any URI of `common.Storage`
+        shard_size (int): Target size of a shard, in bytes of uncompressed JSON lines
+        parser (callable): Optional function building an evidence dictionary out of a row
+        backend (str): JSON encoder backend, see `common.JsonWriter`.
+        key_fields (tuple): Fields of the association key the evidence is sorted by
+    Returns:
+        count (int): Number of evidence strings written
+    '''
+    # The backend is resolved on the driver so that the executors use the same one:
+    backend = get_encoder(backend).name
+    keyed_lines = (
+        dataframe.rdd.mapPartitions(_key_partition(parser, backend, key_fields))
+        .sortByKey()
+        .persist()
+    )
+
+    # Offset of the first line of each sorted partition in the output:
+    sizes = keyed_lines.mapPartitions(lambda lines: [sum(len(line) + 1 for _, line in lines)]).collect()
+    offsets = [0] + list(itertools.accumulate(sizes))
+    shard_count = shard_of(max(sum(sizes) - 1, 0), shard_size) + 1
+
+    def group(index, lines):
+        for shard, shard_lines in _group_shards(lines, shard_size, offsets[index]):
+            for position, keyed_line in enumerate(shard_lines):
+                yield (shard, index, position), keyed_line
+
+    def compress(shard_lines):
+        shard_lines = [keyed_line for _, keyed_line in shard_lines]
+        if shard_lines:
+            yield _compress_shard(shard_lines)
+
+    shards = (
+        keyed_lines.mapPartitionsWithIndex(group)
+        # One partition per shard, with the lines of the shard in the sorted order:
+        .repartitionAndSortWithinPartitions(shard_count, partitionFunc=lambda key: key[0])
+        .mapPartitions(compress)
+    )
+
+    writer = ShardWriter(output_dir, shard_size, key_fields)
+    for data, entry in shards.toLocalIterator():
+        writer.write_shard(data, entry)
+    writer.close()
+    keyed_lines.unpersist()
+    return writer.count
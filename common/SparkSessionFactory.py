@@ -0,0 +1,130 @@
+'''
+Shared factory for the Spark sessions of the parsers.
+
+Two profiles are available:
+- `local`: Spark runs in the driver process (`local[*]`). Driver memory, shuffle partitions and Arrow batches are sized
+  from the cores and memory of the host and from the size of the input files.
+- `cluster`: the master and the memory settings are left to `spark-submit`/Dataproc, only the shuffle partitions are
+  sized from the input.
+
+Both profiles enable adaptive query execution and the Kryo serializer.
+'''
+
+import logging
+import math
+import os
+
+# Amount of input data that a single shuffle partition is expected to handle:
+TARGET_PARTITION_BYTES = 128 * 1024 * 1024
+
+# Share of the host memory that can be given to the driver in local mode:
+LOCAL_MEMORY_FRACTION = 0.6
+
+# Settings shared by all profiles:
+COMMON_CONFIG = {
+    'spark.debug.maxToStringFields': '2000',
+    'spark.sql.adaptive.enabled': 'true',
+    'spark.sql.adaptive.coalescePartitions.enabled': 'true',
+    'spark.serializer': 'org.apache.spark.serializer.KryoSerializer',
+    'spark.kryoserializer.buffer.max': '512m',
+    # Spark 2.x and 3.x names of the same setting:
+    'spark.sql.execution.arrow.enabled': 'true',
+    'spark.sql.execution.arrow.pyspark.enabled': 'true',
+    # Spark 2.4 reads the Arrow IPC format of pyarrow < 0.15 only (SPARK-29367):
+    'spark.executorEnv.ARROW_PRE_0_15_IPC_FORMAT': '1',
+}
+
+
+def host_resources():
+    '''Returns the number of cores and the physical memory (in bytes) of the host.'''
+    cores = os.cpu_count() or 1
+    try:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        memory = 4 * 1024 ** 3
+    return cores, memory
+
+
+def input_size(input_files):
+    '''
+    Total size in bytes of the given local files or directories. Remote paths (gs://, http://, ...) are not counted.
+    Returns None if the size of none of them is known.
+    '''
+    total, known = 0, False
+    for path in input_files or []:
+        if not path or ('://' in str(path) and not str(path).startswith('file://')):
+            continue
+        path = str(path).replace('file://', '', 1)
+        if os.path.isfile(path):
+            total += os.path.getsize(path)
+            known = True
+        elif os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+            known = True
+    return total if known else None
+
+
+def profile_config(profile, input_files=None):
+    '''Builds the Spark configuration of the given profile as a dictionary.'''
+    if profile not in ('local', 'cluster'):
+        raise ValueError(f'Unknown Spark profile: {profile}. Available: local, cluster.')
+
+    cores, memory = host_resources()
+    size = input_size(input_files)
+    config = dict(COMMON_CONFIG)
+
+    if profile == 'local':
+        # Small inputs get about one partition per core instead of the default 200:
+        partitions = cores * 2 if size is None else min(max(math.ceil(size / TARGET_PARTITION_BYTES), cores), cores * 8)
+
+        # The driver also runs the tasks, so it gets a share of the host memory, but no more than the input needs:
+        driver_memory = memory * LOCAL_MEMORY_FRACTION
+        if size is not None:
+            driver_memory = min(driver_memory, max(2 * 1024 ** 3, 8 * size))
+        driver_memory_gb = max(1, int(driver_memory // 1024 ** 3))
+
+        config.update({
+            'spark.master': f'local[{cores}]',
+            'spark.driver.host': '127.0.0.1',
+            'spark.driver.memory': f'{driver_memory_gb}g',
+            'spark.sql.shuffle.partitions': str(partitions),
+            'spark.default.parallelism': str(partitions),
+            'spark.sql.execution.arrow.maxRecordsPerBatch': '500000' if driver_memory_gb >= 8 else '100000',
+        })
+    elif size is not None:
+        config['spark.sql.shuffle.partitions'] = str(max(math.ceil(size / TARGET_PARTITION_BYTES), 8))
+
+    return config
+
+
+def get_spark_session(app_name, profile='local', input_files=None, extra_config=None):
+    '''
+    Creates (or returns the already running) Spark session configured with the given profile.
+
+    Args:
+        app_name (str): Name of the Spark application
+        profile (str): `local` or `cluster`
+        input_files (list): Input files of the parser, used to size the session
+        extra_config (dict): Additional settings, overriding the ones of the profile
+    Returns:
+        spark (pyspark.sql.SparkSession)
+    '''
+    from pyspark.conf import SparkConf
+    from pyspark.sql import SparkSession
+
+    config = profile_config(profile, input_files)
+    config.update(extra_config or {})
+
+    # The same setting for the driver, which exchanges Arrow batches with the JVM in `toPandas`/`createDataFrame`:
+    os.environ.setdefault('ARROW_PRE_0_15_IPC_FORMAT', '1')
+    spark_conf = SparkConf()
+    for key, value in config.items():
+        spark_conf.set(key, value)
+
+    spark = SparkSession.builder.appName(app_name).config(conf=spark_conf).getOrCreate()
+    logging.info(
+        f'Spark {spark.version} session started with the {profile} profile: '
+        + ', '.join(f'{key}={value}' for key, value in sorted(config.items()) if not key.startswith('spark.debug'))
+    )
+    return spark
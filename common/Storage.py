@@ -0,0 +1,603 @@
+'''
+Storage of the input and output files of the parsers, addressed by URI.
+
+Three kinds of URIs are supported:
+- local paths and `file://` URIs,
+- `gs://bucket/name`: Google Cloud Storage objects, with the optional google-cloud-storage package,
+- `http://` and `https://` URLs, read only.
+
+Large transfers are split into chunks of `Config.STORAGE_CHUNK_SIZE` MiB, transferred by `Config.STORAGE_WORKERS`
+threads:
+- a download is made of ranged reads, each written at its offset in the destination file,
+- an upload is made of temporary part objects, composed into the destination object and then deleted.
+
+The streams work the same way: `open_uri(uri, 'wb')` uploads every chunk as soon as it is full, so that a gzip output
+goes to the bucket without a local copy, with at most one chunk per worker in memory. `open_uri(uri, 'rb')` reads the
+next chunks ahead.
+
+For offline runs and tests, `OT_STORAGE_EMULATOR_PATH` points the `gs://` URIs to a local directory standing in for
+Cloud Storage: `gs://bucket/name` is then the file `<directory>/bucket/name`.
+
+The parsers resolve their paths with:
+- `local_input`: local file with the content of an input, downloaded once per process if needed, for the readers which
+  need a local file (pandas, the standard library),
+- `spark_path`: path given to Spark, which reads and writes `gs://` itself with the Hadoop connector. Only the inputs
+  which Spark cannot read (`http(s)://`) are downloaded, and the emulated buckets are replaced by local paths.
+- `staged_output`: local file or directory for the outputs written by libraries which need one, uploaded after it is
+  written,
+- `open_uri`: binary or text stream, for the outputs written sequentially (gzipped JSON lines, run reports).
+- `staged_spark_input`: location of an intermediate file written by the driver and read by the Spark executors.
+'''
+
+import atexit
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+
+from common import HttpClient
+from settings import Config
+
+# Maximum number of objects composed into one by Cloud Storage:
+MAX_COMPOSE_SOURCES = 32
+
+
+def _chunk_size():
+    return Config.STORAGE_CHUNK_SIZE * 2 ** 20
+
+
+def _ranges(size, chunk_size):
+    return [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+
+def is_local(uri):
+    '''Whether a URI is a local path or a `file://` URI.'''
+    return '://' not in str(uri) or str(uri).startswith('file://')
+
+
+def _local_path(uri):
+    uri = str(uri)
+    return uri[len('file://'):] if uri.startswith('file://') else uri
+
+
+def _split_gcs_uri(uri):
+    bucket, _, name = uri[len('gs://'):].partition('/')
+    return bucket, name
+
+
+class LocalStorage(object):
+    '''Local files and directories.'''
+
+    # Whether the files have a local path:
+    local = True
+
+    def path(self, uri):
+        '''Local path of a URI.'''
+        return _local_path(uri)
+
+    def exists(self, uri):
+        return os.path.exists(self.path(uri))
+
+    def is_directory(self, uri):
+        return os.path.isdir(self.path(uri))
+
+    def list(self, uri):
+        '''Relative names of the files under a directory, sorted.'''
+        root = self.path(uri)
+        return sorted(
+            os.path.relpath(os.path.join(directory, filename), root)
+            for directory, _, filenames in os.walk(root) for filename in filenames
+        )
+
+    def open_read(self, uri):
+        return open(self.path(uri), 'rb')
+
+    def open_write(self, uri):
+        path = self.path(uri)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return open(path, 'wb')
+
+    def download(self, uri, path):
+        source = self.path(uri)
+        if not (os.path.exists(path) and os.path.samefile(source, path)):
+            shutil.copyfile(source, path)
+
+    def upload(self, path, uri):
+        destination = self.path(uri)
+        os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+        if not (os.path.exists(destination) and os.path.samefile(path, destination)):
+            shutil.copyfile(path, destination)
+
+    def delete(self, uri):
+        path = self.path(uri)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+class DirectoryStorage(LocalStorage):
+    '''
+    Local directory standing in for Cloud Storage: `gs://bucket/name` is the file `<root>/bucket/name`.
+
+    Args:
+        root (str): Directory of the buckets
+    '''
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, uri):
+        return os.path.join(self.root, *_split_gcs_uri(uri))
+
+
+class _RangeReader(io.RawIOBase):
+    '''
+    Sequential reader of a remote file by ranged reads, fetching the next chunks ahead on a thread pool.
+
+    Args:
+        size (int): Size of the file
+        read_range (callable): Function returning the bytes from `start` (included) to `end` (excluded)
+        chunk_size (int): Size of the ranges
+        workers (int): Number of ranges fetched ahead
+    '''
+
+    def __init__(self, size, read_range, chunk_size, workers):
+        self.size = size
+        self.read_range = read_range
+        self.chunks = collections.deque(_ranges(size, chunk_size))
+        self.executor = concurrent.futures.ThreadPoolExecutor(max(1, workers))
+        self.pending = collections.deque()
+        self.workers = max(1, workers)
+        self.current = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.current:
+            while self.chunks and len(self.pending) < self.workers:
+                self.pending.append(self.executor.submit(self.read_range, *self.chunks.popleft()))
+            if not self.pending:
+                return 0
+            self.current = memoryview(self.pending.popleft().result())
+        length = min(len(buffer), len(self.current))
+        buffer[:length] = self.current[:length]
+        self.current = self.current[length:]
+        return length
+
+    def close(self):
+        if not self.closed:
+            for future in self.pending:
+                future.cancel()
+            self.executor.shutdown(wait=False)
+        super().close()
+
+
+class _RangedStorage(object):
+    '''Base of the remote storages read by ranges: `size` and `read_range` are implemented by the subclasses.'''
+
+    local = False
+
+    def open_read(self, uri):
+        reader = _RangeReader(self.size(uri), lambda start, end: self.read_range(uri, start, end), _chunk_size(),
+                              Config.STORAGE_WORKERS)
+        return io.BufferedReader(reader, buffer_size=_chunk_size())
+
+    def download(self, uri, path):
+        '''Downloads a remote file by chunks in parallel, each written at its offset in a temporary file.'''
+        size = self.size(uri)
+        temp_name = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(temp_name, 'wb') as f:
+                f.truncate(size)
+
+                def download_chunk(chunk):
+                    os.pwrite(f.fileno(), self.read_range(uri, *chunk), chunk[0])
+
+                with concurrent.futures.ThreadPoolExecutor(Config.STORAGE_WORKERS) as executor:
+                    for _ in executor.map(download_chunk, _ranges(size, _chunk_size())):
+                        pass
+            os.replace(temp_name, path)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+
+
+class _ChunkedUploadWriter(io.RawIOBase):
+    '''
+    Writable stream uploading a Cloud Storage object by chunks, in parallel, composed into the object when closed.
+    Nothing is written to the destination if the stream is closed after an exception.
+    '''
+
+    def __init__(self, storage, uri):
+        self.storage = storage
+        self.bucket_name, self.name = _split_gcs_uri(uri)
+        self.prefix = f'{self.name}.parts-{uuid.uuid4().hex}/'
+        self.chunk_size = _chunk_size()
+        self.executor = concurrent.futures.ThreadPoolExecutor(Config.STORAGE_WORKERS)
+        self.pending, self.parts = collections.deque(), []
+        self.buffer = bytearray()
+        self.position = 0
+        self.failed = False
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.chunk_size:
+            self._submit(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def _submit(self, data):
+        # Bounded number of chunks in memory:
+        while len(self.pending) >= Config.STORAGE_WORKERS:
+            self.pending.popleft().result()
+        part = f'{self.prefix}{len(self.parts):06d}'
+        self.parts.append(part)
+        self.pending.append(self.executor.submit(self.storage.upload_bytes, self.bucket_name, part, data))
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if not self.failed and not self.parts:
+                # A single chunk is uploaded as the object itself:
+                self.storage.upload_bytes(self.bucket_name, self.name, bytes(self.buffer))
+            elif not self.failed:
+                if self.buffer:
+                    self._submit(bytes(self.buffer))
+                for future in self.pending:
+                    future.result()
+                self.storage.compose(self.bucket_name, self.parts, self.name)
+        finally:
+            self.buffer = bytearray()
+            self.executor.shutdown(wait=True)
+            if self.parts:
+                self.storage.delete_objects(self.bucket_name, self.parts)
+            super().close()
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None:
+            self.failed = True
+        self.close()
+
+
+class GCSStorage(_RangedStorage):
+    '''Google Cloud Storage objects, and prefixes as directories.'''
+
+    def __init__(self):
+        try:
+            from google.cloud import storage
+        except ImportError:
+            raise ImportError('Reading or writing gs:// URIs requires the google-cloud-storage package.')
+        self.client = storage.Client()
+
+    def _blob(self, uri):
+        bucket, name = _split_gcs_uri(uri)
+        return self.client.bucket(bucket).get_blob(name) if name else None
+
+    def exists(self, uri):
+        return self._blob(uri) is not None or self.is_directory(uri)
+
+    def is_directory(self, uri):
+        bucket, name = _split_gcs_uri(uri)
+        prefix = name.rstrip('/') + '/' if name else ''
+        return any(True for _ in self.client.list_blobs(bucket, prefix=prefix, max_results=1))
+
+    def list(self, uri):
+        bucket, name = _split_gcs_uri(uri)
+        prefix = name.rstrip('/') + '/' if name else ''
+        return sorted(blob.name[len(prefix):] for blob in self.client.list_blobs(bucket, prefix=prefix)
+                      if not blob.name.endswith('/'))
+
+    def size(self, uri):
+        blob = self._blob(uri)
+        if blob is None:
+            raise FileNotFoundError(uri)
+        return blob.size
+
+    def read_range(self, uri, start, end):
+        bucket, name = _split_gcs_uri(uri)
+        blob = self.client.bucket(bucket).blob(name)
+        # The end of the range is included:
+        return blob.download_as_bytes(start=start, end=end - 1)
+
+    def open_write(self, uri):
+        return _ChunkedUploadWriter(self, uri)
+
+    def upload(self, path, uri):
+        if os.path.getsize(path) <= _chunk_size():
+            bucket, name = _split_gcs_uri(uri)
+            self.client.bucket(bucket).blob(name).upload_from_filename(path)
+            return
+        with open(path, 'rb') as source, self.open_write(uri) as destination:
+            shutil.copyfileobj(source, destination, _chunk_size())
+
+    def upload_bytes(self, bucket, name, data):
+        self.client.bucket(bucket).blob(name).upload_from_string(data)
+
+    def compose(self, bucket_name, parts, name):
+        '''Composes part objects into an object, through intermediate objects beyond `MAX_COMPOSE_SOURCES` parts.'''
+        bucket = self.client.bucket(bucket_name)
+        intermediates = []
+        while len(parts) > MAX_COMPOSE_SOURCES:
+            groups = [parts[i:i + MAX_COMPOSE_SOURCES] for i in range(0, len(parts), MAX_COMPOSE_SOURCES)]
+            parts = [f'{group[0]}.composed' for group in groups]
+            for group, composed in zip(groups, parts):
+                bucket.blob(composed).compose([bucket.blob(part) for part in group])
+            intermediates.extend(parts)
+        bucket.blob(name).compose([bucket.blob(part) for part in parts])
+        self.delete_objects(bucket_name, intermediates)
+
+    def delete_objects(self, bucket_name, names):
+        bucket = self.client.bucket(bucket_name)
+        for name in names:
+            try:
+                bucket.blob(name).delete()
+            except Exception as e:
+                logging.warning(f'Failed to delete the temporary object gs://{bucket_name}/{name}: {e}')
+
+    def delete(self, uri):
+        bucket, name = _split_gcs_uri(uri)
+        blob = self._blob(uri)
+        if blob is not None:
+            blob.delete()
+        self.delete_objects(bucket, [f'{name.rstrip("/")}/{filename}' for filename in self.list(uri)])
+
+
+class HTTPStorage(_RangedStorage):
+    '''
+    Files served over HTTP(S), read by ranges when the server supports them, with the kept-alive connections of
+    `common.HttpClient`.
+    '''
+
+    def _head(self, uri):
+        response = HttpClient.head(uri)
+        response.raise_for_status()
+        return response.headers
+
+    def exists(self, uri):
+        try:
+            self._head(uri)
+            return True
+        except Exception:
+            return False
+
+    def is_directory(self, uri):
+        return False
+
+    def size(self, uri):
+        return int(self._head(uri)['Content-Length'])
+
+    def _supports_ranges(self, uri):
+        headers = self._head(uri)
+        return headers.get('Accept-Ranges') == 'bytes' and 'Content-Length' in headers and (
+            headers.get('Content-Encoding') in (None, 'identity')
+        )
+
+    def read_range(self, uri, start, end):
+        response = HttpClient.get(uri, headers={'Range': f'bytes={start}-{end - 1}'})
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise IOError(f'{uri} did not return the range {start}-{end - 1}.')
+        return response.content
+
+    def open_read(self, uri):
+        if self._supports_ranges(uri):
+            return super().open_read(uri)
+        return HttpClient.open_stream(uri)
+
+    def download(self, uri, path):
+        if self._supports_ranges(uri):
+            return super().download(uri, path)
+        with self.open_read(uri) as source, open(path, 'wb') as destination:
+            shutil.copyfileobj(source, destination, _chunk_size())
+
+    def open_write(self, uri):
+        raise ValueError(f'HTTP URLs are read only: {uri}.')
+
+    def upload(self, path, uri):
+        self.open_write(uri)
+
+    def delete(self, uri):
+        self.open_write(uri)
+
+
+_STORAGES = {}
+
+
+def get_storage(uri):
+    '''
+    Storage of a URI: local, Cloud Storage (or the directory standing in for it, see `Config.STORAGE_EMULATOR_PATH`)
+    or HTTP(S).
+    '''
+    uri = str(uri)
+    if is_local(uri):
+        key = 'file'
+    elif uri.startswith('gs://'):
+        key = ('gs', Config.STORAGE_EMULATOR_PATH)
+    elif uri.startswith(('http://', 'https://')):
+        key = 'http'
+    else:
+        raise ValueError(f'Unsupported URI: {uri}. Local paths, file://, gs://, http:// and https:// are supported.')
+
+    if key not in _STORAGES:
+        if key == 'file':
+            _STORAGES[key] = LocalStorage()
+        elif key == 'http':
+            _STORAGES[key] = HTTPStorage()
+        else:
+            _STORAGES[key] = DirectoryStorage(key[1]) if key[1] else GCSStorage()
+    return _STORAGES[key]
+
+
+def open_uri(uri, mode='rb'):
+    '''
+    Opens a file of any storage as a stream.
+
+    Args:
+        uri (str): Local path or URI
+        mode (str): `rb`, `wb`, `r` or `w`. The text modes are UTF-8.
+    Returns:
+        stream (file object)
+    '''
+    if mode not in ('rb', 'wb', 'r', 'w'):
+        raise ValueError(f'Unsupported mode: {mode}.')
+    storage = get_storage(uri)
+    stream = storage.open_read(uri) if mode.startswith('r') else storage.open_write(uri)
+    return stream if mode.endswith('b') else io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def exists(uri):
+    return get_storage(uri).exists(uri)
+
+
+def join_uri(uri, name):
+    return f'{str(uri).rstrip("/")}/{name}'
+
+
+def _copy_directory(source_storage, source, destination_storage, destination):
+    '''
+    Copies the files of a directory. The small files (such as the part files written by Spark) are copied in parallel,
+    the others one after the other, each by chunks in parallel.
+    '''
+    destination_storage.delete(destination)
+    small_files, large_files = [], []
+    for name in source_storage.list(source):
+        local_size = os.path.getsize(source_storage.path(join_uri(source, name))) if source_storage.local else None
+        (small_files if local_size is not None and local_size <= _chunk_size() else large_files).append(name)
+    with concurrent.futures.ThreadPoolExecutor(Config.STORAGE_WORKERS) as executor:
+        for _ in executor.map(lambda name: copy(join_uri(source, name), join_uri(destination, name)), small_files):
+            pass
+    for name in large_files:
+        copy(join_uri(source, name), join_uri(destination, name))
+
+
+def copy(source, destination):
+    '''
+    Copies a file, or the files of a directory, between any storages. Remote files are transferred by chunks in
+    parallel.
+
+    Args:
+        source (str): Local path or URI of a file or directory
+        destination (str): Local path or URI of the copy, replaced if it exists
+    '''
+    source_storage, destination_storage = get_storage(source), get_storage(destination)
+    if source_storage.is_directory(source):
+        _copy_directory(source_storage, source, destination_storage, destination)
+    elif destination_storage.local:
+        path = destination_storage.path(destination)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        source_storage.download(source, path)
+    elif source_storage.local:
+        destination_storage.upload(source_storage.path(source), destination)
+    else:
+        with source_storage.open_read(source) as f, destination_storage.open_write(destination) as g:
+            shutil.copyfileobj(f, g, _chunk_size())
+
+
+_DOWNLOADS = {}
+_DOWNLOAD_DIR = None
+
+
+def _download_dir():
+    global _DOWNLOAD_DIR
+    if _DOWNLOAD_DIR is None:
+        _DOWNLOAD_DIR = tempfile.mkdtemp(prefix='evidence_inputs_')
+        atexit.register(shutil.rmtree, _DOWNLOAD_DIR, ignore_errors=True)
+    return _DOWNLOAD_DIR
+
+
+def local_input(uri):
+    '''
+    Local path with the content of an input file or directory. Remote inputs are downloaded once per process, into a
+    temporary directory removed at exit.
+    '''
+    storage = get_storage(uri)
+    if storage.local:
+        return storage.path(uri)
+    if uri not in _DOWNLOADS:
+        name = os.path.basename(str(uri).rstrip('/')) or 'input'
+        path = os.path.join(_download_dir(), hashlib.sha256(str(uri).encode('utf-8')).hexdigest()[:16], name)
+        logging.info(f'Downloading {uri} into {path}.')
+        copy(uri, path)
+        _DOWNLOADS[uri] = path
+    return _DOWNLOADS[uri]
+
+
+def spark_path(uri):
+    '''
+    Path of an input or output for Spark: `gs://` URIs are read and written by Spark itself, unless the buckets are
+    emulated by a local directory. HTTP(S) inputs are downloaded.
+    '''
+    if str(uri).startswith(('http://', 'https://')):
+        return local_input(uri)
+    storage = get_storage(uri)
+    return storage.path(uri) if storage.local else uri
+
+
+@contextlib.contextmanager
+def staged_output(uri):
+    '''
+    Local path for an output file or directory: the path itself for a local output, or a temporary path uploaded to
+    the URI once the block exits without an exception.
+
+    >>> with staged_output('gs://bucket/evidence.parquet') as path:
+    ...     write_parquet(records, path)
+    '''
+    storage = get_storage(uri)
+    if storage.local:
+        path = storage.path(uri)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        yield path
+        return
+
+    with tempfile.TemporaryDirectory(prefix='evidence_output_') as temp_dir:
+        path = os.path.join(temp_dir, os.path.basename(str(uri).rstrip('/')) or 'output')
+        yield path
+        if os.path.exists(path):
+            logging.info(f'Uploading {path} to {uri}.')
+            copy(path, uri)
+
+
+@contextlib.contextmanager
+def staged_spark_input(output_uri, name, local=False):
+    '''
+    Location of an intermediate file written by the driver and read by Spark, removed when the block exits. Yields
+    the URI to write the file to, with `open_uri`, and the path to give to Spark:
+    - with a local Spark session, a temporary local file, given to Spark as a `file://` URI, as a path without a scheme
+      is resolved against the default file system of Spark,
+    - on a cluster, whose executors cannot read the files of the driver, a file next to the output of the parser,
+      `<output_uri>.<name>`, in the storage the executors write the output to. A local output must then be on a file
+      system shared with the executors.
+
+    >>> with staged_spark_input('gs://bucket/orphanet', 'records.json') as (uri, path):
+    ...     with open_uri(uri, 'wb') as f:
+    ...         write_records(f)
+    ...     df = spark.read.json(path)
+    '''
+    if local:
+        with tempfile.TemporaryDirectory(prefix='spark_input_') as temp_dir:
+            path = os.path.join(temp_dir, name)
+            yield path, f'file://{path}'
+        return
+
+    uri = f'{str(output_uri).rstrip("/")}.{name}'
+    storage = get_storage(uri)
+    try:
+        yield uri, f'file://{os.path.abspath(storage.path(uri))}' if storage.local else uri
+    finally:
+        storage.delete(uri)
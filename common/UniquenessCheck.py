@@ -0,0 +1,169 @@
+'''
+External-memory check of the uniqueness of the evidence strings on their association key.
+
+Every evidence string is reduced to a fixed-width entry: a 128-bit digest of its datasource and of the values of its
+unique association fields (`UNIQUE_ASSOCIATION_FIELDS`), and its position in the input. The entries are split into
+partitions by their digest, spilled to disk beyond the memory limit (see `common/HashPartitions.py`). Each partition is
+then sorted on its own, and the entries sharing a digest are the duplicate groups.
+
+>>> summary = check_uniqueness(['epmc/'])
+>>> summary['duplicate_records']
+0
+'''
+
+import collections
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from common.AssociationKey import UNIQUE_ASSOCIATION_FIELDS, association_key
+from common.HashPartitions import PARTITIONS, HashPartitions
+from common.SchemaValidation import list_shards
+
+# Entry of an evidence string: the two halves of its digest, and its position packed as datasource index (8 bits),
+# shard index (16 bits) and line number (40 bits).
+ENTRY = np.dtype([('digest_high', '>u8'), ('digest_low', '>u8'), ('position', '<u8')])
+DEFAULT_MEMORY_LIMIT = 512 * 2 ** 20
+
+# Duplicate groups reported with their key values:
+MAX_REPORTED_GROUPS = 20
+
+
+def _digest(key):
+    return hashlib.blake2b(key, digest_size=16).digest()
+
+
+def _pack_position(datasource_index, shard_index, line):
+    return (datasource_index << 56) | (shard_index << 40) | line
+
+
+def _unpack_position(position):
+    return position >> 56, (position >> 40) & 0xffff, position & 0xffffffffff
+
+
+def _open(filename):
+    return gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb')
+
+
+def _duplicate_groups(entries):
+    '''Yields the positions of the entries sharing a digest, for every duplicated digest of a partition.'''
+    if len(entries) < 2:
+        return
+    entries = entries[np.lexsort((entries['digest_low'], entries['digest_high']))]
+    same = (
+        (entries['digest_high'][1:] == entries['digest_high'][:-1])
+        & (entries['digest_low'][1:] == entries['digest_low'][:-1])
+    )
+    if not same.any():
+        return
+    # Boundaries of the runs of equal digests:
+    starts = np.flatnonzero(np.concatenate([[True], ~same]))
+    ends = np.concatenate([starts[1:], [len(entries)]])
+    for start, end in zip(starts, ends):
+        if end - start > 1:
+            yield [int(p) for p in entries['position'][start:end]]
+
+
+def check_uniqueness(paths, fields=None, memory_limit=DEFAULT_MEMORY_LIMIT, temp_dir=None,
+                     max_groups=MAX_REPORTED_GROUPS):
+    '''
+    Finds the evidence strings sharing their association key.
+
+    Args:
+        paths (list): Evidence files, or directories of part files
+        fields (tuple): Fields of the association key of all the datasources. Defaults to `UNIQUE_ASSOCIATION_FIELDS`.
+        memory_limit (int): Size in bytes of the entries kept in memory before they are spilled to disk
+        temp_dir (str): Directory of the spilled partitions. Defaults to the system temporary directory.
+        max_groups (int): Number of duplicate groups reported with their key and positions
+    Returns:
+        summary (dict): Records and duplicates per datasource, and the first duplicate groups
+    '''
+    shards = list_shards(paths)
+    if len(shards) > 0xffff:
+        raise ValueError(f'At most {0xffff + 1} files can be checked at once, {len(shards)} given.')
+    datasources, records = {}, collections.Counter()
+    work_dir = tempfile.mkdtemp(prefix='uniqueness_', dir=temp_dir)
+    try:
+        entries = HashPartitions(work_dir, ENTRY, memory_limit)
+        for shard_index, filename in enumerate(shards):
+            with _open(filename) as f:
+                for line, text in enumerate(f, 1):
+                    if not text.strip():
+                        continue
+                    record = json.loads(text)
+                    datasource = record.get('datasourceId')
+                    datasource_index = datasources.setdefault(datasource, len(datasources))
+                    records[datasource] += 1
+                    position = _pack_position(datasource_index, shard_index, line)
+                    entries.add(_digest(association_key(record, fields)) + position.to_bytes(8, 'little'))
+        if os.listdir(work_dir):
+            entries.spill()
+            logging.info(f'The entries were spilled to disk into {PARTITIONS} partitions.')
+
+        names = {index: name for name, index in datasources.items()}
+        duplicate_groups, duplicate_records = collections.Counter(), collections.Counter()
+        reported = []
+        for partition in entries.partitions():
+            for positions in _duplicate_groups(partition):
+                datasource = names[_unpack_position(positions[0])[0]]
+                duplicate_groups[datasource] += 1
+                duplicate_records[datasource] += len(positions) - 1
+                if len(reported) < max_groups:
+                    reported.append(sorted(positions))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = {
+        'records': sum(records.values()),
+        'duplicate_records': sum(duplicate_records.values()),
+        'datasources': {
+            str(name): {
+                'records': records[name],
+                'key': list(fields or UNIQUE_ASSOCIATION_FIELDS.get(name, ['<all fields>'])),
+                'duplicate_groups': duplicate_groups[name],
+                'duplicate_records': duplicate_records[name],
+            }
+            for name in sorted(records, key=str)
+        },
+        'groups': _describe_groups(reported, shards, fields),
+    }
+    for name, datasource in summary['datasources'].items():
+        logging.info(
+            f'{name}: {datasource["records"]} records, {datasource["duplicate_records"]} duplicates in '
+            f'{datasource["duplicate_groups"]} groups.'
+        )
+    return summary
+
+
+def _describe_groups(groups, shards, fields):
+    '''Reads back the association key and the positions of the reported duplicate groups.'''
+    wanted = collections.defaultdict(dict)
+    for group in groups:
+        _, shard_index, line = _unpack_position(group[0])
+        wanted[shard_index][line] = None
+
+    for shard_index, lines in wanted.items():
+        last_line = max(lines)
+        with _open(shards[shard_index]) as f:
+            for line, text in enumerate(f, 1):
+                if line in lines:
+                    lines[line] = json.loads(association_key(json.loads(text), fields))
+                if line >= last_line:
+                    break
+
+    described = []
+    for group in groups:
+        positions = [_unpack_position(position)[1:] for position in group]
+        datasource, values = wanted[positions[0][0]][positions[0][1]]
+        described.append({
+            'datasourceId': datasource,
+            'key': values,
+            'records': [{'file': shards[shard_index], 'line': line} for shard_index, line in positions],
+        })
+    return described
@@ -1,7 +1,8 @@
 import logging
-import requests
 import tqdm
 
+from common import HttpClient
+
 class TqdmLoggingHandler (logging.Handler):
     def __init__ (self, level = logging.NOTSET):
         super (self.__class__, self).__init__ (level)
@@ -25,7 +26,7 @@ def mapping_on_github(modulename):
     send a HEAD request to github's mapping repo to see if we have a mapping
     file
     '''
-    r = requests.head(ghmappings(modulename))
+    r = HttpClient.head(ghmappings(modulename))
     return r.status_code == 200
 
 
@@ -0,0 +1 @@
+# Makes the `common` package and `settings` importable when running `pytest` from the repository root.
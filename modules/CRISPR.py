@@ -2,7 +2,11 @@ import sys
 import logging
 import argparse
 
-import pandas as pd
+from common.InputSchemas import read_pandas
+from common.Instrumentation import RunReport
+from common.ParquetWriter import JSON, OUTPUT_FORMATS, PARQUET, output_formats, parquet_path, write_pandas_parquet
+from common.Storage import staged_output
+from settings import Config
 
 # A few genes do not have Ensembl IDs in the data file provided
 CRISPR_SYMBOL_MAPPING = {
@@ -18,91 +22,105 @@ CRISPR_SYMBOL_MAPPING = {
 }
 
 
-def main(desc_file, evid_file, cell_file, out_file):
+def main(desc_file, evid_file, cell_file, out_file, output_format=None):
+    import pandas as pd
 
     # Log parameters:
     logging.info(f'Evidence file: {evid_file}')
     logging.info(f'Description file: {desc_file}')
     logging.info(f'Cell type annotation: {cell_file}')
     logging.info(f'Output file: {out_file}')
+    report = RunReport('CRISPR')
 
     # Read files:
-    evidence_df = pd.read_csv(evid_file, sep='\t')
-    description_df = pd.read_csv(desc_file, sep='\t')
-    cell_lines_df = pd.read_csv(cell_file, sep='\t')
+    with report.stage('load') as stage:
+        # A sampled run keeps the same diseases in the evidence and their descriptions:
+        evidence_df = read_pandas('crispr_evidence', evid_file, sep='\t', sample='disease_id')
+        description_df = read_pandas('crispr_descriptions', desc_file, sep='\t', sample='efo_id')
+        cell_lines_df = read_pandas('crispr_cell_lines', cell_file, sep='\t')
+        stage.set_rows(output_rows=len(evidence_df) + len(description_df) + len(cell_lines_df))
 
     # Logging dataframe stats:
     logging.info(f'Number of evidence: {len(evidence_df)}')
     logging.info(f'Number of descriptions: {len(description_df)}')
     logging.info(f'Number of cell/tissue annotation: {len(cell_lines_df)}')
 
-    # Merging description with cell types and tissue:
-    tissue_desc = description_df.merge(cell_lines_df[['Name', 'Tissue']], left_on='tissue_or_cancer_type', how='inner', right_on='Tissue')
-    cell_desc = description_df.merge(cell_lines_df[['Name', 'Cancer Type']], left_on='tissue_or_cancer_type', how='inner', right_on='Cancer Type')
-
-    # Concatenating annotation:
-    merged_annotation = pd.concat([tissue_desc, cell_desc], ignore_index=True)
-
-    # Aggregating names accross disease/targets:
-    pooled_annotation = (
-        merged_annotation
-        .groupby(['efo_id', 'tissue_or_cancer_type', 'method'])
-        .agg(
-            {'Name': lambda x: list(x)}
+    with report.stage('annotate') as stage:
+        # Merging description with cell types and tissue:
+        tissue_desc = description_df.merge(cell_lines_df[['Name', 'Tissue']], left_on='tissue_or_cancer_type', how='inner', right_on='Tissue')
+        cell_desc = description_df.merge(cell_lines_df[['Name', 'Cancer Type']], left_on='tissue_or_cancer_type', how='inner', right_on='Cancer Type')
+
+        # Concatenating annotation:
+        merged_annotation = pd.concat([tissue_desc, cell_desc], ignore_index=True)
+
+        # Aggregating names accross disease/targets:
+        pooled_annotation = (
+            merged_annotation
+            .groupby(['efo_id', 'tissue_or_cancer_type', 'method'])
+            .agg(
+                {'Name': lambda x: list(x)}
+            )
+            .reset_index()
         )
-        .reset_index()
-    )
-
-    # Updating columns:
-    pooled_annotation = (
-        pooled_annotation
-        .drop(['method'], axis=1)
-        .rename(columns={
-            'efo_id': 'diseaseFromSourceMappedId',
-            'Name': 'diseaseCellLines',
-            'tissue_or_cancer_type': 'diseaseFromSource',
-        })
-    )
 
-    # Some columns from the evidence file are not needed:
-    evidence_df = (
-        evidence_df
-        .drop(['pmid', 'gene_set_name', 'disease_name'], axis=1)
-        .rename(columns={
-            'target_id': 'targetFromSourceId', 
-            'disease_id': 'diseaseFromSourceMappedId',
-            'score': 'resourceScore',
-        })
-    )
+        # Updating columns:
+        pooled_annotation = (
+            pooled_annotation
+            .drop(['method'], axis=1)
+            .rename(columns={
+                'efo_id': 'diseaseFromSourceMappedId',
+                'Name': 'diseaseCellLines',
+                'tissue_or_cancer_type': 'diseaseFromSource',
+            })
+        )
 
-    # Replace some target ids:
-    evidence_df.targetFromSourceId = evidence_df.targetFromSourceId.apply(lambda x: CRISPR_SYMBOL_MAPPING[x] if x in CRISPR_SYMBOL_MAPPING else x)
+        # Some columns from the evidence file are not needed:
+        evidence_df = (
+            evidence_df
+            .drop(['pmid', 'gene_set_name', 'disease_name'], axis=1)
+            .rename(columns={
+                'target_id': 'targetFromSourceId', 
+                'disease_id': 'diseaseFromSourceMappedId',
+                'score': 'resourceScore',
+            })
+        )
 
-    # Merging evidence and annotations:
-    annotated_evidence = evidence_df.merge(pooled_annotation, on='diseaseFromSourceMappedId', how='outer', indicator=True)
+        # Replace some target ids:
+        evidence_df.targetFromSourceId = evidence_df.targetFromSourceId.apply(lambda x: CRISPR_SYMBOL_MAPPING[x] if x in CRISPR_SYMBOL_MAPPING else x)
 
-    # Checking if all disease terms got matched:
-    if len(annotated_evidence.loc[annotated_evidence._merge != 'both']) == 0:
-        logging.info('Cell/tissue annotation and evidence successfully merged.')
-    else:
-        logging.warning('Problems with matching diseases between annotation and evidence. The following rows were problematic:')
-        logging.warning(annotated_evidence.loc[annotated_evidence._merge != 'both'])
-        annotated_evidence = annotated_evidence[annotated_evidence._merge != 'both']
-        logging.warning(f'Number of evidence with mathing diseases: {len(annotated_evidence)}')
+        # Merging evidence and annotations:
+        annotated_evidence = evidence_df.merge(pooled_annotation, on='diseaseFromSourceMappedId', how='outer', indicator=True)
 
-    # Remove unused column
-    annotated_evidence.drop(['_merge'], inplace=True, axis=1)
+        # Checking if all disease terms got matched:
+        if len(annotated_evidence.loc[annotated_evidence._merge != 'both']) == 0:
+            logging.info('Cell/tissue annotation and evidence successfully merged.')
+        else:
+            logging.warning('Problems with matching diseases between annotation and evidence. The following rows were problematic:')
+            logging.warning(annotated_evidence.loc[annotated_evidence._merge != 'both'])
+            annotated_evidence = annotated_evidence[annotated_evidence._merge != 'both']
+            logging.warning(f'Number of evidence with mathing diseases: {len(annotated_evidence)}')
 
-    # Update efo identifier:
-    annotated_evidence.diseaseFromSourceMappedId = annotated_evidence.diseaseFromSourceMappedId.str.extract('/([^/]+?)$', expand=False)
+        # Remove unused column
+        annotated_evidence.drop(['_merge'], inplace=True, axis=1)
 
-    # Adding new columns:
-    annotated_evidence['datasourceId'] = 'crispr'
-    annotated_evidence['datatypeId'] = 'affected_pathway'
+        # Update efo identifier:
+        annotated_evidence.diseaseFromSourceMappedId = annotated_evidence.diseaseFromSourceMappedId.str.extract('/([^/]+?)$', expand=False)
 
-    logging.info(f'Saving {len(annotated_evidence)} CRISPR evidence in JSON format, GZIP compressed file: {out_file}')
+        # Adding new columns:
+        annotated_evidence['datasourceId'] = 'crispr'
+        annotated_evidence['datatypeId'] = 'affected_pathway'
+        stage.set_rows(input_rows=len(evidence_df), output_rows=len(annotated_evidence))
 
-    annotated_evidence.to_json(out_file, compression='gzip', orient='records', lines=True)
+    formats = output_formats(output_format)
+    with report.stage('write') as stage:
+        if JSON in formats:
+            logging.info(f'Saving {len(annotated_evidence)} CRISPR evidence in JSON format, GZIP compressed file: {out_file}')
+            with staged_output(out_file) as path:
+                annotated_evidence.to_json(path, compression='gzip', orient='records', lines=True)
+        if PARQUET in formats:
+            write_pandas_parquet(annotated_evidence, parquet_path(out_file))
+        stage.set_rows(output_rows=len(annotated_evidence))
+    report.write(out_file)
 
 
 if __name__ == "__main__":
@@ -124,6 +142,10 @@ if __name__ == "__main__":
     parser.add_argument('-l', '--log_file',
                         help='Name of log file. If not provided logs are written to standard error.',
                         type=str, required=False)
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
 
     args = parser.parse_args()
     desc_file = args.descriptions_file
@@ -142,4 +164,4 @@ if __name__ == "__main__":
     else:
         logging.StreamHandler(sys.stderr)
 
-    main(desc_file, evid_file, cell_file, out_file)
+    main(desc_file, evid_file, cell_file, out_file, args.output_format)
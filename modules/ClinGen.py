@@ -1,107 +1,144 @@
-import ontoma
 import logging
 import argparse
-import json
-import gzip
 
-import pandas as pd
+from common.EvidenceWriter import write_evidence_records
+from common.InputSchemas import read_pandas
+from common.Instrumentation import RunReport
+from common.MappingCache import CachedOnToma
+from common.ParquetWriter import OUTPUT_FORMATS
+from common.RecordBuffer import RecordBuffer
+from common.Resolver import BatchResolver
+from settings import Config
 
 class ClinGen():
     def __init__(self):
 
-        self.evidence_strings = list()
+        # The evidence strings are spilled to disk beyond the memory budget of the buffer:
+        self.evidence_strings = RecordBuffer(name='ClinGen evidence')
         self.unmapped_diseases = set()
 
         # Create formatter
         formatter = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
 
-        # Create OnToma object
-        self.ontoma = ontoma.interface.OnToma()
+        # Create OnToma object, with its lookups cached on disk
+        self.ontoma = CachedOnToma()
 
-    def process_gene_validity_curations(self, in_filename, out_filename):
+        self.report = RunReport('ClinGen')
+
+    def process_gene_validity_curations(self, in_filename, out_filename, output_format=None):
 
         self.generate_evidence_strings(in_filename)
 
         # Save results to file
-        self.write_evidence_strings(out_filename)
+        self.write_evidence_strings(out_filename, output_format)
+        self.report.write(out_filename)
 
     def generate_evidence_strings(self, filename):
 
-        # When reading csv file skip header lines that don't contain column names
-        gene_validity_curation_df = pd.read_csv(filename, skiprows=[0, 1, 2, 3, 5], quotechar='"')
-
-        for index, row in gene_validity_curation_df.iterrows():
-            logging.info('{} - {}'.format(row['GENE SYMBOL'], row['DISEASE LABEL']))
-
-            disease_name = row['DISEASE LABEL']
-            disease_id = row['DISEASE ID (MONDO)']
-            efo_mappings = None
-
-            evidence = {
-                'datasourceId': 'clingen',
-                'datatypeId': 'genetic_literature',
-                'targetFromSourceId': row['GENE SYMBOL'].rstrip(),
-                'diseaseFromSource': disease_name,
-                'diseaseFromSourceId': disease_id,
-                'allelicRequirements': [row['MOI']],
-                'confidence': row['CLASSIFICATION'],
-                'studyId': row['GCEP'],
-                'urls': [{'url': row['ONLINE REPORT']}]
-            }
-
-            # Looking up disease in Ontoma using disease id and label:
-            if self.ontoma.get_efo_label(disease_id):
-                disease_label = self.ontoma.get_efo_label(disease_id)
-                # Create list of single disease to mimic what is returned by next step
-                efo_mappings = [{'id': disease_id, 'name': disease_label}]
-
-            elif self.ontoma.get_efo_from_xref(disease_id):
-                efo_mappings = self.ontoma.get_efo_from_xref(disease_id)
-                logging.info('{} mapped to {} EFO ids based on xrefs.'.format(disease_id, len(efo_mappings)))
-
-            else:
-                # Search disease label using OnToma and accept perfect matches
-                ontoma_mapping = self.ontoma.find_term(disease_name, verbose=True)
-                if ontoma_mapping:
-                    if ontoma_mapping['action'] is None:
-                        efo_mappings = [{'id': ontoma_mapping['term'], 'name': ontoma_mapping['label']}]
-                    else:
-                        # OnToma fuzzy match ignored
-                        logging.info('Fuzzy match from OnToma ignored. Request EFO team to import {} - {}'.format(disease_name, disease_id))
-                        # Record the unmapped disease
-                        self.unmapped_diseases.add((disease_id, disease_name))
+        with self.report.stage('load') as stage:
+            # When reading csv file skip header lines that don't contain column names
+            gene_validity_curation_df = read_pandas(
+                'clingen_gene_validity', filename, sample='GENE SYMBOL', skiprows=[0, 1, 2, 3, 5], quotechar='"'
+            )
+            gene_validity_curation_df = gene_validity_curation_df.astype(object).where(
+                gene_validity_curation_df.notna(), None
+            )
+            stage.set_rows(output_rows=gene_validity_curation_df)
+
+        with self.report.stage('map') as stage:
+            # Mapping the distinct diseases concurrently:
+            disease_mappings = BatchResolver(self.map_disease).resolve(
+                zip(gene_validity_curation_df['DISEASE ID (MONDO)'], gene_validity_curation_df['DISEASE LABEL'])
+            )
+            self.unmapped_diseases = {disease for disease, efo_mappings in disease_mappings.items() if not efo_mappings}
+            stage.set_rows(input_rows=gene_validity_curation_df, output_rows=disease_mappings)
+
+        with self.report.stage('build') as stage:
+            for index, row in gene_validity_curation_df.iterrows():
+                logging.info('{} - {}'.format(row['GENE SYMBOL'], row['DISEASE LABEL']))
+
+                disease_name = row['DISEASE LABEL']
+                disease_id = row['DISEASE ID (MONDO)']
+                efo_mappings = disease_mappings[(disease_id, disease_name)]
+
+                evidence = {
+                    'datasourceId': 'clingen',
+                    'datatypeId': 'genetic_literature',
+                    'targetFromSourceId': row['GENE SYMBOL'].rstrip(),
+                    'diseaseFromSource': disease_name,
+                    'diseaseFromSourceId': disease_id,
+                    'allelicRequirements': [row['MOI']],
+                    'confidence': row['CLASSIFICATION'],
+                    'studyId': row['GCEP'],
+                    'urls': [{'url': row['ONLINE REPORT']}]
+                }
+
+                # Generating evidence for all mapped efo:
+                if efo_mappings:
+                    import ontoma
+
+                    for efo_mapping in efo_mappings:
+                        evidence_with_efo = evidence.copy()
+                        evidence_with_efo['diseaseFromSourceMappedId'] = ontoma.interface.make_uri(efo_mapping['id']).split('/')[-1]
+                        self.evidence_strings.append(evidence_with_efo)
                 else:
-                    # MONDO id could not be found in EFO. Log it and continue
-                    logging.info('{} - {} could not be mapped to any EFO id. Skipping it, it should be checked with the EFO team'.format(disease_name, disease_id))
-                    # Record the unmapped disease
-                    self.unmapped_diseases.add((disease_id, disease_name))
-
-            # Generating evidence for all mapped efo:
-            if efo_mappings:
-                for efo_mapping in efo_mappings:
-                    evidence_with_efo = evidence.copy()
-                    evidence_with_efo['diseaseFromSourceMappedId'] = ontoma.interface.make_uri(efo_mapping['id']).split('/')[-1]
-                    self.evidence_strings.append(evidence_with_efo)
-            else:
-                self.evidence_strings.append(evidence)
+                    self.evidence_strings.append(evidence)
+            stage.set_rows(input_rows=gene_validity_curation_df, output_rows=self.evidence_strings)
 
         if len(self.unmapped_diseases) > 0:
             logging.info(f'There are {len(self.unmapped_diseases)} unmapped diseases.')
             unmapped_diseases_string = "\n- ".join([x[1] for x in self.unmapped_diseases])
             logging.info(f'Unmapped diseases: \n- {unmapped_diseases_string}')
 
-    def write_evidence_strings(self, filename):
+        self.ontoma.cache.log_stats()
+
+    def map_disease(self, disease):
+        '''
+        Maps a ClinGen disease to EFO. Called concurrently for all the distinct diseases.
+
+        Args:
+            disease (tuple): MONDO id and label of the disease
+        Returns:
+            efo_mappings (list): EFO terms of the disease, as dictionaries with an id and a name. None if unmapped.
+        '''
+        disease_id, disease_name = disease
+
+        # Looking up disease in Ontoma using disease id and label:
+        if self.ontoma.get_efo_label(disease_id):
+            disease_label = self.ontoma.get_efo_label(disease_id)
+            # Create list of single disease to mimic what is returned by next step
+            return [{'id': disease_id, 'name': disease_label}]
+
+        elif self.ontoma.get_efo_from_xref(disease_id):
+            efo_mappings = self.ontoma.get_efo_from_xref(disease_id)
+            logging.info('{} mapped to {} EFO ids based on xrefs.'.format(disease_id, len(efo_mappings)))
+            return efo_mappings
+
+        # Search disease label using OnToma and accept perfect matches
+        ontoma_mapping = self.ontoma.find_term(disease_name, verbose=True)
+        if ontoma_mapping:
+            if ontoma_mapping['action'] is None:
+                return [{'id': ontoma_mapping['term'], 'name': ontoma_mapping['label']}]
+
+            # OnToma fuzzy match ignored
+            logging.info('Fuzzy match from OnToma ignored. Request EFO team to import {} - {}'.format(disease_name, disease_id))
+        else:
+            # MONDO id could not be found in EFO. Log it and continue
+            logging.info('{} - {} could not be mapped to any EFO id. Skipping it, it should be checked with the EFO team'.format(disease_name, disease_id))
+        return None
+
+    def write_evidence_strings(self, filename, output_format=None):
         logging.info('Writing ClinGen evidence strings to %s', filename)
-        with gzip.open(filename, 'wt') as tp_file:
-            for evidence_string in self.evidence_strings:
-                json.dump(evidence_string, tp_file)
-                tp_file.write('\n')
+        with self.report.stage('write') as stage:
+            stage.set_rows(output_rows=write_evidence_records(self.evidence_strings, filename, output_format))
+        self.evidence_strings.log_stats()
+        self.evidence_strings.close()
 
 
-def main(infile, outfile):
+def main(infile, outfile, output_format=None):
 
     clingen = ClinGen()
-    clingen.process_gene_validity_curations(infile, outfile)
+    clingen.process_gene_validity_curations(infile, outfile, output_format)
 
 
 if __name__ == "__main__":
@@ -116,6 +153,10 @@ if __name__ == "__main__":
                         type=str, required=True)
     parser.add_argument('-l', '--log_file', type=str,
                         help='Optional filename to redirect the logs into.')
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
 
     args = parser.parse_args()
 
@@ -134,4 +175,4 @@ if __name__ == "__main__":
         logging_config['filename'] = log_file
     logging.basicConfig(**logging_config)
 
-    main(infile, outfile)
+    main(infile, outfile, args.output_format)
@@ -4,10 +4,12 @@ import argparse
 import logging
 import sys
 
-from pyspark.conf import SparkConf
-from pyspark.sql import SparkSession
-from pyspark.sql.types import StringType
-import pyspark.sql.functions as pf
+from common.Instrumentation import RunReport
+from common.ParquetWriter import JSON, OUTPUT_FORMATS, PARQUET, output_formats, parquet_path, write_spark_parquet
+from common.Sampling import sample_spark
+from common.ShardedWriter import write_spark_shards
+from common.SparkSessionFactory import get_spark_session
+from settings import Config
 
 
 # The following target labels are excluded as they were grounded to too many target Ids
@@ -15,72 +17,53 @@ EXCLUDED_TARGET_TERMS = ['TEC', 'TECS', 'Tec', 'tec', '\'', '(', ')', '-', '-S',
     'Ss', 'Ss-', 's', 's-', 'ss', 'U3', 'U6', 'u6', 'SNORA70', 'U2', 'U8']
 
 
-def main(cooccurrenceFile, outputFile, local=False):
+def main(cooccurrenceFile, outputFile, local=False, output_format=None, shard_size=0):
+    from pyspark.sql.types import StringType
+    import pyspark.sql.functions as pf
 
     # Initialize spark session
-    if local:
-        sparkConf = (
-            SparkConf()
-            .set('spark.driver.memory', '15g')
-            .set('spark.executor.memory', '15g')
-            .set('spark.driver.maxResultSize', '0')
-            .set('spark.debug.maxToStringFields', '2000')
-            .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-        )
-        spark = (
-            SparkSession.builder
-            .config(conf=sparkConf)
-            .master('local[*]')
-            .getOrCreate()
-        )
-    else:
-        sparkConf = (
-            SparkConf()
-            .set('spark.driver.maxResultSize', '0')
-            .set('spark.debug.maxToStringFields', '2000')
-            .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-        )
-        spark = (
-            SparkSession.builder
-            .config(conf=sparkConf)
-            .getOrCreate()
-        )
-
-    logging.info(f'Spark version: {spark.version}')
+    spark = get_spark_session('EPMC', 'local' if local else 'cluster', [cooccurrenceFile])
+    report = RunReport('EPMC', spark)
 
     # Log parameters:
     logging.info(f'Cooccurrence file: {cooccurrenceFile}')
     logging.info(f'Output file: {outputFile}')
     logging.info('Generating evidence:')
 
-    # Load/filter datasets:
-    filtered_cooccurrence_df = (
-        # Reading file:
-        spark.read.parquet(cooccurrenceFile)
-
-        # Casting integer pmid column to string:
-        .withColumn("pmid", pf.col('pmid').cast(StringType()))
-
-        # Publication identifier is a pmid if available, otherwise pmcid
-        .withColumn(
-            'publicationIdentifier',
-            pf.when(pf.col('pmid').isNull(), pf.col('pmcid'))
-            .otherwise(pf.col('pmid'))
+    with report.stage('load') as stage:
+        # Load/filter datasets:
+        cooccurrence_df = (
+            # Reading file:
+            spark.read.parquet(cooccurrenceFile)
+
+            # Casting integer pmid column to string:
+            .withColumn("pmid", pf.col('pmid').cast(StringType()))
+
+            # Publication identifier is a pmid if available, otherwise pmcid
+            .withColumn(
+                'publicationIdentifier',
+                pf.when(pf.col('pmid').isNull(), pf.col('pmcid'))
+                .otherwise(pf.col('pmid'))
+            )
         )
-
-        # Filtering for disease/target cooccurrences:
-        .filter(
-            (pf.col('type') == 'GP-DS') &  # Filter gene/protein - disease cooccurrence
-            (pf.col('isMapped')) &  # Filtering for mapped cooccurrences
-            (pf.col('publicationIdentifier').isNotNull()) &  # Making sure at least the pmid or the pmcid is given:
-            (pf.length(pf.col('text')) < 600) &  # Exclude sentences with more than 600 characters
-            (pf.col('label1').isin(EXCLUDED_TARGET_TERMS) == False)  # Excluding target labels from the exclusion list
+        filtered_cooccurrence_df = (
+            # A sampled run keeps all the cooccurrences of the sampled publications:
+            sample_spark(cooccurrence_df, 'publicationIdentifier')
+
+            # Filtering for disease/target cooccurrences:
+            .filter(
+                (pf.col('type') == 'GP-DS') &  # Filter gene/protein - disease cooccurrence
+                (pf.col('isMapped')) &  # Filtering for mapped cooccurrences
+                (pf.col('publicationIdentifier').isNotNull()) &  # Making sure at least the pmid or the pmcid is given:
+                (pf.length(pf.col('text')) < 600) &  # Exclude sentences with more than 600 characters
+                (pf.col('label1').isin(EXCLUDED_TARGET_TERMS) == False)  # Excluding target labels from the exclusion list
+            )
+
+            # Renaming columns:
+            .withColumnRenamed('keywordId1', 'targetFromSourceId')
+            .withColumnRenamed('keywordId2', 'diseaseFromSourceMappedId')
         )
-
-        # Renaming columns:
-        .withColumnRenamed('keywordId1', 'targetFromSourceId')
-        .withColumnRenamed('keywordId2', 'diseaseFromSourceMappedId')
-    )
+        stage.set_rows(output_rows=filtered_cooccurrence_df)
 
     # Report on the number of diseases, targets and associations if loglevel == "debug" to avoid cost on computation time:
     logging.debug(f"Number of publications: {filtered_cooccurrence_df.select(pf.col('publicationIdentifier')).distinct().count()}")
@@ -116,25 +99,39 @@ def main(cooccurrenceFile, outputFile, local=False):
     )
 
     # Report number of evidence:
-    logging.info(f'Number of evidence: {aggregated_df.count()}')
-
-    # Final formatting and saving data:
-    (
-        aggregated_df
-
-        # Adding literal columns:
-        .withColumn('datasourceId', pf.lit('europepmc'))
-        .withColumn('datatypeId', pf.lit('literature'))
-
-        # Reorder columns:
-        .select(['datasourceId', 'datatypeId', 'targetFromSourceId', 'diseaseFromSourceMappedId', 'resourceScore',
-                 'literature', 'textMiningSentences', 'pmcIds'])
+    with report.stage('aggregate') as stage:
+        evidence_count = aggregated_df.count()
+        stage.set_rows(input_rows=filtered_cooccurrence_df, output_rows=evidence_count)
+    logging.info(f'Number of evidence: {evidence_count}')
+
+    formats = output_formats(output_format)
+    with report.stage('write') as stage:
+        # Final formatting and saving data:
+        evidence_df = (
+            aggregated_df
+
+            # Adding literal columns:
+            .withColumn('datasourceId', pf.lit('europepmc'))
+            .withColumn('datatypeId', pf.lit('literature'))
+
+            # Reorder columns:
+            .select(['datasourceId', 'datatypeId', 'targetFromSourceId', 'diseaseFromSourceMappedId', 'resourceScore',
+                     'literature', 'textMiningSentences', 'pmcIds'])
+        )
+        if len(formats) > 1:
+            evidence_df = evidence_df.persist()
 
         # Save output:
-        .write.format('json').mode('overwrite').option('compression', 'gzip').save(outputFile)
-    )
+        if JSON in formats and shard_size:
+            write_spark_shards(evidence_df, outputFile, shard_size * 2 ** 20)
+        elif JSON in formats:
+            evidence_df.write.format('json').mode('overwrite').option('compression', 'gzip').save(outputFile)
+        if PARQUET in formats:
+            write_spark_parquet(evidence_df, parquet_path(outputFile))
+        stage.set_rows(output_rows=evidence_count)
 
     logging.info('EPMC disease target evidence saved.')
+    report.write(outputFile)
 
 
 def parse_args():
@@ -149,6 +146,15 @@ def parse_args():
         '--logFile', help='Destination of the logs generated by this script.', type=str, required=False)
     parser.add_argument(
         '--local', help='Destination of the logs generated by this script.', action='store_true', required=False, default=False)
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON output, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
+    parser.add_argument('--shard-size', help=(
+        'Target size of the JSON output shards, in MiB of uncompressed JSON lines. When set, the JSON output is a '
+        'directory of shards sorted by association, with a manifest. Defaults to the OT_SHARD_SIZE environment '
+        'variable or 0 (no sharding).'
+    ), type=int, default=Config.SHARD_SIZE)
     args = parser.parse_args()
 
     # extract parameters:
@@ -156,14 +162,16 @@ def parse_args():
     logFile = args.logFile
     outputFile = args.outputFile
     local = args.local
+    outputFormat = args.output_format
+    shardSize = args.shard_size
 
-    return (cooccurrenceFile, logFile, outputFile, local)
+    return (cooccurrenceFile, logFile, outputFile, local, outputFormat, shardSize)
 
 
 if __name__ == '__main__':
 
     # Parse arguments:
-    cooccurrenceFile, logFile, outputFile, local = parse_args()
+    cooccurrenceFile, logFile, outputFile, local, outputFormat, shardSize = parse_args()
 
     # Initialize logger based on the provided logfile.
     # If no logfile is specified, logs are written to stderr
@@ -178,4 +186,4 @@ if __name__ == '__main__':
         logging.StreamHandler(sys.stderr)
 
     # Calling main function:
-    main(cooccurrenceFile, outputFile, local)
+    main(cooccurrenceFile, outputFile, local, outputFormat, shardSize)
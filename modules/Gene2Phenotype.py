@@ -1,16 +1,13 @@
 import logging
-import csv
-import gzip
 import argparse
-import json
 import sys
 
-from pyspark.conf import SparkConf
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import split, col, udf, lit
-from pyspark.sql.types import StringType, IntegerType, TimestampType, StructType
-
-import ontoma
+from common.Engine import ENGINES, get_engine
+from common.Instrumentation import RunReport
+from common.MappingCache import CachedOnToma
+from common.ParquetWriter import OUTPUT_FORMATS
+from common.Resolver import BatchResolver
+from settings import Config
 
 
 G2P_mutationCsq2functionalCsq = {
@@ -27,19 +24,10 @@ G2P_mutationCsq2functionalCsq = {
     'part of contiguous gene duplication': 'SO_1000173'  # tandem_duplication
 }
 
-
-def translate(mapping):
-    '''
-    Mapping consequences - to SO codes
-    '''
-    def translate_(col):
-        return mapping.get(col)
-    return udf(translate_, StringType())
-
 class disease_map(object):
 
     def __init__(self):
-        self.ontoma = ontoma.interface.OnToma()
+        self.ontoma = CachedOnToma()
 
     def map_disease(self, disease_name, omim_id):
         logging.info(f"Mapping '{disease_name}'")
@@ -117,155 +105,132 @@ class disease_map(object):
                 'exact': True
             }
         except KeyError as e:
-            exact_ols_mondo = self.ontoma._ols.besthit(disease_name,
-                                                       ontology=['mondo'], field_list=['iri', 'label'], exact=True)
+            exact_ols_mondo = self.ontoma.ols_besthit(disease_name,
+                                                      ontology=['mondo'], field_list=['iri', 'label'], exact=True)
 
             if exact_ols_mondo:
                 return {'term': exact_ols_mondo['iri'], 'name': exact_ols_mondo['label'], 'exact':True}
 
             else:
-                ols_mondo = self.ontoma._ols.besthit(disease_name,
-                                                     ontology=['mondo'],
-                                                     field_list=['iri', 'label'],
-                                                     bytype='class')
+                ols_mondo = self.ontoma.ols_besthit(disease_name,
+                                                    ontology=['mondo'],
+                                                    field_list=['iri', 'label'],
+                                                    bytype='class')
                 if ols_mondo:
                     return {'term': ols_mondo['iri'], 'name': ols_mondo['label'], 'exact': False}
                 else:
                     return None
 
-def main(dd_file, eye_file, skin_file, cancer_file, outfile, local):
-
-    # Initialize disease mapping object:
-    dm_obj = disease_map()
-
-    # UDF to look up EFO mappings:
-    @udf(StringType())
-    def map_disease(label, disease_id):
-        lookup = dm_obj.map_disease(label, disease_id)
-        if lookup:
-            try:
-                return lookup['term'].split('/')[-1]
-            except Exception as e:
-                print(lookup)
-        else:
-            return None
-
-    # Initialize spark session
-    if local:
-        sparkConf = (
-            SparkConf()
-            .set('spark.driver.memory', '15g')
-            .set('spark.executor.memory', '15g')
-            .set('spark.driver.maxResultSize', '0')
-            .set('spark.debug.maxToStringFields', '2000')
-            .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-        )
-        spark = (
-            SparkSession.builder
-            .config(conf=sparkConf)
-            .config("spark.sql.broadcastTimeout", "36000")
-            .master('local[*]')
-            .getOrCreate()
-        )
-    else:
-        sparkConf = (
-            SparkConf()
-            .set('spark.driver.maxResultSize', '0')
-            .set('spark.debug.maxToStringFields', '2000')
-            .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-        )
-        spark = (
-            SparkSession.builder
-            .config(conf=sparkConf)
-            .config("spark.sql.broadcastTimeout", "36000")
-            .getOrCreate()
-        )
-
-    # Specify schema -> this schema is applied for all gene2phenotype files:
-    gene2phenotype_schema = (
-        StructType()
-        .add('gene symbol', StringType())
-        .add('gene mim', IntegerType())
-        .add('disease name', StringType())
-        .add('disease mim', StringType())
-        .add('DDD category', StringType())
-        .add('allelic requirement list', StringType())
-        .add('mutation consequence', StringType())
-        .add('phenotype list', StringType())
-        .add('organ specificity list', StringType())
-        .add('pmid list', StringType())
-        .add('panel', StringType())
-        .add('prev symbol list', StringType())
-        .add('hgnc id', IntegerType())
-        .add('gene disease entry date', TimestampType())
-    )
+def generate_evidence(engine, input_files, dm_obj, report=None):
+    '''
+    Builds the evidence table from the gene2phenotype panels. The disease mapping is done on the driver, once per
+    distinct disease, on a pool of threads.
+
+    Args:
+        engine (common.Engine.SparkEngine or common.Engine.PandasEngine): Engine running the transformations
+        input_files (list): gene2phenotype panel files
+        dm_obj (disease_map): Disease mapping object
+        report (common.Instrumentation.RunReport): Run report recording the stages, if any
+    Returns:
+        evidence_df (pyspark.sql.DataFrame or pandas.DataFrame)
+    '''
+    report = report or RunReport('Gene2Phenotype', getattr(engine, 'spark', None))
 
-    # Load all files for one go:
-    gene2phenotype_data = (
-        spark.read.csv(
-            [dd_file, eye_file, skin_file, cancer_file], schema=gene2phenotype_schema, enforceSchema=True, header=True
-        )
+    with report.stage('load') as stage:
+        # Load all files for one go:
+        gene2phenotype_data = engine.read_csv(input_files, schema='gene2phenotype', sample='gene symbol')
 
         # Split pubmed IDs to list:
-        .withColumn('literature', split(col('pmid list'), ';'))
-
-        # Split phenotypes:
-        .withColumn('phenotypes', split(col('phenotype list'), ';'))
-
-        # Split organ specificity:
-        .withColumn('organ_specificities', split(col('organ specificity list'), ';'))
+        gene2phenotype_data = engine.split(gene2phenotype_data, 'pmid list', ';', output='literature')
 
         # Split allelic requirements:
-        .withColumn('allelicRequirements', split(col('allelic requirement list'), ';'))
-    )
-
-    # Processing data:
-    evidence_df = (
-        gene2phenotype_data
+        gene2phenotype_data = engine.split(
+            gene2phenotype_data, 'allelic requirement list', ';', output='allelicRequirements'
+        )
 
         # Renaming columns:
-        .withColumnRenamed('gene symbol', 'targetFromSourceId')
-        .withColumnRenamed('disease mim', 'diseaseFromSourceId')
-        .withColumnRenamed('disease name', 'diseaseFromSource')
-        .withColumnRenamed('panel', 'studyId')
-        .withColumnRenamed('DDD category', 'confidence')
+        evidence_df = engine.rename(gene2phenotype_data, {
+            'gene symbol': 'targetFromSourceId',
+            'disease mim': 'diseaseFromSourceId',
+            'disease name': 'diseaseFromSource',
+            'panel': 'studyId',
+            'DDD category': 'confidence',
+        })
 
         # Map functional consequences:
-        .withColumn("variantFunctionalConsequenceId", translate(G2P_mutationCsq2functionalCsq)("mutation consequence"))
+        evidence_df = engine.map_values(
+            evidence_df, 'mutation consequence', G2P_mutationCsq2functionalCsq, output='variantFunctionalConsequenceId'
+        )
 
         # Adding literature columns:
-        .withColumn('datasourceId', lit('gene2phenotype'))
-        .withColumn('datatypeId', lit('genetic_literature'))
+        evidence_df = engine.with_constant(evidence_df, 'datasourceId', 'gene2phenotype')
+        evidence_df = engine.with_constant(evidence_df, 'datatypeId', 'genetic_literature')
 
         # Selecting relevant columns:
-        .select(
+        evidence_df = engine.select(evidence_df, [
             'datasourceId', 'datatypeId', 'targetFromSourceId', 'diseaseFromSource',
             'diseaseFromSourceId', 'confidence', 'studyId', 'literature',
             'allelicRequirements', 'variantFunctionalConsequenceId'
+        ])
+        stage.set_rows(output_rows=evidence_df)
+
+    with report.stage('map') as stage:
+        # Get all the diseases + map disease to EFO:
+        diseases = engine.collect(engine.distinct(evidence_df, ['diseaseFromSource', 'diseaseFromSourceId']))
+        disease_mappings = BatchResolver(lambda disease: map_disease(dm_obj, *disease)).resolve(
+            (disease['diseaseFromSource'], disease['diseaseFromSourceId']) for disease in diseases
+        )
+        for disease in diseases:
+            disease['diseaseFromSourceMappedId'] = disease_mappings[
+                (disease['diseaseFromSource'], disease['diseaseFromSourceId'])
+            ]
+        dm_obj.ontoma.cache.log_stats()
+        stage.set_rows(input_rows=evidence_df, output_rows=diseases)
+        diseases = engine.from_records(
+            diseases, ['diseaseFromSource', 'diseaseFromSourceId', 'diseaseFromSourceMappedId']
         )
-        .coalesce(1)
-    )
-
-    # Get all the diseases + map disease to EFO:
-    diseases = (
-        evidence_df
-        .select('diseaseFromSource', 'diseaseFromSourceId')
-        .distinct()
-        .withColumn('diseaseFromSourceMappedId', map_disease(col('diseaseFromSource'), col('diseaseFromSourceId')))
-        .persist()
-    )
 
     # Merge evidence with the mapped disease:
-    evidence_df = (
-        evidence_df
-        .join(diseases, how='left', on=['diseaseFromSource', 'diseaseFromSourceId'])
-    )
+    with report.stage('join') as stage:
+        evidence_df = engine.join(evidence_df, diseases, how='left', on=['diseaseFromSource', 'diseaseFromSourceId'])
+        stage.set_rows(output_rows=evidence_df)
+    return evidence_df
+
+
+def map_disease(dm_obj, label, disease_id):
+    '''
+    Looks up the EFO mapping of a disease.
+    '''
+    lookup = dm_obj.map_disease(label, disease_id)
+    if lookup:
+        try:
+            return lookup['term'].split('/')[-1]
+        except Exception as e:
+            print(lookup)
+    else:
+        return None
+
+
+def main(dd_file, eye_file, skin_file, cancer_file, outfile, local, engine='spark', output_format=None,
+         shard_size=0):
+
+    # Initialize disease mapping object:
+    dm_obj = disease_map()
+
+    # Initialize the engine running the transformations (Spark session or in-process pandas):
+    input_files = [dd_file, eye_file, skin_file, cancer_file]
+    engine = get_engine(engine, 'Gene2Phenotype', local, input_files)
+    report = RunReport('Gene2Phenotype', getattr(engine, 'spark', None))
+
+    evidence_df = generate_evidence(engine, input_files, dm_obj, report)
 
     # Saving data:
-    (
-        evidence_df
-        .write.format('json').mode('overwrite').option('compression', 'gzip').save(outfile)
-    )
+    logging.info('Generating evidence:')
+    with report.stage('write') as stage:
+        stage.set_rows(output_rows=engine.write_evidence(
+            evidence_df, outfile, output_format=output_format, shard_size=shard_size * 2 ** 20
+        ))
+    report.write(outfile)
 
 
 if __name__ == "__main__":
@@ -286,6 +251,17 @@ if __name__ == "__main__":
                         help='Cancer panel file downloaded from https://www.ebi.ac.uk/gene2phenotype/downloads',
                         type=str)
     parser.add_argument('--local', help='Where the ', action='store_true', required=False, default=False)
+    parser.add_argument('--engine', help='Engine running the transformations: spark, or pandas for a Spark-free run.',
+                        type=str, choices=ENGINES, required=False, default='spark')
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
+    parser.add_argument('--shard-size', help=(
+        'Target size of the JSON output shards, in MiB of uncompressed JSON lines. When set, the JSON output is a '
+        'directory of shards sorted by association, with a manifest. Defaults to the OT_SHARD_SIZE environment '
+        'variable or 0 (no sharding).'
+    ), type=int, default=Config.SHARD_SIZE)
     parser.add_argument('-o', '--output_file', help='Name of gzipped evidence file', type=str)
     parser.add_argument('-l', '--log_file', help='Name of gzipped evidence file', type=str)
 
@@ -299,6 +275,7 @@ if __name__ == "__main__":
     outfile = args.output_file
     log_file = args.log_file
     local = args.local
+    engine = args.engine
 
     # Configure logger:
     logging.basicConfig(
@@ -318,4 +295,4 @@ if __name__ == "__main__":
     logging.info(f'Cancer panel file: {cancer_file}')
 
     # Calling main:
-    main(dd_file, eye_file, skin_file, cancer_file, outfile, local)
+    main(dd_file, eye_file, skin_file, cancer_file, outfile, local, engine, args.output_format, args.shard_size)
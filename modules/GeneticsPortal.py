@@ -2,11 +2,16 @@
 
 import argparse
 import sys
-import pyspark.sql
-from pyspark.sql.types import DoubleType, StringType, IntegerType
-from pyspark.sql.functions import col, lit, udf, when, expr, explode, substring, array, regexp_extract, concat_ws
 import logging
 
+from common.InputSchemas import read_spark
+from common.Instrumentation import RunReport
+from common.ParquetWriter import JSON, OUTPUT_FORMATS, PARQUET, output_formats, parquet_path, write_spark_parquet
+from common.Sampling import sample_spark
+from common.ShardedWriter import write_spark_shards
+from common.SparkSessionFactory import get_spark_session
+from settings import Config
+
 
 def load_eco_dict(inf):
     '''
@@ -15,10 +20,7 @@ def load_eco_dict(inf):
     '''
 
     # Load
-    eco_df = (
-        spark.read.csv(inf, sep='\t', header=True, inferSchema=True)
-        .select('Term', 'Accession', col('eco_score').cast(DoubleType()))
-    )
+    eco_df = read_spark(spark, 'eco_scores', inf, sep='\t')
 
     # Convert to python dict
     eco_dict = {}
@@ -46,8 +48,22 @@ def main():
     parser.add_argument('--outputFile', help='Output gzipped json file.', type=str, required=True)
     parser.add_argument('--threshold', help='Threshold applied on l2g score for filtering.', type=float, required=True)
     parser.add_argument('--logFile', help='Destination of the logs generated by this script.', type=str, required=False)
+    parser.add_argument('--local', help='Run Spark locally, with a session sized from the host and the input files.',
+                        action='store_true', required=False, default=False)
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON output, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
+    parser.add_argument('--shard-size', help=(
+        'Target size of the JSON output shards, in MiB of uncompressed JSON lines. When set, the JSON output is a '
+        'directory of shards sorted by association, with a manifest. Defaults to the OT_SHARD_SIZE environment '
+        'variable or 0 (no sharding).'
+    ), type=int, default=Config.SHARD_SIZE)
     args = parser.parse_args()
 
+    from pyspark.sql.types import StringType, IntegerType
+    from pyspark.sql.functions import col, lit, udf, when, expr, explode, substring, array, regexp_extract, concat_ws
+
     # extract parameters:
     in_l2g = args.locus2gene
     in_toploci = args.toploci
@@ -73,8 +89,10 @@ def main():
 
     # Initialize spark session
     global spark
-    spark = (pyspark.sql.SparkSession.builder.getOrCreate())
-    logging.info(f'Spark version: {spark.version}')
+    spark = get_spark_session(
+        'GeneticsPortal', 'local' if args.local else 'cluster', [in_l2g, in_toploci, in_study, in_varindex]
+    )
+    report = RunReport('GeneticsPortal', spark)
 
     # Log parameters:
     logging.info(f'Locus2gene table: {in_l2g}')
@@ -86,184 +104,199 @@ def main():
     logging.info(f'l2g score threshold: {l2g_threshold}')
     logging.info('Generating evidence:')
 
-    # Load locus-to-gene (L2G) score data
-    l2g = (
-        spark.read.parquet(in_l2g)
-        # Keep results trained on high or medium confidence gold-standards
-        .filter(col('training_gs') == 'high_medium')
-        # Keep results from xgboost model
-        .filter(col('training_clf') == 'xgboost')
-        # keepging rows with l2g score above the threshold:
-        .filter(col('y_proba_full_model') >= l2g_threshold)
-        # Only keep study, variant, gene and score info
-        .select(
-            'study_id',
-            'chrom', 'pos', 'ref', 'alt',
-            'gene_id',
-            'y_proba_full_model',
-        )
-    )
-
-    # Load association statistics (only pvalue is required) from top loci table
-    pvals = (
-        spark.read.parquet(in_toploci)
-        # # Calculate pvalue from the mantissa and exponent
-        # .withColumn('pval', col('pval_mantissa') * pow(10, col('pval_exponent')))
-        # # NB. be careful as very small floats will be set to 0, we can se these
-        # # to the smallest possible float instead
-        # .withColumn('pval',
-        #     when(col('pval') == 0, sys.float_info.min)
-        #     .otherwise(col('pval'))
-        # )
-        # Keep required fields
-        .select(
-            'study_id', 'chrom', 'pos', 'ref', 'alt', 'beta', 'beta_ci_lower', 'beta_ci_upper',
-            'pval_mantissa', 'pval_exponent', 'odds_ratio', 'oddsr_ci_lower', 'oddsr_ci_upper'
+    with report.stage('load') as stage:
+        # Load locus-to-gene (L2G) score data
+        # A sampled run keeps the same variants in the L2G, top loci and variant index tables:
+        l2g = (
+            sample_spark(spark.read.parquet(in_l2g), 'chrom', 'pos', 'ref', 'alt')
+            # Keep results trained on high or medium confidence gold-standards
+            .filter(col('training_gs') == 'high_medium')
+            # Keep results from xgboost model
+            .filter(col('training_clf') == 'xgboost')
+            # keepging rows with l2g score above the threshold:
+            .filter(col('y_proba_full_model') >= l2g_threshold)
+            # Only keep study, variant, gene and score info
+            .select(
+                'study_id',
+                'chrom', 'pos', 'ref', 'alt',
+                'gene_id',
+                'y_proba_full_model',
+            )
         )
-    )
 
-    # Load (a) disease information, (b) sample size from the study table
-    study_info = (
-        spark.read.parquet(in_study)
-        .select(
-            'study_id', 'pmid', 'pub_date', 'pub_author', 'trait_reported',
-            'trait_efos',
-            col('n_initial').alias('sample_size')  # Rename to sample size
+        # Load association statistics (only pvalue is required) from top loci table
+        pvals = (
+            sample_spark(spark.read.parquet(in_toploci), 'chrom', 'pos', 'ref', 'alt')
+            # # Calculate pvalue from the mantissa and exponent
+            # .withColumn('pval', col('pval_mantissa') * pow(10, col('pval_exponent')))
+            # # NB. be careful as very small floats will be set to 0, we can se these
+            # # to the smallest possible float instead
+            # .withColumn('pval',
+            #     when(col('pval') == 0, sys.float_info.min)
+            #     .otherwise(col('pval'))
+            # )
+            # Keep required fields
+            .select(
+                'study_id', 'chrom', 'pos', 'ref', 'alt', 'beta', 'beta_ci_lower', 'beta_ci_upper',
+                'pval_mantissa', 'pval_exponent', 'odds_ratio', 'oddsr_ci_lower', 'oddsr_ci_upper'
+            )
         )
 
-        # Warning! Not all studies have an EFO annotated. Also, some have
-        # multiple EFOs! We need to decide a strategy to deal with these.
-
-        # # For example, only keep studies with 1 efo:
-        # .filter(size(col('trait_efos')) == 1)
-        # .withColumn('efo', col('trait_efos').getItem(0))
-        # .drop('trait_efos')
+        # Load (a) disease information, (b) sample size from the study table
+        study_info = (
+            spark.read.parquet(in_study)
+            .select(
+                'study_id', 'pmid', 'pub_date', 'pub_author', 'trait_reported',
+                'trait_efos',
+                col('n_initial').alias('sample_size')  # Rename to sample size
+            )
 
-        # Or, drop rows with no EFO and then explode array to multiple rows
-        .withColumn(
-            'trait_efos',
-            when(
-                col('trait_efos').isNotNull(),
-                expr('filter(trait_efos, t -> length(t) > 0)')
+            # Warning! Not all studies have an EFO annotated. Also, some have
+            # multiple EFOs! We need to decide a strategy to deal with these.
+
+            # # For example, only keep studies with 1 efo:
+            # .filter(size(col('trait_efos')) == 1)
+            # .withColumn('efo', col('trait_efos').getItem(0))
+            # .drop('trait_efos')
+
+            # Or, drop rows with no EFO and then explode array to multiple rows
+            .withColumn(
+                'trait_efos',
+                when(
+                    col('trait_efos').isNotNull(),
+                    expr('filter(trait_efos, t -> length(t) > 0)')
+                )
             )
+            .withColumn('efo', explode(col('trait_efos')))
+            .drop('trait_efos')
         )
-        .withColumn('efo', explode(col('trait_efos')))
-        .drop('trait_efos')
-    )
 
-    # Get mapping for rsIDs:
-    rsID_map = (
-        spark.read.parquet(in_varindex)
-        # chrom_b38|pos_b38
-        # Explode consequences, only keeping canonical transcript
-        .selectExpr(
-            'chrom_b38 as chrom', 'pos_b38 as pos', 'ref', 'alt', 'rsid'
+        # Get mapping for rsIDs:
+        rsID_map = (
+            sample_spark(spark.read.parquet(in_varindex), 'chrom_b38', 'pos_b38', 'ref', 'alt')
+            # chrom_b38|pos_b38
+            # Explode consequences, only keeping canonical transcript
+            .selectExpr(
+                'chrom_b38 as chrom', 'pos_b38 as pos', 'ref', 'alt', 'rsid'
+            )
         )
-    )
 
-    # Load consequences:
-    var_consequences = (
-        spark.read.parquet(in_varindex)
-        # chrom_b38|pos_b38
-        # Explode consequences, only keeping canonical transcript
-        .selectExpr(
-            'chrom_b38 as chrom', 'pos_b38 as pos', 'ref', 'alt',
-            'vep.most_severe_consequence as most_severe_csq',
-            '''explode(
-                filter(vep.transcript_consequences, x -> x.canonical == 1)
-            ) as tc
-            '''
-        )
-        # Keep required fields from consequences struct
-        .selectExpr(
-            'chrom', 'pos', 'ref', 'alt', 'most_severe_csq',
-            'tc.gene_id as gene_id',
-            'tc.consequence_terms as csq_arr',
+        # Load consequences:
+        var_consequences = (
+            sample_spark(spark.read.parquet(in_varindex), 'chrom_b38', 'pos_b38', 'ref', 'alt')
+            # chrom_b38|pos_b38
+            # Explode consequences, only keeping canonical transcript
+            .selectExpr(
+                'chrom_b38 as chrom', 'pos_b38 as pos', 'ref', 'alt',
+                'vep.most_severe_consequence as most_severe_csq',
+                '''explode(
+                    filter(vep.transcript_consequences, x -> x.canonical == 1)
+                ) as tc
+                '''
+            )
+            # Keep required fields from consequences struct
+            .selectExpr(
+                'chrom', 'pos', 'ref', 'alt', 'most_severe_csq',
+                'tc.gene_id as gene_id',
+                'tc.consequence_terms as csq_arr',
+            )
         )
-    )
-
-    # Get most severe consequences:
 
-    # Load term to eco score dict
-    # (eco_dict,eco_link_dict) = spark.sparkContext.broadcast(load_eco_dict(in_csq_eco))
-    eco_dicts = spark.sparkContext.broadcast(load_eco_dict(in_csq_eco))
+        # Get most severe consequences:
 
-    get_link = udf(
-        lambda x: eco_dicts.value[1][x],
-        StringType()
-    )
-
-    # Extract most sereve csq per gene.
-    # Create UDF that reverse sorts csq terms using eco score dict, then select
-    # the first item. Then apply UDF to all rows in the data.
-    get_most_severe = udf(
-        lambda arr: sorted(arr, key=lambda x: eco_dicts.value[0].get(x, 0), reverse=True)[0],
-        StringType()
-    )
+        # Load term to eco score dict
+        # (eco_dict,eco_link_dict) = spark.sparkContext.broadcast(load_eco_dict(in_csq_eco))
+        eco_dicts = spark.sparkContext.broadcast(load_eco_dict(in_csq_eco))
 
-    var_consequences = (
-        var_consequences.withColumn('most_severe_gene_csq', get_most_severe(col('csq_arr')))
-        .withColumn('consequence_link', get_link(col('most_severe_gene_csq')))
-    )
+        get_link = udf(
+            lambda x: eco_dicts.value[1][x],
+            StringType()
+        )
 
-    # Join datasets together
-    processed = (
-        l2g
-        # Join L2G to pvals, using study and variant info as key
-        .join(pvals, on=['study_id', 'chrom', 'pos', 'ref', 'alt'])
-        # Join this to the study info, using study_id as key
-        .join(study_info, on='study_id', how='left')
-        # Join transcript consequences:
-        .join(var_consequences, on=['chrom', 'pos', 'ref', 'alt', 'gene_id'], how='left')
-        # Join rsIDs:
-        .join(rsID_map, on=['chrom', 'pos', 'ref', 'alt'], how='left')
-        # Filling with missing values:
-        .fillna(
-            {
-                'most_severe_gene_csq': 'intergenic_variant',
-                'consequence_link': 'http://purl.obolibrary.org/obo/SO_0001628'
-            }
+        # Extract most sereve csq per gene.
+        # Create UDF that reverse sorts csq terms using eco score dict, then select
+        # the first item. Then apply UDF to all rows in the data.
+        get_most_severe = udf(
+            lambda arr: sorted(arr, key=lambda x: eco_dicts.value[0].get(x, 0), reverse=True)[0],
+            StringType()
         )
-    )
 
-    # Write output
-    (
-        processed
-        .withColumn(
-            'literature',
-            when(col('pmid') != '', array(regexp_extract(col('pmid'), r"PMID:(\d+)$", 1))).otherwise(None)
+        var_consequences = (
+            var_consequences.withColumn('most_severe_gene_csq', get_most_severe(col('csq_arr')))
+            .withColumn('consequence_link', get_link(col('most_severe_gene_csq')))
         )
-        .select(
-            lit('ot_genetics_portal').alias('datasourceId'),
-            lit('genetic_association').alias('datatypeId'),
-            col('gene_id').alias('targetFromSourceId'),
-            col('efo').alias('diseaseFromSourceMappedId'),
-            col('literature'),
-            col('pub_author').alias('publicationFirstAuthor'),
-            substring(col('pub_date'), 1, 4).cast(IntegerType()).alias('publicationYear'),
-            col('trait_reported').alias('diseaseFromSource'),
-            col('study_id').alias('studyId'),
-            col('sample_size').alias('studySampleSize'),
-            col('pval_mantissa').alias('pValueMantissa'),
-            col('pval_exponent').alias('pValueExponent'),
-
-            col('odds_ratio').alias('oddsRatio'),
-            col('oddsr_ci_lower').alias('oddsRatioConfidenceIntervalLower'),
-            col('oddsr_ci_upper').alias('oddsRatioConfidenceIntervalUpper'),
-
-            col('beta').alias('beta'),
-            col('beta_ci_lower').alias('betaConfidenceIntervalLower'),
-            col('beta_ci_upper').alias('betaConfidenceIntervalUpper'),
-
-            col('y_proba_full_model').alias('resourceScore'),
-            col('rsid').alias('variantRsId'),
-            concat_ws('_', col('chrom'), col('pos'), col('ref'), col('alt')).alias('variantId'),
-            regexp_extract(col('consequence_link'), r"\/(SO.+)$", 1).alias('variantFunctionalConsequenceId')
+        stage.set_rows(output_rows=l2g)
+
+    with report.stage('join') as stage:
+        # Join datasets together
+        processed = (
+            l2g
+            # Join L2G to pvals, using study and variant info as key
+            .join(pvals, on=['study_id', 'chrom', 'pos', 'ref', 'alt'])
+            # Join this to the study info, using study_id as key
+            .join(study_info, on='study_id', how='left')
+            # Join transcript consequences:
+            .join(var_consequences, on=['chrom', 'pos', 'ref', 'alt', 'gene_id'], how='left')
+            # Join rsIDs:
+            .join(rsID_map, on=['chrom', 'pos', 'ref', 'alt'], how='left')
+            # Filling with missing values:
+            .fillna(
+                {
+                    'most_severe_gene_csq': 'intergenic_variant',
+                    'consequence_link': 'http://purl.obolibrary.org/obo/SO_0001628'
+                }
+            )
         )
-        .dropDuplicates(['variantId', 'studyId', 'targetFromSourceId', 'diseaseFromSourceMappedId'])
-        .write.format('json').mode('overwrite').option('compression', 'gzip').save(out_file)
-    )
-
+        stage.set_rows(input_rows=l2g, output_rows=processed)
+
+    formats = output_formats(args.output_format)
+    with report.stage('write'):
+        # Write output
+        evidence = (
+            processed
+            .withColumn(
+                'literature',
+                when(col('pmid') != '', array(regexp_extract(col('pmid'), r"PMID:(\d+)$", 1))).otherwise(None)
+            )
+            .select(
+                lit('ot_genetics_portal').alias('datasourceId'),
+                lit('genetic_association').alias('datatypeId'),
+                col('gene_id').alias('targetFromSourceId'),
+                col('efo').alias('diseaseFromSourceMappedId'),
+                col('literature'),
+                col('pub_author').alias('publicationFirstAuthor'),
+                substring(col('pub_date'), 1, 4).cast(IntegerType()).alias('publicationYear'),
+                col('trait_reported').alias('diseaseFromSource'),
+                col('study_id').alias('studyId'),
+                col('sample_size').alias('studySampleSize'),
+                col('pval_mantissa').alias('pValueMantissa'),
+                col('pval_exponent').alias('pValueExponent'),
+
+                col('odds_ratio').alias('oddsRatio'),
+                col('oddsr_ci_lower').alias('oddsRatioConfidenceIntervalLower'),
+                col('oddsr_ci_upper').alias('oddsRatioConfidenceIntervalUpper'),
+
+                col('beta').alias('beta'),
+                col('beta_ci_lower').alias('betaConfidenceIntervalLower'),
+                col('beta_ci_upper').alias('betaConfidenceIntervalUpper'),
+
+                col('y_proba_full_model').alias('resourceScore'),
+                col('rsid').alias('variantRsId'),
+                concat_ws('_', col('chrom'), col('pos'), col('ref'), col('alt')).alias('variantId'),
+                regexp_extract(col('consequence_link'), r"\/(SO.+)$", 1).alias('variantFunctionalConsequenceId')
+            )
+            .dropDuplicates(['variantId', 'studyId', 'targetFromSourceId', 'diseaseFromSourceMappedId'])
+        )
+        if len(formats) > 1:
+            evidence = evidence.persist()
+        if JSON in formats and args.shard_size:
+            write_spark_shards(evidence, out_file, args.shard_size * 2 ** 20)
+        elif JSON in formats:
+            evidence.write.format('json').mode('overwrite').option('compression', 'gzip').save(out_file)
+        if PARQUET in formats:
+            write_spark_parquet(evidence, parquet_path(out_file))
+
+    report.write(out_file)
     return 0
 
 
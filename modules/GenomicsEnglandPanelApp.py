@@ -1,36 +1,30 @@
 import logging
 from sys import stderr
-import requests
 import argparse
 import re
-import gzip
 import json
-import multiprocessing as mp
-import numpy as np
 
-import pandas as pd
-
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import (
-    col, lit, when, array_distinct, split, explode, udf, regexp_extract, trim, regexp_replace, element_at
-)
-from pyspark.sql.types import StringType, ArrayType
-
-from ontoma import OnToma
+from common.EvidenceWriter import write_evidence_strings
+from common.HttpClient import get_json
+from common.InputSchemas import read_spark
+from common.Instrumentation import RunReport
+from common.MappingCache import CachedOnToma
+from common.ParquetWriter import OUTPUT_FORMATS
+from common.Resolver import BatchResolver
+from common.Sampling import sample_spark
+from common.SparkSessionFactory import get_spark_session
+from settings import Config
 
 class PanelAppEvidenceGenerator():
 
-    def __init__(self, phenotypesMappings, limit=None):
-        # Create OnToma object
-        self.otmap = OnToma()
+    def __init__(self, phenotypesMappings, limit=None, local=False, inputFiles=None):
+        # Create OnToma object, with its lookups cached on disk
+        self.otmap = CachedOnToma()
 
         # Create spark session
-        self.spark = (
-            SparkSession.builder
-            .appName('evidence_builder')
-            .getOrCreate()
-        )
+        self.spark = get_spark_session('evidence_builder', 'local' if local else 'cluster', inputFiles)
         self.dataframe = None
+        self.report = RunReport('PanelApp', self.spark)
 
         # Initialize mapping variables
         self.diseaseMappings = phenotypesMappings
@@ -42,36 +36,45 @@ class PanelAppEvidenceGenerator():
         Processing of the dataframe to build all the evidences from its data
 
         Args:
-            dataframe (pyspark.DataFrame): Initial .tsv file
+            inputFile (str): Input .tsv file
+            skipMapping (bool): Whether the disease mapping step is skipped
         Returns:
-            evidences (array): Object with all the generated evidences strings
+            dataframe (pyspark.DataFrame): Final dataframe from which the evidence strings are built
         '''
-
-        # Reading and filtering input file
-        self.dataframe = (
-            self.spark.read.csv(inputFile, sep=r'\t', header=True)
-            .filter(
-                ((col('List') == 'green') | (col('List') == 'amber'))
-                & (col('Panel Version') > 1) & (col('Panel Status') == 'PUBLIC')
+        from pyspark.sql.functions import col, lit
+
+        with self.report.stage('load') as stage:
+            # Reading and filtering input file. A sampled run keeps whole panels, whose publications are fetched
+            # panel by panel:
+            self.dataframe = (
+                sample_spark(read_spark(self.spark, 'panelapp', inputFile, sep='\t'), 'Panel Id')
+                .filter(
+                    ((col('List') == 'green') | (col('List') == 'amber'))
+                    & (col('Panel Version') > 1) & (col('Panel Status') == 'PUBLIC')
+                )
             )
-        )
 
-        # Applying limit is present:
-        if self.limit is not None:
-            self.dataframe = self.dataframe.sample(False, 1.0, 829348).limit(self.limit)
+            # Applying limit is present:
+            if self.limit is not None:
+                self.dataframe = self.dataframe.sample(False, 1.0, 829348).limit(self.limit)
 
-        logging.info('Fetching publications from the API...')
-        pdf = PanelAppEvidenceGenerator.buildPublications(self.dataframe.toPandas())  # TODO: write in pyspark
-        pdf.dropna(axis=1, how='all', inplace=True)
-        self.dataframe = self.spark.createDataFrame(pdf)
-        logging.info('Publications loaded.')
+            logging.info('Fetching publications from the API...')
+            pdf = PanelAppEvidenceGenerator.buildPublications(self.dataframe.toPandas())  # TODO: write in pyspark
+            pdf.dropna(axis=1, how='all', inplace=True)
+            self.dataframe = self.spark.createDataFrame(pdf)
+            logging.info('Publications loaded.')
+            stage.set_rows(output_rows=pdf)
 
         # Cleaning the phenotype related data of the dataframe
-        self.dataframe = PanelAppEvidenceGenerator.cleanDataframe(self.dataframe)
+        with self.report.stage('clean') as stage:
+            self.dataframe = PanelAppEvidenceGenerator.cleanDataframe(self.dataframe)
+            stage.set_rows(output_rows=self.dataframe)
 
         # Map the diseases to an EFO term if necessary
         if not skipMapping:
-            self.dataframe = self.diseaseMappingStep()
+            with self.report.stage('map') as stage:
+                self.dataframe = self.diseaseMappingStep()
+                stage.set_rows(output_rows=self.dataframe)
         else:
             logging.info('Disease mapping has been skipped.')
             self.dataframe = self.dataframe.withColumn(
@@ -79,31 +82,8 @@ class PanelAppEvidenceGenerator():
                 lit(None)
             )
 
-        logging.info('Generating evidence:')
-        evidences = (
-            self.dataframe
-            # Removing redundant evidence after the explosion of phenotypes
-            .dropDuplicates(['Panel Id', 'Symbol', 'ontomaUrl', 'cohortPhenotypes'])
-            # Build evidence strings per row
-            .rdd.map(PanelAppEvidenceGenerator.parseEvidenceString)
-            .collect()  # list of dictionaries
-        )
-
-        for evidence in evidences:
-            # Delete empty keys
-            if skipMapping or evidence['diseaseFromSourceMappedId'] is None:
-                del evidence['diseaseFromSourceMappedId']
-
-            if not evidence['diseaseFromSourceId']:
-                del evidence['diseaseFromSourceId']
-
-            if len(evidence['literature']) == 0:
-                del evidence['literature']
-
-            if evidence['allelicRequirements'] == [None]:
-                del evidence['allelicRequirements']
-
-        return evidences
+        # Removing redundant evidence after the explosion of phenotypes
+        return self.dataframe.dropDuplicates(['Panel Id', 'Symbol', 'ontomaUrl', 'cohortPhenotypes'])
 
     @staticmethod
     def buildPublications(pdf):
@@ -115,6 +95,8 @@ class PanelAppEvidenceGenerator():
         Returns:
             dataframe (pandas.DataFrame): DataFrame with an 'publications' column added
         '''
+        import pandas as pd
+
         populated_groups = []
 
         for (PanelId), group in pdf.groupby('Panel Id'):
@@ -151,8 +133,8 @@ class PanelAppEvidenceGenerator():
         '''
         try:
             url = f'http://panelapp.genomicsengland.co.uk/api/v1/panels/{panelId}/'
-            res = requests.get(url).json()
-            return res['genes']
+            # The calls share the kept-alive connections of the process:
+            return get_json(url)['genes']
         except Exception as e:
             logging.error('Query of the PanelApp API has failed.')
             return None
@@ -180,6 +162,7 @@ class PanelAppEvidenceGenerator():
         Returns:
             dataframe (pyspark.DataFrame): Transformed initial dataframe
         '''
+        from pyspark.sql.functions import array_distinct, col, explode, regexp_extract, regexp_replace, split, trim, when
 
         dataframe = (
             dataframe
@@ -217,20 +200,15 @@ class PanelAppEvidenceGenerator():
         Returns:
             dataframe (pyspark.DataFrame): DataFrame with the mapping results filtered by only matches
         '''
+        from pyspark.sql.functions import col, element_at, split, udf
+        from pyspark.sql.types import ArrayType, StringType
 
         omimCodesDistinct = list(self.dataframe.select('omimCode').distinct().toPandas()['omimCode'])
         phenotypesDistinct = list(self.dataframe.select('phenotype').distinct().toPandas()['phenotype'])
 
         if self.diseaseMappings is None:
             # Checks whether the dictionary is not provided as a parameter
-            try:
-                pool = mp.Pool(mp.cpu_count())
-                self.diseaseMappings = pool.map(self.diseaseToEfo, phenotypesDistinct)  # list of dictionaries
-                self.diseaseMappings = {k: v for dct in self.diseaseMappings for (k, v) in self.diseaseMappings.items()}
-                pool.close()
-            except Exception as e:
-                logging.error(f'Processing the mappings without multithreading. Following error occurred: \n{e}.')
-                self.diseaseMappings = self.diseaseToEfo(*phenotypesDistinct)
+            self.diseaseMappings = self.diseaseToEfo(*phenotypesDistinct)
         else:
             logging.info('Disease mappings have been imported.')
 
@@ -262,34 +240,22 @@ class PanelAppEvidenceGenerator():
 
     def diseaseToEfo(self, *iterable, dictExport='diseaseToEfo_results.json'):
         '''
-        Queries the OnToma utility to map a phenotype to an EFO ID.
+        Queries the OnToma utility to map a phenotype to an EFO ID. The terms are queried concurrently through the
+        persistent mapping cache, and the results of the queried terms are exported from it for analysis or for a
+        later run.
 
         Args:
             iterable (array): Array or column of a dataframe containing the strings to query
-            dictExport (str): Name of the output file where the OnToma queries will be saved
+            dictExport (str): Name of the output file where the OnToma queries will be exported
         Returns:
             mappings (dict): Output file. Keys: queried term (phenotype or OMIM code), Values: OnToma output
         '''
-        mappings = dict()
-        for e in iterable:
-            try:
-                ontomaResult = self.otmap.find_term(e, verbose=True)
-                if ontomaResult is not None:
-                    mappings[e] = ontomaResult
-                else:
-                    mappings[e] = {
-                        'term': None,
-                        'label': None,
-                        'source': None,
-                        'quality': None,
-                        'action': None
-                    }
-            except Exception as error:
-                logging.error(f'{e} mapping has failed.')
-                continue
+        BatchResolver(lambda e: self.otmap.find_term(e, verbose=True)).resolve(iterable)
 
-        with open(dictExport, 'w') as outfile:
-            json.dump(mappings, outfile)
+        # Terms without a match are exported with an empty mapping:
+        emptyMapping = {'term': None, 'label': None, 'source': None, 'quality': None, 'action': None}
+        mappings = self.otmap.export(dictExport, 'find_term', iterable, default=emptyMapping, verbose=True)
+        self.otmap.cache.log_stats()
 
         return mappings
 
@@ -368,6 +334,12 @@ def main():
                         type=str, required=False)
     parser.add_argument('-m', '--limit', help='For testing purposes input narrowed down to this size of random sample.',
                         type=int, required=False)
+    parser.add_argument('--local', help='Run Spark locally, with a session sized from the host and the input files.',
+                        action='store_true', required=False, default=False)
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
 
     # Parsing parameters
     args = parser.parse_args()
@@ -377,6 +349,7 @@ def main():
     skipMapping = args.skipMapping
     mappingsDict = args.mappingsDict
     limit = args.limit
+    local = args.local
 
     # Initialize logging:
     logging.basicConfig(
@@ -402,17 +375,19 @@ def main():
         phenotypesMappings = None
 
     # Initialize evidence builder object
-    evidenceBuilder = PanelAppEvidenceGenerator(phenotypesMappings, limit)
+    evidenceBuilder = PanelAppEvidenceGenerator(phenotypesMappings, limit, local, [inputFile])
 
     # Writing evidence strings into a json file
-    evidences = evidenceBuilder.writeEvidenceFromSource(inputFile, skipMapping)
+    evidenceDataframe = evidenceBuilder.writeEvidenceFromSource(inputFile, skipMapping)
 
     # Exporting the outfile
-    with gzip.open(outputFile, 'wt') as f:
-        for evidence in evidences:
-            json.dump(evidence, f)
-            f.write('\n')
-    logging.info(f'{len(evidences)} evidence strings have been generated.')
+    logging.info('Generating evidence:')
+    with evidenceBuilder.report.stage('write') as stage:
+        stage.set_rows(output_rows=write_evidence_strings(
+            evidenceDataframe, outputFile, PanelAppEvidenceGenerator.parseEvidenceString,
+            output_format=args.output_format
+        ))
+    evidenceBuilder.report.write(outputFile)
 
 if __name__ == '__main__':
     main()
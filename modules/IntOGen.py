@@ -2,24 +2,25 @@
 
 import argparse
 import sys
-import gzip
 import logging
-import json
 
-from pyspark.sql import SparkSession
-import pyspark.sql.functions as F
+from common.Engine import ENGINES, get_engine
+from common.Instrumentation import RunReport
+from common.ParquetWriter import OUTPUT_FORMATS
+from settings import Config
+
+# Mutation roles mapped to a SO code:
+ROLE_TO_SO = {
+    'Act': 'SO_0002053',  # gain_of_function_variant
+    'LoF': 'SO_0002054',  # loss_of_function_variant
+}
 
 class intogenEvidenceGenerator():
-    def __init__(self):
-        
-        # Create spark session
-        self.spark = (
-            SparkSession.builder
-            .appName('intOGen')
-            .getOrCreate()
-        )
-        
-        logging.info(f"Spark version: {self.spark.version}")
+    def __init__(self, local=False, inputFiles=None, engine='spark'):
+
+        # Create the engine running the transformations (Spark session or in-process pandas)
+        self.engine = get_engine(engine, 'intOGen', local, inputFiles)
+        self.report = RunReport('IntOGen', getattr(self.engine, 'spark', None))
 
         # Initialize source tables
         self.dataframe = None
@@ -28,95 +29,56 @@ class intogenEvidenceGenerator():
         '''
         Processing of the input file to build all the evidences from its data
         Returns:
-            evidences (array): Object with all the generated evidences strings from source file
+            dataframe (pyspark.sql.DataFrame or pandas.DataFrame): Final dataframe from which the evidence strings
+                are built
         '''
 
-        genes = (
-            self.spark
-            .read.csv(inputGenes, sep=r'\t', header=True, inferSchema=True)
-            .select(
-                'SYMBOL',
-                'COHORT',
-                F.col('CANCER_TYPE').alias('Cancer_type_acronym'),
-                F.col('SAMPLES').alias('numberMutatedSamples'),
-                'METHODS',
-                'ROLE',
-                'QVALUE_COMBINATION'
-            )
-            .withColumn('METHODS', F.split(F.col('METHODS'), ','))
-          
-            # Mutation role mapping to a SO code
-            .withColumn(
-                'functionalConsequenceId',
-                # gain_of_function_variant
-                F.when(F.col('ROLE') == 'Act', 'SO_0002053')
-                # loss_of_function_variant
-                .when(F.col('ROLE') == 'LoF', 'SO_0002054')
-                .otherwise(None)
-            )
-        )
+        engine = self.engine
 
-        cohorts = (
-            self.spark
-            .read.csv(inputCohorts, sep=r'\t', header=True, inferSchema=True)
-            .select(
-                'COHORT',
-                'CANCER_TYPE_NAME',
-                'WEB_SHORT_COHORT_NAME',
-                'WEB_LONG_COHORT_NAME',
-                F.col('SAMPLES').alias('numberSamplesTested')
-            )
-        )
+        with self.report.stage('load') as stage:
+            genes = engine.read_csv(inputGenes, sep='\t', schema='intogen_genes', sample='SYMBOL')
+            genes = engine.rename(genes, {'CANCER_TYPE': 'Cancer_type_acronym', 'SAMPLES': 'numberMutatedSamples'})
+            genes = engine.split(genes, 'METHODS', ',')
 
-        # Joining genes and cohorts data
-        self.dataframe = genes.join(
-            cohorts,
-            on='COHORT',
-            how='inner'
-        )
-
-        # Mapping step
-        if not skipMapping:
-            try:
-                self.dataframe = self.cancer2EFO(diseaseMapping)
-                logging.info('Disease mappings have been imported.')
-            except Exception as e:
-                logging.error(f'An error occurred while importing disease mappings: \n{e}.')
-        else:
-            logging.info('Disease mapping has been skipped.')
-            self.dataframe = self.dataframe.withColumn(
-                'EFO_id',
-                F.lit(None)
+            # Mutation role mapping to a SO code
+            genes = engine.map_values(genes, 'ROLE', ROLE_TO_SO, output='functionalConsequenceId')
+
+            cohorts = engine.read_csv(inputCohorts, sep='\t', schema='intogen_cohorts')
+            cohorts = engine.rename(cohorts, {'SAMPLES': 'numberSamplesTested'})
+            stage.set_rows(output_rows=genes)
+
+        with self.report.stage('join') as stage:
+            # Joining genes and cohorts data
+            self.dataframe = engine.join(
+                genes,
+                cohorts,
+                on='COHORT',
+                how='inner'
             )
+            stage.set_rows(input_rows=genes, output_rows=self.dataframe)
+
+        with self.report.stage('map') as stage:
+            # Mapping step
+            if not skipMapping:
+                try:
+                    self.dataframe = self.cancer2EFO(diseaseMapping)
+                    logging.info('Disease mappings have been imported.')
+                except Exception as e:
+                    logging.error(f'An error occurred while importing disease mappings: \n{e}.')
+            else:
+                logging.info('Disease mapping has been skipped.')
+                self.dataframe = engine.with_constant(self.dataframe, 'EFO_id', None)
+            stage.set_rows(output_rows=self.dataframe)
 
-        # Build evidence strings per row
-        logging.info('Generating evidence:')
-        evidences = (
-            self.dataframe.rdd
-            .map(intogenEvidenceGenerator.parseEvidenceString)
-            .collect()
-        )  # list of dictionaries
-
-        for evidence in evidences:
-            if skipMapping:
-                # Delete empty keys if mapping is skipped
-                del evidence['diseaseFromSourceMappedId']
-            if not evidence['mutatedSamples'][0]['functionalConsequenceId']:
-                # Dele empty key if functionalConsequenceId is unknown
-                del evidence['mutatedSamples'][0]['functionalConsequenceId']
-
-        return evidences
+        return self.dataframe
 
     def cancer2EFO(self, diseaseMapping):
 
-        diseaseMappingsFile = (
-            self.spark
-            .read.csv(diseaseMapping, sep=r'\t', header=True)
-            .select('Cancer_type_acronym', 'EFO_id')
-            .withColumn('EFO_id', F.trim(F.col('EFO_id')))
-        )
+        diseaseMappingsFile = self.engine.read_csv(diseaseMapping, sep='\t', schema='cancer_to_efo', lookup=True)
+        diseaseMappingsFile = self.engine.trim(diseaseMappingsFile, 'EFO_id')
 
-        self.dataframe = self.dataframe.join(
+        self.dataframe = self.engine.join(
+            self.dataframe,
             diseaseMappingsFile,
             on='Cancer_type_acronym',
             how='left'
@@ -153,7 +115,8 @@ class intogenEvidenceGenerator():
             raise
 
 
-def main(inputGenes, inputCohorts, diseaseMapping, outputFile, skipMapping):
+def main(inputGenes, inputCohorts, diseaseMapping, outputFile, skipMapping,
+         local=False, engine='spark', output_format=None):
 
     # Logging parameters
     logging.info(f'intOGen driver genes table: {inputGenes}')
@@ -163,17 +126,17 @@ def main(inputGenes, inputCohorts, diseaseMapping, outputFile, skipMapping):
     logging.info(f'Skipping disease mapping: {skipMapping}')
 
     # Initialize evidence builder object
-    evidenceBuilder = intogenEvidenceGenerator()
+    evidenceBuilder = intogenEvidenceGenerator(local, [inputGenes, inputCohorts], engine)
 
     # Writing evidence strings into a json file
-    evidences = evidenceBuilder.generateEvidenceFromSource(inputGenes, inputCohorts, diseaseMapping, skipMapping)
-
-    with gzip.open(outputFile, 'wt') as f:
-        for evidence in evidences:
-            json.dump(evidence, f)
-            f.write('\n')
+    evidenceDataframe = evidenceBuilder.generateEvidenceFromSource(inputGenes, inputCohorts, diseaseMapping, skipMapping)
 
-    logging.info(f'{len(evidences)} evidence strings saved into {outputFile}. Exiting.')
+    logging.info('Generating evidence:')
+    with evidenceBuilder.report.stage('write') as stage:
+        stage.set_rows(output_rows=evidenceBuilder.engine.write_evidence(
+            evidenceDataframe, outputFile, intogenEvidenceGenerator.parseEvidenceString, output_format
+        ))
+    evidenceBuilder.report.write(outputFile)
 
 
 if __name__ == '__main__':
@@ -187,6 +150,14 @@ if __name__ == '__main__':
     parser.add_argument('-o', '--outputFile', required=True, type=str, help='Gzipped JSON file containing the evidence strings.')
     parser.add_argument('-s', '--skipMapping', required=False, action='store_true', help='State whether to skip the disease to EFO mapping step.')
     parser.add_argument('-l', '--logFile', help='Destination of the logs generated by this script.', type=str, required=False)
+    parser.add_argument('--local', help='Run Spark locally, with a session sized from the host and the input files.',
+                        action='store_true', required=False, default=False)
+    parser.add_argument('--engine', help='Engine running the transformations: spark, or pandas for a Spark-free run.',
+                        type=str, choices=ENGINES, required=False, default='spark')
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
 
     # Parsing parameters
     args = parser.parse_args()
@@ -195,6 +166,8 @@ if __name__ == '__main__':
     diseaseMapping = args.diseaseMapping
     outputFile = args.outputFile
     skipMapping = args.skipMapping
+    local = args.local
+    engine = args.engine
 
     # Initialize logging:
     logging.basicConfig(
@@ -207,4 +180,4 @@ if __name__ == '__main__':
     else:
         logging.StreamHandler(sys.stderr)
 
-    main(inputGenes, inputCohorts, diseaseMapping, outputFile, skipMapping)
+    main(inputGenes, inputCohorts, diseaseMapping, outputFile, skipMapping, local, engine, args.output_format)
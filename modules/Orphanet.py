@@ -1,15 +1,21 @@
 import argparse
 import logging
 import sys
-import time
 from itertools import chain
 
 import xml.etree.ElementTree as ET
-from pyspark.conf import SparkConf
-from pyspark.sql import SparkSession, Row
-from pyspark.sql.functions import col, lit, create_map, split
 
-from ontoma import OnToma
+from common.EvidenceSchema import STRING, spark_schema
+from common.Instrumentation import RunReport, peak_rss
+from common.JsonWriter import get_encoder
+from common.MappingCache import CachedOnToma
+from common.ParquetWriter import JSON, OUTPUT_FORMATS, PARQUET, output_formats, parquet_path, write_spark_parquet
+from common.Resolver import BatchResolver
+from common.Sampling import in_sample
+from common.ShardedWriter import write_spark_shards
+from common.SparkSessionFactory import get_spark_session
+from common.Storage import open_uri, staged_spark_input
+from settings import Config
 
 # The rest of the types are assigned to -> germline for allele origins
 EXCLUDED_ASSOCIATIONTYPES = [
@@ -21,6 +27,18 @@ EXCLUDED_ASSOCIATIONTYPES = [
     "Disease-causing somatic mutation(s) in"
 ]
 
+# Fields of the disorder-gene associations parsed from the XML file:
+ORPHANET_FIELDS = {
+    'diseaseFromSource': STRING,
+    'diseaseFromSourceId': STRING,
+    'type': STRING,
+    'literature': [STRING],
+    'associationType': STRING,
+    'confidence': STRING,
+    'targetFromSource': STRING,
+    'targetFromSourceId': STRING,
+}
+
 # Assigning variantFunctionalConsequenceId:
 CONSEQUENCE_MAP = {
     "Disease-causing germline mutation(s) (loss of function) in": "SO_0002054",
@@ -35,9 +53,9 @@ class ontoma_efo_lookup():
     Simple class to map orphanet ids to efo
     """
     def __init__(self):
-        self.otmap = OnToma()
+        self.otmap = CachedOnToma()
 
-    def get_mapping(self, terms=[]):
+    def get_mapping(self, terms=()):
         disease_label, disease_id = terms
 
         mappings = self.query_ontoma(disease_id)
@@ -53,113 +71,120 @@ class ontoma_efo_lookup():
             return None
 
     def query_ontoma(self, term):
+        # Failed queries are retried with a backoff by the cached OnToma object:
+        return self.otmap.find_term(term, verbose=True)
 
-        try:
-            mappings = self.otmap.find_term(term, verbose=True)
-        except Exception:
-            time.sleep(3)
-            mappings = self.otmap.find_term(term, verbose=True)
-
-        return mappings
 
-
-def parse_orphanet_xml(orphanet_file: str) -> list:
+def parse_disorder(disorder: ET.Element) -> list:
     """
-    Function to parse Orphanet xml dump and return the parsed
-    data as a list of dictionaries.
+    Builds the evidence of the gene associations of a disorder of the Orphanet XML file.
 
     Args:
-        orphanet_file (str): Orphanet XML filename
+        disorder (ET.Element): Disorder element
 
     Returns:
-        parsed data as a list of dictionaries
+        list of dictionaries, one per associated gene
     """
 
-    # Reading + validating xml:
-    tree = ET.parse(orphanet_file)
-    assert isinstance(tree, ET.ElementTree)
+    # Extracting disease information:
+    parsed_disorder = {
+        "diseaseFromSource": disorder.find('Name').text,
+        "diseaseFromSourceId": 'Orphanet_' + disorder.find('OrphaCode').text,
+        "type": disorder.find('DisorderType/Name').text,
+    }
 
-    root = tree.getroot()
-    assert isinstance(root, ET.Element)
+    evidence_strings = []
 
-    # Checking if the basic nodes are in the xml structure:
+    # One disease might be mapped to multiple genes:
+    for association in disorder.find('DisorderGeneAssociationList'):
 
-    logging.info(f"There are {root.find('DisorderList').get('count')} disease in the Orphanet xml file.")
+        # For each mapped gene, an evidence is created:
+        evidence = parsed_disorder.copy()
 
-    orphanet_disorders = []
+        # Not all gene/disease association is backed up by publication:
+        try:
+            evidence['literature'] = [
+                pmid.replace('[PMID]', '') for pmid in association.find('SourceOfValidation').text.split('_') if '[PMID]' in pmid
+            ]
+        except AttributeError:
+            evidence['literature'] = None
 
-    for disorder in root.find('DisorderList').findall('Disorder'):
+        evidence['associationType'] = association.find('DisorderGeneAssociationType/Name').text
+        evidence['confidence'] = association.find('DisorderGeneAssociationStatus/Name').text
 
-        # Extracting disease information:
-        parsed_disorder = {
-            "diseaseFromSource": disorder.find('Name').text,
-            "diseaseFromSourceId": 'Orphanet_' + disorder.find('OrphaCode').text,
-            "type": disorder.find('DisorderType/Name').text,
-        }
+        # Parse gene name and id - going for Ensembl gene id only:
+        gene = association.find('Gene')
+        evidence['targetFromSource'] = gene.find('Name').text
 
-        # One disease might be mapped to multiple genes:
-        for association in disorder.find('DisorderGeneAssociationList'):
+        # Extracting ensembl gene id from cross references:
+        ensembl_gene_id = [
+            xref.find('Reference').text for xref in gene.find('ExternalReferenceList') if 'ENSG' in xref.find('Reference').text
+        ]
+        evidence['targetFromSourceId'] = ensembl_gene_id[0] if len(ensembl_gene_id) > 0 else None
 
-            # For each mapped gene, an evidence is created:
-            evidence = parsed_disorder.copy()
+        evidence_strings.append(evidence)
 
-            # Not all gene/disease association is backed up by publication:
-            try:
-                evidence['literature'] = [
-                    pmid.replace('[PMID]', '') for pmid in association.find('SourceOfValidation').text.split('_') if '[PMID]' in pmid
-                ]
-            except AttributeError:
-                evidence['literature'] = None
+    return evidence_strings
 
-            evidence['associationType'] = association.find('DisorderGeneAssociationType/Name').text
-            evidence['confidence'] = association.find('DisorderGeneAssociationStatus/Name').text
 
-            # Parse gene name and id - going for Ensembl gene id only:
-            gene = association.find('Gene')
-            evidence['targetFromSource'] = gene.find('Name').text
+def parse_orphanet_xml(orphanet_file: str, records_file) -> int:
+    """
+    Function to parse Orphanet xml dump and write the parsed
+    data as JSON lines into a file, read by Spark.
 
-            # Extracting ensembl gene id from cross references:
-            ensembl_gene_id = [
-                xref.find('Reference').text for xref in gene.find('ExternalReferenceList') if 'ENSG' in xref.find('Reference').text
-            ]
-            evidence['targetFromSourceId'] = ensembl_gene_id[0] if len(ensembl_gene_id) > 0 else None
+    The file is parsed incrementally: each disorder is released once its evidence is written, so neither the XML tree
+    nor the parsed records are held in memory.
+
+    Args:
+        orphanet_file (str): Orphanet XML file, local or remote (see `common.Storage`)
+        records_file (file object): Binary file the parsed records are written into, one JSON object per line
+
+    Returns:
+        number of parsed records
+    """
 
-            # Collect evidence:
-            orphanet_disorders.append(evidence)
+    encoder = get_encoder()
+    parsed_records = 0
+
+    # Tags of the elements being parsed, from the root:
+    path, disorder_list = [], None
+    with open_uri(orphanet_file) as xml_file:
+        for event, element in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                path.append(element.tag)
+                if element.tag == 'DisorderList' and disorder_list is None:
+                    disorder_list = element
+                    logging.info(f"There are {element.get('count')} disease in the Orphanet xml file.")
+                continue
+
+            path.pop()
+            if element.tag != 'Disorder' or not path or path[-1] != 'DisorderList':
+                continue
+
+            # A sampled run keeps all the genes of the sampled disorders:
+            if in_sample(element.find('OrphaCode').text):
+                records = parse_disorder(element)
+                records_file.write(b''.join(encoder.encode(record) + b'\n' for record in records))
+                parsed_records += len(records)
+
+            # The parsed disorder is released:
+            disorder_list.remove(element)
 
-    return orphanet_disorders
+    # Checking if the basic nodes are in the xml structure:
+    if disorder_list is None:
+        raise ValueError(f'No DisorderList in the Orphanet xml file {orphanet_file}.')
+
+    logging.info(f'{parsed_records} gene-disease associations parsed, peak RSS {peak_rss() / 2 ** 20:,.0f} MiB.')
+    return parsed_records
 
 
-def main(input_file: str, output_file: str, local: bool = False) -> None:
+def main(input_file: str, output_file: str, local: bool = False, output_format: str = None,
+         shard_size: int = 0) -> None:
+    from pyspark.sql.functions import col, lit, create_map, split
 
     # Initialize spark session
-    if local:
-        sparkConf = (
-            SparkConf()
-            .set('spark.driver.memory', '15g')
-            .set('spark.executor.memory', '15g')
-            .set('spark.driver.maxResultSize', '0')
-            .set('spark.debug.maxToStringFields', '2000')
-            .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-        )
-        spark = (
-            SparkSession.builder
-            .config(conf=sparkConf)
-            .master('local[*]')
-            .getOrCreate()
-        )
-    else:
-        sparkConf = (
-            SparkConf()
-            .set('spark.driver.maxResultSize', '0')
-            .set('spark.debug.maxToStringFields', '2000')
-            .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-        )
-        spark = (
-            SparkSession.builder
-            .config(conf=sparkConf)
-            .getOrCreate()
-        )
+    spark = get_spark_session('Orphanet', 'local' if local else 'cluster', [input_file])
+    report = RunReport('Orphanet', spark)
 
     # Initialize mapping object:
     ol_obj = ontoma_efo_lookup()
@@ -167,51 +192,69 @@ def main(input_file: str, output_file: str, local: bool = False) -> None:
     # Map association type to sequence ontology ID:
     so_mapping_expr = create_map([lit(x) for x in chain(*CONSEQUENCE_MAP.items())])
 
-    # Parsing xml file:s
-    orphanet_disorders = parse_orphanet_xml(input_file)
-
-    # Crete a spark dataframe from the parsed data:
-    orphanet_df = (
-        spark.createDataFrame(Row(**x) for x in orphanet_disorders)
-        .filter(
-            ~col('associationType').isin(EXCLUDED_ASSOCIATIONTYPES)
+    # The parsed records are read by Spark from an intermediate JSON lines file, removed at the end of the run:
+    with staged_spark_input(output_file, 'records.json', local) as (records_uri, records_path):
+        # Parsing xml file:
+        with report.stage('parse') as stage:
+            with open_uri(records_uri, 'wb') as records_file:
+                parsed_rows = parse_orphanet_xml(input_file, records_file)
+            stage.set_rows(output_rows=parsed_rows)
+
+        with report.stage('transform') as stage:
+            # Crete a spark dataframe from the parsed data:
+            orphanet_df = (
+                spark.read.json(records_path, schema=spark_schema(ORPHANET_FIELDS))
+                .filter(
+                    ~col('associationType').isin(EXCLUDED_ASSOCIATIONTYPES)
+                )
+                .withColumn('dataSourceId', lit('orphanet'))
+                .withColumn('datatypeId', lit('genetic_association'))
+                .withColumn('alleleOrigins', split(lit('germline'), "_"))
+                .withColumn('variantFunctionalConsequenceId', so_mapping_expr.getItem(col('associationType')))
+                .drop('associationType', 'type')
+                .persist()
+            )
+            stage.set_rows(input_rows=parsed_rows, output_rows=orphanet_df)
+
+        with report.stage('map') as stage:
+            # Generating a lookup table for the mapped orphanet terms:
+            orphanet_diseases = (
+                orphanet_df
+                .select('diseaseFromSource', 'diseaseFromSourceId')
+                .distinct()
+                .collect()
+            )
+            disease_mappings = BatchResolver(ol_obj.get_mapping).resolve(tuple(x) for x in orphanet_diseases)
+            mapped_diseases = {disease_id: mapping for (_, disease_id), mapping in disease_mappings.items()}
+            ol_obj.otmap.cache.log_stats()
+            disease_mapping_expr = create_map([lit(x) for x in chain(*mapped_diseases.items())])
+            stage.set_rows(input_rows=orphanet_diseases, output_rows=mapped_diseases)
+
+        # Adding EFO mapping as new column:
+        orphanet_df = (
+            orphanet_df
+            .withColumn('diseaseFromSourceMappedId', disease_mapping_expr.getItem(col('diseaseFromSourceId')))
         )
-        .withColumn('dataSourceId', lit('orphanet'))
-        .withColumn('datatypeId', lit('genetic_association'))
-        .withColumn('alleleOrigins', split(lit('germline'), "_"))
-        .withColumn('variantFunctionalConsequenceId', so_mapping_expr.getItem(col('associationType')))
-        .drop('associationType', 'type')
-        .persist()
-    )
-
-    # Generating a lookup table for the mapped orphanet terms:
-    orphanet_diseases = (
-        orphanet_df
-        .select('diseaseFromSource', 'diseaseFromSourceId')
-        .distinct()
-        .collect()
-    )
-    mapped_diseases = {x[1]: ol_obj.get_mapping(x) for x in orphanet_diseases}
-    disease_mapping_expr = create_map([lit(x) for x in chain(*mapped_diseases.items())])
 
-    # Adding EFO mapping as new column:
-    orphanet_df = (
-        orphanet_df
-        .withColumn('diseaseFromSourceMappedId', disease_mapping_expr.getItem(col('diseaseFromSourceId')))
-    )
-
-    # Save data:
-    (
-        orphanet_df
-        .select(
-            'datasourceId', 'datatypeId', 'alleleOrigins', 'confidence', 'diseaseFromSource',
-            'diseaseFromSourceId', 'diseaseFromSourceMappedId', 'literature', 'targetFromSource',
-            'targetFromSourceId'
-        )
-        .coalesce(1)
-        .write.format('json').mode('overwrite').option('compression', 'gzip')
-        .save(output_file)
-    )
+        formats = output_formats(output_format)
+        with report.stage('write'):
+            # Save data:
+            evidence_df = (
+                orphanet_df
+                .select(
+                    'datasourceId', 'datatypeId', 'alleleOrigins', 'confidence', 'diseaseFromSource',
+                    'diseaseFromSourceId', 'diseaseFromSourceMappedId', 'literature', 'targetFromSource',
+                    'targetFromSourceId'
+                )
+            )
+            if JSON in formats and shard_size:
+                write_spark_shards(evidence_df, output_file, shard_size * 2 ** 20)
+            elif JSON in formats:
+                evidence_df.coalesce(1).write.format('json').mode('overwrite').option('compression', 'gzip').save(output_file)
+            if PARQUET in formats:
+                write_spark_parquet(evidence_df, parquet_path(output_file))
+
+        report.write(output_file)
 
 
 if __name__ == '__main__':
@@ -225,6 +268,15 @@ if __name__ == '__main__':
         '--local', action='store_true', required=False, default=False,
         help='Flag to indicate if the script is executed locally or on the cluster'
     )
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON output, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
+    parser.add_argument('--shard-size', help=(
+        'Target size of the JSON output shards, in MiB of uncompressed JSON lines. When set, the JSON output is a '
+        'directory of shards sorted by association, with a manifest. Defaults to the OT_SHARD_SIZE environment '
+        'variable or 0 (no sharding).'
+    ), type=int, default=Config.SHARD_SIZE)
 
     args = parser.parse_args()
 
@@ -244,4 +296,4 @@ if __name__ == '__main__':
     else:
         logging.StreamHandler(sys.stderr)
 
-    main(input_file, output_file, is_local)
+    main(input_file, output_file, is_local, args.output_format, args.shard_size)
@@ -2,22 +2,19 @@
 
 import sys
 import argparse
-import gzip
 import logging
-import json
 
-from pyspark.sql import SparkSession
-import pyspark.sql.functions as F
+from common.Engine import ENGINES, get_engine
+from common.Instrumentation import RunReport
+from common.ParquetWriter import OUTPUT_FORMATS
+from settings import Config
 
 class progenyEvidenceGenerator():
 
-    def __init__(self):
-        # Create spark session
-        self.spark = (
-            SparkSession.builder
-            .appName('progeny')
-            .getOrCreate()
-        )
+    def __init__(self, local=False, inputFiles=None, engine='spark'):
+        # Create the engine running the transformations (Spark session or in-process pandas)
+        self.engine = get_engine(engine, 'progeny', local, inputFiles)
+        self.report = RunReport('PROGENy', getattr(self.engine, 'spark', None))
 
         # Initialize source table
         self.dataframe = None
@@ -26,50 +23,40 @@ class progenyEvidenceGenerator():
         '''
         Processing of the input file to build all the evidences from its data
         Returns:
-            evidences (array): Object with all the generated evidences strings from source file
+            dataframe (pyspark.sql.DataFrame or pandas.DataFrame): Final dataframe from which the evidence strings
+                are built
         '''
-        # Read input file
-        self.dataframe = (
-            self.spark.read
-            .option('header', 'true')
-            .option('delimiter', '\t')
-            .option('inferSchema', 'true')
-            .csv(inputFile)
-        )
+        with self.report.stage('load') as stage:
+            # Read input file
+            self.dataframe = self.engine.read_csv(inputFile, sep='\t', schema='progeny', sample='Pathway')
+            stage.set_rows(output_rows=self.dataframe)
+
+        with self.report.stage('map') as stage:
+            # Disease mapping step
+            if not skipMapping:
+                try:
+                    self.dataframe = self.cancer2EFO(diseaseMapping)
+                    logging.info('Disease mappings have been imported.')
+                except Exception as e:
+                    logging.error(f'An error occurred while importing disease mappings: \n{e}.')
+            else:
+                logging.info('Disease mapping has been skipped.')
+                self.dataframe = self.engine.with_constant(self.dataframe, 'EFO_id', None)
+            stage.set_rows(output_rows=self.dataframe)
+
+        with self.report.stage('pathways') as stage:
+            self.dataframe = self.pathway2Reactome(pathwayMapping)
+            logging.info('Pathway to reaction ID mappings have been imported.')
+            stage.set_rows(output_rows=self.dataframe)
 
-        # Disease mapping step
-        if not skipMapping:
-            try:
-                self.dataframe = self.cancer2EFO(diseaseMapping)
-                logging.info('Disease mappings have been imported.')
-            except Exception as e:
-                logging.error(f'An error occurred while importing disease mappings: \n{e}.')
-        else:
-            logging.info('Disease mapping has been skipped.')
-            self.dataframe = self.dataframe.withColumn('EFO_id', F.lit(None))
-
-        self.dataframe = self.pathway2Reactome(pathwayMapping)
-        logging.info('Pathway to reaction ID mappings have been imported.')
-
-        # Build evidence strings per row
-        logging.info('Generating evidence:')
-        evidences = (
-            self.dataframe.rdd
-            .map(progenyEvidenceGenerator.parseEvidenceString)
-            .collect()  # list of dictionaries
-        )
-
-        return evidences
+        return self.dataframe
 
     def cancer2EFO(self, diseaseMapping):
-        diseaseMappingsFile = (
-            self.spark
-            .read.csv('resources/cancer2EFO_mappings.tsv', sep=r'\t', header=True)
-            .select('Cancer_type_acronym', 'EFO_id')
-            .withColumnRenamed('Cancer_type_acronym', 'Cancer_type')
-        )
+        diseaseMappingsFile = self.engine.read_csv(diseaseMapping, sep='\t', schema='cancer_to_efo', lookup=True)
+        diseaseMappingsFile = self.engine.rename(diseaseMappingsFile, {'Cancer_type_acronym': 'Cancer_type'})
 
-        self.dataframe = self.dataframe.join(
+        self.dataframe = self.engine.join(
+            self.dataframe,
             diseaseMappingsFile,
             on='Cancer_type',
             how='left'
@@ -78,19 +65,14 @@ class progenyEvidenceGenerator():
         return self.dataframe
 
     def pathway2Reactome(self, pathwayMapping):
-
-        pathwayMappingsFile = (
-            self.spark
-            .read.csv('resources/pathway2Reactome_mappings.tsv', sep=r'\t', header=True)
-            .withColumnRenamed('pathway', 'Pathway')
+        pathwayMappingsFile = self.engine.read_csv(
+            pathwayMapping, sep='\t', schema='pathway_to_reactome', lookup=True
         )
+        pathwayMappingsFile = self.engine.rename(pathwayMappingsFile, {'pathway': 'Pathway'})
 
-        self.dataframe = (
-            self.dataframe
-            .join(pathwayMappingsFile, on='Pathway', how='inner')
-            .withColumn('target', F.split(F.col('target'), ', '))
-            .withColumn('target', F.explode('target'))
-        )
+        self.dataframe = self.engine.join(self.dataframe, pathwayMappingsFile, on='Pathway', how='inner')
+        self.dataframe = self.engine.split(self.dataframe, 'target', ', ')
+        self.dataframe = self.engine.explode(self.dataframe, 'target')
 
         return self.dataframe
 
@@ -120,7 +102,8 @@ class progenyEvidenceGenerator():
             raise
 
 
-def main(inputFile, diseaseMapping, pathwayMapping, outputFile, skipMapping):
+def main(inputFile, diseaseMapping, pathwayMapping, outputFile, skipMapping,
+         local=False, engine='spark', output_format=None):
 
     # Logging parameters
     logging.info(f'PROGENy input table: {inputFile}')
@@ -129,17 +112,17 @@ def main(inputFile, diseaseMapping, pathwayMapping, outputFile, skipMapping):
     logging.info(f'Output file: {outputFile}')
 
     # Initialize evidence builder object
-    evidenceBuilder = progenyEvidenceGenerator()
+    evidenceBuilder = progenyEvidenceGenerator(local, [inputFile], engine)
 
     # Writing evidence strings into a json file
-    evidences = evidenceBuilder.generateEvidenceFromSource(inputFile, diseaseMapping, pathwayMapping, skipMapping)
-
-    with gzip.open(outputFile, 'wt') as f:
-        for evidence in evidences:
-            json.dump(evidence, f)
-            f.write('\n')
+    evidenceDataframe = evidenceBuilder.generateEvidenceFromSource(inputFile, diseaseMapping, pathwayMapping, skipMapping)
 
-    logging.info(f'{len(evidences)} evidence strings saved into {outputFile}. Exiting.')
+    logging.info('Generating evidence:')
+    with evidenceBuilder.report.stage('write') as stage:
+        stage.set_rows(output_rows=evidenceBuilder.engine.write_evidence(
+            evidenceDataframe, outputFile, progenyEvidenceGenerator.parseEvidenceString, output_format
+        ))
+    evidenceBuilder.report.write(outputFile)
 
 
 if __name__ == '__main__':
@@ -153,6 +136,14 @@ if __name__ == '__main__':
     parser.add_argument('-o', '--outputFile', required=True, type=str, help='Gzipped JSON file containing the evidence strings.')
     parser.add_argument('-s', '--skipMapping', required=False, action='store_true', help='State whether to skip the disease to EFO mapping step.')
     parser.add_argument('-l', '--logFile', help='Destination of the logs generated by this script.', type=str, required=False)
+    parser.add_argument('--local', help='Run Spark locally, with a session sized from the host and the input files.',
+                        action='store_true', required=False, default=False)
+    parser.add_argument('--engine', help='Engine running the transformations: spark, or pandas for a Spark-free run.',
+                        type=str, choices=ENGINES, required=False, default='spark')
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
 
     # Parsing parameters
     args = parser.parse_args()
@@ -161,6 +152,8 @@ if __name__ == '__main__':
     pathwayMapping = args.pathwayMapping
     outputFile = args.outputFile
     skipMapping = args.skipMapping
+    local = args.local
+    engine = args.engine
 
     # Initialize logging:
     logging.basicConfig(
@@ -173,4 +166,4 @@ if __name__ == '__main__':
     else:
         logging.StreamHandler(sys.stderr)
 
-    main(inputFile, diseaseMapping, pathwayMapping, outputFile, skipMapping)
+    main(inputFile, diseaseMapping, pathwayMapping, outputFile, skipMapping, local, engine, args.output_format)
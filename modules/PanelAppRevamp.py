@@ -8,47 +8,15 @@ import multiprocessing as mp
 import re
 from sys import stderr
 
-from pyspark.conf import SparkConf
-from pyspark.sql import SparkSession, DataFrame
-from pyspark.sql.functions import (
-    col, lit, when, array_distinct, split, explode, udf, regexp_extract, trim, regexp_replace, element_at
-)
-from pyspark.sql.types import StringType, ArrayType
-import requests
-
-from ontoma import OnToma
+from common.HttpClient import get_json
+from common.InputSchemas import read_spark
+from common.Sampling import sample_spark
+from common.SparkSessionFactory import get_spark_session
 
 class PanelAppEvidenceGenerator():
-    def __init__(self):
+    def __init__(self, local=True):
         # Initialize spark session
-        local=True
-        if local:
-            sparkConf = (
-                SparkConf()
-                .set('spark.driver.memory', '15g')
-                .set('spark.executor.memory', '15g')
-                .set('spark.driver.maxResultSize', '0')
-                .set('spark.debug.maxToStringFields', '2000')
-                .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-            )
-            self.spark = (
-                SparkSession.builder
-                .config(conf=sparkConf)
-                .master('local[*]')
-                .getOrCreate()
-            )
-        else:
-            sparkConf = (
-                SparkConf()
-                .set('spark.driver.maxResultSize', '0')
-                .set('spark.debug.maxToStringFields', '2000')
-                .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-            )
-            self.spark = (
-                SparkSession.builder
-                .config(conf=sparkConf)
-                .getOrCreate()
-        )
+        self.spark = get_spark_session('PanelApp', 'local' if local else 'cluster')
         self.evidence = None
 
     def generate_panelapp_evidence(
@@ -56,8 +24,11 @@ class PanelAppEvidenceGenerator():
         input_file: str,
         output_file: str,
     ):
+        from pyspark.sql.functions import array_distinct, col, explode, regexp_extract, regexp_replace, split, trim, when
+
         panelapp_df = (
-            self.spark.read.csv(input_file, sep=r'\t', header=True)
+            # A sampled run keeps whole panels, whose publications are fetched panel by panel:
+            sample_spark(read_spark(self.spark, 'panelapp', input_file, sep='\t'), 'Panel Id')
             .filter(
                 ((col('List') == 'green') | (col('List') == 'amber')) &
                 (col('Panel Version') > 1) &
@@ -93,7 +64,6 @@ class PanelAppEvidenceGenerator():
             panelapp_df.select('Panel Id').toPandas()['Panel Id'].unique()
         )
         panelapp_df = panelapp_df.withColumn(
-            #'literature', self._translate(literature_mappings, col('Panel Name'), col('Symbol'))
             'literature', PanelAppEvidenceGenerator.translate(literature_mappings)('Panel Name', 'Symbol')
         )
 
@@ -124,7 +94,7 @@ class PanelAppEvidenceGenerator():
         """
         try:
             url = f'http://panelapp.genomicsengland.co.uk/api/v1/panels/{panel_id}/'
-            return requests.get(url).json()['genes']
+            return get_json(url)['genes']
         except Exception:
             print('Query of the PanelApp API has failed.')
     
@@ -135,14 +105,20 @@ class PanelAppEvidenceGenerator():
         """
         Mapping panel/gene pairs to literature
         """
+        from pyspark.sql.functions import udf
+        from pyspark.sql.types import ArrayType, StringType
+
         def translate_(panel, gene):
             return literature_mappings.get(panel).get(gene)
         return udf(translate_, ArrayType(StringType()))
-    
-    @staticmethod
-    @udf(ArrayType(StringType()))
-    def _translate(self, literature_mappings, panel, gene):
-            return literature_mappings.get(panel).get(gene)
 
 
-PanelAppEvidenceGenerator().generate_panelapp_evidence(input_file="Some_genes.tsv", output_file='output/first_iter.json.gz')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prototype of the PanelApp evidence generation.')
+    parser.add_argument('--input_file', help='Input .tsv file with the PanelApp gene panels.', type=str,
+                        default='Some_genes.tsv')
+    parser.add_argument('--output_file', help='Gzipped JSON output directory.', type=str,
+                        default='output/first_iter.json.gz')
+    args = parser.parse_args()
+
+    PanelAppEvidenceGenerator().generate_panelapp_evidence(input_file=args.input_file, output_file=args.output_file)
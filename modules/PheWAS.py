@@ -1,46 +1,29 @@
 #!/usr/bin/env python
 
 import logging
-import gzip
-import json
 import sys
 
 import argparse
-import numpy as np
-from pyspark import SparkFiles
-from pyspark.conf import SparkConf
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import udf, col, element_at, split, lit, count, concat
-from pyspark.sql.types import StringType, IntegerType, DoubleType
 
-from common.HGNCParser import GeneParser
+from common.HGNCIndex import get_hgnc_index
+from common.EvidenceWriter import write_evidence_strings
+from common.InputSchemas import read_spark
+from common.Instrumentation import RunReport
+from common.ParquetWriter import OUTPUT_FORMATS
+from common.Sampling import sample_spark
+from common.SparkSessionFactory import get_spark_session
+from settings import Config
 
 class phewasEvidenceGenerator():
 
-    def __init__(self, genesSet):
+    def __init__(self, genesSet, inputFiles=None):
         # Create spark session
-        sparkConf = (
-            SparkConf()
-            .set('spark.driver.host', '127.0.0.1')
-            .set('spark.driver.memory', '15g')
-            .set('spark.executor.memory', '15g')
-            .set('spark.driver.maxResultSize', '0')
-            .set('spark.debug.maxToStringFields', '2000')
-            .set('spark.sql.execution.arrow.maxRecordsPerBatch', '500000')
-        )
-        self.spark = (
-            SparkSession.builder
-            .config(conf=sparkConf)
-            .master('local[*]')
-            .getOrCreate()
-        )
+        self.spark = get_spark_session('PheWAS', 'local', inputFiles)
+        self.report = RunReport('PheWAS', self.spark)
 
-        # Initialize gene parser
-        gene_parser = GeneParser()
-        gene_parser._get_hgnc_data_from_json(genesSet)
-        self.udfGeneParser = udf(
-            lambda x: gene_parser.genes.get(x.strip('*'), np.nan),
-            StringType()
+        # Gene symbol to Ensembl gene ID lookup, from the local HGNC index
+        self.geneMappings = self.spark.createDataFrame(
+            get_hgnc_index(genesSet).symbol_mappings(), ['gene_symbol', 'ens_id']
         )
 
         # Initialize variables
@@ -51,96 +34,83 @@ class phewasEvidenceGenerator():
         '''
         Processing of the dataframe to build all the evidences from its data
         Returns:
-            evidences (array): Object with all the generated evidences strings from source file
+            dataframe (pyspark.sql.DataFrame): Final dataframe from which the evidence strings are built
         '''
-
-        # Read input file
-        self.dataframe = (
-            self.spark
-            .read.csv(inputFile, header=True)
-            .select(
-                'gene', 'snp', 'phewas_code', 'phewas_string',
-                col('cases').cast(IntegerType()),
-                col('odds_ratio').cast(DoubleType()),
-                col('p').cast(DoubleType())
-            )
-            # Filter out null genes & p-value > 0.05
-            .filter(
-                (col('gene').isNotNull())
-                & (col('p') < 0.05)
-            )
-        )
-
-        # Mapping step
-        if not skipMapping:
-            try:
-                self.spark.sparkContext.addFile(diseaseMapping)
-                phewasMapping = (
-                    self.spark.read.csv(SparkFiles.get(diseaseMapping.split('/')[-1]), sep=r'\t', header=True)
-                    .select('Phewas_string', col('EFO_id').alias('EFO_link'))
-                    .withColumn('EFO_id', element_at(split(col('EFO_link'), '/'), -1))
+        from pyspark.sql.functions import broadcast, col, element_at, split, lit, regexp_replace
+
+        with self.report.stage('load') as stage:
+            # Read input file
+            self.dataframe = (
+                sample_spark(read_spark(self.spark, 'phewas_catalog', inputFile), 'snp')
+                # Filter out null genes & p-value > 0.05
+                .filter(
+                    (col('gene').isNotNull())
+                    & (col('p') < 0.05)
                 )
-                self.dataframe = self.dataframe.join(phewasMapping, on=['Phewas_string'], how='left')
-                logging.info('Disease mappings have been imported.')
-
-            except Exception as e:
-                logging.error(f'An error occurred while importing disease mappings: \n{e}.')
+            )
+            stage.set_rows(output_rows=self.dataframe)
+
+        with self.report.stage('map_diseases') as stage:
+            # Mapping step
+            if not skipMapping:
+                try:
+                    phewasMapping = (
+                        read_spark(self.spark, 'phewas_mappings', diseaseMapping, sep='\t')
+                        .select('Phewas_string', col('EFO_id').alias('EFO_link'))
+                        .withColumn('EFO_id', element_at(split(col('EFO_link'), '/'), -1))
+                    )
+                    self.dataframe = self.dataframe.join(phewasMapping, on=['Phewas_string'], how='left')
+                    logging.info('Disease mappings have been imported.')
+
+                except Exception as e:
+                    logging.error(f'An error occurred while importing disease mappings: \n{e}.')
+
+                else:
+                    # Filter out invalid disease IDs: MPATH_579, CHEBI_36047
+                    pattern = r'(^NCIT_C\d+$|^Orphanet_\d+$|^GO_\d+$|^HP_\d+$|^EFO_\d+$|^MONDO_\d+$|^DOID_\d+$|^MP_\d+$)'
+                    self.dataframe = self.dataframe.filter(col('EFO_id').rlike(pattern))
 
             else:
-                # Filter out invalid disease IDs: MPATH_579, CHEBI_36047
-                pattern = r'(^NCIT_C\d+$|^Orphanet_\d+$|^GO_\d+$|^HP_\d+$|^EFO_\d+$|^MONDO_\d+$|^DOID_\d+$|^MP_\d+$)'
-                self.dataframe = self.dataframe.filter(col('EFO_id').rlike(pattern))
-
-        else:
-            logging.info('Disease mapping has been skipped.')
-            self.dataframe = self.dataframe.withColumn('EFO_id', lit(None))
-
-        # Parse gene symbols to ENSID to join with the consequences table
-        self.dataframe = (
-            self.dataframe
-            .withColumn('ens_id', self.udfGeneParser(col('gene')))
-            # Remove rows where the target is not valid
-            .filter(col('ens_id') != 'NaN')
-        )
-
-        # Get functional consequence per variant from OT Genetics Portal
-        cols = [
-            'phewas_string', 'phewas_code', 'EFO_id', 'odds_ratio', 'p',
-            'cases', 'ens_id', 'consequence_id', 'variantId', 'snp'
-        ]
-        self.enrichedDataframe = (
-            self.enrichVariantData(consequencesFile)
-            .dropDuplicates(cols)
-        )
-        logging.info('Functional consequences have been imported.')
-
-        # Build evidence strings per row
-        logging.info('Generating evidence:')
-        evidences = (
-            self.enrichedDataframe.rdd
-            .map(phewasEvidenceGenerator.parseEvidenceString)
-            .collect()
-        )
-
-        for evidence in evidences:
-            if skipMapping:
-                # Delete empty keys if mapping is skipped
-                del evidence['diseaseFromSourceMappedId']
-            if not evidence['variantId']:
-                # Delete empty variantId
-                del evidence['variantId']
+                logging.info('Disease mapping has been skipped.')
+                self.dataframe = self.dataframe.withColumn('EFO_id', lit(None))
+            stage.set_rows(output_rows=self.dataframe)
+
+        with self.report.stage('map_genes') as stage:
+            # Parse gene symbols to ENSID to join with the consequences table. Rows where the target is not valid are
+            # removed by the inner join.
+            self.dataframe = (
+                self.dataframe
+                .withColumn('gene_symbol', regexp_replace(col('gene'), r'^\*+|\*+$', ''))
+                .join(broadcast(self.geneMappings), on='gene_symbol', how='inner')
+                .drop('gene_symbol')
+            )
+            stage.set_rows(output_rows=self.dataframe)
+
+        with self.report.stage('consequences') as stage:
+            # Get functional consequence per variant from OT Genetics Portal
+            cols = [
+                'phewas_string', 'phewas_code', 'EFO_id', 'odds_ratio', 'p',
+                'cases', 'ens_id', 'consequence_id', 'variantId', 'snp'
+            ]
+            self.enrichedDataframe = (
+                self.enrichVariantData(consequencesFile)
+                .dropDuplicates(cols)
+            )
+            logging.info('Functional consequences have been imported.')
+            stage.set_rows(output_rows=self.enrichedDataframe)
 
-        return evidences
+        return self.enrichedDataframe
 
     def enrichVariantData(self, consequencesFile):
-        self.spark.sparkContext.addFile(consequencesFile)
+        from pyspark.sql.functions import col, element_at, split, lit, count, concat
+
         phewasWithConsequences = (
-            self.spark.read.csv(SparkFiles.get(consequencesFile.split('/')[-1]), header=True)
+            # Sampled on the same variants as the PheWAS catalog:
+            sample_spark(read_spark(self.spark, 'phewas_consequences', consequencesFile), 'rsid')
             .select(
                 col('rsid').alias('snp'),
                 col('gene_id').alias('ens_id'),
-                col('pos').cast(IntegerType()),
-                'chrom', 'ref', 'alt',
+                'pos', 'chrom', 'ref', 'alt',
                 'consequence_link'
             )
             .withColumn(
@@ -209,19 +179,19 @@ class phewasEvidenceGenerator():
             raise
 
 
-def main(genesSet, inputFile, consequencesFile, diseaseMapping, skipMapping):
+def main(genesSet, inputFile, consequencesFile, diseaseMapping, skipMapping, output_format=None):
     # Initialize evidence builder object
-    evidenceBuilder = phewasEvidenceGenerator(genesSet)
+    evidenceBuilder = phewasEvidenceGenerator(genesSet, [inputFile, consequencesFile])
 
     # Writing evidence strings into a json file
-    evidences = evidenceBuilder.generateEvidenceFromSource(inputFile, consequencesFile, diseaseMapping, skipMapping)
+    evidenceDataframe = evidenceBuilder.generateEvidenceFromSource(inputFile, consequencesFile, diseaseMapping, skipMapping)
 
-    with gzip.open(outputFile, 'wt') as f:
-        for evidence in evidences:
-            json.dump(evidence, f)
-            f.write('\n')
-
-    logging.info(f'{len(evidences)} evidence strings saved into {outputFile}. Exiting.')
+    logging.info('Generating evidence:')
+    with evidenceBuilder.report.stage('write') as stage:
+        stage.set_rows(output_rows=write_evidence_strings(
+            evidenceDataframe, outputFile, phewasEvidenceGenerator.parseEvidenceString, output_format=output_format
+        ))
+    evidenceBuilder.report.write(outputFile)
 
 
 if __name__ == '__main__':
@@ -232,10 +202,14 @@ if __name__ == '__main__':
     parser.add_argument('-i', '--inputFile', required=True, type=str, help='Input .csv file with the table containing association details.')
     parser.add_argument('-c', '--consequencesFile', required=True, type=str, help='Input look-up table containing the variation consequences coming from the Variant Index.')
     parser.add_argument('-d', '--diseaseMapping', required=False, type=str, help='Input look-up table containing the phenotype mappings to an EFO ID.')
-    parser.add_argument('-g', '--genesSet', required=False, type=str, help='URL for the complete HGNC approved dataset in JSON format.')
+    parser.add_argument('-g', '--genesSet', required=False, type=str, help='URL for the complete HGNC approved dataset (TSV or JSON). A local index of it is built on the first run.')
     parser.add_argument('-o', '--outputFile', required=True, type=str, help='Name of the compressed json.gz output file containing the evidence strings.')
     parser.add_argument('-s', '--skipMapping', required=False, action='store_true', help='State whether to skip the disease to EFO mapping step.')
     parser.add_argument('-l', '--logFile', help='Destination of the logs generated by this script.', type=str, required=False)
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
 
     # Parsing parameters
     args = parser.parse_args()
@@ -265,4 +239,4 @@ if __name__ == '__main__':
     logging.info(f'HGNC dataset URL: {genesSet}')
     logging.info(f'Output file: {outputFile}')
 
-    main(genesSet, inputFile, consequencesFile, diseaseMapping, skipMapping)
+    main(genesSet, inputFile, consequencesFile, diseaseMapping, skipMapping, args.output_format)
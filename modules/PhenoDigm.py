@@ -7,12 +7,19 @@ import os
 import pathlib
 import shutil
 import tempfile
-import urllib.request
 
-import pyspark
-import pyspark.sql.functions as pf
-import requests
-from retry import retry
+from common.BlockGzip import compress_files
+from common.HttpClient import get, get_json
+from common.HGNCIndex import HGNC_ID, get_hgnc_index
+from common.InputSchemas import ingest, read_spark
+from common.Instrumentation import RunReport
+from common.ParquetWriter import JSON, OUTPUT_FORMATS, PARQUET, output_formats, parquet_path, write_spark_parquet
+from common.Resolver import call_with_backoff
+from common.Sampling import sample_spark
+from common.ShardedWriter import write_spark_shards
+from common.SparkSessionFactory import get_spark_session
+from common.Storage import copy
+from settings import Config
 
 
 # The tables and their fields to fetch from SOLR. Other tables (not currently used): gene, disease_gene_summary.
@@ -40,21 +47,17 @@ class ImpcSolrRetriever:
     IMPC_SOLR_BATCH_SIZE = 1000000000
     IMPC_SOLR_TIMEOUT = 3600
 
-    # The decorator ensures that the requests are retried in case of network or server errors.
-    @retry(tries=3, delay=5, backoff=1.2, jitter=(1, 3))
+    # The requests are retried by the HTTP client in case of network or server errors.
     def get_number_of_solr_records(self, data_type):
         params = {'q': '*:*', 'fq': f'type:{data_type}', 'rows': 0}
-        response = requests.get(self.IMPC_SOLR_HOST, params=params, timeout=self.IMPC_SOLR_TIMEOUT)
-        response.raise_for_status()  # Check for HTTP errors. This will be caught by @retry.
-        return response.json()['response']['numFound']
+        return get_json(self.IMPC_SOLR_HOST, params=params, timeout=self.IMPC_SOLR_TIMEOUT)['response']['numFound']
 
-    @retry(tries=3, delay=5, backoff=1.2, jitter=(1, 3))
     def query_solr(self, data_type, start):
         """Request one batch of SOLR records of the specified data type and write it into a temporary file."""
         list_of_columns = [column.split(' > ')[0] for column in IMPC_SOLR_TABLES[data_type]]
         params = {'q': '*:*', 'fq': f'type:{data_type}', 'start': start, 'rows': self.IMPC_SOLR_BATCH_SIZE, 'wt': 'csv',
                   'fl': ','.join(list_of_columns)}
-        response = requests.get(self.IMPC_SOLR_HOST, params=params, timeout=self.IMPC_SOLR_TIMEOUT, stream=True)
+        response = get(self.IMPC_SOLR_HOST, params=params, timeout=self.IMPC_SOLR_TIMEOUT, stream=True)
         response.raise_for_status()
         # Write records as they appear to avoid keeping the entire response in memory.
         with tempfile.NamedTemporaryFile('wt', delete=False) as tmp_file:
@@ -75,7 +78,9 @@ class ImpcSolrRetriever:
         with open(output_filename, 'wb') as outfile:
             start, total = 0, 0  # Initialise the counters.
             while True:
-                number_of_records, tmp_filename = self.query_solr(data_type, start)
+                # A response interrupted midway is requested again:
+                number_of_records, tmp_filename = call_with_backoff(self.query_solr, data_type, start,
+                                                                    max_retries=Config.HTTP_MAX_RETRIES)
                 with open(tmp_filename, 'rb') as tmp_file:
                     shutil.copyfileobj(tmp_file, outfile)
                 os.remove(tmp_filename)
@@ -90,20 +95,16 @@ class ImpcSolrRetriever:
 class PhenoDigm:
     """Retrieve the data, load it into Spark, process and write the resulting evidence strings."""
 
-    # Human gene mappings.
-    HGNC_DATASET_URI = 'http://ftp.ebi.ac.uk/pub/databases/genenames/hgnc/tsv/hgnc_complete_set.txt'
-    HGNC_DATASET_FILENAME = 'hgnc_complete_set.txt'
-
     # Mouse gene mappings.
     MGI_DATASET_URI = 'http://www.informatics.jax.org/downloads/reports/MGI_Gene_Model_Coord.rpt'
     MGI_DATASET_FILENAME = 'MGI_Gene_Model_Coord.rpt'
 
     IMPC_FILENAME = 'impc_solr_{data_type}.csv'
 
-    def __init__(self, logger, cache_dir):
+    def __init__(self, logger, cache_dir, local=False):
         self.logger = logger
         self.cache_dir = cache_dir
-        self.spark = pyspark.sql.SparkSession.builder.appName('phenodigm_parser').getOrCreate()
+        self.spark = get_spark_session('phenodigm_parser', 'local' if local else 'cluster', [cache_dir])
         self.hgnc_gene_id_to_ensembl_human_gene_id, self.mgi_gene_id_to_ensembl_mouse_gene_id = [None] * 2
         self.mouse_gene_to_human_gene, self.mouse_phenotype_to_human_phenotype = [None] * 2
         self.mouse_model, self.disease, self.disease_model_summary, self.ontology = [None] * 4
@@ -113,11 +114,14 @@ class PhenoDigm:
         """Fetch the Ensembl gene ID and SOLR data into the local cache directory."""
         pathlib.Path(self.cache_dir).mkdir(parents=False, exist_ok=True)
 
-        self.logger.info('Fetching human gene ID mappings from HGNC.')
-        urllib.request.urlretrieve(self.HGNC_DATASET_URI, os.path.join(self.cache_dir, self.HGNC_DATASET_FILENAME))
+        self.logger.info('Updating the HGNC index of the human gene ID mappings.')
+        get_hgnc_index()
 
         self.logger.info('Fetching mouse gene ID mappings from MGI.')
-        urllib.request.urlretrieve(self.MGI_DATASET_URI, os.path.join(self.cache_dir, self.MGI_DATASET_FILENAME))
+        mgi_filename = os.path.join(self.cache_dir, self.MGI_DATASET_FILENAME)
+        copy(self.MGI_DATASET_URI, mgi_filename)
+        # The tables are converted once into typed Parquet files, read instead of the raw files:
+        ingest('mgi_gene_model_coord', mgi_filename)
 
         self.logger.info('Fetching PhenoDigm data from IMPC SOLR.')
         impc_solr_retriever = ImpcSolrRetriever()
@@ -125,15 +129,16 @@ class PhenoDigm:
             self.logger.info(f'Fetching PhenoDigm data type {data_type}.')
             filename = os.path.join(self.cache_dir, self.IMPC_FILENAME.format(data_type=data_type))
             impc_solr_retriever.fetch_data(data_type, filename)
+            ingest(f'impc_solr_{data_type}', filename)
 
-    def load_tsv(self, filename):
-        return self.spark.read.csv(os.path.join(self.cache_dir, filename), sep='\t', header=True, nullValue='null')
+    def load_tsv(self, schema, filename):
+        return read_spark(self.spark, schema, os.path.join(self.cache_dir, filename), sep='\t', nullValue='null')
 
     def load_solr_csv(self, data_type):
-        """Load the CSV from SOLR; rename and select columns as specified."""
-        df = self.spark.read.csv(
-            os.path.join(self.cache_dir, self.IMPC_FILENAME.format(data_type=data_type)),
-            header=True
+        """Load the CSV from SOLR, with the types of its input schema; rename and select columns as specified."""
+        df = read_spark(
+            self.spark, f'impc_solr_{data_type}',
+            os.path.join(self.cache_dir, self.IMPC_FILENAME.format(data_type=data_type))
         )
         column_name_mappings = [column_map.split(' > ') for column_map in IMPC_SOLR_TABLES[data_type]]
         columns_to_rename = {mapping[0]: mapping[1] for mapping in column_name_mappings if len(mapping) == 2}
@@ -146,15 +151,17 @@ class PhenoDigm:
 
     def load_data_from_cache(self):
         """Load the Ensembl gene ID and SOLR data from the downloaded TSV/CSV files into Spark."""
-        # Mappings from HGNC/MGI gene IDs to Ensembl gene IDs.
-        self.hgnc_gene_id_to_ensembl_human_gene_id = (  # E.g. 'HGNC:5', 'ENSG00000121410'.
-            self.load_tsv(self.HGNC_DATASET_FILENAME)
-            .withColumnRenamed('hgnc_id', 'hgnc_gene_id')
-            .withColumnRenamed('ensembl_gene_id', 'targetFromSourceId')  # Using the final name.
-            .select('hgnc_gene_id', 'targetFromSourceId')
+        import pyspark.sql.functions as pf
+
+        # Mappings from HGNC/MGI gene IDs to Ensembl gene IDs. The HGNC ones come from the local HGNC index, which
+        # is not rebuilt when using the cached data.
+        hgnc_index = get_hgnc_index(max_age_days=0)
+        self.hgnc_gene_id_to_ensembl_human_gene_id = self.spark.createDataFrame(  # E.g. 'HGNC:5', 'ENSG00000121410'.
+            [(hgnc_id, ensembl_gene_id or None) for hgnc_id, ensembl_gene_id in hgnc_index.items(HGNC_ID)],
+            'hgnc_gene_id string, targetFromSourceId string'  # Using the final name.
         )
         self.mgi_gene_id_to_ensembl_mouse_gene_id = (  # E.g. 'MGI:87853', 'ENSMUSG00000027596'.
-            self.load_tsv(self.MGI_DATASET_FILENAME)
+            self.load_tsv('mgi_gene_model_coord', self.MGI_DATASET_FILENAME)
             .withColumnRenamed('1. MGI accession id', 'mgi_gene_id')
             .withColumnRenamed('3. marker symbol', 'targetInModel')  # Using the final name.
             .withColumnRenamed('11. Ensembl gene id', 'targetInModelId')  # Using the final name.
@@ -172,11 +179,14 @@ class PhenoDigm:
 
         # Mouse model and disease data.
         # Note that the models are accessioned with the same prefix ('MGI:') as genes, but they are separate entities.
-        self.mouse_model = self.load_solr_csv('mouse_model')  # E. g. 'MGI:3800884', ['MP:0001304 cataract'].
+        # A sampled run keeps the same mouse models in both tables.
+        self.mouse_model = sample_spark(  # E. g. 'MGI:3800884', ['MP:0001304 cataract'].
+            self.load_solr_csv('mouse_model'), 'model_id'
+        )
         self.disease = self.load_solr_csv('disease')  # E.g. 'OMIM:609258', ['HP:0000545 Myopia'].
         # E. g. 'MGI:2681494', 'C57BL/6JY-smk', 'smk/smk', 'ORPHA:3097', 'Meacham Syndrome', 91.6, 'MGI:98324'.
         self.disease_model_summary = (
-            self.load_solr_csv('disease_model_summary')
+            sample_spark(self.load_solr_csv('disease_model_summary'), 'model_id')
             .withColumnRenamed('model_genetic_background', 'biologicalModelGeneticBackground')
             .withColumnRenamed('model_description', 'biologicalModelAllelicComposition')
             # In Phenodigm, the scores report the association between diseases and animal models, not genes. The
@@ -199,6 +209,8 @@ class PhenoDigm:
 
     def generate_phenodigm_evidence_strings(self, score_cutoff):
         """Generate the evidence by renaming, transforming and joining the columns."""
+        import pyspark.sql.functions as pf
+
         # Process ontology information to enable MP and HP term lookup based on the ID.
         mp_terms, hp_terms = (
             self.ontology
@@ -321,20 +333,40 @@ class PhenoDigm:
                     'targetFromSourceId', 'targetInModel', 'targetInModelId')
         )
 
-    def write_evidence_strings(self, evidence_strings_filename):
+    def write_evidence_strings(self, evidence_strings_filename, compression_threads=None, compression_block_size=None,
+                               output_format=None, shard_size=0):
         """Dump the Spark evidence dataframe as a compressed JSON file. The order of the evidence strings is not
-        maintained, and they are returned in random order as collected by Spark."""
+        maintained, and they are returned in random order as collected by Spark.
+
+        Spark writes uncompressed JSON chunks in parallel, which are then concatenated and compressed in blocks on
+        `compression_threads` threads into a single (multi-member) gzip file. With the `parquet` or `both` output
+        format, the evidence is also written as Parquet, including the phenotype arrays as nested columns.
+
+        With a `shard_size` (in MiB), the JSON output is instead a directory of shards in a deterministic order, with a
+        manifest (see `common.ShardedWriter`)."""
+        formats = output_formats(output_format)
+        if len(formats) > 1:
+            self.evidence = self.evidence.persist()
+        if PARQUET in formats:
+            write_spark_parquet(self.evidence, parquet_path(evidence_strings_filename))
+        if JSON not in formats:
+            return
+        if shard_size:
+            write_spark_shards(self.evidence, evidence_strings_filename, shard_size * 2 ** 20)
+            return
+
         with tempfile.TemporaryDirectory() as tmp_dir_name:
-            (
-                self.evidence.coalesce(1).write.format('json').mode('overwrite')
-                .option('compression', 'org.apache.hadoop.io.compress.GzipCodec').save(tmp_dir_name)
+            self.evidence.write.format('json').mode('overwrite').save(tmp_dir_name)
+            json_chunks = sorted(f for f in os.listdir(tmp_dir_name) if f.startswith('part-') and f.endswith('.json'))
+            assert len(json_chunks) > 0, 'Spark did not write any JSON file.'
+            compress_files(
+                [os.path.join(tmp_dir_name, f) for f in json_chunks], evidence_strings_filename,
+                threads=compression_threads, block_size=compression_block_size
             )
-            json_chunks = [f for f in os.listdir(tmp_dir_name) if f.endswith('.json.gz')]
-            assert len(json_chunks) == 1, f'Expected one JSON file, but found {len(json_chunks)}.'
-            os.rename(os.path.join(tmp_dir_name, json_chunks[0]), evidence_strings_filename)
 
 
-def main(cache_dir, output, score_cutoff, use_cached=False, log_file=None):
+def main(cache_dir, output, score_cutoff, use_cached=False, log_file=None, compression_threads=None,
+         compression_block_size=None, local=False, output_format=None, shard_size=0):
     # Initialize the logger based on the provided log file. If no log file is specified, logs are written to STDERR.
     logging_config = {
         'level': logging.INFO,
@@ -346,19 +378,29 @@ def main(cache_dir, output, score_cutoff, use_cached=False, log_file=None):
     logging.basicConfig(**logging_config)
 
     # Process the data.
-    phenodigm = PhenoDigm(logging, cache_dir)
+    phenodigm = PhenoDigm(logging, cache_dir, local)
+    report = RunReport('PhenoDigm', phenodigm.spark)
     if not use_cached:
         logging.info('Update the HGNC/MGI/SOLR cache.')
-        phenodigm.update_cache()
+        with report.stage('fetch'):
+            phenodigm.update_cache()
 
     logging.info('Load gene mappings and SOLR data from local cache.')
-    phenodigm.load_data_from_cache()
+    with report.stage('load') as stage:
+        phenodigm.load_data_from_cache()
+        stage.set_rows(output_rows=phenodigm.disease_model_summary)
 
     logging.info('Build the evidence strings.')
-    phenodigm.generate_phenodigm_evidence_strings(score_cutoff)
+    with report.stage('build') as stage:
+        phenodigm.generate_phenodigm_evidence_strings(score_cutoff)
+        stage.set_rows(input_rows=phenodigm.disease_model_summary, output_rows=phenodigm.evidence)
 
     logging.info('Collect and write the evidence strings.')
-    phenodigm.write_evidence_strings(output)
+    with report.stage('write'):
+        phenodigm.write_evidence_strings(
+            output, compression_threads, compression_block_size, output_format, shard_size
+        )
+    report.write(output)
 
 
 if __name__ == '__main__':
@@ -372,5 +414,24 @@ if __name__ == '__main__':
     ), type=float, default=0.0)
     parser.add_argument('--use-cached', help='Use the existing cache and do not update it.', action='store_true')
     parser.add_argument('--log-file', help='Optional filename to redirect the logs into.')
+    parser.add_argument('--compression-threads', help=(
+        'Number of threads used to gzip the output. With more than one thread, the file is written as a multi-member '
+        'gzip. Defaults to the OT_GZIP_THREADS environment variable or 1.'
+    ), type=int)
+    parser.add_argument('--compression-block-size', help=(
+        'Size in bytes of the blocks which are compressed independently when using more than one thread.'
+    ), type=int)
+    parser.add_argument('--local', help='Run Spark locally, with a session sized from the host and the input files.',
+                        action='store_true')
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable.'
+    ), choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
+    parser.add_argument('--shard-size', help=(
+        'Target size of the JSON output shards, in MiB of uncompressed JSON lines. When set, the JSON output is a '
+        'directory of shards sorted by association, with a manifest. Defaults to the OT_SHARD_SIZE environment '
+        'variable or 0 (no sharding).'
+    ), type=int, default=Config.SHARD_SIZE)
     args = parser.parse_args()
-    main(args.cache_dir, args.output, args.score_cutoff, args.use_cached, args.log_file)
+    main(args.cache_dir, args.output, args.score_cutoff, args.use_cached, args.log_file, args.compression_threads,
+         args.compression_block_size, args.local, args.output_format, args.shard_size)
@@ -2,23 +2,19 @@
 
 import sys
 import argparse
-import gzip
 import logging
-import json
 
-from pyspark.sql import SparkSession
-import pyspark.sql.functions as F
+from common.Engine import ENGINES, get_engine
+from common.Instrumentation import RunReport
+from common.ParquetWriter import OUTPUT_FORMATS
+from settings import Config
 
 class SLAPEnrichEvidenceGenerator():
 
-    def __init__(self):
-        # Create spark session
-        self.spark = (
-            SparkSession.builder
-            .appName('SLAPEnrich')
-            .getOrCreate()
-        )
-        logging.info(f'Spark version: {self.spark.version}')
+    def __init__(self, local=False, inputFiles=None, engine='spark'):
+        # Create the engine running the transformations (Spark session or in-process pandas)
+        self.engine = get_engine(engine, 'SLAPEnrich', local, inputFiles)
+        self.report = RunReport('SLAPEnrich', getattr(self.engine, 'spark', None))
 
         # Initialize source table
         self.dataframe = None
@@ -27,51 +23,43 @@ class SLAPEnrichEvidenceGenerator():
         '''
         Processing of the input file to build all the evidences from its data
         Returns:
-            evidences (array): Object with all the generated evidences strings from source file
+            dataframe (pyspark.sql.DataFrame or pandas.DataFrame): Final dataframe from which the evidence strings
+                are built
         '''
-        # Read input file
-        self.dataframe = (
-            self.spark
-            .read.csv(inputFile, sep=r'\t', header=True, inferSchema=True)
-            .select('ctype', 'gene', 'pathway', 'SLAPEnrichPval')
-            .withColumnRenamed('ctype', 'Cancer_type_acronym')
-            .withColumnRenamed('SLAPEnrichPval', 'pval')
-            .withColumn('pathwayId', F.split(F.col('pathway'), ': ').getItem(0))
-            .withColumn('pathwayDescription', F.split(F.col('pathway'), ': ').getItem(1))
-        )
+        engine = self.engine
+
+        with self.report.stage('load') as stage:
+            # Read input file
+            self.dataframe = engine.read_csv(inputFile, sep='\t', schema='slapenrich', sample='gene')
+            self.dataframe = engine.rename(self.dataframe, {'ctype': 'Cancer_type_acronym', 'SLAPEnrichPval': 'pval'})
+            self.dataframe = engine.split(self.dataframe, 'pathway', ': ', output='pathwayFields')
+            self.dataframe = engine.get_item(self.dataframe, 'pathwayFields', 0, output='pathwayId')
+            self.dataframe = engine.get_item(self.dataframe, 'pathwayFields', 1, output='pathwayDescription')
+
+            # Filter by p-value
+            self.dataframe = engine.filter_less_than(self.dataframe, 'pval', 1e-4)
+            stage.set_rows(output_rows=self.dataframe)
+
+        with self.report.stage('map') as stage:
+            # Mapping step
+            if not skipMapping:
+                try:
+                    self.dataframe = self.cancer2EFO(diseaseMapping)
+                    logging.info('Disease mappings have been imported.')
+                except Exception as e:
+                    logging.error(f'An error occurred while importing disease mappings: \n{e}.')
+            else:
+                logging.info('Disease mapping has been skipped.')
+                self.dataframe = engine.with_constant(self.dataframe, 'EFO_id', None)
+            stage.set_rows(output_rows=self.dataframe)
 
-        # Filter by p-value
-        self.dataframe = self.dataframe.filter(F.col('pval') < 1e-4)
-
-        # Mapping step
-        if not skipMapping:
-            try:
-                self.dataframe = self.cancer2EFO(diseaseMapping)
-                logging.info('Disease mappings have been imported.')
-            except Exception as e:
-                logging.error(f'An error occurred while importing disease mappings: \n{e}.')
-        else:
-            logging.info('Disease mapping has been skipped.')
-            self.dataframe = self.dataframe.withColumn('EFO_id', F.lit(None))
-
-        # Build evidence strings per row
-        logging.info('Generating evidence:')
-        evidences = (
-            self.dataframe.rdd
-            .map(SLAPEnrichEvidenceGenerator.parseEvidenceString)
-            .collect()
-        )  # list of dictionaries
-
-        return evidences
+        return self.dataframe
 
     def cancer2EFO(self, diseaseMapping):
-        diseaseMappingsFile = (
-            self.spark
-            .read.csv(diseaseMapping, sep=r'\t', header=True)
-            .select('Cancer_type_acronym', 'EFO_id')
-        )
+        diseaseMappingsFile = self.engine.read_csv(diseaseMapping, sep='\t', schema='cancer_to_efo', lookup=True)
 
-        self.dataframe = self.dataframe.join(
+        self.dataframe = self.engine.join(
+            self.dataframe,
             diseaseMappingsFile,
             on='Cancer_type_acronym',
             how='left'
@@ -105,7 +93,7 @@ class SLAPEnrichEvidenceGenerator():
             raise
 
 
-def main(inputFile, diseaseMapping, outputFile, skipMapping):
+def main(inputFile, diseaseMapping, outputFile, skipMapping, local=False, engine='spark', output_format=None):
 
     # Logging parameters
     logging.info(f'SLAPEnrich input table: {inputFile}')
@@ -113,16 +101,17 @@ def main(inputFile, diseaseMapping, outputFile, skipMapping):
     logging.info(f'Output file: {outputFile}')
 
     # Initialize evidence builder object
-    evidenceBuilder = SLAPEnrichEvidenceGenerator()
+    evidenceBuilder = SLAPEnrichEvidenceGenerator(local, [inputFile], engine)
 
     # Writing evidence strings into a json file
-    evidences = evidenceBuilder.generateEvidenceFromSource(inputFile, diseaseMapping, skipMapping)
+    evidenceDataframe = evidenceBuilder.generateEvidenceFromSource(inputFile, diseaseMapping, skipMapping)
 
-    with gzip.open(outputFile, 'wt') as f:
-        for evidence in evidences:
-            json.dump(evidence, f)
-            f.write('\n')
-    logging.info(f'{len(evidences)} evidence strings saved into {outputFile}. Exiting.')
+    logging.info('Generating evidence:')
+    with evidenceBuilder.report.stage('write') as stage:
+        stage.set_rows(output_rows=evidenceBuilder.engine.write_evidence(
+            evidenceDataframe, outputFile, SLAPEnrichEvidenceGenerator.parseEvidenceString, output_format
+        ))
+    evidenceBuilder.report.write(outputFile)
 
 
 if __name__ == '__main__':
@@ -139,6 +128,14 @@ if __name__ == '__main__':
                         help='State whether to skip the disease to EFO mapping step.')
     parser.add_argument('-l', '--logFile', help='Destination of the logs generated by this script.',
                         type=str, required=False)
+    parser.add_argument('--local', help='Run Spark locally, with a session sized from the host and the input files.',
+                        action='store_true', required=False, default=False)
+    parser.add_argument('--engine', help='Engine running the transformations: spark, or pandas for a Spark-free run.',
+                        type=str, choices=ENGINES, required=False, default='spark')
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
 
     # Parsing parameters
     args = parser.parse_args()
@@ -146,6 +143,8 @@ if __name__ == '__main__':
     diseaseMapping = args.diseaseMapping
     outputFile = args.outputFile
     skipMapping = args.skipMapping
+    local = args.local
+    engine = args.engine
 
     # Initialize logging:
     logging.basicConfig(
@@ -158,4 +157,4 @@ if __name__ == '__main__':
     else:
         logging.StreamHandler(sys.stderr)
 
-    main(inputFile, diseaseMapping, outputFile, skipMapping)
+    main(inputFile, diseaseMapping, outputFile, skipMapping, local, engine, args.output_format)
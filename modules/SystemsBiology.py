@@ -3,7 +3,11 @@ import argparse
 import logging
 import sys
 
-import pandas as pd
+from common.InputSchemas import read_pandas
+from common.Instrumentation import RunReport
+from common.ParquetWriter import JSON, OUTPUT_FORMATS, PARQUET, output_formats, parquet_path, write_pandas_parquet
+from common.Storage import staged_output
+from settings import Config
 
 def renormalize(n, start_range, new_range=[0.5, 1]):
     """
@@ -56,51 +60,67 @@ def generate_score(row):
     return parsed_score
 
 
-def main(studyFile, evidenceFile, out_file):
+def main(studyFile, evidenceFile, out_file, output_format=None):
 
     logging.info(f'Output file: {out_file}')
 
-    # Reading evidence:
-    logging.info(f'Evidence file: {evidenceFile}')
-    evidence_df = pd.read_csv(evidenceFile, sep='\t')
-    logging.info(f'Number of evidence: {len(evidence_df)}')
-    logging.info(f'Number of target: {len(evidence_df.target_id.unique())}')
-    logging.info(f'Number of disease: {len(evidence_df.disease_id.unique())}')
-
-    # Reading study file:
-    logging.info(f'Study description file: {studyFile}')
-    publication_df = pd.read_csv(studyFile, sep='\t')
-    logging.info(f'Number of studies: {len(publication_df)}')
-
-    # Merging publication with evidence data:
-    merged = evidence_df.merge(publication_df.drop('pmid', axis=1), on='gene_set_name', how='outer', indicator=True)
-
-    # Checking if merging worked just fine:
-    if len(merged.loc[merged._merge != 'both']) != 0:
-        logging.warning(f'{len(merged.loc[merged._merge != "both"])} rows could not be joined.')
-        logging.warning(merged.loc[merged._merge != "both"])
-
-    # Generate evidence:
-    merged = (
-        merged
-        .assign(
-            diseaseFromSourceMappedId=merged.disease_id.apply(lambda x: x.split('/')[-1]),
-            datasourceId='sysbio',
-            datatypeId='affected_pathway',
-            literature=merged.pmid.apply(lambda x: [str(x)]),
-            pathways=merged.gene_set_name.apply(lambda x: [{'name': x}]),
-            resourceScore=merged.apply(generate_score, axis=1)
+    report = RunReport('SysBio')
+
+    with report.stage('load') as stage:
+        # Reading evidence:
+        logging.info(f'Evidence file: {evidenceFile}')
+        # A sampled run keeps the same gene sets in the evidence and study files:
+        evidence_df = read_pandas('sysbio_evidence', evidenceFile, sep='\t', sample='gene_set_name')
+        logging.info(f'Number of evidence: {len(evidence_df)}')
+        logging.info(f'Number of target: {len(evidence_df.target_id.unique())}')
+        logging.info(f'Number of disease: {len(evidence_df.disease_id.unique())}')
+
+        # Reading study file:
+        logging.info(f'Study description file: {studyFile}')
+        publication_df = read_pandas('sysbio_studies', studyFile, sep='\t', sample='gene_set_name')
+        logging.info(f'Number of studies: {len(publication_df)}')
+        stage.set_rows(output_rows=len(evidence_df) + len(publication_df))
+
+    with report.stage('merge') as stage:
+        # Merging publication with evidence data:
+        merged = evidence_df.merge(publication_df.drop('pmid', axis=1), on='gene_set_name', how='outer', indicator=True)
+
+        # Checking if merging worked just fine:
+        if len(merged.loc[merged._merge != 'both']) != 0:
+            logging.warning(f'{len(merged.loc[merged._merge != "both"])} rows could not be joined.')
+            logging.warning(merged.loc[merged._merge != "both"])
+
+        # Generate evidence:
+        merged = (
+            merged
+            .assign(
+                diseaseFromSourceMappedId=merged.disease_id.apply(lambda x: x.split('/')[-1]),
+                datasourceId='sysbio',
+                datatypeId='affected_pathway',
+                literature=merged.pmid.apply(lambda x: [str(x)]),
+                pathways=merged.gene_set_name.apply(lambda x: [{'name': x}]),
+                resourceScore=merged.apply(generate_score, axis=1)
+            )
+            .rename(columns={
+                'target_id': 'targetFromSourceId',
+                'disease_name': 'diseaseFromSource',
+                'method': 'studyOverview'
+            })
+            .drop(['_merge', 'max_score', 'min_score', 'score_type', 'score', 'disease_id', 'pmid', 'gene_set_name'], axis=1)
         )
-        .rename(columns={
-            'target_id': 'targetFromSourceId',
-            'disease_name': 'diseaseFromSource',
-            'method': 'studyOverview'
-        })
-        .drop(['_merge', 'max_score', 'min_score', 'score_type', 'score', 'disease_id', 'pmid', 'gene_set_name'], axis=1)
-        .to_json(out_file, compression='gzip', orient='records', lines=True)
-    )
+        stage.set_rows(input_rows=len(evidence_df), output_rows=len(merged))
+
+    formats = output_formats(output_format)
+    with report.stage('write') as stage:
+        if JSON in formats:
+            with staged_output(out_file) as path:
+                merged.to_json(path, compression='gzip', orient='records', lines=True)
+        if PARQUET in formats:
+            write_pandas_parquet(merged, parquet_path(out_file))
+        stage.set_rows(output_rows=len(merged))
 
     logging.info('Evidence generation finished.')
+    report.write(out_file)
 
 
 if __name__ == "__main__":
@@ -119,6 +139,10 @@ if __name__ == "__main__":
     parser.add_argument('-l', '--logFile',
                         help='Name of log file. If not provided logs are written to standard error.',
                         type=str, required=False)
+    parser.add_argument('--output-format', help=(
+        'Format of the evidence: json, parquet (written next to the JSON file, with a .parquet extension) or both. '
+        'Defaults to the OT_OUTPUT_FORMAT environment variable or json.'
+    ), type=str, choices=OUTPUT_FORMATS, default=Config.OUTPUT_FORMAT)
 
     args = parser.parse_args()
     studyFile = args.studyFile
@@ -136,4 +160,4 @@ if __name__ == "__main__":
     else:
         logging.StreamHandler(sys.stderr)
 
-    main(studyFile, evidenceFile, out_file)
+    main(studyFile, evidenceFile, out_file, args.output_format)
@@ -1,22 +1,21 @@
 # General settings that all parsers can share
 
 import os
-import pkg_resources as res
 from datetime import datetime
 
+# Folder of the resource files shipped with the parsers, resolved without pkg_resources, which is slow to import
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
 def file_or_resource(fname=None):
     # get filename and check if in getcwd then get from the package resources folder
     filename = os.path.expanduser(fname)
 
-    resource_package = __name__
-    resource_path = '/'.join(('resources', filename))
-
     if filename is not None:
         abs_filename = os.path.join(os.path.abspath(os.getcwd()), filename) \
                        if not os.path.isabs(filename) else filename
 
         return abs_filename if os.path.isfile(abs_filename) \
-            else res.resource_filename(resource_package, resource_path)
+            else os.path.join(RESOURCES_DIR, filename)
 
 class Config:
     # shared settings
@@ -28,8 +27,84 @@ class Config:
     EFO_URL = 'https://github.com/EBISPOT/efo/raw/v2018-01-15/efo.obo'
     HP_URL = 'http://purl.obolibrary.org/obo/hp.obo'
 
-    # HGNC
-    GENES_HGNC = 'http://ftp.ebi.ac.uk/pub/databases/genenames/new/json/hgnc_complete_set.json'
+    # Evidence JSON schema (see common/SchemaValidation.py): local copy, fetched from the given branch or tag of the
+    # opentargets/json_schema repository when missing
+    EVIDENCE_SCHEMA_VERSION = os.environ.get('OT_EVIDENCE_SCHEMA_VERSION', 'master')
+    EVIDENCE_SCHEMA_PATH = os.environ.get('OT_EVIDENCE_SCHEMA_PATH', os.path.expanduser(
+        f'~/.cache/evidence_datasource_parsers/disease_target_evidence-{EVIDENCE_SCHEMA_VERSION}.json'
+    ))
+
+    # JSON encoder used to write the evidence files: 'json' (standard library) or 'orjson'
+    JSON_ENCODER_BACKEND = os.environ.get('OT_JSON_ENCODER_BACKEND', 'json')
+
+    # Gzip output: with more than one thread, blocks of GZIP_BLOCK_SIZE bytes are compressed in parallel
+    GZIP_THREADS = int(os.environ.get('OT_GZIP_THREADS', 1))
+    GZIP_BLOCK_SIZE = int(os.environ.get('OT_GZIP_BLOCK_SIZE', 4 * 1024 * 1024))
+
+    # Output of the parsers: 'json' (gzipped JSON lines), 'parquet' or 'both', and the compression of the Parquet
+    # files (see common/ParquetWriter.py)
+    OUTPUT_FORMAT = os.environ.get('OT_OUTPUT_FORMAT', 'json')
+    PARQUET_COMPRESSION = os.environ.get('OT_PARQUET_COMPRESSION', 'snappy')
+
+    # Sharded JSON output (see common/ShardedWriter.py): target size of a shard in MiB of uncompressed JSON lines, the
+    # output being a single file when 0
+    SHARD_SIZE = int(os.environ.get('OT_SHARD_SIZE', 0))
+
+    # Persistent cache of the OnToma lookups shared by the parsers (see common/MappingCache.py). Entries of another
+    # ontology release are ignored, results expire after the given number of days (0: never)
+    ONTOMA_CACHE_PATH = os.environ.get(
+        'OT_ONTOMA_CACHE_PATH', os.path.expanduser('~/.cache/evidence_datasource_parsers/ontoma_cache.sqlite')
+    )
+    ONTOMA_CACHE_RELEASE = os.environ.get('OT_ONTOMA_CACHE_RELEASE', 'latest')
+    ONTOMA_CACHE_TTL_DAYS = float(os.environ.get('OT_ONTOMA_CACHE_TTL_DAYS', 30))
+    ONTOMA_CACHE_NEGATIVE_TTL_DAYS = float(os.environ.get('OT_ONTOMA_CACHE_NEGATIVE_TTL_DAYS', 7))
+
+    # OnToma lookups missing from the cache: worker threads, maximum calls per second to each OnToma method and retries
+    ONTOMA_WORKERS = int(os.environ.get('OT_ONTOMA_WORKERS', 8))
+    ONTOMA_RATE_LIMIT = float(os.environ.get('OT_ONTOMA_RATE_LIMIT', 10))
+    ONTOMA_MAX_RETRIES = int(os.environ.get('OT_ONTOMA_MAX_RETRIES', 5))
+
+    # HGNC complete set, and the local index of its symbols and ids built from it (see common/HGNCIndex.py). The index
+    # is rebuilt when it is older than the given number of days (0: never)
+    GENES_HGNC = 'http://ftp.ebi.ac.uk/pub/databases/genenames/hgnc/tsv/hgnc_complete_set.txt'
+    HGNC_INDEX_PATH = os.environ.get(
+        'OT_HGNC_INDEX_PATH', os.path.expanduser('~/.cache/evidence_datasource_parsers/hgnc_index.bin')
+    )
+    HGNC_INDEX_MAX_AGE_DAYS = float(os.environ.get('OT_HGNC_INDEX_MAX_AGE_DAYS', 7))
+
+    # Content-addressed store of the input files fetched by the Snakefile (see common/FetchCache.py)
+    FETCH_CACHE_PATH = os.environ.get(
+        'OT_FETCH_CACHE_PATH', os.path.expanduser('~/.cache/evidence_datasource_parsers/inputs')
+    )
+
+    # Storage of the inputs and outputs addressed by URI (see common/Storage.py): size in MiB of the chunks of the
+    # transfers, number of chunks transferred in parallel, and local directory standing in for the gs:// buckets
+    STORAGE_CHUNK_SIZE = int(os.environ.get('OT_STORAGE_CHUNK_SIZE', 32))
+    STORAGE_WORKERS = int(os.environ.get('OT_STORAGE_WORKERS', 8))
+    STORAGE_EMULATOR_PATH = os.environ.get('OT_STORAGE_EMULATOR_PATH')
+
+    # Memory budget in MiB of the records built on the driver, spilled to disk beyond it (see common/RecordBuffer.py)
+    RECORD_BUFFER_SIZE = int(os.environ.get('OT_RECORD_BUFFER_SIZE', 256))
+
+    # Fraction of the primary keys (genes, variants, ...) kept by a sampled run, 0 for a full run (see common/Sampling.py)
+    SAMPLE_FRACTION = float(os.environ.get('OT_SAMPLE_FRACTION', 0))
+
+    # Network fetches (see common/HttpClient.py): timeout in seconds, retries of the failed requests, and kept-alive
+    # connections per host, which is also the maximum number of concurrent requests to a host
+    HTTP_TIMEOUT = float(os.environ.get('OT_HTTP_TIMEOUT', 60))
+    HTTP_MAX_RETRIES = int(os.environ.get('OT_HTTP_MAX_RETRIES', 5))
+    HTTP_HOST_CONNECTIONS = int(os.environ.get('OT_HTTP_HOST_CONNECTIONS', 8))
+
+    # Outputs of the previous parser runs, republished when the fingerprint of a run matches (see common/Fingerprint.py)
+    RUN_CACHE_PATH = os.environ.get(
+        'OT_RUN_CACHE_PATH', os.path.expanduser('~/.cache/evidence_datasource_parsers/runs')
+    )
+
+    # Run reports (see common/Instrumentation.py): whether the Spark dataframes of the stages are counted, which runs
+    # their plan once more
+    INSTRUMENTATION_COUNT_ROWS = os.environ.get('OT_INSTRUMENTATION_COUNT_ROWS', 'false').lower() in (
+        '1', 'true', 'yes'
+    )
 
     # UKBIOBANK
     UKBIOBANK_FILENAME = file_or_resource('ukbiobank.txt')
@@ -0,0 +1,30 @@
+import filecmp
+import gzip
+
+from benchmarks.generators import generate
+from benchmarks.harness import FakeOnToma
+from benchmarks.run import count_records
+
+
+def test_generators_are_seeded(tmp_path):
+    first = generate('Gene2Phenotype', str(tmp_path / 'first'), 200, seed=1)
+    second = generate('Gene2Phenotype', str(tmp_path / 'second'), 200, seed=1)
+    other = generate('Gene2Phenotype', str(tmp_path / 'other'), 200, seed=2)
+
+    assert filecmp.cmp(first['dd_panel'], second['dd_panel'], shallow=False)
+    assert not filecmp.cmp(first['dd_panel'], other['dd_panel'], shallow=False)
+    assert sum(count_records(filename) for filename in first.values()) == 200 + 4  # Rows and headers
+
+
+def test_fake_ontoma_and_record_count(tmp_path):
+    ontoma = FakeOnToma()
+    assert ontoma.find_term('Asthma', verbose=True) == ontoma.find_term('Asthma', verbose=True)
+    assert sum(ontoma.find_term(f'disease {i}') is not None for i in range(1000)) in range(600, 800)
+
+    output = tmp_path / 'output'
+    output.mkdir()
+    for part in range(2):
+        with gzip.open(output / f'part-0000{part}.json.gz', 'wt') as f:
+            f.write('{"id": 1}\n{"id": 2}\n')
+    (output / '_SUCCESS').write_text('')
+    assert count_records(str(output)) == 4
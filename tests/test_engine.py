@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from common.Engine import ENGINES, PandasEngine, get_engine
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_pandas_engine_follows_spark_semantics(tmp_path):
+    genes = tmp_path / 'genes.tsv'
+    genes.write_text('gene\tcancer\tpval\tpathways\nA\tBRCA\t1e-5\tp1, p2\nB\t\t0.5\tp3\nC\tLUAD\t1e-6\t\n')
+    mappings = tmp_path / 'mappings.tsv'
+    mappings.write_text('cancer\tEFO_id\nBRCA\tEFO_0000305\n\tEFO_0000001\n')
+
+    engine = PandasEngine()
+    df = engine.read_csv(str(genes), sep='\t')
+    df = engine.cast(df, 'pval', 'float')
+    df = engine.split(df, 'pathways', ', ')
+    # Null keys do not match the null key of the mappings:
+    df = engine.join(df, engine.read_csv(str(mappings), sep='\t'), on='cancer', how='left')
+    # Rows without pathways are dropped by the explode:
+    df = engine.explode(engine.filter_less_than(df, 'pval', 0.6), 'pathways')
+
+    assert engine.collect(df) == [
+        {'gene': 'A', 'cancer': 'BRCA', 'pval': 1e-5, 'pathways': 'p1', 'EFO_id': 'EFO_0000305'},
+        {'gene': 'A', 'cancer': 'BRCA', 'pval': 1e-5, 'pathways': 'p2', 'EFO_id': 'EFO_0000305'},
+        {'gene': 'B', 'cancer': None, 'pval': 0.5, 'pathways': 'p3', 'EFO_id': None},
+    ]
+
+
+def _read_evidence(output_file):
+    '''Evidence strings of an output file, in a canonical order and key order.'''
+    with gzip.open(output_file, 'rt') as f:
+        return sorted(json.dumps(json.loads(line), sort_keys=True) for line in f)
+
+
+class _DiseaseMap(object):
+    '''Offline disease mapping of Gene2Phenotype: every other disease name is mapped.'''
+    ontoma = SimpleNamespace(cache=SimpleNamespace(log_stats=lambda: None))
+
+    def map_disease(self, label, disease_id):
+        return {'term': f'http://www.ebi.ac.uk/efo/EFO_{len(label):07d}'} if len(label) % 2 else None
+
+
+def test_engines_produce_identical_evidence(tmp_path):
+    pytest.importorskip('pyspark')
+    import modules.Gene2Phenotype as Gene2Phenotype
+    import modules.IntOGen as IntOGen
+    import modules.PROGENY as PROGENY
+    import modules.SLAPEnrich as SLAPEnrich
+    from benchmarks.generators import generate
+
+    cancer_mappings = os.path.join(REPOSITORY_ROOT, 'resources', 'cancer2EFO_mappings.tsv')
+    pathway_mappings = os.path.join(REPOSITORY_ROOT, 'resources', 'pathway2Reactome_mappings.tsv')
+    slapenrich = tmp_path / 'slapenrich.tsv'
+    slapenrich.write_text(
+        'ctype\tgene\tpathway\tSLAPEnrichPval\n'
+        'BRCA\tENSG00000141510\tR-HSA-1: Signaling by EGFR\t1e-5\n'
+        'XXXX\tENSG00000157764\tR-HSA-2: Apoptosis\t2e-6\n'
+        'BLCA\tENSG00000133703\tR-HSA-3: Cell cycle\t0.5\n'
+    )
+    progeny = tmp_path / 'progeny.tsv'
+    progeny.write_text(
+        'Cancer_type\tPathway\tP.Value\n'
+        'BRCA\tAndrogen\t1e-4\nKIRC\tEGFR\t0.02\nXXXX\tHypoxia\t3e-7\nBLCA\tUnknown\t0.1\n'
+    )
+    intogen_genes = tmp_path / 'intogen_genes.tsv'
+    intogen_genes.write_text(
+        'SYMBOL\tCOHORT\tCANCER_TYPE\tSAMPLES\tMETHODS\tROLE\tQVALUE_COMBINATION\n'
+        'BRAF\tC1\tBRCA\t12\tdndscv,cbase\tAct\t1e-5\n'
+        'TP53\tC2\tHNSC\t\tdndscv\tLoF\t\n'
+        'KRAS\tC3\tBLCA\t3\tmutpanning\tambiguous\t0.01\n'
+    )
+    intogen_cohorts = tmp_path / 'intogen_cohorts.tsv'
+    intogen_cohorts.write_text(
+        'COHORT\tCANCER_TYPE_NAME\tWEB_SHORT_COHORT_NAME\tWEB_LONG_COHORT_NAME\tSAMPLES\n'
+        'C1\tBreast adenocarcinoma\tBRCA\tBreast cohort\t100\nC2\tHead and neck\tHNSC\tHead and neck cohort\t\n'
+    )
+    panels = generate('Gene2Phenotype', str(tmp_path / 'gene2phenotype'), 200, seed=1)
+
+    outputs = {}
+    for engine in ENGINES:
+        output_dir = tmp_path / engine
+        output_dir.mkdir()
+        SLAPEnrich.main(str(slapenrich), cancer_mappings, str(output_dir / 'slapenrich.json.gz'), False, True, engine)
+        PROGENY.main(
+            str(progeny), cancer_mappings, pathway_mappings, str(output_dir / 'progeny.json.gz'), False, True, engine
+        )
+        IntOGen.main(
+            str(intogen_genes), str(intogen_cohorts), cancer_mappings, str(output_dir / 'intogen.json.gz'), False,
+            True, engine
+        )
+        gene2phenotype_engine = get_engine(engine, 'Gene2Phenotype', True)
+        gene2phenotype_engine.write_evidence(
+            Gene2Phenotype.generate_evidence(gene2phenotype_engine, list(panels.values()), _DiseaseMap()),
+            str(output_dir / 'gene2phenotype.json.gz')
+        )
+        outputs[engine] = {
+            name: _read_evidence(str(output_dir / f'{name}.json.gz'))
+            for name in ('slapenrich', 'progeny', 'intogen', 'gene2phenotype')
+        }
+
+    assert all(outputs['pandas'].values())
+    assert outputs['spark'] == outputs['pandas']
+
+    # The separators are literal, regular expression characters included:
+    rows = [{'value': 'a.b|c+d'}, {'value': None}]
+    splits = {}
+    for name in ENGINES:
+        engine = get_engine(name, 'split', True)
+        df = engine.from_records(rows, ['value'])
+        df = engine.split(engine.split(df, 'value', '.', output='dot'), 'value', '|', output='pipe')
+        splits[name] = engine.collect(engine.split(df, 'value', '+', output='plus'))
+    assert splits['spark'] == splits['pandas'] == [
+        {'value': 'a.b|c+d', 'dot': ['a', 'b|c+d'], 'pipe': ['a.b', 'c+d'], 'plus': ['a.b|c', 'd']},
+        {'value': None, 'dot': None, 'pipe': None, 'plus': None},
+    ]
@@ -0,0 +1,52 @@
+import gzip
+import json
+
+from common.EvidenceDelta import content_digest, evidence_delta
+
+
+def _write(path, records):
+    with gzip.open(path, 'wt') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def _read(directory):
+    records = []
+    for part in sorted(directory.iterdir()):
+        with gzip.open(part, 'rt') as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_content_digest_ignores_order():
+    record = {'datasourceId': 'orphanet', 'targetFromSourceId': 'ENSG1', 'literature': ['1', '2'], 'score': 1}
+    reordered = {'score': 1, 'literature': ['2', '1'], 'targetFromSourceId': 'ENSG1', 'datasourceId': 'orphanet'}
+    assert content_digest(record) == content_digest(reordered)
+    assert content_digest(record) != content_digest(dict(record, score=2))
+
+
+def test_delta(tmp_path):
+    def evidence(i, score=1):
+        return {
+            'datasourceId': 'ot_genetics_portal', 'variantId': f'1_{i}_A_G', 'studyId': 'GCST1',
+            'targetFromSourceId': 'ENSG1', 'diseaseFromSourceMappedId': 'EFO_1', 'resourceScore': score,
+        }
+
+    old, new = tmp_path / 'old', tmp_path / 'new'
+    old.mkdir()
+    new.mkdir()
+    _write(old / 'part-00000.json.gz', [evidence(i) for i in range(0, 300)])
+    _write(old / 'part-00001.json.gz', [evidence(i) for i in range(300, 600)])
+    # 100 removed, 50 changed, 200 added, in a different order:
+    _write(new / 'part-00000.json.gz', [evidence(i, 2 if i < 150 else 1) for i in reversed(range(100, 800))])
+
+    summary = evidence_delta([str(old)], [str(new)], str(tmp_path / 'delta'), processes=2, memory_limit=2 ** 10,
+                             temp_dir=str(tmp_path))
+    assert summary['datasources']['ot_genetics_portal'] == {
+        'old_records': 600, 'new_records': 700, 'added': 200, 'removed': 100, 'changed': 50, 'unchanged': 450
+    }
+    assert sorted(r['variantId'] for r in _read(tmp_path / 'delta' / 'removed')) == sorted(
+        f'1_{i}_A_G' for i in range(100))
+    assert {r['resourceScore'] for r in _read(tmp_path / 'delta' / 'changed')} == {2}
+    assert len(_read(tmp_path / 'delta' / 'added')) == 200
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['delta', 'new', 'old']
@@ -0,0 +1,28 @@
+from common.EvidenceWriter import prune_evidence
+
+
+def test_prune_evidence_removes_empty_keys():
+    evidence = {
+        'datasourceId': 'genomics_england',
+        'diseaseFromSourceId': '',
+        'diseaseFromSourceMappedId': None,
+        'literature': [],
+        'allelicRequirements': [None],
+        'confidence': 'green',
+    }
+    assert prune_evidence(evidence) == {'datasourceId': 'genomics_england', 'confidence': 'green'}
+
+
+def test_prune_evidence_is_recursive():
+    evidence = {
+        'datasourceId': 'intogen',
+        'mutatedSamples': [{
+            'functionalConsequenceId': None,
+            'numberMutatedSamples': 0,
+            'numberSamplesTested': 10
+        }]
+    }
+    assert prune_evidence(evidence) == {
+        'datasourceId': 'intogen',
+        'mutatedSamples': [{'numberMutatedSamples': 0, 'numberSamplesTested': 10}]
+    }
@@ -0,0 +1,44 @@
+import functools
+import http.server
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('requests')
+
+from common.FetchCache import CACHED, DOWNLOADED, UNCHANGED, ContentStore, fetch
+
+
+@pytest.fixture
+def web_root(tmp_path):
+    root = tmp_path / 'www'
+    root.mkdir()
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(root))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield root, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+def test_fetch_http(tmp_path, web_root):
+    root, url = web_root
+    (root / 'panel.csv').write_text('gene,disease\n')
+    store = ContentStore(str(tmp_path / 'store'))
+
+    first, second = str(tmp_path / 'panel-2021-03-01.csv'), str(tmp_path / 'panel-2021-03-02.csv')
+    assert fetch(f'{url}/panel.csv', first, store) == [(first, DOWNLOADED, 13)]
+    # Not modified since the Last-Modified date of the first request:
+    assert fetch(f'{url}/panel.csv', second, store) == [(second, CACHED, 0)]
+    assert os.path.samefile(first, second)
+
+    # A new upload of the same content is transferred, and linked to the same object:
+    os.utime(root / 'panel.csv', (0, 2 ** 31))
+    third = str(tmp_path / 'panel-2021-03-03.csv')
+    assert fetch(f'{url}/panel.csv', third, store)[0][1] == UNCHANGED
+    assert os.path.samefile(first, third)
+
+    (root / 'panel.csv').write_text('gene,disease\nBRCA2,EFO_0000305\n')
+    os.utime(root / 'panel.csv', (0, 2 ** 31 + 60))
+    assert fetch(f'{url}/panel.csv', first, store)[0][1] == DOWNLOADED
+    assert open(first).read() == 'gene,disease\nBRCA2,EFO_0000305\n' and open(second).read() == 'gene,disease\n'
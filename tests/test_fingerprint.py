@@ -0,0 +1,30 @@
+import os
+
+from common.Fingerprint import RunCache, fingerprint, source_files
+
+
+def test_source_files():
+    sources = source_files('modules/Gene2Phenotype.py')
+    assert {'modules/Gene2Phenotype.py', 'common/Engine.py', 'common/EvidenceWriter.py', 'settings.py'} <= set(sources)
+    assert 'modules/EPMC.py' not in sources
+
+
+def test_republish_cached_run(tmp_path):
+    cache = RunCache(str(tmp_path / 'cache'))
+    first_input, second_input = tmp_path / 'panel-1.csv', tmp_path / 'panel-2.csv'
+    first_input.write_text('gene,disease\n')
+    second_input.write_text('gene,disease\n')
+
+    run_fingerprint, components = fingerprint('modules/ClinGen.py', [str(first_input)], ['{input0}'], cache.checksums)
+    # Same content under another name:
+    assert fingerprint('modules/ClinGen.py', [str(second_input)], ['{input0}'], cache.checksums)[0] == run_fingerprint
+    assert fingerprint('modules/ClinGen.py', [str(first_input)], ['{input0}', '--local'],
+                       cache.checksums)[0] != run_fingerprint
+    assert cache.lookup('ClinGen', run_fingerprint) is None
+
+    (tmp_path / 'clingen-1.json.gz').write_bytes(b'evidence')
+    (tmp_path / 'clingen-1.parquet').write_bytes(b'parquet')
+    cache.store('ClinGen', run_fingerprint, components, [str(tmp_path / 'clingen-1.json.gz')])
+    cache.republish('ClinGen', run_fingerprint, [str(tmp_path / 'clingen-2.json.gz')])
+    assert os.path.samefile(tmp_path / 'clingen-1.json.gz', tmp_path / 'clingen-2.json.gz')
+    assert (tmp_path / 'clingen-2.parquet').read_bytes() == b'parquet'
@@ -0,0 +1,30 @@
+from common.HGNCIndex import HGNCIndex, get_hgnc_index
+
+HGNC_TSV = (
+    'hgnc_id\tsymbol\tname\tprev_symbol\tensembl_gene_id\n'
+    'HGNC:1097\tBRAF\tB-Raf proto-oncogene\t\tENSG00000157764\n'
+    'HGNC:20363\tEFCAB4B\tCa2+ release activated channel regulator 2A\t"CRACR2A|OLD1"\tENSG00000130038\n'
+    'HGNC:1\tOLD1\tgene without Ensembl id\t\t\n'
+)
+
+
+def test_hgnc_index_lookups(tmp_path):
+    source = tmp_path / 'hgnc_complete_set.txt'
+    source.write_text(HGNC_TSV)
+    path = str(tmp_path / 'hgnc_index.bin')
+
+    index = get_hgnc_index(str(source), path)
+    assert index.symbol_to_ensembl('BRAF') == 'ENSG00000157764'
+    assert index.symbol_to_ensembl('CRACR2A') == 'ENSG00000130038'
+    # Approved symbols take precedence over previous symbols, even without an Ensembl id:
+    assert index.symbol_to_ensembl('OLD1') is None
+    assert index.symbol_to_ensembl('UNKNOWN') is None
+    assert index.hgnc_id_to_ensembl('HGNC:1097') == 'ENSG00000157764'
+    assert sorted(index.symbol_mappings()) == [
+        ('BRAF', 'ENSG00000157764'), ('CRACR2A', 'ENSG00000130038'), ('EFCAB4B', 'ENSG00000130038')
+    ]
+
+    # The existing index is reused:
+    source.write_text('')
+    assert get_hgnc_index(str(source), path).metadata == index.metadata
+    assert len(HGNCIndex(path)) == 8
@@ -0,0 +1,68 @@
+import gzip
+import http.server
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('requests')
+
+from common import HttpClient
+from settings import Config
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Ports of the client connections, and number of failures left before serving:
+    ports, failures = set(), 0
+
+    def do_GET(self):
+        Handler.ports.add(self.client_address[1])
+        if Handler.failures:
+            Handler.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps({'path': self.path}).encode()
+        compressed = 'gzip' in self.headers.get('Accept-Encoding', '')
+        self.send_response(200)
+        if compressed:
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+def test_http_client(server_url, tmp_path, monkeypatch):
+    monkeypatch.setattr('common.Resolver.time.sleep', lambda delay: None)
+
+    # The requests to a host share one kept-alive connection, and the responses are decoded:
+    Handler.ports = set()
+    assert [HttpClient.get_json(f'{server_url}/panels/{i}/') for i in range(5)] == [
+        {'path': f'/panels/{i}/'} for i in range(5)
+    ]
+    assert len(Handler.ports) == 1
+
+    # The transient errors are retried:
+    Handler.failures = 2
+    assert HttpClient.get_json(f'{server_url}/retried') == {'path': '/retried'}
+    Handler.failures = Config.HTTP_MAX_RETRIES + 1
+    with pytest.raises(HttpClient.TransientHTTPError):
+        HttpClient.get(f'{server_url}/failed')
+    Handler.failures = 0
+
+    HttpClient.download(f'{server_url}/file', str(tmp_path / 'downloads' / 'file.json'))
+    assert json.loads((tmp_path / 'downloads' / 'file.json').read_text()) == {'path': '/file'}
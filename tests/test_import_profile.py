@@ -0,0 +1,36 @@
+import glob
+import os
+import subprocess
+import sys
+
+from benchmarks.imports import REPOSITORY_ROOT, group_import_times, parse_importtime, profile_script
+
+REPORT = '''import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     numpy._core
+import time:       300 |        420 |   numpy
+import time:        80 |        500 | common.UniquenessCheck
+'''
+
+
+def test_parse_importtime():
+    imports = parse_importtime(REPORT + 'Traceback (most recent call last):\n')
+    assert imports == [('numpy._core', 120, 120), ('numpy', 300, 420), ('common.UniquenessCheck', 80, 500)]
+    assert group_import_times(imports) == {'numpy': 0.00042, 'common.UniquenessCheck': 0.00008}
+
+
+def test_writers_import_no_heavy_dependency():
+    # The modules imported by every parser only import the heavy packages where they are used:
+    code = (
+        'import sys, common.Engine, common.Instrumentation, common.MappingCache, common.HGNCIndex, settings; '
+        'print(" ".join(sorted(set(sys.modules) & {"numpy", "pandas", "pyarrow", "pkg_resources", "pyspark", '
+        '"ontoma", "requests", "urllib.request", "jsonschema"})))'
+    )
+    loaded = subprocess.run([sys.executable, '-c', code], cwd=REPOSITORY_ROOT, stdout=subprocess.PIPE, check=True)
+    assert loaded.stdout.decode().split() == []
+
+
+def test_parsers_show_their_help_without_heavy_dependency():
+    # The Spark parsers included: pyspark is only imported once the arguments are parsed.
+    for script in sorted(glob.glob(os.path.join(REPOSITORY_ROOT, 'modules', '*.py'))):
+        result = profile_script(os.path.relpath(script, REPOSITORY_ROOT), repeat=1)
+        assert (result['status'], result.get('heavy_imports')) == ('succeeded', []), result
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+from common.Engine import PandasEngine
+from common.InputCache import cache_path
+from common.InputSchemas import fresh_caches, ingest, read_pandas
+
+
+def test_cache_is_read_while_fresh(tmp_path):
+    genes = tmp_path / 'genes.tsv'
+    genes.write_text(
+        'SYMBOL\tCOHORT\tCANCER_TYPE\tSAMPLES\tMETHODS\tROLE\tQVALUE_COMBINATION\tEXTRA\n'
+        'BRAF\tC1\tSKCM\t12\tdndscv,cbase\tAct\t1e-5\tx\n'
+        'TP53\tC2\t\t\tdndscv\tLoF\t\t\n'
+    )
+    raw = read_pandas('intogen_genes', str(genes), sep='\t')
+    raw_rows = PandasEngine().collect(PandasEngine().read_csv(str(genes), sep='\t', schema='intogen_genes'))
+
+    ingest('intogen_genes', str(genes))
+    assert fresh_caches('intogen_genes', [str(genes)]) == [cache_path(str(genes))]
+    pd.testing.assert_frame_equal(read_pandas('intogen_genes', str(genes), sep='\t'), raw)
+    assert PandasEngine().collect(PandasEngine().read_csv(str(genes), sep='\t', schema='intogen_genes')) == raw_rows
+
+    # A new version of the raw file is read instead of its cache, even with the same modification time.
+    modified = os.stat(genes).st_mtime_ns
+    with open(genes, 'a') as f:
+        f.write('KRAS\tC1\tLUAD\t3\tdndscv\tAct\t0.01\ty\n')
+    os.utime(genes, ns=(modified, modified))
+    assert fresh_caches('intogen_genes', [str(genes)]) is None
+    assert len(read_pandas('intogen_genes', str(genes), sep='\t')) == 3
+
+
+def test_columns_with_invalid_parquet_characters(tmp_path):
+    summary = tmp_path / 'clingen.csv'
+    summary.write_text(
+        'CLINGEN GENE VALIDITY CURATIONS\nFILE CREATED: 2021-01-18\nWEBPAGE: https://search.clinicalgenome.org\n'
+        '++++++++++,++++++++++\n'
+        '"GENE SYMBOL","GENE ID (HGNC)","DISEASE LABEL","DISEASE ID (MONDO)","MOI","SOP","CLASSIFICATION",'
+        '"ONLINE REPORT","CLASSIFICATION DATE","GCEP"\n'
+        '++++++++++,++++++++++\n'
+        '"A2ML1","HGNC:23336","Noonan syndrome","MONDO:0018997","AD","SOP7","Disputed",'
+        '"https://search.clinicalgenome.org/kb/gene-validity/1","2018-01-03","RASopathy"\n'
+    )
+    raw = read_pandas('clingen_gene_validity', str(summary), skiprows=[0, 1, 2, 3, 5], quotechar='"')
+
+    ingest('clingen_gene_validity', str(summary))
+    assert fresh_caches('clingen_gene_validity', [str(summary)]) == [cache_path(str(summary))]
+    cached = read_pandas('clingen_gene_validity', str(summary), skiprows=[0, 1, 2, 3, 5], quotechar='"')
+    pd.testing.assert_frame_equal(cached, raw)
+    assert cached.loc[0, 'DISEASE ID (MONDO)'] == 'MONDO:0018997'
@@ -0,0 +1,57 @@
+import gzip
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+import common.InputSchemas
+from common.Engine import PandasEngine
+from common.InputSchemas import SchemaDriftError, ingest, read_header, read_pandas
+
+
+def test_typed_read_prunes_columns(tmp_path):
+    genes = tmp_path / 'genes.tsv'
+    genes.write_text(
+        'SYMBOL\tCOHORT\tCANCER_TYPE\tSAMPLES\tMETHODS\tROLE\tQVALUE_COMBINATION\tEXTRA\n'
+        'BRAF\tC1\tSKCM\t12\tdndscv,cbase\tAct\t1e-5\tx\n'
+        'TP53\tC2\t\t\tdndscv\tLoF\t\t\n'
+    )
+
+    rows = PandasEngine().collect(PandasEngine().read_csv(str(genes), sep='\t', schema='intogen_genes'))
+    assert rows == [
+        {'SYMBOL': 'BRAF', 'COHORT': 'C1', 'CANCER_TYPE': 'SKCM', 'SAMPLES': 12, 'METHODS': 'dndscv,cbase',
+         'ROLE': 'Act', 'QVALUE_COMBINATION': 1e-5},
+        {'SYMBOL': 'TP53', 'COHORT': 'C2', 'CANCER_TYPE': None, 'SAMPLES': None, 'METHODS': 'dndscv',
+         'ROLE': 'LoF', 'QVALUE_COMBINATION': None},
+    ]
+    assert type(rows[0]['SAMPLES']) is int
+
+
+def test_schema_drift_fails_fast(tmp_path):
+    evidence = tmp_path / 'evidence.tsv'
+    evidence.write_text('target_id\tdisease_id\tscore\nENSG01\tEFO_1\t0.5\n')
+    with pytest.raises(SchemaDriftError, match='disease_name, pmid, gene_set_name'):
+        read_pandas('crispr_evidence', str(evidence), sep='\t')
+
+    studies = tmp_path / 'studies.tsv'
+    studies.write_text('gene_set_name\tpmid\tmethod\tscore_type\tmin_score\tmax_score\nset\t1\tm\trank\tlow\t10\n')
+    with pytest.raises(ValueError):
+        read_pandas('sysbio_studies', str(studies), sep='\t')
+
+
+def test_header_of_gzipped_file(tmp_path):
+    panel = tmp_path / 'DDG2P.csv.gz'
+    with gzip.open(panel, 'wt') as f:
+        f.write('"gene symbol","disease name",panel\nA,"B, C",DD\n')
+    assert read_header(str(panel)) == ['gene symbol', 'disease name', 'panel']
+
+
+def test_ingest_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(common.InputSchemas, 'is_available', lambda: False)
+    evidence = tmp_path / 'evidence.tsv'
+    evidence.write_text('target_id\tdisease_id\tdisease_name\tscore\tpmid\tgene_set_name\nENSG01\tEFO_1\td\t0.5\t1\ts\n')
+
+    # The file is not converted, and the parsers read the raw file:
+    assert ingest('crispr_evidence', str(evidence)) is None
+    assert list(tmp_path.iterdir()) == [evidence]
+    assert len(read_pandas('crispr_evidence', str(evidence), sep='\t')) == 1
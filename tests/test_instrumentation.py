@@ -0,0 +1,35 @@
+import json
+
+import pandas as pd
+import pytest
+
+from common.Instrumentation import RunReport, report_path
+
+
+def test_report_path():
+    assert report_path('/data/crispr.json.gz') == '/data/crispr.run_report.json'
+    assert report_path('/data/epmc/') == '/data/epmc.run_report.json'
+    assert report_path('gs://bucket/evidence/orphanet') == 'gs://bucket/evidence/orphanet.run_report.json'
+
+
+def test_stages_are_recorded(tmp_path):
+    report = RunReport('test')
+    with report.stage('load') as stage:
+        df = pd.DataFrame({'id': range(10)})
+        stage.set_rows(output_rows=df)
+    with pytest.raises(ValueError):
+        with report.stage('map') as stage:
+            stage.set_rows(input_rows=len(df))
+            raise ValueError('Failed mapping')
+
+    filename = report.write(str(tmp_path / 'test.json.gz'))
+    assert filename == str(tmp_path / 'test.run_report.json')
+    with open(filename) as f:
+        written = json.load(f)
+
+    assert written['parser'] == 'test'
+    load, failed = written['stages']
+    assert (load['name'], load['status'], load['output_rows']) == ('load', 'ok', 10)
+    assert (failed['name'], failed['status'], failed['input_rows']) == ('map', 'failed', 10)
+    assert load['wall_time_s'] >= 0 and load['peak_rss_bytes'] > 0
+    assert 'spark' not in load
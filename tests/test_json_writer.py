@@ -0,0 +1,67 @@
+import gzip
+import io
+import json
+
+import pytest
+
+import common.BlockGzip as BlockGzip
+from common.JsonWriter import JsonLinesWriter, write_json_lines
+
+RECORDS = [
+    {'datasourceId': 'clingen', 'resourceScore': 1e-05, 'diseaseFromSource': 'Maladie d’Alzheimer'},
+    {'datasourceId': 'clingen', 'literature': ['12345678'], 'studyCases': 12},
+]
+
+
+def test_output_is_identical_to_json_dump(tmp_path):
+    legacy_file = tmp_path / 'legacy.json.gz'
+    with gzip.open(legacy_file, 'wt') as f:
+        for record in RECORDS:
+            json.dump(record, f)
+            f.write('\n')
+
+    new_file = tmp_path / 'new.json.gz'
+    assert write_json_lines(RECORDS, str(new_file), backend='json') == len(RECORDS)
+
+    assert gzip.open(new_file).read() == gzip.open(legacy_file).read()
+
+
+def test_small_buffer_and_repeated_runs_give_the_same_bytes(tmp_path):
+    first, second = tmp_path / 'first.json.gz', tmp_path / 'second.json.gz'
+    write_json_lines(RECORDS, str(first))
+    with JsonLinesWriter(str(second), buffer_size=1) as writer:
+        for record in RECORDS:
+            writer.write(record)
+
+    assert first.read_bytes() == second.read_bytes()
+
+
+def test_multithreaded_output_reads_as_a_normal_gzip_file(tmp_path):
+    records = [{'datasourceId': 'phenodigm', 'resourceScore': i / 7} for i in range(5000)]
+    single, multi = tmp_path / 'single.json.gz', tmp_path / 'multi.json.gz'
+    write_json_lines(records, str(single), threads=1)
+    write_json_lines(records, str(multi), threads=4, block_size=1024)
+
+    assert gzip.open(multi).read() == gzip.open(single).read()
+
+
+class RemoteOutput(io.BytesIO):
+    '''Output stream recording whether it was published, as a remote output is when closed without an exception.'''
+
+    published = None
+
+    def __exit__(self, exc_type, *exc_info):
+        self.published = exc_type is None
+        self.close()
+
+
+def test_multithreaded_output_is_not_published_after_an_exception(monkeypatch):
+    output = RemoteOutput()
+    monkeypatch.setattr(BlockGzip, 'open_uri', lambda filename, mode: output)
+
+    with pytest.raises(RuntimeError):
+        with JsonLinesWriter('gs://bucket/evidence.json.gz', threads=4, block_size=1024, buffer_size=1) as writer:
+            for i in range(5000):
+                writer.write({'datasourceId': 'phenodigm', 'resourceScore': i / 7})
+            raise RuntimeError()
+    assert output.published is False
@@ -0,0 +1,64 @@
+import json
+import time
+
+from common.MappingCache import MISSING, CachedOnToma, MappingCache
+
+
+class FakeOnToma(object):
+    def __init__(self):
+        self.queries = []
+
+    def find_term(self, term, verbose=False):
+        self.queries.append(term)
+        return {'term': 'http://www.ebi.ac.uk/efo/EFO_0000305', 'quality': 'match'} if term == 'breast carcinoma' else None
+
+
+def test_lookups_are_cached_across_instances(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    otmap = FakeOnToma()
+
+    # The second query is served from the cache, whatever the case and spacing of the term:
+    for term in ['breast carcinoma', 'Breast  Carcinoma']:
+        cached = CachedOnToma(otmap, MappingCache(path, release='v1'))
+        assert cached.find_term(term, verbose=True)['quality'] == 'match'
+        # Negative results are cached too:
+        assert cached.find_term('unknown disease', verbose=True) is None
+
+    assert otmap.queries == ['breast carcinoma', 'unknown disease']
+    assert cached.cache.hits == 2
+
+    mappings = cached.export(str(tmp_path / 'export.json'), 'find_term', ['unknown disease'], default={}, verbose=True)
+    assert mappings == {'unknown disease': {}}
+    with open(tmp_path / 'export.json') as f:
+        assert json.load(f) == mappings
+
+
+def test_release_and_ttl_invalidate_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    MappingCache(path, release='v1').set('find_term', 'asthma', {'term': 'EFO_0000270'})
+
+    assert MappingCache(path, release='v1').get('find_term', 'asthma') == {'term': 'EFO_0000270'}
+    assert MappingCache(path, release='v2').get('find_term', 'asthma') is MISSING
+    time.sleep(0.01)
+    assert MappingCache(path, release='v1', ttl_days=1e-9).get('find_term', 'asthma') is MISSING
+
+
+class FakeOLS(object):
+    def __init__(self):
+        self.queries = []
+
+    def besthit(self, term, ontology=None, exact=False):
+        self.queries.append((term, exact))
+        return {'iri': 'http://purl.obolibrary.org/obo/MONDO_0004975', 'label': term} if exact else None
+
+
+def test_ols_lookups_are_cached_by_options(tmp_path):
+    otmap = FakeOnToma()
+    otmap._ols = FakeOLS()
+    cached = CachedOnToma(otmap, MappingCache(str(tmp_path / 'cache.sqlite'), release='v1'))
+
+    for _ in range(2):
+        assert cached.ols_besthit('alzheimer disease', ontology=['mondo'], exact=True)['label'] == 'alzheimer disease'
+        assert cached.ols_besthit('alzheimer disease', ontology=['mondo']) is None
+
+    assert otmap._ols.queries == [('alzheimer disease', True), ('alzheimer disease', False)]
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from common.EvidenceSchema import EVIDENCE_FIELDS, conform_record, sql_type
+from common.EvidenceWriter import write_evidence_records
+from common.ParquetWriter import JSON, PARQUET, output_formats, parquet_path
+
+
+def test_output_formats_and_paths():
+    assert output_formats('both') == {JSON, PARQUET}
+    assert output_formats('parquet') == {PARQUET}
+    with pytest.raises(ValueError):
+        output_formats('csv')
+    assert parquet_path('output/epmc.json.gz') == 'output/epmc.parquet'
+    assert parquet_path('output/orphanet') == 'output/orphanet.parquet'
+    assert parquet_path('output/crispr.parquet') == 'output/crispr.parquet'
+
+
+def test_schema():
+    assert sql_type(EVIDENCE_FIELDS['textMiningSentences']) == (
+        'array<struct<text:string,tStart:bigint,tEnd:bigint,dStart:bigint,dEnd:bigint,section:string>>'
+    )
+    record = conform_record({
+        'datasourceId': 'intogen', 'resourceScore': np.float32(0.5),
+        'mutatedSamples': [{'functionalConsequenceId': 'SO_0002054', 'numberMutatedSamples': np.int64(3)}],
+    })
+    assert type(record['resourceScore']) is float and type(record['mutatedSamples'][0]['numberMutatedSamples']) is int
+    with pytest.raises(ValueError, match='mutatedSamples.unknownField'):
+        conform_record({'mutatedSamples': [{'unknownField': 1}]})
+
+
+def test_parquet_output(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    records = [
+        {'datasourceId': 'phenodigm', 'resourceScore': 90.5, 'targetFromSourceId': f'ENSG{i}',
+         'diseaseModelAssociatedHumanPhenotypes': [{'id': 'HP:0000001', 'label': 'All'}]}
+        for i in range(5)
+    ]
+    output_file = tmp_path / 'phenodigm.json.gz'
+    assert write_evidence_records(records, str(output_file), 'both') == 5
+    table = pq.read_table(str(tmp_path / 'phenodigm.parquet'), columns=['targetFromSourceId', 'resourceScore'])
+    assert table.to_pydict() == {'targetFromSourceId': [f'ENSG{i}' for i in range(5)], 'resourceScore': [90.5] * 5}
+    assert output_file.exists()
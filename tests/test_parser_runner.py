@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from common.Fingerprint import RunCache
+from common.ParserRunner import FAILED, REPUBLISHED, SUCCEEDED, ParserJob, run_parsers
+
+PARSER = '''
+import argparse
+import logging
+import sys
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--input')
+parser.add_argument('--output')
+args = parser.parse_args()
+logging.info('Parsing %s', args.input)
+content = open(args.input).read()
+if not content:
+    sys.exit('Empty input.')
+with open(args.output, 'w') as f:
+    f.write(content.upper())
+'''
+
+
+def test_run_parsers(tmp_path):
+    module = tmp_path / 'Dummy.py'
+    module.write_text(PARSER)
+    (tmp_path / 'first.txt').write_text('brca2')
+    (tmp_path / 'empty.txt').write_text('')
+    (tmp_path / 'second.txt').write_text('tp53')
+
+    jobs = [
+        ParserJob(str(module), ['--input', str(tmp_path / name), '--output', str(tmp_path / f'{name}.out')],
+                  [str(tmp_path / name)], [str(tmp_path / f'{name}.out')], str(tmp_path / f'{name}.log'), name)
+        for name in ('first.txt', 'empty.txt', 'second.txt')
+    ]
+    run_cache = RunCache(str(tmp_path / 'cache'))
+    logging.getLogger().setLevel(logging.INFO)
+
+    # A failing parser does not stop the next ones:
+    assert run_parsers(jobs, run_cache) == {'first.txt': SUCCEEDED, 'empty.txt': FAILED, 'second.txt': SUCCEEDED}
+    assert (tmp_path / 'second.txt.out').read_text() == 'TP53'
+    assert 'Parsing' in (tmp_path / 'first.txt.log').read_text()
+    assert 'second.txt' not in (tmp_path / 'first.txt.log').read_text()
+
+    statuses = run_parsers(jobs, run_cache)
+    assert statuses == {'first.txt': REPUBLISHED, 'empty.txt': FAILED, 'second.txt': REPUBLISHED}
+
+
+def test_rerun_into_the_same_output_keeps_the_cached_run(tmp_path):
+    module = tmp_path / 'Dummy.py'
+    module.write_text(PARSER)
+    panel, output = tmp_path / 'panel.txt', tmp_path / 'panel.out'
+    job = ParserJob(str(module), ['--input', str(panel), '--output', str(output)], [str(panel)], [str(output)],
+                    str(tmp_path / 'panel.log'), 'panel')
+    run_cache = RunCache(str(tmp_path / 'cache'))
+
+    panel.write_text('brca2')
+    assert run_parsers([job], run_cache) == {'panel': SUCCEEDED}
+    # A new input of the same day is parsed into the same output, which is linked to the cached run:
+    panel.write_text('tp53')
+    assert run_parsers([job], run_cache) == {'panel': SUCCEEDED}
+    assert output.read_text() == 'TP53'
+
+    panel.write_text('brca2')
+    assert run_parsers([job], run_cache) == {'panel': REPUBLISHED}
+    assert output.read_text() == 'BRCA2'
+
+
+def test_status_file(tmp_path):
+    module = tmp_path / 'Dummy.py'
+    module.write_text(PARSER)
+    (tmp_path / 'first.txt').write_text('brca2')
+    (tmp_path / 'empty.txt').write_text('')
+    jobs_file, status_file = tmp_path / 'jobs.json', tmp_path / 'status.json'
+    jobs_file.write_text(json.dumps([
+        {'name': name, 'module': str(module),
+         'arguments': ['--input', str(tmp_path / f'{name}.txt'), '--output', str(tmp_path / f'{name}.out')]}
+        for name in ('first', 'empty')
+    ]))
+
+    # A failed parser is reported in the status file, and the command succeeds:
+    subprocess.run(
+        [sys.executable, 'utils/run_parsers.py', '--no-cache', '--status-file', str(status_file), str(jobs_file)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env={**os.environ, 'PYTHONPATH': '.'},
+        check=True
+    )
+    assert json.loads(status_file.read_text()) == {'first': SUCCEEDED, 'empty': FAILED}
@@ -0,0 +1,37 @@
+from common.RecordBuffer import RecordBuffer, deep_size
+
+
+def test_record_buffer_spills_beyond_budget():
+    records = [{'targetFromSourceId': f'ENSG{i:05d}', 'literature': [str(i)], 'score': i / 7} for i in range(1000)]
+    budget = deep_size(records[0]) * 100
+
+    with RecordBuffer(budget=budget, batch_size=30) as buffer:
+        buffer.extend(records)
+        assert len(buffer) == 1000
+        assert buffer.spilled_records > 0 and len(buffer.records) <= 100
+        assert buffer.memory <= budget
+        # The records are read back in order, as many times as needed:
+        assert list(buffer) == records
+        assert list(buffer) == records
+        assert max(len(batch) for batch in buffer.batches()) == 30
+
+        buffer.append({'targetFromSourceId': 'last'})
+        assert list(buffer)[-1] == {'targetFromSourceId': 'last'}
+
+
+def test_record_buffer_within_budget():
+    buffer = RecordBuffer(budget=2 ** 20)
+    buffer.extend({'id': i} for i in range(10))
+    assert list(buffer) == [{'id': i} for i in range(10)] and buffer.spilled_batches == 0
+
+
+def test_record_buffer_spills_while_read():
+    buffer = RecordBuffer(budget=1, batch_size=1)
+    buffer.extend({'i': i} for i in range(5))
+    batches = buffer.batches()
+    assert next(batches) == [{'i': 0}]
+
+    # A spill after a partial read appends to the spill file, and the partial read goes on from where it was:
+    buffer.append({'i': 5})
+    assert list(buffer) == [{'i': i} for i in range(6)]
+    assert next(batches) == [{'i': 1}]
@@ -0,0 +1,34 @@
+import random
+import time
+
+from common.Resolver import BatchResolver, RateLimiter, call_with_backoff
+
+
+def test_batch_resolver_keeps_the_order_of_the_terms():
+    def lookup(term):
+        time.sleep(random.uniform(0, 0.01))
+        if term == 'failing':
+            raise ValueError(term)
+        return term.upper()
+
+    results = BatchResolver(lookup, workers=4).resolve(['b', 'a', 'failing', 'c', 'a'])
+    assert list(results.items()) == [('b', 'B'), ('a', 'A'), ('failing', None), ('c', 'C')]
+
+
+def test_rate_limiter_and_backoff():
+    limiter = RateLimiter(100)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.05
+
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError('timeout')
+        return 'ok'
+
+    assert call_with_backoff(flaky, max_retries=3, base_delay=0.001) == 'ok'
+    assert len(attempts) == 3
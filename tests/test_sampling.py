@@ -0,0 +1,48 @@
+import zlib
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+import common.Engine
+import common.InputSchemas
+from common.Engine import PandasEngine
+from common.InputSchemas import read_pandas
+from common.Sampling import in_sample, sample_key, sample_pandas
+from settings import Config
+
+
+def test_sampling_keeps_the_same_keys_in_every_table(tmp_path, monkeypatch):
+    genes = [f'GENE{i}' for i in range(1000)]
+    assert all(in_sample(gene) for gene in genes)
+
+    monkeypatch.setattr(Config, 'SAMPLE_FRACTION', 0.1)
+    sampled = {gene for gene in genes if in_sample(gene)}
+    assert 50 < len(sampled) < 150
+    assert sampled == {gene for gene in genes if zlib.crc32(gene.encode()) < 0.1 * 2 ** 32}
+    assert sample_key('1', 12345, 'A', 'T') == '1_12345_A_T' and sample_key('1', None) is None
+
+    # Read by chunks, with the same selection as the other tables holding the genes:
+    evidence = tmp_path / 'evidence.tsv'
+    evidence.write_text('gene\tscore\n' + ''.join(f'{gene}\t{i}\n' for i, gene in enumerate(genes)) + '\t0\n')
+    monkeypatch.setattr(common.Engine, 'SAMPLE_CHUNK_ROWS', 64)
+    df = PandasEngine().read_csv(str(evidence), sep='\t', sample='gene')
+    assert set(df['gene']) == sampled
+
+    mappings = sample_pandas(pd.DataFrame({'gene': genes, 'symbol': genes}), 'gene', 'symbol')
+    assert {gene for gene in mappings['gene'] if in_sample(gene, gene)} == set(mappings['gene'])
+
+
+def test_typed_reader_samples_each_chunk(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'SAMPLE_FRACTION', 0.1)
+    monkeypatch.setattr(common.InputSchemas, 'ROW_GROUP_SIZE', 64)
+    gene_sets = [f'SET{i}' for i in range(1000)]
+    studies = tmp_path / 'studies.tsv'
+    studies.write_text(
+        'gene_set_name\tpmid\tmethod\tscore_type\tmin_score\tmax_score\n'
+        + ''.join(f'{gene_set}\t{i}\tm\trank\t0.1\t10\n' for i, gene_set in enumerate(gene_sets))
+    )
+
+    df = read_pandas('sysbio_studies', str(studies), sep='\t', sample='gene_set_name')
+    assert list(df['gene_set_name']) == [gene_set for gene_set in gene_sets if in_sample(gene_set)]
+    assert list(df.index) == list(range(len(df)))
@@ -0,0 +1,55 @@
+import gzip
+import json
+
+import pytest
+
+from common import SchemaValidation
+from common.SchemaValidation import ValidationSummary, list_shards, validate_evidence
+
+SCHEMA = {
+    '$schema': 'http://json-schema.org/draft-07/schema#',
+    'type': 'object',
+    'properties': {
+        'datasourceId': {'type': 'string'},
+        'resourceScore': {'type': 'number'},
+        'literature': {'type': 'array', 'items': {'type': 'string', 'pattern': '^[0-9]+$'}},
+    },
+    'required': ['datasourceId', 'resourceScore'],
+}
+
+
+def test_summary_merge():
+    first, second = ValidationSummary(max_examples=2), ValidationSummary(max_examples=2)
+    first.add('crispr')
+    for line in range(3):
+        first.add('crispr', ('data.literature[0]', 'pattern', 'must match pattern'), 'a.json.gz', line)
+        second.add('crispr', ('data.literature[1]', 'pattern', 'must match pattern'), 'b.json.gz', line)
+    second.add('sysbio')
+    first.merge(second)
+
+    summary = first.as_dict()
+    assert (summary['records'], summary['invalid']) == (8, 6)
+    errors = summary['datasources']['crispr']['errors']
+    assert [(e['error'], e['count'], len(e['examples'])) for e in errors] == [('data.literature[] (pattern)', 6, 2)]
+
+
+def test_validate_evidence(tmp_path):
+    if SchemaValidation.fastjsonschema is None and SchemaValidation.jsonschema is None:
+        pytest.skip('No JSON schema validator is installed.')
+    schema_file = tmp_path / 'schema.json'
+    schema_file.write_text(json.dumps(SCHEMA))
+
+    output = tmp_path / 'output'
+    output.mkdir()
+    for part in range(3):
+        with gzip.open(output / f'part-0000{part}.json.gz', 'wt') as f:
+            f.write(json.dumps({'datasourceId': 'epmc', 'resourceScore': 1.0, 'literature': ['123']}) + '\n')
+            f.write(json.dumps({'datasourceId': 'epmc', 'resourceScore': 'high'}) + '\n')
+            f.write('{"datasourceId": \n')
+    assert len(list_shards([str(output)])) == 3
+
+    for processes in (1, 4):
+        summary = validate_evidence([str(output)], str(schema_file), processes=processes, chunk_size=2)
+        assert (summary.records, summary.invalid) == (9, 6)
+        assert summary.datasources['epmc']['invalid'] == 3
+        assert summary.datasources['unparsable']['invalid'] == 3
@@ -0,0 +1,44 @@
+import gzip
+import hashlib
+import json
+import random
+
+from common.ShardedWriter import MANIFEST_NAME, write_sharded_records
+
+
+def _read_shards(output_dir):
+    manifest = json.loads((output_dir / MANIFEST_NAME).read_text())
+    lines = []
+    for shard in manifest['shards']:
+        data = (output_dir / shard['file']).read_bytes()
+        assert hashlib.sha256(data).hexdigest() == shard['sha256'] and len(data) == shard['bytes']
+        shard_lines = gzip.decompress(data).splitlines()
+        assert len(shard_lines) == shard['records']
+        lines.extend(shard_lines)
+    return manifest, lines
+
+
+def test_sharded_output_is_deterministic(tmp_path):
+    records = [
+        {'datasourceId': 'clingen', 'targetFromSourceId': f'ENSG{i % 50:03d}', 'diseaseFromSourceMappedId': f'EFO_{i}',
+         'allelicRequirements': ['Autosomal dominant']}
+        for i in range(500)
+    ]
+    assert write_sharded_records(records, str(tmp_path / 'first'), shard_size=4096) == 500
+    random.Random(1).shuffle(records)
+    write_sharded_records(records, str(tmp_path / 'second'), shard_size=4096)
+
+    manifest, lines = _read_shards(tmp_path / 'first')
+    assert _read_shards(tmp_path / 'second') == (manifest, lines)
+    assert manifest['records'] == 500 and len(manifest['shards']) > 1
+    assert all(shard['uncompressedBytes'] <= 4096 + 200 for shard in manifest['shards'])
+
+    # Sorted on all the fields, as there are no unique association fields for ClinGen:
+    keys = [(record['diseaseFromSourceMappedId'], record['targetFromSourceId']) for record in map(json.loads, lines)]
+    assert keys == sorted(keys)
+    assert manifest['shards'][0]['firstKey'] == ['clingen', [['Autosomal dominant'], 'clingen', 'EFO_0', 'ENSG000']]
+
+    # A rerun replaces the shards of the previous one:
+    write_sharded_records(records[:10], str(tmp_path / 'first'), shard_size=4096)
+    assert _read_shards(tmp_path / 'first')[0]['records'] == 10
+    assert len(list((tmp_path / 'first').glob('part-*'))) == 1
@@ -0,0 +1,117 @@
+import gzip
+import json
+
+import pytest
+
+import common.Storage as Storage
+from common.EvidenceWriter import write_evidence_records
+from common.Instrumentation import RunReport
+from common.Storage import copy, local_input, open_uri, staged_output, staged_spark_input
+from settings import Config
+
+
+class MemoryStorage(Storage._RangedStorage):
+    '''Remote storage held in a dictionary, recording the calls made to it.'''
+
+    def __init__(self):
+        self.objects, self.calls = {}, []
+
+    def size(self, uri):
+        return len(self.objects[uri])
+
+    def read_range(self, uri, start, end):
+        self.calls.append(('read', start, end))
+        return self.objects[uri][start:end]
+
+    def upload_bytes(self, bucket, name, data):
+        self.calls.append(('upload', name))
+        self.objects[f'gs://{bucket}/{name}'] = data
+
+    def compose(self, bucket, parts, name):
+        self.calls.append(('compose', len(parts)))
+        self.objects[f'gs://{bucket}/{name}'] = b''.join(self.objects[f'gs://{bucket}/{part}'] for part in parts)
+
+    def delete_objects(self, bucket, names):
+        for name in names:
+            del self.objects[f'gs://{bucket}/{name}']
+
+
+@pytest.fixture
+def buckets(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'STORAGE_EMULATOR_PATH', str(tmp_path / 'buckets'))
+    return tmp_path / 'buckets'
+
+
+def test_chunked_transfers(tmp_path, monkeypatch):
+    monkeypatch.setattr(Storage, '_chunk_size', lambda: 4)
+    storage = MemoryStorage()
+
+    with Storage._ChunkedUploadWriter(storage, 'gs://bucket/evidence.json') as f:
+        f.write(b'0123456789')
+        assert f.tell() == 10
+    # Three parts composed into the object, then deleted:
+    assert storage.objects == {'gs://bucket/evidence.json': b'0123456789'}
+    assert ('compose', 3) in storage.calls
+
+    with pytest.raises(RuntimeError):
+        with Storage._ChunkedUploadWriter(storage, 'gs://bucket/failed.json') as f:
+            f.write(b'0123456789')
+            raise RuntimeError()
+    assert list(storage.objects) == ['gs://bucket/evidence.json']
+
+    storage.calls = []
+    storage.download('gs://bucket/evidence.json', str(tmp_path / 'evidence.json'))
+    assert (tmp_path / 'evidence.json').read_bytes() == b'0123456789'
+    assert sorted(storage.calls) == [('read', 0, 4), ('read', 4, 8), ('read', 8, 10)]
+    with storage.open_read('gs://bucket/evidence.json') as f:
+        assert f.read() == b'0123456789'
+
+
+def test_emulated_bucket(tmp_path, buckets):
+    source = tmp_path / 'source'
+    (source / 'nested').mkdir(parents=True)
+    (source / 'part-0.txt').write_text('first')
+    (source / 'nested' / 'part-1.txt').write_text('second')
+
+    copy(str(source), 'gs://bucket/copy')
+    assert (buckets / 'bucket' / 'copy' / 'nested' / 'part-1.txt').read_text() == 'second'
+    copy('gs://bucket/copy', str(tmp_path / 'back'))
+    assert (tmp_path / 'back' / 'part-0.txt').read_text() == 'first'
+
+    with staged_output('gs://bucket/staged.txt') as path:
+        with open(path, 'w') as f:
+            f.write('staged')
+    with open_uri('gs://bucket/staged.txt', 'r') as f:
+        assert f.read() == 'staged'
+    assert open(local_input('gs://bucket/staged.txt')).read() == 'staged'
+
+
+def test_evidence_to_bucket(buckets):
+    records = [{'datasourceId': 'clingen', 'targetFromSourceId': f'ENSG{i:03d}'} for i in range(10)]
+    assert write_evidence_records(records, 'gs://bucket/clingen.json.gz', 'json', shard_size=0) == 10
+    with open_uri('gs://bucket/clingen.json.gz') as f:
+        assert [json.loads(line) for line in gzip.decompress(f.read()).splitlines()] == records
+
+    write_evidence_records(records, 'gs://bucket/clingen', 'json', shard_size=100)
+    manifest = json.loads((buckets / 'bucket' / 'clingen' / 'manifest.json').read_text())
+    assert manifest['records'] == 10 and len(manifest['shards']) > 1
+
+    # The run report is written next to the output:
+    assert RunReport('clingen').write('gs://bucket/clingen.json.gz') == 'gs://bucket/clingen.run_report.json'
+    assert json.loads((buckets / 'bucket' / 'clingen.run_report.json').read_text())['parser'] == 'clingen'
+
+
+def test_staged_spark_input(buckets):
+    with staged_spark_input('gs://bucket/orphanet', 'records.json', local=True) as (uri, path):
+        with open_uri(uri, 'wb') as f:
+            f.write(b'{}\n')
+        assert path == f'file://{uri}'
+    assert not Storage.exists(uri)
+
+    # On a cluster, the file is written next to the output:
+    with staged_spark_input('gs://bucket/orphanet', 'records.json') as (uri, path):
+        assert uri == 'gs://bucket/orphanet.records.json'
+        with open_uri(uri, 'wb') as f:
+            f.write(b'{}\n')
+        assert path == f'file://{buckets / "bucket" / "orphanet.records.json"}'
+    assert not (buckets / 'bucket' / 'orphanet.records.json').exists()
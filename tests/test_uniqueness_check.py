@@ -0,0 +1,35 @@
+import gzip
+import json
+
+from common.UniquenessCheck import association_key, check_uniqueness
+
+
+def test_association_key():
+    first = {'datasourceId': 'europepmc', 'targetFromSourceId': 'ENSG1', 'diseaseFromSourceMappedId': 'EFO_1',
+             'literature': ['2', '1'], 'pmcIds': [], 'resourceScore': 2}
+    second = dict(first, literature=['1', '2'], resourceScore=3)
+    assert association_key(first) == association_key(second)
+    assert association_key(first, ('resourceScore',)) != association_key(second, ('resourceScore',))
+    # Other datasources are compared on all their fields:
+    assert association_key(dict(first, datasourceId='crispr')) != association_key(dict(second, datasourceId='crispr'))
+
+
+def test_duplicates_are_found_when_spilled(tmp_path):
+    output = tmp_path / 'output'
+    output.mkdir()
+    for part in range(2):
+        with gzip.open(output / f'part-0000{part}.json.gz', 'wt') as f:
+            for i in range(500):
+                f.write(json.dumps({
+                    'datasourceId': 'ot_genetics_portal', 'variantId': f'1_{i % 400}_A_G', 'studyId': f'GCST{part}',
+                    'targetFromSourceId': 'ENSG1', 'diseaseFromSourceMappedId': 'EFO_1', 'resourceScore': i,
+                }) + '\n')
+
+    in_memory = check_uniqueness([str(output)])
+    spilled = check_uniqueness([str(output)], memory_limit=24 * 64, temp_dir=str(tmp_path))
+    for summary in (in_memory, spilled):
+        assert (summary['records'], summary['duplicate_records']) == (1000, 200)
+        assert summary['datasources']['ot_genetics_portal']['duplicate_groups'] == 200
+    group = spilled['groups'][0]
+    assert len(group['records']) == 2 and group['records'][0]['line'] + 400 == group['records'][1]['line']
+    assert list(tmp_path.iterdir()) == [output]
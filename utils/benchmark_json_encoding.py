@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+'''Benchmark of the gzipped JSON lines evidence writers on a synthetic evidence set.'''
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from common.JsonWriter import ENCODERS, write_json_lines
+
+
+def generate_evidence(number_of_records, seed=42):
+    '''Yields synthetic evidence strings shaped like the genetic association ones.'''
+    rng = random.Random(seed)
+    for i in range(number_of_records):
+        yield {
+            'datasourceId': 'phewas_catalog',
+            'datatypeId': 'genetic_association',
+            'diseaseFromSource': f'Phenotype number {rng.randint(1, 2000)}',
+            'diseaseFromSourceId': f'{rng.randint(1, 999)}.{rng.randint(0, 99)}',
+            'diseaseFromSourceMappedId': f'EFO_{rng.randint(1, 9999999):07d}',
+            'oddsRatio': rng.uniform(0.1, 10),
+            'resourceScore': rng.uniform(1e-10, 0.05),
+            'studyCases': rng.randint(20, 20000),
+            'targetFromSource': f'GENE{rng.randint(1, 20000)}',
+            'targetFromSourceId': f'ENSG{rng.randint(1, 99999999999):011d}',
+            'variantFunctionalConsequenceId': 'SO_0001060',
+            'variantId': f'{rng.randint(1, 22)}_{rng.randint(1, 250000000)}_A_G',
+            'variantRsId': f'rs{i}',
+            'literature': [str(rng.randint(10000000, 40000000)) for _ in range(rng.randint(0, 3))],
+        }
+
+
+def legacy_writer(records, filename):
+    '''The writer the parsers used before: two small writes per record through the gzip text wrapper.'''
+    count = 0
+    with gzip.open(filename, 'wt') as f:
+        for record in records:
+            json.dump(record, f)
+            f.write('\n')
+            count += 1
+    return count
+
+
+def run_benchmark(label, writer, number_of_records, filename, generation_time=0.0):
+    '''Runs one writer; the time spent generating the synthetic records is subtracted from the measurement.'''
+    start = time.perf_counter()
+    count = writer(generate_evidence(number_of_records), filename)
+    elapsed = time.perf_counter() - start - generation_time
+    logging.info(f'{label:>8}: {count} records in {elapsed:.1f} s, {count / elapsed:,.0f} records/sec, '
+                 f'{os.path.getsize(filename) / 2 ** 20:.1f} MiB')
+    return elapsed
+
+
+def file_digest(filename):
+    '''Digest of the uncompressed content of a gzip file, read in blocks.'''
+    digest = hashlib.sha256()
+    with gzip.open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main(number_of_records, backends):
+    # The records are generated on the fly to keep memory flat, so the generation cost is measured separately:
+    start = time.perf_counter()
+    for _ in generate_evidence(number_of_records):
+        pass
+    generation_time = time.perf_counter() - start
+    logging.info(f'Generating {number_of_records} records takes {generation_time:.1f} s.')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_file = os.path.join(tmp_dir, 'legacy.json.gz')
+        run_benchmark('legacy', legacy_writer, number_of_records, legacy_file, generation_time)
+        legacy_digest = file_digest(legacy_file)
+
+        for backend in backends:
+            filename = os.path.join(tmp_dir, f'{backend}.json.gz')
+            try:
+                run_benchmark(
+                    backend, lambda r, f: write_json_lines(r, f, backend), number_of_records, filename,
+                    generation_time
+                )
+            except ImportError as e:
+                logging.warning(f'Skipping the {backend} backend: {e}')
+                continue
+            identical = file_digest(filename) == legacy_digest
+            logging.info(f'{backend:>8}: output identical to the legacy writer: {identical}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--records', help='Number of synthetic evidence strings.', type=int, default=5000000)
+    parser.add_argument('-b', '--backends', help='Encoder backends to benchmark.', nargs='+', default=list(ENCODERS))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    main(args.records, args.backends)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Checks that evidence files are unique on the association key of their datasource, and reports the duplicates."""
+
+import argparse
+import json
+import logging
+import sys
+
+from common.UniquenessCheck import DEFAULT_MEMORY_LIMIT, MAX_REPORTED_GROUPS, check_uniqueness
+
+
+def main(paths, fields, memory_limit, temp_dir, max_groups, output_file):
+    summary = check_uniqueness(paths, fields, memory_limit, temp_dir, max_groups)
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(summary, f, indent=2)
+        logging.info(f'Uniqueness summary saved into {output_file}.')
+    for group in summary['groups']:
+        logging.warning(f'Duplicate {group["datasourceId"]} evidence: {group["key"]} in {group["records"]}.')
+
+    return 1 if summary['duplicate_records'] else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('paths', help='Gzipped JSON lines evidence files, or directories of part files.', nargs='+')
+    parser.add_argument('--fields', help=(
+        'Fields of the association key, for all the datasources. Defaults to the unique association fields of each '
+        'datasource.'
+    ), nargs='+')
+    parser.add_argument('--memory-limit', help='Memory used by the key digests before they are spilled to disk, in MiB.',
+                        type=int, default=DEFAULT_MEMORY_LIMIT // 2 ** 20)
+    parser.add_argument('--temp-dir', help='Directory to spill the key digests into.')
+    parser.add_argument('--max-groups', help='Number of duplicate groups reported with their key.', type=int,
+                        default=MAX_REPORTED_GROUPS)
+    parser.add_argument('--output', help='JSON file to write the summary into.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    sys.exit(main(
+        args.paths, tuple(args.fields) if args.fields else None, args.memory_limit * 2 ** 20, args.temp_dir,
+        args.max_groups, args.output
+    ))
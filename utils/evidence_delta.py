@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Writes the evidence strings added, removed and changed between two releases of evidence files."""
+
+import argparse
+import logging
+
+from common.EvidenceDelta import DEFAULT_MEMORY_LIMIT, evidence_delta
+
+
+def main(old_paths, new_paths, output_dir, fields, processes, memory_limit, temp_dir):
+    summary = evidence_delta(old_paths, new_paths, output_dir, fields, processes, memory_limit, temp_dir)
+    logging.info(
+        f'{summary["added"]} added, {summary["removed"]} removed and {summary["changed"]} changed evidence strings '
+        f'saved into {output_dir}.'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--old', help='Evidence files of the old release, or directories of part files.', nargs='+',
+                        required=True)
+    parser.add_argument('--new', help='Evidence files of the new release, or directories of part files.', nargs='+',
+                        required=True)
+    parser.add_argument('--output-dir', help=(
+        'Directory to write the added, removed and changed part files into, with a summary.json.'
+    ), required=True)
+    parser.add_argument('--fields', help=(
+        'Fields of the association key, for all the datasources. Defaults to the unique association fields of each '
+        'datasource.'
+    ), nargs='+')
+    parser.add_argument('--processes', help='Number of reading processes. Defaults to the number of CPUs.', type=int)
+    parser.add_argument('--memory-limit', help='Memory used by the digests before they are spilled to disk, in MiB.',
+                        type=int, default=DEFAULT_MEMORY_LIMIT // 2 ** 20)
+    parser.add_argument('--temp-dir', help='Directory to spill the digests into.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    main(
+        args.old, args.new, args.output_dir, tuple(args.fields) if args.fields else None, args.processes,
+        args.memory_limit * 2 ** 20, args.temp_dir
+    )
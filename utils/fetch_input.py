@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Fetches input files through the local content-addressed store, transferring only the sources which have changed."""
+
+import argparse
+import logging
+
+from common.FetchCache import ContentStore, fetch
+
+
+def main(pairs, store_dir):
+    store = ContentStore(store_dir)
+    for source, destination in pairs:
+        fetch(source, destination, store)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', help='HTTP(S) URL, gs:// object or prefix, or local file.')
+    parser.add_argument('destination', help='Destination file, or directory for a gs:// prefix.')
+    parser.add_argument('more', nargs='*', metavar='SOURCE DESTINATION',
+                        help='Other sources and destinations, fetched in order.')
+    parser.add_argument('--store', help=(
+        'Directory of the content-addressed store. Defaults to the OT_FETCH_CACHE_PATH environment variable or '
+        '~/.cache/evidence_datasource_parsers/inputs.'
+    ))
+    args = parser.parse_args()
+    if len(args.more) % 2:
+        parser.error('The sources and destinations must come in pairs.')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    arguments = [args.source, args.destination] + args.more
+    main(list(zip(arguments[::2], arguments[1::2])), args.store)
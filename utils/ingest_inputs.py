@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""Converts fetched input files into the typed Parquet files read by the parsers instead of the raw files."""
+
+import argparse
+import logging
+
+from common.InputSchemas import INPUT_LAYOUTS, ingest
+
+
+def main(pairs):
+    for name, path in pairs:
+        ingest(name, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('schema', choices=sorted(INPUT_LAYOUTS), metavar='SCHEMA',
+                        help='Input schema of the file, declared in common/InputSchemas.py.')
+    parser.add_argument('file', help='Local raw file. Its Parquet file is written next to it, with a .parquet suffix.')
+    parser.add_argument('more', nargs='*', metavar='SCHEMA FILE', help='Other input schemas and files.')
+    args = parser.parse_args()
+    if len(args.more) % 2:
+        parser.error('The input schemas and files must come in pairs.')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    arguments = [args.schema, args.file] + args.more
+    main(list(zip(arguments[::2], arguments[1::2])))
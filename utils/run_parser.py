@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Runs a parser, or republishes the outputs of a previous run with the same inputs, code and parameters."""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+
+from common.Fingerprint import RunCache, fingerprint, placeholder_arguments, remove_outputs
+
+
+def main(command, inputs, outputs, cache_dir=None, force=False):
+    module_file = next((argument for argument in command if argument.endswith('.py')), None)
+    if module_file is None:
+        raise ValueError(f'No Python module in the command: {" ".join(command)}.')
+    name = os.path.splitext(os.path.basename(module_file))[0]
+
+    cache = RunCache(cache_dir)
+    arguments = placeholder_arguments(command[command.index(module_file) + 1:], inputs, outputs)
+    run_fingerprint, components = fingerprint(
+        module_file, cache.local_inputs(inputs), arguments + [f'outputs={len(outputs)}'], cache.checksums
+    )
+
+    run = cache.lookup(name, run_fingerprint)
+    if run and not force:
+        cache.republish(name, run_fingerprint, outputs)
+        logging.info(f'{name}: unchanged inputs, code and parameters (fingerprint {run_fingerprint[:12]}), the outputs '
+                     f'of the run of {run["created"]} were republished.')
+        return 0
+
+    logging.info(f'{name}: running the parser (fingerprint {run_fingerprint[:12]}).')
+    remove_outputs(outputs)
+    returncode = subprocess.call(command)
+    if returncode == 0:
+        cache.store(name, run_fingerprint, components, outputs)
+    return returncode
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, usage=(
+        '%(prog)s [-h] [--input PATH] [--output PATH] [--cache-dir DIR] [--force] -- python modules/<parser>.py ...'
+    ))
+    parser.add_argument('--input', help=(
+        'Input file or directory of the parser, or URL of a remote input it reads, which can be repeated.'
+    ), action='append', default=[])
+    parser.add_argument('--output', help='Output file or directory of the parser, which can be repeated.',
+                        action='append', default=[], required=True)
+    parser.add_argument('--cache-dir', help=(
+        'Directory of the run cache. Defaults to the OT_RUN_CACHE_PATH environment variable or '
+        '~/.cache/evidence_datasource_parsers/runs.'
+    ))
+    parser.add_argument('--force', help='Run the parser even if a run with the same fingerprint is cached.',
+                        action='store_true')
+    parser.add_argument('command', help='Command running the parser, after --.', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error('The command running the parser is missing.')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    sys.exit(main(command, args.input, args.output, args.cache_dir, args.force))
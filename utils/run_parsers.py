@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Runs several parsers one after the other in the same process, sharing one Spark session."""
+
+import argparse
+import json
+import logging
+import sys
+
+from common.Fingerprint import RunCache
+from common.ParserRunner import FAILED, LOG_FORMAT, ParserJob, run_parsers
+
+
+def main(jobs_file, spark_profile=None, cache_dir=None, use_cache=True, force=False, status_file=None):
+    with open(jobs_file) as f:
+        jobs = [
+            ParserJob(
+                job['module'], job.get('arguments', []), job.get('inputs', []), job.get('outputs', []),
+                job.get('log'), job.get('name'),
+            )
+            for job in json.load(f)
+        ]
+    run_cache = RunCache(cache_dir) if use_cache else None
+    statuses = run_parsers(jobs, run_cache, force, spark_profile)
+    if status_file:
+        # The failures are reported by the status file instead of the exit status:
+        with open(status_file, 'w') as f:
+            json.dump(statuses, f, indent=2)
+        return 0
+    return 1 if FAILED in statuses.values() else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('jobs', help=(
+        'JSON file of the parsers to run: a list of objects with the path of the parser `module`, its command line '
+        '`arguments`, and optionally its `inputs` and `outputs` (for the run cache), a `log` file and a `name`.'
+    ))
+    parser.add_argument('--spark-profile', help=(
+        'Profile of the Spark session started before the parsers, sized from all their inputs. By default, the '
+        'session is started by the first parser using Spark.'
+    ), choices=['local', 'cluster'])
+    parser.add_argument('--cache-dir', help=(
+        'Directory of the run cache. Defaults to the OT_RUN_CACHE_PATH environment variable or '
+        '~/.cache/evidence_datasource_parsers/runs.'
+    ))
+    parser.add_argument('--no-cache', help='Always run the parsers, without using nor updating the run cache.',
+                        action='store_true')
+    parser.add_argument('--force', help='Run the parsers even if a run with the same fingerprint is cached.',
+                        action='store_true')
+    parser.add_argument('--status-file', help=(
+        'JSON file in which the status of every parser is written, by name. The command then succeeds even if some '
+        'parsers failed.'
+    ))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
+    sys.exit(main(args.jobs, args.spark_profile, args.cache_dir, not args.no_cache, args.force, args.status_file))
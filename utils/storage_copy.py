@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""Copies files or directories between local paths, gs:// and http(s):// URIs, by chunks in parallel."""
+
+import argparse
+import logging
+
+from common.Storage import copy
+
+
+def main(pairs):
+    for source, destination in pairs:
+        logging.info(f'Copying {source} to {destination}.')
+        copy(source, destination)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', help='Local path, gs:// or http(s):// URI of a file or directory.')
+    parser.add_argument('destination', help='Local path or gs:// URI of the copy, replaced if it exists.')
+    parser.add_argument('more', nargs='*', metavar='SOURCE DESTINATION',
+                        help='Other sources and destinations, copied in order.')
+    args = parser.parse_args()
+    if len(args.more) % 2:
+        parser.error('The sources and destinations must come in pairs.')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    arguments = [args.source, args.destination] + args.more
+    main(list(zip(arguments[::2], arguments[1::2])))
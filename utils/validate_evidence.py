@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Validates evidence files against the evidence JSON schema, and summarises the errors per datasource."""
+
+import argparse
+import json
+import logging
+import sys
+
+from common.SchemaValidation import DEFAULT_CHUNK_SIZE, MAX_EXAMPLES, load_schema, validate_evidence
+from settings import Config
+
+
+def main(paths, schema_file, schema_version, output_file, processes, chunk_size, max_examples):
+    # Fetches the local copy of the schema of the requested version if it is not there yet:
+    load_schema(schema_file, schema_version)
+
+    summary = validate_evidence(paths, schema_file, processes, chunk_size, max_examples)
+    summary.log()
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(summary.as_dict(), f, indent=2)
+        logging.info(f'Validation summary saved into {output_file}.')
+
+    return 1 if summary.invalid else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('paths', help='Gzipped JSON lines evidence files, or directories of part files.', nargs='+')
+    parser.add_argument('--schema', help='Local copy of the evidence schema.', default=Config.EVIDENCE_SCHEMA_PATH)
+    parser.add_argument('--schema-version', help=(
+        'Branch or tag of https://github.com/opentargets/json_schema to fetch the schema from, when the local copy '
+        'is missing.'
+    ), default=Config.EVIDENCE_SCHEMA_VERSION)
+    parser.add_argument('--output', help='JSON file to write the validation summary into.')
+    parser.add_argument('--processes', help='Number of validating processes. Defaults to the number of CPUs.',
+                        type=int)
+    parser.add_argument('--chunk-size', help='Number of lines handed to a process at once.', type=int,
+                        default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--max-examples', help='Number of example lines kept for every error.', type=int,
+                        default=MAX_EXAMPLES)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    sys.exit(main(
+        args.paths, args.schema, args.schema_version, args.output, args.processes, args.chunk_size,
+        args.max_examples
+    ))